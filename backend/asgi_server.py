@@ -0,0 +1,277 @@
+"""Async (ASGI) variant of flask_server.py for production use.
+
+Serves the same routes with FastAPI under uvicorn. Hot JSON endpoints go
+through an in-process response cache (see response_cache.py) that is
+invalidated whenever the listener commits, and support ETag/304 and gzip.
+
+    uvicorn asgi_server:app --host 0.0.0.0 --port 5000
+"""
+import asyncio
+import base64
+import json
+import os
+import sys
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
+
+import commands
+import image_store
+import queries
+import storage
+from event_stream import EventBroadcaster
+from mqtt_publisher import MqttPublisher, PublishQueueFull
+from response_cache import ResponseCache
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common import metrics  # noqa: E402
+
+IMAGE_MAX_AGE = 365 * 24 * 3600  # seconds
+
+REQUEST_SECONDS = metrics.histogram("api_request_seconds", "Time to the response headers, by route",
+                                    ("method", "route", "status"))
+
+
+class RequestTimer:
+    """Pure ASGI middleware: observes each request until its response starts.
+
+    Streams (/api/stream) count their time to the first byte. The route is
+    the matched path template, so ids do not create new series.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+
+        async def timed_send(message):
+            if message["type"] == "http.response.start":
+                route = scope.get("route")
+                REQUEST_SECONDS.labels(scope["method"], route.path if route else "unmatched",
+                                       message["status"]).observe(time.perf_counter() - start)
+            await send(message)
+
+        await self.app(scope, receive, timed_send)
+
+
+app = FastAPI()
+app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
+app.add_middleware(RequestTimer)
+
+storage.init_db()
+print("[DEBUG] Using DB file:", os.path.abspath(storage.DB_FILE))
+
+# Checks the database version from its own thread, so lookups never query
+# SQLite on the event loop.
+cache = ResponseCache().start()
+broadcaster = EventBroadcaster().start()
+publisher = MqttPublisher().start()
+ACK_TIMEOUT = 5.0  # seconds
+
+metrics.REGISTRY.collect("api_cache", cache.stats, counters=("hits", "misses", "invalidations"))
+metrics.REGISTRY.collect("api_stream", broadcaster.stats, counters=("delivered", "overflows"))
+metrics.REGISTRY.collect("api_mqtt", publisher.stats,
+                         counters=("published", "acked", "rejected", "expired", "reconnects"))
+
+
+async def cached_json(request, build, *args):
+    """Serve ``build(*args)`` as JSON through the response cache.
+
+    ``build`` returns the data, or ``(data, status_code)`` for non-200
+    answers. The cache key is the full path and query string. Cache hits and
+    304s never touch the database or the thread pool; the cache's poller
+    thread notices writes within its poll interval.
+    """
+    key = request.url.path + "?" + request.url.query
+    entry, version = cache.get(key)
+    if entry is None:
+        data = await run_in_threadpool(build, *args)
+        status_code = 200
+        if isinstance(data, tuple):
+            data, status_code = data
+        entry = cache.put(key, data, version, status_code)
+
+    body, encoding, etag = entry.encode_for(request.headers.get("accept-encoding"))
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(body, status_code=entry.status_code, media_type="application/json", headers=headers)
+
+
+def light_status_or_unknown(intersection_id):
+    status = queries.get_light_status(intersection_id)
+    if status:
+        return status
+    return {
+        "intersection_id": intersection_id,
+        "status": "Unknown",
+        "timestamp": None
+    }, 404
+
+
+@app.get("/api/light_status/{intersection_id}")
+async def api_light_status(request: Request, intersection_id: str):
+    return await cached_json(request, light_status_or_unknown, intersection_id)
+
+
+@app.get("/api/light_status/{intersection_id}/history")
+async def api_light_status_history(request: Request, intersection_id: str,
+                                   since: str = None, until: str = None,
+                                   limit: int = 100, after_id: int = None):
+    return await cached_json(request, queries.get_light_status_history,
+                             intersection_id, since, until, limit, after_id)
+
+
+@app.get("/api/violations/{violation_id}/image")
+async def api_violation_image(request: Request, violation_id: int):
+    row = await run_in_threadpool(queries.get_violation_image, violation_id)
+    if not row or not (row[0] or row[1]):
+        return JSONResponse({"error": "Not found"}, status_code=404)
+
+    image_hash, image_base64 = row
+    etag = f'"{image_hash or f"legacy-{violation_id}"}"'
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={IMAGE_MAX_AGE}, immutable"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    if image_hash:
+        path = image_store.image_path(image_hash)
+        if not os.path.exists(path):
+            return JSONResponse({"error": "Not found"}, status_code=404)
+        # FileResponse streams from disk and answers Range requests.
+        return FileResponse(path, media_type="image/jpeg", headers=headers)
+    # Rows written before the image store still carry the image inline.
+    try:
+        image_bytes = base64.b64decode(image_base64)
+    except ValueError:
+        return JSONResponse({"error": "Not found"}, status_code=404)  # corrupt: there is no image to serve
+    return Response(image_bytes, media_type="image/jpeg", headers=headers)
+
+
+@app.get("/api/violations")
+async def api_violations(request: Request, page: int = 1, limit: int = 6, after_id: int = None,
+                         plate: str = None, intersection_id: str = None,
+                         since: str = None, until: str = None):
+    return await cached_json(request, queries.get_paginated_violations,
+                             page, limit, after_id, plate, intersection_id, since, until)
+
+
+def stats_or_error(build, *args):
+    try:
+        return build(*args)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+
+
+@app.get("/api/stats/lights/{intersection_id}")
+async def api_light_stats(request: Request, intersection_id: str, since: str = None, until: str = None):
+    return await cached_json(request, stats_or_error, queries.get_light_stats,
+                             intersection_id, since, until)
+
+
+@app.get("/api/stats/violations")
+async def api_violation_stats(request: Request, since: str = None, until: str = None,
+                              intersection_id: str = None, bucket: str = "hour"):
+    return await cached_json(request, stats_or_error, queries.get_violation_stats,
+                             since, until, intersection_id, bucket)
+
+
+@app.get("/api/stats/plates")
+async def api_plate_stats(request: Request, since: str = None, until: str = None,
+                          intersection_id: str = None, min_count: int = 2, limit: int = 20):
+    return await cached_json(request, stats_or_error, queries.get_repeat_offenders,
+                             since, until, intersection_id, min_count, limit)
+
+
+def lights_summary():
+    data = queries.get_latest_light_status()
+    return {
+        "total": len(data),
+        "data": data
+    }
+
+
+@app.get("/api/lights")
+async def api_lights(request: Request):
+    return await cached_json(request, lights_summary)
+
+
+@app.get("/api/stream")
+async def api_stream(request: Request, last_event_id: int = None):
+    header = request.headers.get("last-event-id")
+    if header and header.isdigit():
+        last_event_id = int(header)
+    return StreamingResponse(
+        broadcaster.astream(last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    return Response(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+
+@app.get("/api/cache_stats")
+async def api_cache_stats():
+    return {"cache": cache.stats(), "stream": broadcaster.stats(), "mqtt": publisher.stats()}
+
+
+@app.post("/api/control")
+async def api_control(request: Request):
+    data = await request.json()
+    command = data.get("command")
+    targets = await run_in_threadpool(commands.resolve_targets, data)
+
+    payload = commands.build_command(command)
+    if payload is None:
+        return JSONResponse({"error": "Invalid command"}, status_code=400)
+    if targets is None:
+        return JSONResponse({"error": "Invalid or no intersection ids"}, status_code=400)
+
+    # No ack can arrive while the broker is down, and publish_many rejects
+    # the batch up front if the queue cannot hold all of it.
+    wait_for_ack = data.get("wait_for_ack", True)
+    if wait_for_ack and not publisher.connected.is_set():
+        return JSONResponse({"error": "MQTT broker not connected"}, status_code=503)
+    # publish_many() only hands the messages to paho's loop thread; it never
+    # blocks on the network, so it is safe to call on the event loop.
+    message = json.dumps(payload)
+    try:
+        futures = dict(zip(targets, publisher.publish_many(
+            [(commands.command_topic(intersection_id), message) for intersection_id in targets])))
+    except PublishQueueFull as e:
+        return JSONResponse({"error": str(e)}, status_code=503)
+
+    if not wait_for_ack:
+        return JSONResponse({"success": True, "sent": payload, "queued": targets}, status_code=202)
+
+    async def wait_ack(future):
+        try:
+            await publisher.wait_ack(future, ACK_TIMEOUT)
+            return "acked"
+        except asyncio.TimeoutError:
+            return "error: ack timeout"
+        except Exception as e:
+            return f"error: {e}"
+
+    acks = await asyncio.gather(*(wait_ack(f) for f in futures.values()))
+    results = dict(zip(futures.keys(), acks))
+    success = all(result == "acked" for result in acks)
+    return JSONResponse({"success": success, "sent": payload, "results": results},
+                        status_code=200 if success else 504)
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=5000)
@@ -0,0 +1,95 @@
+"""HTTP load benchmark for the API servers.
+
+Runs ``--concurrency`` keep-alive clients against a running server for
+``--duration`` seconds, each cycling through the dashboard's hot endpoints,
+and reports requests/sec and latency percentiles per endpoint.
+
+    python flask_server.py                                  # or
+    uvicorn asgi_server:app --port 5000 --workers 2
+    python bench_api.py --url http://localhost:5000 --concurrency 50
+"""
+import argparse
+import http.client
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import urlparse
+
+ENDPOINTS = [
+    "/api/lights",
+    "/api/light_status/0",
+    "/api/violations?page=1&limit=6",
+]
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def worker(host, port, paths, stop_at, headers, results, errors, lock):
+    conn = http.client.HTTPConnection(host, port, timeout=10)
+    local = defaultdict(list)
+    failures = 0
+    i = 0
+    while time.perf_counter() < stop_at:
+        path = paths[i % len(paths)]
+        i += 1
+        start = time.perf_counter()
+        try:
+            conn.request("GET", path, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            if response.status >= 500:
+                failures += 1
+        except Exception:
+            failures += 1
+            conn.close()
+            conn = http.client.HTTPConnection(host, port, timeout=10)
+            continue
+        local[path].append(time.perf_counter() - start)
+    conn.close()
+    with lock:
+        for path, latencies in local.items():
+            results[path].extend(latencies)
+        errors[0] += failures
+
+
+def run(url, concurrency, duration, headers):
+    parsed = urlparse(url)
+    results = defaultdict(list)
+    errors = [0]
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + duration
+    threads = [
+        threading.Thread(target=worker, args=(parsed.hostname, parsed.port or 80, ENDPOINTS,
+                                              stop_at, headers, results, errors, lock))
+        for _ in range(concurrency)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    total = sum(len(v) for v in results.values())
+    print(f"{total / duration:10.0f} req/s  ({total} requests, {errors[0]} errors, "
+          f"concurrency {concurrency}, headers {headers or '{}'})")
+    for path in ENDPOINTS:
+        latencies = results.get(path, [])
+        print(f"  {path:<35} p50 {percentile(latencies, 50) * 1000:7.2f} ms  "
+              f"p95 {percentile(latencies, 95) * 1000:7.2f} ms  "
+              f"p99 {percentile(latencies, 99) * 1000:7.2f} ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:5000")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--gzip", action="store_true", help="send Accept-Encoding: gzip")
+    args = parser.parse_args()
+
+    run(args.url, args.concurrency, args.duration,
+        {"Accept-Encoding": "gzip"} if args.gzip else {})
@@ -0,0 +1,132 @@
+"""Benchmark the violation and light status queries on a large seeded database.
+
+Seeds ``--rows`` violations and light status rows into a temp database with
+the pre-index schema, times the old queries, applies the remaining
+migrations (indexes, row counter) and times the new ones.
+
+    python bench_queries.py                 # 10M rows of each
+    python bench_queries.py --rows 1000000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import queries
+import storage
+
+INTERSECTIONS = 200
+PLATES = 50000
+CHUNK = 100000
+REPEAT = 20
+
+# The pre-index schema has no trace_id or clip columns yet.
+OLD_INSERT_VIOLATION_SQL = '''
+    INSERT INTO violations (timestamp, type, plate, location, image_hash, thumbnail_base64)
+    VALUES (?, ?, ?, ?, ?, ?)
+'''
+OLD_COUNT_SQL = "SELECT COUNT(*) FROM violations"
+OLD_PAGE_SQL = '''
+    SELECT id, timestamp, type, plate, location, image_hash, thumbnail_base64,
+           image_base64 IS NOT NULL
+    FROM violations
+    ORDER BY id DESC
+    LIMIT ? OFFSET ?
+'''
+OLD_LIGHT_STATUS_SQL = '''
+    SELECT status, timestamp
+    FROM light_status
+    WHERE intersection_id = ?
+    ORDER BY id DESC
+    LIMIT 1
+'''
+OLD_LATEST_SQL = '''
+    SELECT intersection_id, status, timestamp
+    FROM light_status
+    WHERE id IN (
+        SELECT MAX(id) FROM light_status GROUP BY intersection_id
+    )
+'''
+
+
+def seed(conn, rows):
+    rng = random.Random(0)
+    start_ts = 1735689600  # 2025-01-01T00:00:00Z
+    for offset in range(0, rows, CHUNK):
+        n = min(CHUNK, rows - offset)
+        violations = []
+        statuses = []
+        for i in range(offset, offset + n):
+            ts = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(start_ts + i * 3))
+            violations.append((ts, "RED_LIGHT_RUN", f"P{rng.randrange(PLATES):05}",
+                               str(rng.randrange(INTERSECTIONS)), None, None))
+            statuses.append((ts, ("Green", "Yellow", "Red")[i % 3], str(i % INTERSECTIONS)))
+        # Plain inserts: the old schema has no intersection_state to upsert.
+        with conn:
+            conn.executemany(OLD_INSERT_VIOLATION_SQL, violations)
+            conn.executemany(storage.INSERT_LIGHT_STATUS_SQL, statuses)
+        print(f"\rSeeded {offset + n:,} / {rows:,} rows", end="", flush=True)
+    print()
+
+
+def timed(label, fn, repeat=REPEAT):
+    fn()  # warm the page cache
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    elapsed = (time.perf_counter() - start) / repeat
+    print(f"  {label:<45} {elapsed * 1000:10.3f} ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        storage.DB_FILE = os.path.join(tmp, "bench.db")
+        conn = storage.connect()
+        # Old schema only (before the indexes), then bulk-load.
+        storage.MIGRATIONS[0](conn)
+        storage.MIGRATIONS[1](conn)
+        conn.execute("PRAGMA user_version = 2")
+        conn.commit()
+        seed(conn, args.rows)
+
+        deep_offset = args.rows // 2
+        plate = "P00042"
+        print("Before:")
+        timed("COUNT(*) violations", lambda: conn.execute(OLD_COUNT_SQL).fetchone())
+        timed("page 1 (OFFSET 0)", lambda: conn.execute(OLD_PAGE_SQL, (6, 0)).fetchall())
+        timed(f"deep page (OFFSET {deep_offset:,})",
+              lambda: conn.execute(OLD_PAGE_SQL, (6, deep_offset)).fetchall(), repeat=3)
+        timed("plate filter (full scan)", lambda: conn.execute(
+            "SELECT id FROM violations WHERE plate = ? ORDER BY id DESC LIMIT 6",
+            (plate,)).fetchall(), repeat=3)
+        timed("latest status, all intersections", lambda: conn.execute(
+            OLD_LATEST_SQL).fetchall(), repeat=3)
+        timed("latest status, one intersection", lambda: conn.execute(
+            OLD_LIGHT_STATUS_SQL, ("7",)).fetchone(), repeat=3)
+        conn.close()
+
+        start = time.perf_counter()
+        storage.init_db()
+        print(f"Migration (indexes, counter, state): {time.perf_counter() - start:.1f} s")
+
+        cursor_id = queries.get_paginated_violations(after_id=args.rows - deep_offset)["data"][0]["id"]
+        print("After:")
+        timed("row counter", lambda: queries.get_paginated_violations(limit=1)["total"])
+        timed("page 1", lambda: queries.get_paginated_violations(1, 6))
+        timed("deep page (after_id keyset)",
+              lambda: queries.get_paginated_violations(after_id=cursor_id))
+        timed("plate filter + count", lambda: queries.get_paginated_violations(plate=plate))
+        timed("intersection filter + count",
+              lambda: queries.get_paginated_violations(intersection_id="7"))
+        timed("time range filter + count", lambda: queries.get_paginated_violations(
+            since="2025-01-02T00:00:00Z", until="2025-01-02T01:00:00Z"))
+        timed("latest status, all intersections", queries.get_latest_light_status)
+        timed("latest status, one intersection", lambda: queries.get_light_status("7"))
+        timed("status history, one hour", lambda: queries.get_light_status_history(
+            "7", since="2025-01-02T00:00:00Z", until="2025-01-02T01:00:00Z"))
+        storage.get_pool().close()
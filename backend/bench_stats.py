@@ -0,0 +1,158 @@
+"""Benchmark analytics over a year of history: scans vs rollup tables.
+
+Seeds ``--days`` of light changes (one every ``--phase`` seconds per
+intersection) and violations, each carrying a thumbnail the size the
+listener stores, into a temp database through storage.py, so
+the rollups are maintained as the listener would maintain them. The
+ingest rate is reported with and without the rollup upkeep. Three
+analytics queries over the whole range are then timed: red-time share,
+violations per hour and repeat offenders. Each is run as a scan of the
+history and from the rollups.
+
+    python bench_stats.py                   # a year, 4 intersections
+    python bench_stats.py --days 30 --intersections 20
+"""
+import argparse
+import base64
+import os
+import random
+import tempfile
+import time
+
+import queries
+import rollups
+import storage
+
+BATCH = 500  # messages per listener transaction, as in ingest.IngestPipeline
+REPEAT = 5
+T0 = 1704067200  # 2024-01-01T00:00:00Z
+
+SCAN_LIGHT_SQL = '''
+    SELECT status, SUM(next_t - t) FROM (
+        SELECT status, julianday(timestamp) * 86400 AS t,
+               LEAD(julianday(timestamp) * 86400) OVER (ORDER BY id) AS next_t
+        FROM light_status
+        WHERE intersection_id = ? AND timestamp >= ? AND timestamp < ?
+    ) GROUP BY status
+'''
+SCAN_HOURLY_SQL = '''
+    SELECT substr(timestamp, 1, 13), COUNT(*) FROM violations
+    WHERE timestamp >= ? AND timestamp < ?
+    GROUP BY 1
+'''
+SCAN_OFFENDERS_SQL = '''
+    SELECT plate, COUNT(*) AS total FROM violations
+    WHERE timestamp >= ? AND timestamp < ?
+    GROUP BY plate HAVING total >= 2 ORDER BY total DESC LIMIT 20
+'''
+
+
+def seed(days, intersections, phase, violations_per_day, thumbnail_bytes, rng):
+    """Yield batches of ("status"|"violation", row) in time order."""
+    thumbnail = base64.b64encode(rng.randbytes(thumbnail_bytes * 3 // 4)).decode()
+    batch = []
+    end = T0 + days * 86400
+    violation_gap = 86400 / violations_per_day
+    next_violation = T0
+    t = T0
+    step = 0
+    while t < end:
+        for i in range(intersections):
+            batch.append(("status", (rollups.format_timestamp(t + i), ("Green", "Yellow", "Red")[step % 3], str(i))))
+        while next_violation < t + phase:
+            batch.append(("violation", (rollups.format_timestamp(next_violation), "RED_LIGHT_RUN",
+                                        f"P{rng.randrange(5000):04}", str(rng.randrange(intersections)),
+                                        f"{rng.getrandbits(256):064x}", thumbnail, None, None)))
+            next_violation += violation_gap
+        if len(batch) >= BATCH:
+            yield batch
+            batch = []
+        t += phase
+        step += 1
+    if batch:
+        yield batch
+
+
+def ingest(batches, with_rollups):
+    start = time.perf_counter()
+    messages = 0
+    for batch in batches:
+        statuses = [row for kind, row in batch if kind == "status"]
+        violations = [row for kind, row in batch if kind == "violation"]
+        with storage.transaction() as conn:
+            if with_rollups:
+                storage.insert_light_statuses(conn, statuses)
+                storage.insert_violations(conn, violations)
+            else:
+                conn.executemany(storage.INSERT_LIGHT_STATUS_SQL, statuses)
+                conn.executemany(storage.UPSERT_INTERSECTION_STATE_SQL, statuses)
+                conn.executemany(storage.INSERT_VIOLATION_SQL, violations)
+        messages += len(batch)
+    return messages / (time.perf_counter() - start)
+
+
+def timed(fn):
+    best = float("inf")
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--intersections", type=int, default=4)
+    parser.add_argument("--phase", type=int, default=60, help="seconds between light changes")
+    parser.add_argument("--violations-per-day", type=int, default=500)
+    parser.add_argument("--thumbnail-bytes", type=int, default=4000, help="base64 thumbnail per violation")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Baseline ingest rate into a database without rollup upkeep.
+        storage.DB_FILE = os.path.join(tmp, "plain.db")
+        storage.init_db()
+        plain_days = min(args.days, 30)
+        plain_rate = ingest(seed(plain_days, args.intersections, args.phase,
+                                 args.violations_per_day, args.thumbnail_bytes, random.Random(0)),
+                            with_rollups=False)
+        storage.get_pool().close()
+        storage._pool = None
+
+        storage.DB_FILE = os.path.join(tmp, "traffic.db")
+        storage.init_db()
+        rollup_rate = ingest(seed(args.days, args.intersections, args.phase,
+                                  args.violations_per_day, args.thumbnail_bytes, random.Random(0)),
+                             with_rollups=True)
+        with storage.connection() as conn:
+            statuses = conn.execute("SELECT COUNT(*) FROM light_status").fetchone()[0]
+            violations = conn.execute("SELECT COUNT(*) FROM violations").fetchone()[0]
+            rollup_rows = sum(conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                              for table in ("light_rollup", "violation_rollup", "plate_rollup"))
+        print(f"{statuses} status rows, {violations} violations, {rollup_rows} rollup rows")
+        print(f"ingest: {plain_rate:9.0f} msgs/s plain ({plain_days} days), "
+              f"{rollup_rate:9.0f} msgs/s with rollups")
+
+        since = rollups.format_timestamp(T0)
+        until = rollups.format_timestamp(T0 + args.days * 86400)
+        now = T0 + args.days * 86400
+
+        def scan(sql, *params):
+            with storage.connection() as conn:
+                return conn.execute(sql, params).fetchall()
+
+        cases = [
+            ("red share, 1 intersection",
+             lambda: scan(SCAN_LIGHT_SQL, "0", since, until),
+             lambda: queries.get_light_stats("0", since, until, now=now)),
+            ("violations per hour",
+             lambda: scan(SCAN_HOURLY_SQL, since, until),
+             lambda: queries.get_violation_stats(since, until, bucket="hour")),
+            ("repeat offenders",
+             lambda: scan(SCAN_OFFENDERS_SQL, since, until),
+             lambda: queries.get_repeat_offenders(since, until)),
+        ]
+        print(f"{'query over ' + str(args.days) + ' days':<28} {'scan ms':>10} {'rollup ms':>10}")
+        for name, old, new in cases:
+            print(f"{name:<28} {timed(old):10.1f} {timed(new):10.1f}")
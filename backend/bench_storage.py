@@ -0,0 +1,124 @@
+"""Compare the old connect-per-statement access pattern with the pooled WAL layer.
+
+Each mode gets a fresh database in a temp directory. A writer thread inserts
+light status rows one message at a time (one transaction each, like the
+listener) while a reader thread runs the API's per-intersection status query,
+so the numbers include reader/writer lock contention.
+
+    python bench_storage.py --inserts 2000 --reads 2000
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+import storage
+
+LATEST_STATUS_SQL = '''
+    SELECT status, timestamp
+    FROM light_status
+    WHERE intersection_id = ?
+    ORDER BY id DESC
+    LIMIT 1
+'''
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+class LegacyAccess:
+    """The original pattern: a fresh default connection around every statement."""
+
+    def __init__(self, db_file):
+        self.db_file = db_file
+
+    def insert(self, i):
+        conn = sqlite3.connect(self.db_file)
+        conn.execute(storage.INSERT_LIGHT_STATUS_SQL, (str(i), "Red", str(i % 10)))
+        conn.commit()
+        conn.close()
+
+    def read(self, i):
+        conn = sqlite3.connect(self.db_file)
+        conn.execute(LATEST_STATUS_SQL, (str(i % 10),)).fetchone()
+        conn.close()
+
+
+class PooledAccess:
+    """The storage module: pooled, WAL-mode connections with cached statements."""
+
+    def __init__(self, db_file):
+        self.pool = storage.ConnectionPool(db_file)
+
+    def insert(self, i):
+        conn = self.pool.acquire()
+        try:
+            with conn:
+                storage.insert_light_status(conn, str(i), "Red", str(i % 10))
+        finally:
+            self.pool.release(conn)
+
+    def read(self, i):
+        conn = self.pool.acquire()
+        try:
+            conn.execute(LATEST_STATUS_SQL, (str(i % 10),)).fetchone()
+        finally:
+            self.pool.release(conn)
+
+
+def run(name, access_cls, inserts, reads):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_file = os.path.join(tmp, "bench.db")
+        storage.DB_FILE = db_file
+        storage.init_db()
+        if access_cls is LegacyAccess:
+            # init_db switches the file to WAL; put it back to the default journal.
+            conn = sqlite3.connect(db_file)
+            conn.execute("PRAGMA journal_mode=DELETE")
+            conn.close()
+        access = access_cls(db_file)
+
+        write_time = []
+        latencies = []
+
+        def writer():
+            start = time.perf_counter()
+            for i in range(inserts):
+                access.insert(i)
+            write_time.append(time.perf_counter() - start)
+
+        def reader():
+            for i in range(reads):
+                start = time.perf_counter()
+                access.read(i)
+                latencies.append(time.perf_counter() - start)
+
+        threads = [threading.Thread(target=writer), threading.Thread(target=reader)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        if hasattr(access, "pool"):
+            access.pool.close()
+
+    print(f"{name:>8}: {inserts / write_time[0]:10.0f} inserts/s   "
+          f"read p50 {percentile(latencies, 50) * 1000:7.3f} ms   "
+          f"p99 {percentile(latencies, 99) * 1000:7.3f} ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--inserts", type=int, default=2000)
+    parser.add_argument("--reads", type=int, default=2000)
+    args = parser.parse_args()
+
+    run("legacy", LegacyAccess, args.inserts, args.reads)
+    run("pooled", PooledAccess, args.inserts, args.reads)
@@ -0,0 +1,134 @@
+"""Load test for the /api/stream push endpoint.
+
+Opens ``--clients`` concurrent SSE connections to a running API server, then
+writes ``--events`` light status changes straight into the database the
+server uses and measures how long each change takes to reach every client.
+
+    # terminal 1
+    TRAFFIC_DB_FILE=/tmp/stream_bench.db python flask_server.py
+    # terminal 2
+    TRAFFIC_DB_FILE=/tmp/stream_bench.db python bench_stream.py --clients 1000
+"""
+import argparse
+import json
+import resource
+import selectors
+import socket
+import threading
+import time
+from urllib.parse import urlparse
+
+import storage
+
+BENCH_INTERSECTION = "bench"
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+class Client:
+    def __init__(self, sock):
+        self.sock = sock
+        self.buffer = b""
+        self.received = 0
+
+    def feed(self, data, sent_at, latencies):
+        self.buffer += data
+        while b"\n\n" in self.buffer:
+            message, self.buffer = self.buffer.split(b"\n\n", 1)
+            fields = dict(line.split(": ", 1) for line in message.decode().split("\n")
+                          if ": " in line and not line.startswith(":"))
+            if fields.get("event") != "light":
+                continue
+            light = json.loads(fields["data"])
+            if light.get("intersection_id") != BENCH_INTERSECTION:
+                continue
+            start = sent_at.get(light["timestamp"])
+            if start is not None:
+                latencies.append(time.perf_counter() - start)
+                self.received += 1
+
+
+def open_clients(url, count):
+    parsed = urlparse(url)
+    request = (f"GET {parsed.path or '/'} HTTP/1.0\r\nHost: {parsed.netloc}\r\n"
+               f"Accept: text/event-stream\r\n\r\n").encode()
+    clients = []
+    for _ in range(count):
+        sock = socket.create_connection((parsed.hostname, parsed.port or 80))
+        sock.sendall(request)
+        sock.setblocking(False)
+        clients.append(Client(sock))
+    return clients
+
+
+def write_events(count, interval, sent_at):
+    statuses = ["Red", "Green"]
+    for i in range(count):
+        time.sleep(interval)
+        marker = f"bench-{i}"
+        sent_at[marker] = time.perf_counter()
+        with storage.transaction() as conn:
+            storage.insert_light_status(conn, marker, statuses[i % 2], BENCH_INTERSECTION)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:5000/api/stream")
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--events", type=int, default=20)
+    parser.add_argument("--interval", type=float, default=0.5)
+    parser.add_argument("--settle", type=float, default=5.0,
+                        help="seconds to keep reading after the last event")
+    args = parser.parse_args()
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (min(hard, max(soft, args.clients + 100)), hard))
+
+    storage.init_db()
+    start = time.perf_counter()
+    clients = open_clients(args.url, args.clients)
+    print(f"Connected {len(clients)} clients in {time.perf_counter() - start:.2f} s")
+    time.sleep(1.0)  # let every subscription register before the first event
+
+    selector = selectors.DefaultSelector()
+    for client in clients:
+        selector.register(client.sock, selectors.EVENT_READ, client)
+
+    sent_at = {}
+    latencies = []
+    writer = threading.Thread(target=write_events, args=(args.events, args.interval, sent_at))
+    writer.start()
+
+    closed = 0
+    deadline = None
+    while True:
+        if deadline is None and not writer.is_alive():
+            deadline = time.monotonic() + args.settle
+        if deadline is not None and time.monotonic() > deadline:
+            break
+        for key, _ in selector.select(timeout=0.1):
+            client = key.data
+            try:
+                data = client.sock.recv(65536)
+            except BlockingIOError:
+                continue
+            if not data:
+                selector.unregister(client.sock)
+                closed += 1
+                continue
+            client.feed(data, sent_at, latencies)
+
+    expected = args.events * len(clients)
+    complete = sum(1 for c in clients if c.received == args.events)
+    print(f"Delivered {len(latencies)} / {expected} events "
+          f"({complete} / {len(clients)} clients got all {args.events}); {closed} closed early")
+    print(f"Latency p50 {percentile(latencies, 50) * 1000:.1f} ms  "
+          f"p99 {percentile(latencies, 99) * 1000:.1f} ms  "
+          f"max {max(latencies, default=0) * 1000:.1f} ms")
+    for client in clients:
+        client.sock.close()
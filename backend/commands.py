@@ -0,0 +1,54 @@
+from datetime import datetime
+
+import queries
+
+MQTT_BROKER = "mqtt-dashboard.com"
+MQTT_PORT = 1883
+
+# How long (seconds) a manual command holds before the light returns to auto.
+COMMAND_TIMEOUTS = {
+    "Red": 30,
+    "Green": 30,
+    "Yellow": 10,
+    "Auto": 1
+}
+
+
+def command_topic(intersection_id):
+    return f"traffic_light/{intersection_id}/command"
+
+
+def build_command(command):
+    """Return the MQTT payload for an admin command, or None if it is invalid."""
+    if command not in COMMAND_TIMEOUTS:
+        return None
+    return {
+        "command": command,
+        "timeout": COMMAND_TIMEOUTS[command],
+        "timestamp": datetime.utcnow().isoformat() + "Z",
+        "source": "admin_panel"
+    }
+
+
+def valid_intersection_id(intersection_id):
+    """An id must be one non-empty MQTT topic level, without wildcards."""
+    return bool(intersection_id) and not any(c in intersection_id for c in "+#/\0")
+
+
+def resolve_targets(data):
+    """Return the intersection ids an /api/control request is aimed at, or
+    None if there are none or any of them is invalid.
+
+    Accepts ``intersection_id`` (one), ``intersection_ids`` (a list) or
+    ``intersection_ids: "all"`` for every intersection that has reported.
+    """
+    ids = data.get("intersection_ids")
+    if ids == "all":
+        targets = [light["intersection_id"] for light in queries.get_latest_light_status()]
+    elif isinstance(ids, list):
+        targets = [str(i) for i in ids]
+    else:
+        targets = [str(data.get("intersection_id", "0"))]
+    if not targets or not all(valid_intersection_id(i) for i in targets):
+        return None
+    return targets
@@ -0,0 +1,241 @@
+"""Fan out listener events to Server-Sent Events clients.
+
+The listener appends light changes and new violations to the ``events``
+table (see storage._migrate_5). One poller thread in the API process reads
+new rows and copies them into every subscriber's bounded buffer, so the
+database is read once per change no matter how many dashboards are open.
+
+Event ids are the ``events`` row ids, so a client reconnecting with
+``Last-Event-ID`` resumes exactly where it left off. A subscriber that falls
+more than ``client_buffer`` events behind stops receiving pushes and catches
+up from the table instead.
+"""
+import asyncio
+import json
+import threading
+import time
+from collections import deque
+
+import queries
+import storage
+
+EVENTS_AFTER_SQL = '''
+    SELECT id, kind, payload, created
+    FROM events
+    WHERE id > ?
+    ORDER BY id
+    LIMIT ?
+'''
+FIRST_EVENT_SQL = "SELECT MIN(id) FROM events"
+LAST_EVENT_SQL = "SELECT MAX(id) FROM events"
+
+
+def format_event(event_id, kind, data):
+    """Encode one SSE message. ``data`` is a JSON string."""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {kind}")
+    lines.append(f"data: {data}")
+    return ("\n".join(lines) + "\n\n").encode("utf-8")
+
+
+class Subscription:
+    def __init__(self, broadcaster, last_id, size):
+        self.broadcaster = broadcaster
+        self.last_id = last_id
+        self.buffer = deque()
+        self.size = size
+        self.overflowed = False
+        self.cond = threading.Condition()
+        self.on_push = None  # set by async readers that can't block on cond
+
+    def push(self, rows):
+        with self.cond:
+            if self.overflowed:
+                return
+            for row in rows:
+                if row[0] <= self.last_id:
+                    continue
+                if len(self.buffer) >= self.size:
+                    # Too slow: drop the buffer and let the reader catch up
+                    # from the events table at its own pace.
+                    self.buffer.clear()
+                    self.overflowed = True
+                    self.broadcaster.overflows += 1
+                    break
+                self.buffer.append(row)
+            self.cond.notify()
+        if self.on_push is not None:
+            self.on_push()
+
+    def get(self, timeout):
+        """Return the next batch of ``(id, kind, payload, created)`` rows.
+
+        Returns an empty list after ``timeout`` seconds without events.
+        """
+        rows = self.take(timeout)
+        return self.catch_up() if rows is None else rows
+
+    def take(self, timeout=0):
+        """Return the buffered rows, or None if the reader must ``catch_up``.
+
+        Never touches the database, so async readers can call it on the
+        event loop.
+        """
+        with self.cond:
+            if not self.buffer and not self.overflowed:
+                self.cond.wait(timeout)
+            if self.overflowed:
+                self.overflowed = False
+                return None
+            # Rows pushed while a catch-up read was running may repeat it.
+            rows = [row for row in self.buffer if row[0] > self.last_id]
+            self.buffer.clear()
+        if rows:
+            self.last_id = rows[-1][0]
+        return rows
+
+    def catch_up(self):
+        """Read the next rows from the events table after an overflow."""
+        rows = self.broadcaster.read_events(self.last_id, self.size)
+        if len(rows) == self.size:
+            # Still behind; keep reading from the table on the next call.
+            with self.cond:
+                self.overflowed = True
+        if rows:
+            self.last_id = rows[-1][0]
+        return rows
+
+
+class EventBroadcaster:
+    def __init__(self, poll_interval=0.05, client_buffer=256, batch_size=500):
+        self.poll_interval = poll_interval
+        self.client_buffer = client_buffer
+        self.batch_size = batch_size
+        self.subscribers = set()
+        self.lock = threading.Lock()
+        self.last_id = 0
+        self.overflows = 0
+        self.delivered = 0
+        self.thread = None
+
+    def start(self):
+        if self.thread is None:
+            with storage.connection() as conn:
+                self.last_id = conn.execute(LAST_EVENT_SQL).fetchone()[0] or 0
+            self.thread = threading.Thread(target=self._run, name="event-poller", daemon=True)
+            self.thread.start()
+        return self
+
+    def read_events(self, after_id, limit):
+        with storage.connection() as conn:
+            return conn.execute(EVENTS_AFTER_SQL, (after_id, limit)).fetchall()
+
+    def subscribe(self, last_event_id=None):
+        """Register a client.
+
+        Returns ``(subscription, reset)``. ``reset`` is True when the client
+        has no usable position (new client, or its last event was already
+        pruned) and should be sent a full snapshot first.
+        """
+        resume = False
+        if last_event_id is not None:
+            with storage.connection() as conn:
+                first_id = conn.execute(FIRST_EVENT_SQL).fetchone()[0]
+            resume = first_id is not None and last_event_id >= first_id - 1
+
+        # Under the lock the poller is not between reading new rows and
+        # pushing them, so the starting position cannot miss a batch.
+        with self.lock:
+            sub = Subscription(self, last_event_id if resume else self.last_id, self.client_buffer)
+            if resume and sub.last_id < self.last_id:
+                sub.overflowed = True  # replay the gap from the table
+            self.subscribers.add(sub)
+        return sub, not resume
+
+    def unsubscribe(self, sub):
+        with self.lock:
+            self.subscribers.discard(sub)
+
+    def stats(self):
+        with self.lock:
+            clients = len(self.subscribers)
+        return {
+            "clients": clients,
+            "last_event_id": self.last_id,
+            "delivered": self.delivered,
+            "overflows": self.overflows,
+        }
+
+    def _run(self):
+        # A private connection: PRAGMA data_version only changes when another
+        # connection commits, which makes "anything new?" a cheap check.
+        conn = storage.connect()
+        data_version = None
+        while True:
+            try:
+                version = conn.execute("PRAGMA data_version").fetchone()[0]
+                if version != data_version:
+                    data_version = version
+                    while True:
+                        rows = conn.execute(EVENTS_AFTER_SQL, (self.last_id, self.batch_size)).fetchall()
+                        if not rows:
+                            break
+                        with self.lock:
+                            self.last_id = rows[-1][0]
+                            for sub in self.subscribers:
+                                sub.push(rows)
+                            self.delivered += len(rows) * len(self.subscribers)
+            except Exception as e:
+                print("[ERROR] Event poller failed:", e)
+            time.sleep(self.poll_interval)
+
+    def stream(self, last_event_id=None, heartbeat=15.0):
+        """Generator of SSE-encoded bytes for one client."""
+        sub, reset = self.subscribe(last_event_id)
+        try:
+            yield b"retry: 3000\n\n"
+            if reset:
+                snapshot = json.dumps({"lights": queries.get_latest_light_status()})
+                yield format_event(sub.last_id, "snapshot", snapshot)
+            while True:
+                rows = sub.get(heartbeat)
+                if not rows:
+                    yield b": keep-alive\n\n"
+                    continue
+                yield b"".join(format_event(row[0], row[1], row[2]) for row in rows)
+        finally:
+            self.unsubscribe(sub)
+
+    async def astream(self, last_event_id=None, heartbeat=15.0):
+        """Async generator version of ``stream`` for ASGI servers.
+
+        Waiting clients cost an asyncio.Event each rather than a thread.
+        Reads from the database (resume check, snapshot, catch-up after an
+        overflow) run in worker threads.
+        """
+        loop = asyncio.get_running_loop()
+        wakeup = asyncio.Event()
+        sub, reset = await asyncio.to_thread(self.subscribe, last_event_id)
+        sub.on_push = lambda: loop.call_soon_threadsafe(wakeup.set)
+        try:
+            yield b"retry: 3000\n\n"
+            if reset:
+                lights = await asyncio.to_thread(queries.get_latest_light_status)
+                yield format_event(sub.last_id, "snapshot", json.dumps({"lights": lights}))
+            while True:
+                # Clear before reading so a push in between still wakes us.
+                wakeup.clear()
+                rows = sub.take()
+                if rows is None:
+                    rows = await asyncio.to_thread(sub.catch_up)
+                if rows:
+                    yield b"".join(format_event(row[0], row[1], row[2]) for row in rows)
+                    continue
+                try:
+                    await asyncio.wait_for(wakeup.wait(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield b": keep-alive\n\n"
+        finally:
+            self.unsubscribe(sub)
@@ -1,98 +1,67 @@
-from flask import Flask, jsonify, request
+from flask import Flask, Response, g, jsonify, request, send_file, abort
 from flask_cors import CORS
-import sqlite3
 import os
-from datetime import datetime
+import io
+import base64
 import json
-import paho.mqtt.publish as publish
+import sys
+import time
+from concurrent.futures import TimeoutError
+
+import commands
+import image_store
+import queries
+import storage
+from event_stream import EventBroadcaster
+from mqtt_publisher import MqttPublisher, PublishQueueFull
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common import metrics  # noqa: E402
+
 app = Flask(__name__)
 CORS(app)  
 
-DB_FILE = os.path.join(os.path.dirname(__file__), "traffic_data.db")
 print("--------------------------------------")
-print("[DEBUG] Using DB file:", os.path.abspath(DB_FILE))
-
-def get_latest_light_status():
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-
-    cursor.execute('''
-        SELECT intersection_id, status, timestamp
-        FROM light_status
-        WHERE id IN (
-            SELECT MAX(id) FROM light_status GROUP BY intersection_id
-        )
-    ''')
-    rows = cursor.fetchall()
-    conn.close()
-
-    result = []
-    for row in rows:
-        result.append({
-            "intersection_id": row[0],
-            "status": row[1],   # e.g., "RED", "GREEN", "YELLOW"
-            "timestamp": row[2]
-        })
-
-    return result
-
-def get_paginated_violations(page=1, limit=6):
-    offset = (page - 1) * limit
-
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-
-    cursor.execute("SELECT COUNT(*) FROM violations")
-    total = cursor.fetchone()[0]
-
-    cursor.execute('''
-        SELECT id, timestamp, type, plate, location, image_base64
-        FROM violations
-        ORDER BY id DESC
-        LIMIT ? OFFSET ?
-    ''', (limit, offset))
-    rows = cursor.fetchall()
-    conn.close()
-
-    result = []
-    for row in rows:
-        result.append({
-            "id": row[0],
-            "timestamp": row[1],
-            "type": row[2],
-            "plate": row[3],
-            "location": row[4],
-            "image": row[5]
-        })
-
-    return {
-        "total": total,
-        "page": page,
-        "limit": limit,
-        "data": result
-    }
+print("[DEBUG] Using DB file:", os.path.abspath(storage.DB_FILE))
+storage.init_db()
+
+IMAGE_MAX_AGE = 365 * 24 * 3600  # seconds
+
+# One poller thread feeds every /api/stream client.
+broadcaster = EventBroadcaster().start()
+
+# One persistent broker connection for every /api/control request.
+publisher = MqttPublisher().start()
+ACK_TIMEOUT = 5.0  # seconds
+
+REQUEST_SECONDS = metrics.histogram("api_request_seconds", "Time to the response headers, by route",
+                                    ("method", "route", "status"))
+metrics.REGISTRY.collect("api_stream", broadcaster.stats, counters=("delivered", "overflows"))
+metrics.REGISTRY.collect("api_mqtt", publisher.stats,
+                         counters=("published", "acked", "rejected", "expired", "reconnects"))
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def observe_request(response):
+    # The rule is the route template, so ids do not create new series.
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    REQUEST_SECONDS.labels(request.method, route, response.status_code).observe(
+        time.perf_counter() - g.request_start)
+    return response
+
+@app.route('/metrics')
+def prometheus_metrics():
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
 
 @app.route('/api/light_status/<intersection_id>')
 def api_light_status(intersection_id):
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-
-    cursor.execute('''
-        SELECT status, timestamp
-        FROM light_status
-        WHERE intersection_id = ?
-        ORDER BY id DESC
-        LIMIT 1
-    ''', (intersection_id,))
-    row = cursor.fetchone()
-    conn.close()
-
-    if row:
-        return jsonify({
-            "intersection_id": intersection_id,
-            "status": row[0],
-            "timestamp": row[1]
-        })
+    status = queries.get_light_status(intersection_id)
+
+    if status:
+        return jsonify(status)
     else:
         return jsonify({
             "intersection_id": intersection_id,
@@ -100,6 +69,50 @@ def api_light_status(intersection_id):
             "timestamp": None
         }), 404
 
+@app.route('/api/light_status/<intersection_id>/history')
+def api_light_status_history(intersection_id):
+    try:
+        limit = int(request.args.get('limit', 100))
+    except ValueError:
+        limit = 100
+
+    data = queries.get_light_status_history(
+        intersection_id,
+        since=request.args.get('since'),
+        until=request.args.get('until'),
+        limit=limit,
+        after_id=request.args.get('after_id', type=int)
+    )
+    return jsonify(data)
+
+@app.route('/api/violations/<int:violation_id>/image')
+def api_violation_image(violation_id):
+    row = queries.get_violation_image(violation_id)
+
+    if not row or not (row[0] or row[1]):
+        abort(404)
+
+    image_hash, image_base64 = row
+    if image_hash:
+        path = image_store.image_path(image_hash)
+        if not os.path.exists(path):
+            abort(404)
+        # Content-addressed files never change, so they can be cached forever.
+        # conditional=True adds If-None-Match/304 and Range (206) handling.
+        response = send_file(path, mimetype="image/jpeg", conditional=True,
+                             etag=image_hash, max_age=IMAGE_MAX_AGE)
+    else:
+        # Rows written before the image store still carry the image inline.
+        try:
+            image_bytes = base64.b64decode(image_base64)
+        except ValueError:
+            abort(404)  # corrupt: there is no image to serve
+        response = send_file(io.BytesIO(image_bytes),
+                             mimetype="image/jpeg", conditional=True,
+                             etag=f"legacy-{violation_id}", max_age=IMAGE_MAX_AGE)
+    response.headers["Cache-Control"] = f"public, max-age={IMAGE_MAX_AGE}, immutable"
+    return response
+
 @app.route('/api/violations')
 def api_violations():
     try:
@@ -109,57 +122,119 @@ def api_violations():
         page = 1
         limit = 6
 
-    data = get_paginated_violations(page, limit)
+    # Invalid values are ignored (type=int returns None).
+    after_id = request.args.get('after_id', type=int)
+
+    data = queries.get_paginated_violations(
+        page,
+        limit,
+        after_id=after_id,
+        plate=request.args.get('plate'),
+        intersection_id=request.args.get('intersection_id'),
+        since=request.args.get('since'),
+        until=request.args.get('until')
+    )
     return jsonify(data)
 
+def stats_response(build, *args, **kwargs):
+    try:
+        return jsonify(build(*args, **kwargs))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+@app.route('/api/stats/lights/<intersection_id>')
+def api_light_stats(intersection_id):
+    return stats_response(queries.get_light_stats, intersection_id,
+                          since=request.args.get('since'), until=request.args.get('until'))
+
+@app.route('/api/stats/violations')
+def api_violation_stats():
+    return stats_response(queries.get_violation_stats,
+                          since=request.args.get('since'),
+                          until=request.args.get('until'),
+                          intersection_id=request.args.get('intersection_id'),
+                          bucket=request.args.get('bucket', 'hour'))
+
+@app.route('/api/stats/plates')
+def api_plate_stats():
+    return stats_response(queries.get_repeat_offenders,
+                          since=request.args.get('since'),
+                          until=request.args.get('until'),
+                          intersection_id=request.args.get('intersection_id'),
+                          min_count=request.args.get('min_count', 2, type=int),
+                          limit=request.args.get('limit', 20, type=int))
+
 @app.route('/api/lights')
 def api_lights():
-    data = get_latest_light_status()
+    data = queries.get_latest_light_status()
     return jsonify({
         "total": len(data),
         "data": data
     })
 
+@app.route('/api/stream')
+def api_stream():
+    # Browsers resend the last id they saw in Last-Event-ID when reconnecting.
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+
+    return Response(
+        broadcaster.stream(last_event_id),
+        mimetype='text/event-stream',
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"  # don't let a reverse proxy buffer the stream
+        }
+    )
+
 @app.route('/api/control', methods=['POST'])
 def api_control():
     data = request.json
     command = data.get('command')
-    intersection_id = data.get('intersection_id', '0')  
+    targets = commands.resolve_targets(data)
 
-    timeouts = {
-        "Red": 30,
-        "Green": 30,
-        "Yellow": 10,
-        "Auto": 1  
-    }
-
-    if command not in timeouts:
+    payload = commands.build_command(command)
+    if payload is None:
         return jsonify({"error": "Invalid command"}), 400
-
-    #real_command = "Green" if command == "Auto" else command
-    timeout = timeouts[command]
-
-    payload = {
-        #"command": real_command,
-        "command": command,
-        "timeout": timeout,
-        "timestamp": datetime.utcnow().isoformat() + "Z",
-        "source": "admin_panel"
-    }
-
-    topic = f"traffic_light/{intersection_id}/command"
-
+    if targets is None:
+        return jsonify({"error": "Invalid or no intersection ids"}), 400
+
+    # No ack can arrive while the broker is down, and publish_many rejects
+    # the batch up front if the queue cannot hold all of it.
+    wait_for_ack = data.get('wait_for_ack', True)
+    if wait_for_ack and not publisher.connected.is_set():
+        return jsonify({"error": "MQTT broker not connected"}), 503
+    # Publish to every target first, then wait for the acks together.
+    message = json.dumps(payload)
     try:
-        publish.single(
-            topic,
-            payload=json.dumps(payload),
-            hostname="mqtt-dashboard.com",
-            port=1883
-        )
-        return jsonify({"success": True, "sent": payload})
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        futures = dict(zip(targets, publisher.publish_many(
+            [(commands.command_topic(intersection_id), message) for intersection_id in targets])))
+    except PublishQueueFull as e:
+        return jsonify({"error": str(e)}), 503
+
+    if not wait_for_ack:
+        return jsonify({"success": True, "sent": payload, "queued": targets}), 202
+
+    results = {}
+    for intersection_id, future in futures.items():
+        try:
+            future.result(timeout=ACK_TIMEOUT)
+            results[intersection_id] = "acked"
+        except TimeoutError:
+            publisher.expire(future)
+            results[intersection_id] = "error: ack timeout"
+        except Exception as e:
+            results[intersection_id] = f"error: {str(e) or 'ack timeout'}"
+
+    success = all(result == "acked" for result in results.values())
+    return jsonify({"success": success, "sent": payload, "results": results}), 200 if success else 504
 
 if __name__ == '__main__':
     print("[Flask] Running on http://localhost:5000")
-    app.run(debug=True)
+    # threaded: each open /api/stream holds a worker thread. No debug mode:
+    # its reloader imports this module twice, which would open a second
+    # broker connection and event poller.
+    app.run(threaded=True)
@@ -0,0 +1,66 @@
+import base64
+import hashlib
+import io
+import os
+
+try:
+    from PIL import Image
+except ImportError:  # Thumbnails are optional; the full image is always stored.
+    Image = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+IMAGE_DIR = os.environ.get("TRAFFIC_IMAGE_DIR", os.path.join(BASE_DIR, "images"))
+
+THUMBNAIL_SIZE = (160, 120)
+THUMBNAIL_QUALITY = 60
+
+
+def image_path(digest):
+    """Return the on-disk path of an image, fanned out by the first hash byte."""
+    return os.path.join(IMAGE_DIR, digest[:2], digest + ".jpg")
+
+
+def save_image(image_bytes):
+    """Store raw JPEG bytes under their SHA-256 and return the hex digest.
+
+    Identical images are written only once, so repeated reports of the same
+    frame share a single file.
+    """
+    digest = hashlib.sha256(image_bytes).hexdigest()
+    path = image_path(digest)
+    if os.path.exists(path):
+        return digest
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(image_bytes)
+    os.replace(tmp_path, path)  # rename to ensure atomic write
+    return digest
+
+
+def save_image_base64(image_base64):
+    """Decode a base64 image once at ingest and store it.
+
+    Returns ``(digest, image_bytes)`` or ``(None, None)`` if there is no image.
+    """
+    if not image_base64:
+        return None, None
+    image_bytes = base64.b64decode(image_base64)
+    return save_image(image_bytes), image_bytes
+
+
+def make_thumbnail(image_bytes):
+    """Return a small base64 JPEG preview, or None if Pillow is unavailable."""
+    if Image is None or not image_bytes:
+        return None
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as img:
+            img = img.convert("RGB")
+            img.thumbnail(THUMBNAIL_SIZE)
+            out = io.BytesIO()
+            img.save(out, format="JPEG", quality=THUMBNAIL_QUALITY)
+        return base64.b64encode(out.getvalue()).decode("utf-8")
+    except Exception as e:
+        print("[ERROR] Failed to build thumbnail:", e)
+        return None
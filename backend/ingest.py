@@ -0,0 +1,188 @@
+"""Bounded queue + group-commit writer for incoming MQTT messages.
+
+The paho network thread only enqueues the raw message; a single writer thread
+collects messages into batches and hands each batch to ``write_batch``, which
+is expected to store it in one transaction. A batch is flushed when it holds
+``batch_size`` messages or when its oldest message has waited
+``flush_interval`` seconds, whichever comes first.
+
+If a batch fails, its messages are retried one per transaction, so a
+single bad message costs only itself and not the rest of its batch.
+"""
+import threading
+import time
+from queue import Queue, Empty, Full
+
+_STOP = object()
+
+
+class IngestPipeline:
+    def __init__(self, write_batch, max_queue=10000, batch_size=500,
+                 flush_interval=0.05, put_timeout=1.0, report_interval=30.0):
+        self.write_batch = write_batch
+        self.queue = Queue(maxsize=max_queue)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.report_interval = report_interval
+
+        self.lock = threading.Lock()
+        self.accepted = 0
+        self.dropped = 0
+        self.failed = 0
+        self.retried_batches = 0
+        self.max_depth = 0
+        self.flushes = 0
+        self.flushed_messages = 0
+        self.last_flush_size = 0
+        self.max_flush_size = 0
+        self.last_flush_latency = 0.0
+        self.max_flush_latency = 0.0
+        self.total_flush_latency = 0.0
+
+        self.thread = threading.Thread(target=self._run, name="ingest-writer", daemon=True)
+        # Held across the stopped check and the put, so that once stop() has
+        # set stopped every accepted message is already ahead of _STOP.
+        self.submit_lock = threading.Lock()
+        self.stopped = False
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def submit(self, topic, payload):
+        """Queue one message. Returns False if it had to be dropped.
+
+        When the queue is full this blocks the caller (the MQTT network loop)
+        for up to ``put_timeout`` seconds, which pushes back on the broker via
+        TCP flow control before anything is discarded.
+        """
+        with self.submit_lock:
+            if self.stopped:
+                return False
+            try:
+                self.queue.put((topic, payload), timeout=self.put_timeout)
+            except Full:
+                with self.lock:
+                    self.dropped += 1
+                return False
+        depth = self.queue.qsize()
+        with self.lock:
+            self.accepted += 1
+            if depth > self.max_depth:
+                self.max_depth = depth
+        return True
+
+    def stop(self, timeout=None):
+        """Stop accepting messages and wait until everything queued is written."""
+        with self.submit_lock:
+            self.stopped = True
+        self.queue.put(_STOP)
+        self.thread.join(timeout)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "queue_depth": self.queue.qsize(),
+                "max_queue_depth": self.max_depth,
+                "accepted": self.accepted,
+                "dropped": self.dropped,
+                "failed": self.failed,
+                "retried_batches": self.retried_batches,
+                "flushes": self.flushes,
+                "flushed_messages": self.flushed_messages,
+                "last_flush_size": self.last_flush_size,
+                "max_flush_size": self.max_flush_size,
+                "avg_flush_size": self.flushed_messages / self.flushes if self.flushes else 0.0,
+                "last_flush_ms": self.last_flush_latency * 1000,
+                "max_flush_ms": self.max_flush_latency * 1000,
+                "avg_flush_ms": self.total_flush_latency / self.flushes * 1000 if self.flushes else 0.0,
+            }
+
+    def _flush(self, batch):
+        start = time.perf_counter()
+        written = len(batch)
+        try:
+            self.write_batch(batch)
+        except Exception as e:
+            print(f"[ERROR] Failed to write batch of {len(batch)}:", e)
+            if len(batch) == 1:
+                with self.lock:
+                    self.failed += 1
+                return
+            written = self._write_one_by_one(batch)
+        latency = time.perf_counter() - start
+        with self.lock:
+            self.flushes += 1
+            self.flushed_messages += written
+            self.last_flush_size = len(batch)
+            self.max_flush_size = max(self.max_flush_size, len(batch))
+            self.last_flush_latency = latency
+            self.max_flush_latency = max(self.max_flush_latency, latency)
+            self.total_flush_latency += latency
+
+    def _write_one_by_one(self, batch):
+        """Retry a failed batch a message at a time; returns how many were written."""
+        written = 0
+        for message in batch:
+            try:
+                self.write_batch([message])
+                written += 1
+            except Exception as e:
+                print(f"[ERROR] Dropped message on {message[0]}:", e)
+                with self.lock:
+                    self.failed += 1
+        with self.lock:
+            self.retried_batches += 1
+        return written
+
+    def _run(self):
+        next_report = time.monotonic() + self.report_interval
+        stopping = False
+        while not stopping:
+            # Block for the first message of a batch, then gather more until
+            # the batch is full or its deadline passes.
+            try:
+                item = self.queue.get(timeout=self.report_interval)
+            except Empty:
+                item = None
+            batch = []
+            if item is _STOP:
+                stopping = True
+            elif item is not None:
+                batch.append(item)
+                deadline = time.monotonic() + self.flush_interval
+                while len(batch) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        item = self.queue.get(timeout=remaining)
+                    except Empty:
+                        break
+                    if item is _STOP:
+                        stopping = True
+                        break
+                    batch.append(item)
+
+            if stopping:
+                # Drain whatever was accepted before stop() was called.
+                while True:
+                    try:
+                        item = self.queue.get_nowait()
+                    except Empty:
+                        break
+                    if item is not _STOP:
+                        batch.append(item)
+
+            for i in range(0, len(batch), self.batch_size):
+                self._flush(batch[i:i + self.batch_size])
+
+            now = time.monotonic()
+            if now >= next_report or stopping:
+                next_report = now + self.report_interval
+                s = self.stats()
+                print(f"[INGEST] depth={s['queue_depth']} (max {s['max_queue_depth']}) "
+                      f"accepted={s['accepted']} dropped={s['dropped']} failed={s['failed']} "
+                      f"flushes={s['flushes']} avg_size={s['avg_flush_size']:.1f} "
+                      f"avg={s['avg_flush_ms']:.2f}ms max={s['max_flush_ms']:.2f}ms")
@@ -0,0 +1,479 @@
+"""Load-test harness: a simulated fleet against the listener, DB and API.
+
+Emulates ``--intersections`` controllers and detectors. Each intersection's
+light cycles Green/Yellow/Red, one status message per phase
+(``--status-interval`` seconds), and its detector reports
+``--violations-per-hour`` violations carrying a ``--image-bytes`` JPEG in
+the sv1 format the listener negotiates. Messages use the real topics:
+
+- ``--transport mqtt``: ``--connections`` paho clients publish at QoS 1
+  to a local broker, with mqtt_listener.py running as a subprocess.
+- ``--transport direct``: messages go straight into an in-process
+  IngestPipeline and mqtt_listener.write_batch, as on_message would hand
+  them over. No broker is needed, and it isolates the ingest and DB path.
+
+While the fleet publishes, API clients hit the dashboard's hot endpoints.
+``--api asgi|flask`` starts that server on the same DB, and ``--api
+queries`` calls the query functions in-process. A poller reads new rows to
+measure ingest lag: from a message's timestamp to its row being readable.
+The report covers:
+
+- ingest lag percentiles
+- stored vs published, that is, dropped messages
+- DB and image store growth
+- API latency percentiles
+- whether the fleet kept to its schedule
+
+Everything runs against a temporary DB and image store.
+
+    # with a broker (e.g. mosquitto) on localhost:1883
+    python loadsim.py --intersections 2000 --duration 60 --api asgi
+    python loadsim.py --transport direct --api queries --intersections 5000
+"""
+import argparse
+import heapq
+import http.client
+import json
+import os
+import random
+import re
+import signal
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+
+import bench_api
+import image_store
+import queries
+import rollups
+import storage
+from ingest import IngestPipeline
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common import violation_codec  # noqa: E402
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+STATES = ("Green", "Yellow", "Red")
+API_PATHS = bench_api.ENDPOINTS + ["/api/stats/violations"]
+API_PORT = 5000
+
+# In-process equivalents of API_PATHS for --api queries.
+QUERY_CALLS = {
+    "/api/lights": queries.get_latest_light_status,
+    "/api/light_status/0": lambda: queries.get_light_status("0"),
+    "/api/violations?page=1&limit=6": lambda: queries.get_paginated_violations(page=1, limit=6),
+    "/api/stats/violations": queries.get_violation_stats,
+}
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def timestamp(epoch):
+    """ISO 8601 with microseconds, so the lag can be read back from the row."""
+    return datetime.fromtimestamp(epoch, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def make_jpeg(size, rng):
+    """A JPEG of at least ``size`` bytes.
+
+    With Pillow it is a real 640x480 image, so the listener's thumbnailing
+    costs what it does in production. Without it, the body is random bytes
+    between the JPEG markers. A listener that has Pillow will log a
+    thumbnail error for each of those.
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        return b"\xff\xd8" + rng.randbytes(max(0, size - 4)) + b"\xff\xd9"
+    import io
+    out = io.BytesIO()
+    Image.effect_noise((640, 480), 48).convert("RGB").save(out, format="JPEG", quality=75)
+    return out.getvalue()
+
+
+def with_comment(jpeg, comment, size):
+    """Insert COM segments after SOI: ``comment``, then padding up to ``size`` bytes.
+
+    The comment makes every image unique, so the content-addressed image
+    store writes one file per violation, as it would for real frames.
+    """
+    segments = [comment]
+    padding = size - len(jpeg) - len(comment) - 4
+    while padding > 0:
+        chunk = min(padding, 65533 - 4)
+        segments.append(b"\x00" * chunk)
+        padding -= chunk + 4
+    header = b"".join(b"\xff\xfe" + struct.pack(">H", len(s) + 2) + s for s in segments)
+    return jpeg[:2] + header + jpeg[2:]
+
+
+class Fleet:
+    """Deterministic schedule and payloads for the simulated devices.
+
+    Statuses are staggered across the phase so they arrive evenly;
+    violations are a Poisson process per intersection.
+    """
+
+    def __init__(self, intersections, status_interval=5.0, violations_per_hour=30.0,
+                 image_bytes=60000, fmt=violation_codec.FORMAT_BINARY, seed=0):
+        self.intersections = intersections
+        self.status_interval = status_interval
+        self.violation_rate = violations_per_hour / 3600
+        self.image_bytes = image_bytes
+        self.fmt = fmt
+        self.rng = random.Random(seed)
+        self.jpeg = make_jpeg(min(image_bytes, 60000), self.rng)
+        self.phase = [i % len(STATES) for i in range(intersections)]
+        self.seq = 0
+
+    def events(self, duration):
+        """Yield (offset seconds, kind, intersection_id) in time order."""
+        heap = []
+        for i in range(self.intersections):
+            heap.append((i / self.intersections * self.status_interval, 0, i))
+            if self.violation_rate > 0:
+                heap.append((self.rng.expovariate(self.violation_rate), 1, i))
+        heapq.heapify(heap)
+        while heap and heap[0][0] < duration:
+            at, kind, i = heap[0]
+            if kind == 0:
+                heapq.heapreplace(heap, (at + self.status_interval, 0, i))
+                yield at, "status", str(i)
+            else:
+                heapq.heapreplace(heap, (at + self.rng.expovariate(self.violation_rate), 1, i))
+                yield at, "violation", str(i)
+
+    def status(self, intersection_id, now):
+        i = int(intersection_id)
+        self.phase[i] = (self.phase[i] + 1) % len(STATES)
+        payload = {"timestamp": timestamp(now), "status": STATES[self.phase[i]],
+                   "intersection_id": intersection_id}
+        return f"traffic_light/{intersection_id}/status", json.dumps(payload).encode()
+
+    def violation(self, intersection_id, now):
+        self.seq += 1
+        image = with_comment(self.jpeg, f"loadsim {self.seq}".encode(), self.image_bytes)
+        payload = violation_codec.encode({
+            "timestamp": timestamp(now),
+            "plate": f"LS{self.seq:06d}",
+            "intersection_id": intersection_id,
+            "violation_type": "RED_LIGHT_RUN",
+            "confidence": 0.9,
+            "image_bytes": image,
+        }, self.fmt)
+        return f"traffic_violation/{intersection_id}/detected", payload
+
+    def message(self, kind, intersection_id, now):
+        if kind == "status":
+            return self.status(intersection_id, now)
+        return self.violation(intersection_id, now)
+
+
+class DirectTransport:
+    """Hands messages to an in-process IngestPipeline, like the listener's on_message."""
+
+    def __init__(self):
+        import mqtt_listener
+        self.pipeline = IngestPipeline(mqtt_listener.write_batch, report_interval=3600).start()
+
+    def publish(self, topic, payload, index):
+        return self.pipeline.submit(topic, payload)
+
+    def listener_stats(self):
+        stats = self.pipeline.stats()
+        return {"dropped": stats["dropped"], "failed": stats["failed"]}
+
+    def close(self):
+        self.pipeline.stop()
+
+
+class MqttTransport:
+    """Paho clients to a broker, with mqtt_listener.py as a subprocess."""
+
+    def __init__(self, broker, port, connections, env, log_path):
+        import paho.mqtt.client as mqtt
+        self.log_path = log_path
+        self.log = open(log_path, "w")
+        self.listener = subprocess.Popen(
+            [sys.executable, "-u", "mqtt_listener.py"], cwd=BACKEND_DIR, stdout=self.log,
+            stderr=subprocess.STDOUT, env=dict(env, MQTT_BROKER=broker, MQTT_PORT=str(port)))
+        wait_for(lambda: "Subscribed" in read_text(log_path), 15, "listener to subscribe")
+        self.clients = []
+        for _ in range(connections):
+            client = mqtt.Client()
+            client.max_inflight_messages_set(1000)
+            client.connect(broker, port)
+            client.loop_start()
+            self.clients.append(client)
+
+    def publish(self, topic, payload, index):
+        return self.clients[index % len(self.clients)].publish(topic, payload, qos=1).rc == 0
+
+    def listener_stats(self):
+        # The writer prints its counters on stop (see ingest.IngestPipeline).
+        found = re.findall(r"dropped=(\d+) failed=(\d+)", read_text(self.log_path))
+        if not found:
+            return {"dropped": None, "failed": None}
+        dropped, failed = found[-1]
+        return {"dropped": int(dropped), "failed": int(failed)}
+
+    def close(self):
+        for client in self.clients:
+            client.loop_stop()
+            client.disconnect()
+        self.listener.send_signal(signal.SIGTERM)
+        self.listener.wait(30)
+        self.log.close()
+
+
+def read_text(path):
+    with open(path, errors="replace") as f:
+        return f.read()
+
+
+def wait_for(ready, timeout, what):
+    deadline = time.monotonic() + timeout
+    while not ready():
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"Timed out waiting for {what}")
+        time.sleep(0.1)
+
+
+class IngestWatcher(threading.Thread):
+    """Polls the DB for new rows; a row's lag is when it was seen minus its timestamp."""
+
+    TABLES = {"status": "light_status", "violation": "violations"}
+
+    def __init__(self, db_file, interval=0.1):
+        super().__init__(name="ingest-watcher", daemon=True)
+        self.conn = storage.connect(db_file)
+        self.interval = interval
+        self.last_id = {kind: 0 for kind in self.TABLES}
+        self.seen = defaultdict(int)
+        self.lags = []
+        self.stop_event = threading.Event()
+
+    def poll(self):
+        for kind, table in self.TABLES.items():
+            rows = self.conn.execute(f"SELECT id, timestamp FROM {table} WHERE id > ? ORDER BY id",
+                                     (self.last_id[kind],)).fetchall()
+            now = time.time()
+            for _, ts in rows:
+                sent = rollups.parse_timestamp(ts)
+                if sent is not None:
+                    self.lags.append(now - sent)
+            if rows:
+                self.last_id[kind] = rows[-1][0]
+                self.seen[kind] += len(rows)
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            self.poll()
+
+    def stop(self):
+        self.stop_event.set()
+        self.join()
+        self.poll()
+        self.conn.close()
+
+
+def start_api_server(kind, env, workers, log_path):
+    if kind == "asgi":
+        command = [sys.executable, "-m", "uvicorn", "asgi_server:app", "--port", str(API_PORT),
+                   "--workers", str(workers), "--log-level", "warning"]
+    else:
+        command = [sys.executable, "flask_server.py"]
+    server = subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=open(log_path, "w"),
+                              stderr=subprocess.STDOUT)
+
+    def listening():
+        try:
+            http.client.HTTPConnection("localhost", API_PORT, timeout=1).connect()
+            return True
+        except OSError:
+            return False
+    wait_for(listening, 20, f"{kind} server on port {API_PORT}")
+    return server
+
+
+def query_worker(paths, stop_at, results, errors, lock):
+    local = defaultdict(list)
+    failures = 0
+    i = 0
+    while time.perf_counter() < stop_at:
+        path = paths[i % len(paths)]
+        i += 1
+        start = time.perf_counter()
+        try:
+            QUERY_CALLS[path]()
+        except Exception:
+            failures += 1
+            continue
+        local[path].append(time.perf_counter() - start)
+    with lock:
+        for path, latencies in local.items():
+            results[path].extend(latencies)
+        errors[0] += failures
+
+
+def start_api_load(kind, concurrency, duration):
+    """Start ``concurrency`` API clients; returns (threads, results, errors)."""
+    results, errors, lock = defaultdict(list), [0], threading.Lock()
+    stop_at = time.perf_counter() + duration
+    if kind == "queries":
+        target, args = query_worker, (API_PATHS, stop_at, results, errors, lock)
+    else:
+        target, args = bench_api.worker, ("localhost", API_PORT, API_PATHS, stop_at, {},
+                                          results, errors, lock)
+    threads = [threading.Thread(target=target, args=args, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    return threads, results, errors
+
+
+def disk_usage(db_file, image_dir):
+    db = sum(os.path.getsize(db_file + suffix) for suffix in ("", "-wal", "-shm")
+             if os.path.exists(db_file + suffix))
+    images = sum(os.path.getsize(os.path.join(root, name))
+                 for root, _, names in os.walk(image_dir) for name in names)
+    return db, images
+
+
+def run(fleet, duration, transport="direct", api="queries", api_concurrency=4, api_workers=1,
+        broker="localhost", port=1883, connections=4, drain_timeout=60.0, workdir=None):
+    """Drive the backend with ``fleet`` for ``duration`` seconds; returns the report dict."""
+    workdir = workdir or tempfile.mkdtemp(prefix="loadsim-")
+    db_file = os.path.join(workdir, "traffic.db")
+    image_dir = os.path.join(workdir, "images")
+    storage.DB_FILE = db_file
+    storage._pool = None
+    image_store.IMAGE_DIR = image_dir
+    storage.init_db()
+    env = dict(os.environ, TRAFFIC_DB_FILE=db_file, TRAFFIC_IMAGE_DIR=image_dir)
+    disk_before = disk_usage(db_file, image_dir)
+
+    server = None
+    if api in ("asgi", "flask"):
+        server = start_api_server(api, env, api_workers, os.path.join(workdir, "api.log"))
+    if transport == "mqtt":
+        sink = MqttTransport(broker, port, connections, env, os.path.join(workdir, "listener.log"))
+    else:
+        sink = DirectTransport()
+
+    watcher = IngestWatcher(db_file)
+    watcher.start()
+    api_threads, api_results, api_errors = ([], {}, [0]) if api == "none" else \
+        start_api_load(api, api_concurrency, duration)
+
+    published, failed = defaultdict(int), defaultdict(int)
+    slips = []
+    start = time.monotonic()
+    try:
+        for offset, kind, intersection_id in fleet.events(duration):
+            delay = start + offset - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                slips.append(-delay)
+            topic, payload = fleet.message(kind, intersection_id, time.time())
+            if sink.publish(topic, payload, int(intersection_id)):
+                published[kind] += 1
+            else:
+                failed[kind] += 1
+        for thread in api_threads:
+            thread.join()
+
+        deadline = time.monotonic() + drain_timeout
+        while time.monotonic() < deadline and any(watcher.seen[k] < published[k] for k in published):
+            time.sleep(0.1)
+    finally:
+        sink.close()
+        watcher.stop()
+        if server is not None:
+            server.terminate()
+            server.wait(10)
+        storage.get_pool().close()
+        storage._pool = None
+    disk_after = disk_usage(db_file, image_dir)
+
+    sent = sum(published.values())
+    return {
+        "intersections": fleet.intersections,
+        "duration": duration,
+        "scheduled_rate": sent / duration if duration else 0.0,
+        "schedule_slip_p99": percentile(slips, 99),
+        "published": dict(published),
+        "publish_failed": dict(failed),
+        "stored": dict(watcher.seen),
+        "dropped": sent - sum(watcher.seen.values()),
+        "listener": sink.listener_stats(),
+        "lag": {p: percentile(watcher.lags, p) for p in (50, 95, 99, 100)},
+        "db_growth": disk_after[0] - disk_before[0],
+        "image_growth": disk_after[1] - disk_before[1],
+        "api": {path: sorted(latencies) for path, latencies in api_results.items()},
+        "api_errors": api_errors[0],
+        "workdir": workdir,
+    }
+
+
+def print_report(report, api):
+    duration = report["duration"]
+    sent = sum(report["published"].values())
+    print(f"fleet      {report['intersections']} intersections, {report['scheduled_rate']:.0f} msgs/s "
+          f"over {duration:.0f} s, schedule slip p99 {report['schedule_slip_p99'] * 1000:.1f} ms")
+    print(f"published  {report['published']}  failed {report['publish_failed']}")
+    print(f"stored     {report['stored']}  dropped {report['dropped']}  "
+          f"(listener dropped {report['listener']['dropped']}, failed {report['listener']['failed']})")
+    lag = report["lag"]
+    print(f"ingest lag p50 {lag[50] * 1000:.0f} ms  p95 {lag[95] * 1000:.0f} ms  "
+          f"p99 {lag[99] * 1000:.0f} ms  max {lag[100] * 1000:.0f} ms")
+    per_day = 86400 / duration if duration else 0
+    print(f"growth     db {report['db_growth'] / 1e6:.1f} MB, images {report['image_growth'] / 1e6:.1f} MB "
+          f"({(report['db_growth'] + report['image_growth']) / max(1, sent) / 1e3:.1f} kB/msg, "
+          f"{(report['db_growth'] + report['image_growth']) * per_day / 1e9:.1f} GB/day at this rate)")
+    if report["api"]:
+        total = sum(len(v) for v in report["api"].values())
+        print(f"api ({api}) {total / duration:.0f} req/s, {report['api_errors']} errors")
+        for path in API_PATHS:
+            latencies = report["api"].get(path, [])
+            print(f"  {path:<35} p50 {percentile(latencies, 50) * 1000:7.2f} ms  "
+                  f"p95 {percentile(latencies, 95) * 1000:7.2f} ms  "
+                  f"p99 {percentile(latencies, 99) * 1000:7.2f} ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--intersections", type=int, default=1000)
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of publishing")
+    parser.add_argument("--status-interval", type=float, default=5.0, help="seconds per light phase")
+    parser.add_argument("--violations-per-hour", type=float, default=30.0, help="per intersection")
+    parser.add_argument("--image-bytes", type=int, default=60000)
+    parser.add_argument("--format", default=violation_codec.FORMAT_BINARY,
+                        choices=violation_codec.SUPPORTED_FORMATS)
+    parser.add_argument("--transport", default="mqtt", choices=("mqtt", "direct"))
+    parser.add_argument("--broker", default="localhost")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--connections", type=int, default=4, help="MQTT client connections")
+    parser.add_argument("--api", default="asgi", choices=("asgi", "flask", "queries", "none"))
+    parser.add_argument("--api-concurrency", type=int, default=8)
+    parser.add_argument("--api-workers", type=int, default=1, help="uvicorn workers for --api asgi")
+    parser.add_argument("--drain-timeout", type=float, default=60.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    fleet = Fleet(args.intersections, args.status_interval, args.violations_per_hour,
+                  args.image_bytes, args.format, args.seed)
+    report = run(fleet, args.duration, args.transport, args.api, args.api_concurrency,
+                 args.api_workers, args.broker, args.port, args.connections, args.drain_timeout)
+    print_report(report, args.api)
+    print(f"(DB and images left in {report['workdir']})")
@@ -1,88 +1,156 @@
 #cd traffic_light_backend
 #python flask_server.py
 import json
-import sqlite3
-import paho.mqtt.client as mqtt
 import sys
 import time
 from datetime import datetime
 import os
+import signal
 
-MQTT_BROKER = 'mqtt-dashboard.com'
-MQTT_PORT = 1883
-
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DB_FILE = os.path.join(BASE_DIR, 'traffic_data.db')
-
-def init_db():
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS violations (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp TEXT,
-            type TEXT,
-            plate TEXT,
-            location TEXT,
-            image_base64 TEXT
-        )
-    ''')
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS light_status (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp TEXT,
-            status TEXT,
-            intersection_id TEXT
-        )
-    ''')
-    conn.commit()
-    conn.close()
-
-def insert_violation(raw_data):
-    try:
-        data = {
-            "timestamp": raw_data.get("timestamp"),
-            "type": raw_data.get("violation_type"),
-            "plate": raw_data.get("plate"),
-            "location": raw_data.get("intersection_id"),
-            "image": raw_data.get("image")
-        }
+import image_store
+import rollups
+import storage
+from ingest import IngestPipeline
 
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO violations (timestamp, type, plate, location, image_base64)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (
-            data["timestamp"],
-            data["type"],
-            data["plate"],
-            data["location"],
-            data["image"]
-        ))
-        conn.commit()
-        conn.close()
-        print("[DB] Record inserted:", data)
-    except Exception as e:
-        print("[ERROR] Failed to insert:", e)
-
-def insert_light_status(data):
-    try:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO light_status (timestamp, status, intersection_id)
-            VALUES (?, ?, ?)
-        ''', (
-            data.get('timestamp'),
-            data.get('status'),
-            data.get('intersection_id')
-        ))
-        conn.commit()
-        conn.close()
-        print("[DB] Light status inserted:", data)
-    except Exception as e:
-        print("[ERROR] Failed to insert light status:", e)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common import metrics, violation_codec  # noqa: E402
+
+MQTT_BROKER = os.environ.get('MQTT_BROKER', 'mqtt-dashboard.com')
+MQTT_PORT = int(os.environ.get('MQTT_PORT', 1883))
+METRICS_PORT = int(os.environ.get('MQTT_LISTENER_METRICS_PORT', 9102))  # Prometheus /metrics
+ROLLUP_PRUNE_INTERVAL = 3600  # seconds between sweeps of expired minute rollups
+last_rollup_prune = 0.0
+
+MESSAGES = metrics.counter('listener_messages_total', 'Messages written, by kind', ('kind',))
+STAGE_SECONDS = metrics.histogram('listener_stage_seconds', 'Time spent per ingest stage', ('stage',))
+DECODE_SECONDS = STAGE_SECONDS.labels('decode')
+IMAGE_SECONDS = STAGE_SECONDS.labels('image_save')
+THUMBNAIL_SECONDS = STAGE_SECONDS.labels('thumbnail')
+SQLITE_SECONDS = STAGE_SECONDS.labels('sqlite')
+BATCH_SECONDS = metrics.histogram('listener_batch_seconds', 'Time to write one batch')
+BATCH_SIZE = metrics.histogram('listener_batch_size', 'Messages per batch',
+                               buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500))
+# detected_at (crossing frame captured on the detector) to commit. Across
+# machines this is only as good as their clock sync.
+STORE_LATENCY = metrics.histogram('violation_end_to_end_seconds',
+                                  'From capture of the crossing frame to the violation row being committed')
+
+def migrate_legacy_images(batch_size=100):
+    """Move base64 images stored inline in the DB into the image store."""
+    storage.init_db()
+    moved = 0
+    while True:
+        with storage.transaction() as conn:
+            rows = conn.execute('''
+                SELECT id, image_base64
+                FROM violations
+                WHERE image_base64 IS NOT NULL AND image_hash IS NULL
+                LIMIT ?
+            ''', (batch_size,)).fetchall()
+            for violation_id, image_base64 in rows:
+                try:
+                    digest, image_bytes = image_store.save_image_base64(image_base64)
+                except ValueError as e:
+                    # Left in place, this row would stop every later run here.
+                    print(f"[ERROR] Violation {violation_id}: dropping undecodable inline image: {e}")
+                    conn.execute('UPDATE violations SET image_base64 = NULL WHERE id = ?', (violation_id,))
+                    continue
+                conn.execute('''
+                    UPDATE violations
+                    SET image_hash = ?, thumbnail_base64 = ?, image_base64 = NULL
+                    WHERE id = ?
+                ''', (digest, image_store.make_thumbnail(image_bytes), violation_id))
+                moved += 1
+        if not rows:
+            break
+        print(f"[DB] Migrated {moved} images to {image_store.IMAGE_DIR}")
+    return moved
+
+def violation_row(raw_data):
+    """Turn a decoded violation message into a row for storage.insert_violations."""
+    # Keep the JPEG on disk; the DB only stores its hash.
+    image_bytes = raw_data.get("image_bytes")
+    with metrics.timed(IMAGE_SECONDS):
+        digest = image_store.save_image(image_bytes) if image_bytes else None
+    with metrics.timed(THUMBNAIL_SECONDS):
+        thumbnail = image_store.make_thumbnail(image_bytes)
+    return (
+        raw_data.get("timestamp"),
+        raw_data.get("violation_type"),
+        raw_data.get("plate"),
+        raw_data.get("intersection_id"),
+        digest,
+        thumbnail,
+        raw_data.get("trace_id"),
+        raw_data.get("clip")
+    )
+
+def light_status_row(data):
+    """Turn a status message into a row for storage.insert_light_statuses."""
+    return (
+        data.get('timestamp'),
+        data.get('status'),
+        data.get('intersection_id')
+    )
+
+@metrics.timed(BATCH_SECONDS)
+def write_batch(messages):
+    """Parse a batch of (topic, payload) messages and store it in one transaction.
+
+    Metrics are counted only once the transaction commits, so the
+    pipeline's one-by-one retry of a failed batch does not count twice.
+    """
+    global last_rollup_prune
+    violations = []
+    statuses = []
+    detected = []  # detected_at of each violation, when the detector sent it
+    errors = 0
+    for topic, payload in messages:
+        try:
+            if topic.startswith("traffic_violation/"):
+                # Binary (sv1) or JSON, told apart by the first byte.
+                with metrics.timed(DECODE_SECONDS):
+                    data = violation_codec.decode(payload)
+                violations.append(violation_row(data))
+                detected.append(rollups.parse_timestamp(data.get("detected_at")))
+            elif topic.startswith("traffic_light/") and topic.endswith("/status"):
+                with metrics.timed(DECODE_SECONDS):
+                    statuses.append(light_status_row(json.loads(payload.decode())))
+            else:
+                errors += 1
+                print("[MQTT] Unknown topic:", topic)
+        except Exception as e:
+            errors += 1
+            print(f"[ERROR] MQTT message processing failed on {topic}:", e)
+
+    sqlite_start = time.perf_counter()
+    with storage.transaction() as conn:
+        if violations:
+            storage.insert_violations(conn, violations)
+        if statuses:
+            storage.insert_light_statuses(conn, statuses)
+        storage.prune_events(conn)
+        now = time.time()
+        if now - last_rollup_prune >= ROLLUP_PRUNE_INTERVAL:
+            storage.prune_rollups(conn, now)
+            last_rollup_prune = now
+    SQLITE_SECONDS.observe(time.perf_counter() - sqlite_start)
+
+    committed = time.time()
+    for detected_at in detected:
+        if detected_at is not None:
+            STORE_LATENCY.observe(committed - detected_at)
+    BATCH_SIZE.observe(len(messages))
+    MESSAGES.labels('violation').inc(len(violations))
+    MESSAGES.labels('status').inc(len(statuses))
+    if errors:
+        MESSAGES.labels('invalid').inc(errors)
+    if violations:
+        print(f"[DB] Violations inserted: {[row[2] if row[6] is None else f'{row[2]} ({row[6]})' for row in violations]}")
+
+# Messages go through a bounded queue to a single writer thread, so a slow
+# disk never stalls the paho network loop. Created in start_mqtt().
+pipeline = None
 
 def on_connect(client, userdata, flags, rc):
     if rc == 0:
@@ -90,35 +158,44 @@ def on_connect(client, userdata, flags, rc):
         client.subscribe("traffic_violation/+/detected")
         client.subscribe("traffic_light/+/status")
         print("[MQTT] Subscribed to topics: traffic_violation/+/detected, traffic_light/+/status")
+        # Retained, so detectors that connect later still switch to binary.
+        client.publish(violation_codec.FORMATS_TOPIC, violation_codec.advertisement(), qos=1, retain=True)
     else:
         print(f"[MQTT] ❌ Failed to connect, return code: {rc}")
 
 def on_message(client, userdata, msg):
-    print(f"[MQTT] Message received on topic: {msg.topic}")
-    try:
-        data = json.loads(msg.payload.decode())
-        print(f"[MQTT] Payload: {data}")
+    if not pipeline.submit(msg.topic, msg.payload):
+        print("[INGEST] Queue full, dropped message on topic:", msg.topic)
 
-        if msg.topic.startswith("traffic_violation/"):
-            insert_violation(data)
-        elif msg.topic.startswith("traffic_light/") and msg.topic.endswith("/status"):
-            insert_light_status(data)
-        else:
-            print("[MQTT] Unknown topic:", msg.topic)
+def start_mqtt():
+    global pipeline
+    # Imported here so write_batch can be driven without paho (loadsim.py --transport direct).
+    import paho.mqtt.client as mqtt
 
-    except Exception as e:
-        print("[ERROR] MQTT message processing failed:", e)
+    storage.init_db()
+    pipeline = IngestPipeline(write_batch).start()
+    metrics.REGISTRY.collect('listener_ingest', pipeline.stats,
+                             counters=('accepted', 'dropped', 'failed', 'retried_batches', 'flushes',
+                                       'flushed_messages'))
+    metrics.serve(METRICS_PORT)
 
-def start_mqtt():
-    init_db()
     client = mqtt.Client()
     client.on_connect = on_connect
     client.on_message = on_message
+    # SIGTERM (e.g. from systemd or docker stop) ends the loop like Ctrl+C does.
+    signal.signal(signal.SIGTERM, lambda signum, frame: client.disconnect())
     client.connect(MQTT_BROKER, MQTT_PORT, 60)
-    client.loop_forever()
+    try:
+        client.loop_forever()
+    except KeyboardInterrupt:
+        print("Ctrl+C to quit ...")
+    finally:
+        client.disconnect()
+        # Write out everything that was accepted before exiting.
+        pipeline.stop()
 
 def run_test_inserts(n=5):
-    init_db()
+    storage.init_db()
     for i in range(n):
         test_data = {
             "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
@@ -127,23 +204,23 @@ def run_test_inserts(n=5):
             "location": "Intersection X",
             "image": None
         }
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO violations (timestamp, type, plate, location, image_base64)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (
-            test_data["timestamp"],
-            test_data["type"],
-            test_data["plate"],
-            test_data["location"],
-            test_data["image"]
-        ))
-        conn.commit()
-        conn.close()
+        with storage.transaction() as conn:
+            storage.insert_violation(
+                conn,
+                test_data["timestamp"],
+                test_data["type"],
+                test_data["plate"],
+                test_data["location"],
+                None,
+                None
+            )
         print("[DB] Test data inserted:", test_data)
         time.sleep(1)
 
 if __name__ == '__main__':
-    print("[MODE] MQTT listener starting...")
-    start_mqtt()
+    if len(sys.argv) > 1 and sys.argv[1] == "migrate-images":
+        print("[MODE] Migrating inline images to the image store...")
+        migrate_legacy_images()
+    else:
+        print("[MODE] MQTT listener starting...")
+        start_mqtt()
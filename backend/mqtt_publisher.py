@@ -0,0 +1,175 @@
+"""One persistent MQTT connection for publishing admin commands.
+
+Replaces ``paho.mqtt.publish.single``, which connects, handshakes, publishes
+and disconnects for every command. The client runs paho's network loop in
+a background thread and reconnects with backoff on its own. Each publish
+returns a ``concurrent.futures.Future`` that resolves once the broker has
+acknowledged the message (PUBACK for QoS 1, PUBCOMP for QoS 2, or once it
+is written for QoS 0). Messages published while the broker is unreachable
+stay queued and are sent after reconnecting, up to ``max_pending``.
+
+``publish_many`` rejects a bulk command up front if the queue cannot hold
+the whole batch under ``max_pending``. A caller that gives up
+waiting calls ``expire(future)``: the message stops
+counting against ``max_pending`` and a late ack for it is ignored.
+"""
+import asyncio
+import threading
+from concurrent.futures import Future
+
+import commands
+
+
+class PublishQueueFull(Exception):
+    """Raised when ``max_pending`` messages are already waiting for an ack."""
+
+
+class MqttPublisher:
+    def __init__(self, host=commands.MQTT_BROKER, port=commands.MQTT_PORT,
+                 max_pending=1000, client=None, client_id=""):
+        self.host = host
+        self.port = port
+        self.max_pending = max_pending
+        self.client = client
+        self.client_id = client_id
+        self.lock = threading.Lock()
+        self.pending = {}        # mid -> Future
+        self.reserved = 0        # slots held by a publish_many still sending
+        self.early_acks = set()  # acks that arrived before publish() returned the mid
+        self.expired = set()     # mids given up on; paho wraps mids at 65535, so this stays bounded
+        self.connected = threading.Event()
+        self.published = 0
+        self.acked = 0
+        self.rejected = 0
+        self.expired_count = 0
+        self.reconnects = 0
+
+    def start(self):
+        if self.client is None:
+            import paho.mqtt.client as mqtt
+            self.client = mqtt.Client(client_id=self.client_id)
+            self.client.max_queued_messages_set(self.max_pending)
+            self.client.reconnect_delay_set(min_delay=1, max_delay=30)
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
+        self.client.on_publish = self._on_publish
+        # connect_async + loop_start: the loop thread keeps retrying if the
+        # broker is down at start-up instead of raising here.
+        self.client.connect_async(self.host, self.port, 60)
+        self.client.loop_start()
+        return self
+
+    def stop(self):
+        self.client.loop_stop()
+        self.client.disconnect()
+
+    def _on_connect(self, client, userdata, flags, rc):
+        if rc == 0:
+            print("[MQTT] ✅ Publisher connected.")
+            self.connected.set()
+        else:
+            print(f"[MQTT] ❌ Publisher failed to connect, return code: {rc}")
+
+    def _on_disconnect(self, client, userdata, rc):
+        self.connected.clear()
+        if rc != 0:
+            self.reconnects += 1
+            print(f"[MQTT] Publisher disconnected (rc={rc}), reconnecting...")
+
+    def _on_publish(self, client, userdata, mid):
+        with self.lock:
+            if mid in self.expired:
+                self.expired.discard(mid)
+                return
+            future = self.pending.pop(mid, None)
+            if future is None:
+                self.early_acks.add(mid)
+                return
+            self.acked += 1
+        # The waiter may have cancelled the future; raising here would kill
+        # paho's network thread.
+        if not future.done():
+            future.set_result(mid)
+
+    def publish(self, topic, payload, qos=1, retain=False):
+        """Queue one message and return a Future that resolves on broker ack."""
+        return self.publish_many([(topic, payload)], qos, retain)[0]
+
+    def publish_many(self, messages, qos=1, retain=False):
+        """Queue ``(topic, payload)`` messages and return their Futures, in order.
+
+        Raises PublishQueueFull before sending anything if they do not all
+        fit under ``max_pending``.
+        """
+        with self.lock:
+            if len(self.pending) + self.reserved + len(messages) > self.max_pending:
+                self.rejected += 1
+                raise PublishQueueFull(f"{len(self.pending)} messages awaiting ack, "
+                                       f"no room for {len(messages)} more")
+            self.reserved += len(messages)
+        futures = []
+        try:
+            for topic, payload in messages:
+                futures.append(self._send(topic, payload, qos, retain))
+        finally:
+            unsent = len(messages) - len(futures)
+            if unsent:
+                with self.lock:
+                    self.reserved -= unsent
+        return futures
+
+    def _send(self, topic, payload, qos, retain):
+        # Uses a slot reserved by publish_many, released once paho took the message.
+        info = self.client.publish(topic, payload, qos=qos, retain=retain)
+        future = Future()
+        future.mid = info.mid
+        if info.rc != 0 and info.rc != 4:  # 4 = MQTT_ERR_NO_CONN: queued for reconnect
+            with self.lock:
+                self.reserved -= 1
+            future.set_exception(RuntimeError(f"MQTT publish failed, rc={info.rc}"))
+            return future
+
+        with self.lock:
+            self.reserved -= 1
+            self.published += 1
+            if info.mid in self.early_acks:
+                self.early_acks.discard(info.mid)
+                self.acked += 1
+                future.set_result(info.mid)
+            else:
+                self.expired.discard(info.mid)  # the mid was reused
+                self.pending[info.mid] = future
+        return future
+
+    def expire(self, future):
+        """Stop waiting for ``future``'s ack and free its ``max_pending`` slot."""
+        with self.lock:
+            if self.pending.get(future.mid) is future:
+                del self.pending[future.mid]
+                self.expired.add(future.mid)
+                self.expired_count += 1
+        future.cancel()
+
+    async def wait_ack(self, future, timeout):
+        """Await ``future`` on the event loop; expire it and re-raise on timeout.
+
+        The shield keeps ``wait_for`` from cancelling the Future itself, so
+        ``expire`` still finds it in ``pending``.
+        """
+        try:
+            return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), timeout)
+        except asyncio.TimeoutError:
+            self.expire(future)
+            raise
+
+    def stats(self):
+        with self.lock:
+            return {
+                "connected": self.connected.is_set(),
+                "pending": len(self.pending),
+                "published": self.published,
+                "acked": self.acked,
+                "rejected": self.rejected,
+                "expired": self.expired_count,
+                "reconnects": self.reconnects,
+            }
@@ -0,0 +1,314 @@
+import time
+
+import rollups
+import storage
+
+MAX_PAGE_SIZE = 100
+MAX_SERIES_POINTS = 10000
+DEFAULT_STATS_RANGE = 24 * 3600  # seconds, when ``since`` is not given
+
+# Both read the materialized current state: a primary-key lookup per
+# intersection, independent of how long the light_status history gets.
+LATEST_LIGHT_STATUS_SQL = '''
+    SELECT intersection_id, status, timestamp, since
+    FROM intersection_state
+    ORDER BY intersection_id
+'''
+
+LIGHT_STATUS_SQL = '''
+    SELECT status, timestamp, since
+    FROM intersection_state
+    WHERE intersection_id = ?
+'''
+
+VIOLATION_COUNT_SQL = "SELECT count FROM row_counts WHERE name = 'violations'"
+
+VIOLATION_COLUMNS = '''
+    SELECT id, timestamp, type, plate, location, image_hash, thumbnail_base64,
+           image_base64 IS NOT NULL, clip
+    FROM violations
+'''
+
+VIOLATION_IMAGE_SQL = '''
+    SELECT image_hash, image_base64
+    FROM violations
+    WHERE id = ?
+'''
+
+
+def get_latest_light_status():
+    with storage.connection() as conn:
+        rows = conn.execute(LATEST_LIGHT_STATUS_SQL).fetchall()
+
+    result = []
+    for row in rows:
+        result.append({
+            "intersection_id": row[0],
+            "status": row[1],   # e.g., "RED", "GREEN", "YELLOW"
+            "timestamp": row[2],
+            "since": row[3]     # when the intersection entered this status
+        })
+
+    return result
+
+
+def get_light_status(intersection_id):
+    """Return the newest status of one intersection, or None if never seen."""
+    with storage.connection() as conn:
+        row = conn.execute(LIGHT_STATUS_SQL, (intersection_id,)).fetchone()
+    if row is None:
+        return None
+    return {
+        "intersection_id": intersection_id,
+        "status": row[0],
+        "timestamp": row[1],
+        "since": row[2]
+    }
+
+
+def get_light_status_history(intersection_id, since=None, until=None, limit=100, after_id=None):
+    """Return status changes of one intersection, newest first.
+
+    Pages with ``after_id`` like get_paginated_violations; the time range is
+    compared against the stored timestamp strings.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    filters = ["intersection_id = ?"]
+    params = [intersection_id]
+    if after_id is not None:
+        filters.append("id < ?")
+        params.append(after_id)
+    if since:
+        filters.append("timestamp >= ?")
+        params.append(since)
+    if until:
+        filters.append("timestamp < ?")
+        params.append(until)
+    params.append(limit)
+
+    # Served entirely from idx_light_status_latest.
+    with storage.connection() as conn:
+        rows = conn.execute(
+            "SELECT id, status, timestamp FROM light_status WHERE "
+            + " AND ".join(filters) + " ORDER BY id DESC LIMIT ?", params).fetchall()
+
+    return {
+        "intersection_id": intersection_id,
+        "limit": limit,
+        "next_after_id": rows[-1][0] if len(rows) == limit else None,
+        "data": [{"id": row[0], "status": row[1], "timestamp": row[2]} for row in rows]
+    }
+
+
+def get_paginated_violations(page=1, limit=6, after_id=None, plate=None,
+                             intersection_id=None, since=None, until=None):
+    """Return one page of violations, newest first.
+
+    With ``after_id`` the page starts right below that id (keyset pagination),
+    which costs the same on every page; ``next_after_id`` in the result is the
+    cursor for the following page. Without it, ``page`` falls back to OFFSET.
+    A filtered keyset page has ``total`` None: the first page carried it.
+    ``since``/``until`` are compared against the stored timestamp strings.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    filters = []
+    params = []
+    if plate:
+        filters.append("plate = ?")
+        params.append(plate)
+    if intersection_id is not None:
+        filters.append("location = ?")
+        params.append(intersection_id)
+    if since:
+        filters.append("timestamp >= ?")
+        params.append(since)
+    if until:
+        filters.append("timestamp < ?")
+        params.append(until)
+
+    with storage.connection() as conn:
+        if not filters:
+            # Maintained by triggers; avoids a full COUNT(*) on every request.
+            total = conn.execute(VIOLATION_COUNT_SQL).fetchone()[0]
+        elif after_id is None:
+            # Visits every match, so it costs as much as a wide time range or
+            # a common location; keyset pages skip it to stay cheap.
+            total = conn.execute(
+                "SELECT COUNT(*) FROM violations WHERE " + " AND ".join(filters),
+                params).fetchone()[0]
+        else:
+            total = None
+
+        page_filters = list(filters)
+        page_params = list(params)
+        if after_id is not None:
+            page_filters.append("id < ?")
+            page_params.append(after_id)
+        sql = VIOLATION_COLUMNS
+        if page_filters:
+            sql += " WHERE " + " AND ".join(page_filters)
+        sql += " ORDER BY id DESC LIMIT ?"
+        page_params.append(limit)
+        if after_id is None:
+            sql += " OFFSET ?"
+            page_params.append((max(page, 1) - 1) * limit)
+        rows = conn.execute(sql, page_params).fetchall()
+
+    result = []
+    for row in rows:
+        result.append({
+            "id": row[0],
+            "timestamp": row[1],
+            "type": row[2],
+            "plate": row[3],
+            "location": row[4],
+            # The full JPEG is served separately so pages stay small and cacheable.
+            "image_url": f"/api/violations/{row[0]}/image" if row[5] or row[7] else None,
+            "thumbnail": row[6],
+            # Evidence clip, served by the detector at /clips/<name>.
+            "clip": row[8]
+        })
+
+    return {
+        "total": total,
+        "page": page,
+        "limit": limit,
+        "next_after_id": result[-1]["id"] if len(result) == limit else None,
+        "data": result
+    }
+
+
+def get_violation_image(violation_id):
+    """Return ``(image_hash, image_base64)`` for a violation, or None."""
+    with storage.connection() as conn:
+        return conn.execute(VIOLATION_IMAGE_SQL, (violation_id,)).fetchone()
+
+
+# -------- Analytics (answered from the rollup tables, see rollups.py) --------
+
+LIGHT_ROLLUP_RANGE_SQL = '''
+    SELECT status, SUM(seconds), SUM(transitions)
+    FROM light_rollup
+    WHERE intersection_id = ? AND resolution = ? AND bucket_start >= ? AND bucket_start < ?
+    GROUP BY status
+'''
+
+VIOLATION_SERIES_SQL = '''
+    SELECT bucket_start, count
+    FROM violation_rollup
+    WHERE location = ? AND resolution = ? AND bucket_start >= ? AND bucket_start < ?
+    ORDER BY bucket_start
+'''
+
+
+def stats_range(since, until, align, now=None):
+    """Parse ``since``/``until`` into epoch seconds widened to ``align``.
+
+    ``until`` defaults to now and ``since`` to a day before it. Raises
+    ValueError for an unparseable or empty range.
+    """
+    now = time.time() if now is None else now
+    end = rollups.parse_timestamp(until) if until else now
+    start = rollups.parse_timestamp(since) if since else (end or now) - DEFAULT_STATS_RANGE
+    if start is None or end is None:
+        raise ValueError("since/until must be ISO 8601 timestamps")
+    start = int(start // align) * align
+    end = -int(-end // align) * align
+    if start >= end:
+        raise ValueError("since must be before until")
+    return start, end
+
+
+def get_light_stats(intersection_id, since=None, until=None, now=None):
+    """Time in each status and transitions into it over [since, until)."""
+    now = time.time() if now is None else now
+    start, end = stats_range(since, until, rollups.MINUTE, now)
+    seconds = {}
+    transitions = {}
+    with storage.connection() as conn:
+        for resolution, first, stop in rollups.cover(start, end):
+            for status, total, count in conn.execute(
+                    LIGHT_ROLLUP_RANGE_SQL, (intersection_id, resolution, first, stop)):
+                seconds[status] = seconds.get(status, 0.0) + total
+                transitions[status] = transitions.get(status, 0) + count
+        current = conn.execute(LIGHT_STATUS_SQL, (intersection_id,)).fetchone()
+
+    # The current phase has not ended, so it is not in the rollups yet.
+    if current is not None:
+        phase_start = rollups.parse_timestamp(current[2])
+        if phase_start is not None:
+            overlap = min(end, now) - max(start, phase_start)
+            if overlap > 0:
+                seconds[current[0]] = seconds.get(current[0], 0.0) + overlap
+                transitions.setdefault(current[0], 0)
+
+    observed = sum(seconds.values())
+    return {
+        "intersection_id": intersection_id,
+        "since": rollups.format_timestamp(start),
+        "until": rollups.format_timestamp(end),
+        "observed_seconds": round(observed, 1),
+        "phases": {
+            status: {
+                "seconds": round(seconds[status], 1),
+                "share": round(seconds[status] / observed, 4) if observed else 0.0,
+                "transitions": transitions[status],
+            }
+            for status in sorted(seconds)
+        },
+    }
+
+
+def get_violation_stats(since=None, until=None, intersection_id=None, bucket="hour"):
+    """Violation counts per ``bucket`` (minute, hour or day); empty buckets are omitted."""
+    if bucket not in rollups.BUCKETS:
+        raise ValueError(f"bucket must be one of {', '.join(rollups.BUCKETS)}")
+    resolution = rollups.BUCKETS[bucket]
+    start, end = stats_range(since, until, resolution)
+    if (end - start) // resolution > MAX_SERIES_POINTS:
+        raise ValueError(f"More than {MAX_SERIES_POINTS} {bucket}s; use a coarser bucket")
+
+    location = intersection_id if intersection_id else rollups.ALL_LOCATIONS
+    with storage.connection() as conn:
+        rows = conn.execute(VIOLATION_SERIES_SQL, (location, resolution, start, end)).fetchall()
+
+    return {
+        "intersection_id": intersection_id,
+        "since": rollups.format_timestamp(start),
+        "until": rollups.format_timestamp(end),
+        "bucket": bucket,
+        "total": sum(row[1] for row in rows),
+        "series": [{"start": rollups.format_timestamp(row[0]), "count": row[1]} for row in rows],
+    }
+
+
+def get_repeat_offenders(since=None, until=None, intersection_id=None, min_count=2, limit=20):
+    """Plates with at least ``min_count`` violations in the range (whole UTC days)."""
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    start, end = stats_range(since, until, rollups.DAY)
+    filters = "day >= ? AND day < ?"
+    params = [start, end]
+    if intersection_id:
+        filters += " AND location = ?"
+        params.append(intersection_id)
+    params += [max(1, min_count), limit]
+
+    with storage.connection() as conn:
+        rows = conn.execute(
+            "SELECT plate, SUM(count) AS total, COUNT(DISTINCT location), MIN(day), MAX(day)"
+            " FROM plate_rollup WHERE " + filters
+            + " GROUP BY plate HAVING total >= ? ORDER BY total DESC, plate LIMIT ?", params).fetchall()
+
+    return {
+        "intersection_id": intersection_id,
+        "since": rollups.format_timestamp(start),
+        "until": rollups.format_timestamp(end),
+        "data": [{
+            "plate": row[0],
+            "violations": row[1],
+            "intersections": row[2],
+            "first_day": rollups.format_timestamp(row[3])[:10],
+            "last_day": rollups.format_timestamp(row[4])[:10],
+        } for row in rows],
+    }
@@ -0,0 +1,138 @@
+"""In-process TTL/LRU cache for encoded JSON responses.
+
+Entries are dropped as soon as any other connection commits to the
+database: ``PRAGMA data_version`` on a private connection changes whenever
+the listener (or anyone else) writes. Without ``start()`` the version is
+checked on every lookup, so the API never serves a page older than the
+last ingest flush. After ``start()`` a background thread checks it every
+``poll_interval`` seconds instead, and lookups never run a query: a page
+can then be up to ``poll_interval`` older than the last flush. ``ttl``
+only bounds how long an entry can live if that check is somehow missed.
+
+Each entry keeps its body and, lazily, a gzip-compressed copy, each with its
+own strong ETag (the gzip one ends in ``-gz``), so a hot endpoint is serialised and compressed once per database change
+instead of once per poll.
+"""
+import gzip
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+import storage
+
+GZIP_MIN_SIZE = 1024  # bytes; smaller bodies are not worth compressing
+
+
+class CachedResponse:
+    __slots__ = ("body", "status_code", "etag", "gzip_etag", "expires", "_gzipped")
+
+    def __init__(self, body, status_code, expires):
+        self.body = body
+        self.status_code = status_code
+        digest = hashlib.sha1(body).hexdigest()
+        self.etag = '"' + digest + '"'
+        # A strong ETag names one exact representation, so the gzip body needs its own.
+        self.gzip_etag = '"' + digest + '-gz"'
+        self.expires = expires
+        self._gzipped = None
+
+    def gzipped(self):
+        if self._gzipped is None:
+            self._gzipped = gzip.compress(self.body, compresslevel=6)
+        return self._gzipped
+
+    def encode_for(self, accept_encoding):
+        """Return ``(body, content_encoding, etag)`` for the client's Accept-Encoding."""
+        if len(self.body) >= GZIP_MIN_SIZE and "gzip" in (accept_encoding or ""):
+            return self.gzipped(), "gzip", self.gzip_etag
+        return self.body, None, self.etag
+
+
+class ResponseCache:
+    def __init__(self, max_entries=256, ttl=30.0, poll_interval=0.05):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.conn = storage.connect()
+        self.data_version = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.thread = None
+        self.stopped = threading.Event()
+
+    def start(self):
+        """Check data_version from a background thread rather than per lookup."""
+        if self.thread is None:
+            with self.lock:
+                self._check_version()
+            self.thread = threading.Thread(target=self._poll, name="cache-version-poller", daemon=True)
+            self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def _poll(self):
+        while not self.stopped.wait(self.poll_interval):
+            try:
+                with self.lock:
+                    self._check_version()
+            except Exception as e:
+                print("[ERROR] Cache version poller failed:", e)
+
+    def _check_version(self):
+        # Caller holds self.lock (the connection is shared between threads).
+        version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        if version != self.data_version:
+            if self.entries:
+                self.invalidations += 1
+            self.entries.clear()
+            self.data_version = version
+
+    def get(self, key):
+        """Return ``(entry, version)``; entry is None on a miss.
+
+        Pass ``version`` back to ``put`` so a response built from data that
+        changed in the meantime is returned but never cached.
+        """
+        now = time.monotonic()
+        with self.lock:
+            if self.thread is None:
+                self._check_version()
+            entry = self.entries.get(key)
+            if entry is None or entry.expires < now:
+                self.misses += 1
+                return None, self.data_version
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry, self.data_version
+
+    def put(self, key, data, version, status_code=200):
+        """Serialise ``data`` as JSON and return the entry, caching it if still current."""
+        body = json.dumps(data, separators=(",", ":")).encode("utf-8")
+        entry = CachedResponse(body, status_code, time.monotonic() + self.ttl)
+        with self.lock:
+            if self.thread is None:
+                self._check_version()
+            if self.data_version == version:
+                self.entries[key] = entry
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+        return entry
+
+    def stats(self):
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+            }
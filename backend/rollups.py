@@ -0,0 +1,231 @@
+"""Incrementally maintained rollups for light and violation analytics.
+
+``light_status`` and ``violations`` keep every event, so any range query
+over them scans the history. The writes in storage.py also keep these
+tables up to date, in the same transaction:
+
+- ``light_rollup``: seconds spent in each status, and transitions into
+  it, per intersection per minute, hour and day bucket. A phase is
+  booked when it ends, split across the buckets it spans.
+- ``violation_rollup``: violations per intersection per bucket, plus a
+  row with location "" for all intersections together.
+- ``plate_rollup``: violations per plate per intersection per day, for
+  repeat offenders.
+
+``cover`` splits a range into whole days, hours and minutes, so a year of
+one intersection is a few hundred rollup rows. Minute buckets are pruned
+after ``MINUTE_RETENTION_DAYS``; ranges older than that count only whole
+hours at their edges.
+"""
+import math
+from collections import defaultdict
+from datetime import datetime, timezone
+
+MINUTE, HOUR, DAY = 60, 3600, 86400
+RESOLUTIONS = (MINUTE, HOUR, DAY)
+BUCKETS = {"minute": MINUTE, "hour": HOUR, "day": DAY}
+MINUTE_RETENTION_DAYS = 14
+
+ALL_LOCATIONS = ""  # violation_rollup row that sums every intersection
+
+CURRENT_STATE_SQL = "SELECT status, since FROM intersection_state WHERE intersection_id = ?"
+
+UPSERT_LIGHT_ROLLUP_SQL = '''
+    INSERT INTO light_rollup (intersection_id, resolution, bucket_start, status, seconds, transitions)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT (intersection_id, resolution, bucket_start, status) DO UPDATE SET
+        seconds = seconds + excluded.seconds,
+        transitions = transitions + excluded.transitions
+'''
+UPSERT_VIOLATION_ROLLUP_SQL = '''
+    INSERT INTO violation_rollup (location, resolution, bucket_start, count)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT (location, resolution, bucket_start) DO UPDATE SET
+        count = count + excluded.count
+'''
+UPSERT_PLATE_ROLLUP_SQL = '''
+    INSERT INTO plate_rollup (day, plate, location, count)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT (day, plate, location) DO UPDATE SET
+        count = count + excluded.count
+'''
+
+
+def parse_timestamp(text):
+    """Epoch seconds of an ISO 8601 timestamp, or None if it cannot be parsed.
+
+    Accepts the formats the edge devices send ("...Z", "...+00:00Z") and
+    "YYYY-MM-DD HH:MM:SS"; naive times are taken as UTC. Anything that is
+    not a string, such as an epoch number, is None too.
+    """
+    if not text or not isinstance(text, str):
+        return None
+    text = text.strip()
+    if text.endswith("Z"):
+        text = text[:-1]
+    try:
+        parsed = datetime.fromisoformat(text)
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def format_timestamp(epoch):
+    return datetime.fromtimestamp(epoch, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def bucket_of(epoch, resolution):
+    return int(epoch // resolution) * resolution
+
+
+def split_interval(start, end):
+    """Yield (resolution, bucket_start, seconds) for every bucket [start, end) touches."""
+    for resolution in RESOLUTIONS:
+        t = start
+        while t < end:
+            bucket = bucket_of(t, resolution)
+            stop = min(end, bucket + resolution)
+            yield resolution, bucket, stop - t
+            t = stop
+
+
+def cover(start, end, resolutions=(DAY, HOUR, MINUTE)):
+    """Split minute-aligned [start, end) into (resolution, first, stop) bucket ranges.
+
+    The middle is covered by the coarsest buckets that fit whole and the
+    edges by finer ones: 09:58 to 02:03 the next day is 2 minutes, 16
+    hours and 3 minutes.
+    """
+    resolution, finer = resolutions[0], resolutions[1:]
+    if not finer:
+        return [(resolution, start, end)] if start < end else []
+    first = math.ceil(start / resolution) * resolution
+    stop = end // resolution * resolution
+    if first >= stop:
+        return cover(start, end, finer)
+    return cover(start, first, finer) + [(resolution, first, stop)] + cover(stop, end, finer)
+
+
+class LightRollup:
+    """Books closed phases from a stream of status rows into light_rollup."""
+
+    def __init__(self):
+        self.current = {}  # intersection_id -> (status, since epoch)
+        self.deltas = defaultdict(lambda: [0.0, 0])
+
+    def seed(self, conn, intersection_id):
+        row = conn.execute(CURRENT_STATE_SQL, (intersection_id,)).fetchone()
+        self.current[intersection_id] = (row[0], parse_timestamp(row[1])) if row else (None, None)
+
+    def add(self, timestamp, status, intersection_id):
+        t = parse_timestamp(timestamp)
+        if t is None or intersection_id is None:
+            return
+        previous, since = self.current.get(intersection_id, (None, None))
+        if status == previous:
+            return
+        if since is not None and t < since:
+            return  # older than the phase it would close; arrived out of order
+        if previous is not None and since is not None:
+            for resolution, bucket, seconds in split_interval(since, t):
+                self.deltas[(intersection_id, resolution, bucket, previous)][0] += seconds
+        for resolution in RESOLUTIONS:
+            self.deltas[(intersection_id, resolution, bucket_of(t, resolution), status)][1] += 1
+        self.current[intersection_id] = (status, t)
+
+    def flush(self, conn):
+        conn.executemany(UPSERT_LIGHT_ROLLUP_SQL,
+                         [key + tuple(value) for key, value in self.deltas.items()])
+        self.deltas.clear()
+
+
+def record_light_statuses(conn, rows):
+    """Book the phases ended by (timestamp, status, intersection_id) rows.
+
+    Must run before the rows are applied to intersection_state, which
+    still holds the phase each intersection was in.
+    """
+    rollup = LightRollup()
+    for timestamp, status, intersection_id in rows:
+        if intersection_id is not None and intersection_id not in rollup.current:
+            rollup.seed(conn, intersection_id)
+        rollup.add(timestamp, status, intersection_id)
+    rollup.flush(conn)
+
+
+def record_violations(conn, rows):
+    """Count violation rows (storage.insert_violations order) into the rollups."""
+    counts = defaultdict(int)
+    plates = defaultdict(int)
+    for row in rows:
+        timestamp, plate, location = row[0], row[2], row[3]
+        t = parse_timestamp(timestamp)
+        if t is None:
+            continue
+        for resolution in RESOLUTIONS:
+            bucket = bucket_of(t, resolution)
+            counts[(ALL_LOCATIONS, resolution, bucket)] += 1
+            if location:
+                counts[(location, resolution, bucket)] += 1
+        if plate:
+            plates[(bucket_of(t, DAY), plate, location or ALL_LOCATIONS)] += 1
+    conn.executemany(UPSERT_VIOLATION_ROLLUP_SQL, [key + (n,) for key, n in counts.items()])
+    conn.executemany(UPSERT_PLATE_ROLLUP_SQL, [key + (n,) for key, n in plates.items()])
+
+
+def distinct_keys(conn, table, column):
+    """Distinct values of a table's leading key column, one index seek each."""
+    return [key for (key,) in conn.execute(f'''
+        WITH RECURSIVE keys(key) AS (
+            SELECT MIN({column}) FROM {table}
+            UNION ALL
+            SELECT (SELECT MIN({column}) FROM {table} WHERE {column} > key)
+            FROM keys WHERE key IS NOT NULL
+        )
+        SELECT key FROM keys WHERE key IS NOT NULL
+    ''')]
+
+
+def prune(conn, now, retention_days=MINUTE_RETENTION_DAYS):
+    """Drop minute buckets older than the retention, one index range per key."""
+    cutoff = bucket_of(now, DAY) - retention_days * DAY
+    for intersection_id in distinct_keys(conn, "light_rollup", "intersection_id"):
+        conn.execute('''
+            DELETE FROM light_rollup
+            WHERE intersection_id = ? AND resolution = ? AND bucket_start < ?
+        ''', (intersection_id, MINUTE, cutoff))
+    for location in distinct_keys(conn, "violation_rollup", "location"):
+        conn.execute('''
+            DELETE FROM violation_rollup
+            WHERE location = ? AND resolution = ? AND bucket_start < ?
+        ''', (location, MINUTE, cutoff))
+
+
+def backfill(conn, chunk=50000):
+    """Build the rollups from the full light_status and violations history."""
+    rollup = LightRollup()
+    last_id = 0
+    while True:
+        rows = conn.execute('''
+            SELECT id, timestamp, status, intersection_id FROM light_status
+            WHERE id > ? ORDER BY id LIMIT ?
+        ''', (last_id, chunk)).fetchall()
+        if not rows:
+            break
+        for _, timestamp, status, intersection_id in rows:
+            rollup.add(timestamp, status, intersection_id)
+        rollup.flush(conn)
+        last_id = rows[-1][0]
+
+    last_id = 0
+    while True:
+        rows = conn.execute('''
+            SELECT id, timestamp, type, plate, location FROM violations
+            WHERE id > ? ORDER BY id LIMIT ?
+        ''', (last_id, chunk)).fetchall()
+        if not rows:
+            break
+        record_violations(conn, [row[1:] for row in rows])
+        last_id = rows[-1][0]
@@ -0,0 +1,405 @@
+"""SQLite access shared by the MQTT listener and the API server.
+
+Both processes open the same database file. Connections are tuned once
+(WAL journal, relaxed fsync, larger page cache) and then reused from a small
+pool instead of being opened and closed around every statement, and the
+schema is created and migrated from a single place: ``init_db``.
+"""
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from queue import LifoQueue, Empty, Full
+
+import rollups
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_FILE = os.environ.get("TRAFFIC_DB_FILE", os.path.join(BASE_DIR, "traffic_data.db"))
+
+POOL_SIZE = 8
+EVENT_RETENTION = 10000     # newest rows kept in the events table
+BUSY_TIMEOUT = 5.0          # seconds to wait for a lock held by the other process
+STATEMENT_CACHE_SIZE = 128  # compiled statements kept per connection
+
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",      # readers no longer block the writer (and vice versa)
+    "PRAGMA synchronous=NORMAL",    # fsync at checkpoints only; safe with WAL
+    "PRAGMA cache_size=-32000",     # 32 MB page cache
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",   # 256 MB
+)
+
+# -------- Statements --------
+# Kept as module constants so every call passes the identical SQL string and
+# sqlite3's per-connection statement cache hands back the prepared statement.
+INSERT_VIOLATION_SQL = '''
+    INSERT INTO violations (timestamp, type, plate, location, image_hash, thumbnail_base64, trace_id, clip)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+'''
+INSERT_LIGHT_STATUS_SQL = '''
+    INSERT INTO light_status (timestamp, status, intersection_id)
+    VALUES (?, ?, ?)
+'''
+# Same parameter order as INSERT_LIGHT_STATUS_SQL so one row tuple feeds both.
+# All right-hand sides see the old row, so "since" only moves on a change.
+UPSERT_INTERSECTION_STATE_SQL = '''
+    INSERT INTO intersection_state (timestamp, status, intersection_id, since)
+    VALUES (?1, ?2, ?3, ?1)
+    ON CONFLICT (intersection_id) DO UPDATE SET
+        since = CASE WHEN status = excluded.status THEN since ELSE excluded.timestamp END,
+        status = excluded.status,
+        timestamp = excluded.timestamp
+'''
+
+
+def connect(db_file=None):
+    """Open a new connection with the shared pragmas applied."""
+    conn = sqlite3.connect(
+        db_file or DB_FILE,
+        timeout=BUSY_TIMEOUT,
+        check_same_thread=False,  # pooled connections move between threads
+        cached_statements=STATEMENT_CACHE_SIZE,
+    )
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+class ConnectionPool:
+    """A bounded pool of tuned connections.
+
+    A connection is only ever used by one thread at a time; it is handed out
+    by ``connection()`` and returned when the block exits. The most recently
+    returned connection is reused first so its page cache stays warm.
+    """
+
+    def __init__(self, db_file=None, size=POOL_SIZE):
+        self.db_file = db_file
+        self.idle = LifoQueue(maxsize=size)
+
+    def acquire(self):
+        try:
+            return self.idle.get_nowait()
+        except Empty:
+            return connect(self.db_file)
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        try:
+            self.idle.put_nowait(conn)
+        except Full:
+            conn.close()
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except Empty:
+                break
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool()
+    return _pool
+
+
+@contextmanager
+def connection():
+    """Borrow a pooled connection for a read or a hand-managed transaction."""
+    pool = get_pool()
+    conn = pool.acquire()
+    try:
+        yield conn
+    finally:
+        pool.release(conn)
+
+
+@contextmanager
+def transaction():
+    """Borrow a pooled connection and commit (or roll back) on exit."""
+    with connection() as conn:
+        with conn:
+            yield conn
+
+
+# -------- Schema --------
+
+def _migrate_1(conn):
+    """Base tables, as created by the first version of the listener."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS violations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp TEXT,
+            type TEXT,
+            plate TEXT,
+            location TEXT,
+            image_base64 TEXT
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS light_status (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp TEXT,
+            status TEXT,
+            intersection_id TEXT
+        )
+    ''')
+
+
+def _migrate_2(conn):
+    """Images moved to the image store; rows keep only a hash and thumbnail."""
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(violations)")]
+    if "image_hash" not in columns:
+        conn.execute("ALTER TABLE violations ADD COLUMN image_hash TEXT")
+    if "thumbnail_base64" not in columns:
+        conn.execute("ALTER TABLE violations ADD COLUMN thumbnail_base64 TEXT")
+
+
+def _migrate_3(conn):
+    """Indexes for status lookups and violation filters, plus a row counter."""
+    # Covering index: the newest status of an intersection is one index seek.
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_light_status_latest
+        ON light_status (intersection_id, id, status, timestamp)
+    ''')
+    # Each filter index ends in id so filtered pages can still walk id DESC.
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_violations_plate ON violations (plate, id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_violations_location ON violations (location, id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_violations_timestamp ON violations (timestamp)")
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS row_counts (
+            name TEXT PRIMARY KEY,
+            count INTEGER NOT NULL
+        )
+    ''')
+    conn.execute('''
+        INSERT OR REPLACE INTO row_counts (name, count)
+        SELECT 'violations', COUNT(*) FROM violations
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_violations_count_insert
+        AFTER INSERT ON violations
+        BEGIN
+            UPDATE row_counts SET count = count + 1 WHERE name = 'violations';
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_violations_count_delete
+        AFTER DELETE ON violations
+        BEGIN
+            UPDATE row_counts SET count = count - 1 WHERE name = 'violations';
+        END
+    ''')
+    # Sampled statistics so the planner can choose between the filter indexes.
+    conn.execute("PRAGMA analysis_limit=1000")
+    conn.execute("ANALYZE")
+
+
+def _migrate_4(conn):
+    """Current state per intersection, kept next to the light_status history."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS intersection_state (
+            intersection_id TEXT PRIMARY KEY,
+            status TEXT,
+            timestamp TEXT,
+            since TEXT
+        )
+    ''')
+    # Seed from history: newest row per intersection via the covering index.
+    conn.execute('''
+        INSERT OR REPLACE INTO intersection_state (intersection_id, status, timestamp, since)
+        SELECT intersection_id, status, timestamp, timestamp
+        FROM light_status
+        WHERE id IN (
+            SELECT MAX(id) FROM light_status
+            WHERE intersection_id IS NOT NULL
+            GROUP BY intersection_id
+        )
+    ''')
+
+
+def _migrate_5(conn):
+    """Event log of light changes and new violations for the push stream."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            created REAL NOT NULL
+        )
+    ''')
+    # Triggers write the events in the same transaction as the change itself,
+    # so a stream consumer never sees an event for data that was rolled back.
+    # An UPSERT that updates fires the UPDATE trigger, which only logs actual
+    # status changes, not repeated reports of the same status.
+    light_event = '''
+        INSERT INTO events (kind, payload, created)
+        VALUES ('light', json_object(
+            'intersection_id', new.intersection_id,
+            'status', new.status,
+            'timestamp', new.timestamp,
+            'since', new.since
+        ), (julianday('now') - 2440587.5) * 86400.0);
+    '''
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_intersection_state_event_insert
+        AFTER INSERT ON intersection_state
+        BEGIN {light_event} END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_intersection_state_event_update
+        AFTER UPDATE ON intersection_state
+        WHEN old.status IS NOT new.status
+        BEGIN {light_event} END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_violations_event_insert
+        AFTER INSERT ON violations
+        BEGIN
+            INSERT INTO events (kind, payload, created)
+            VALUES ('violation', json_object(
+                'id', new.id,
+                'timestamp', new.timestamp,
+                'type', new.type,
+                'plate', new.plate,
+                'location', new.location
+            ), (julianday('now') - 2440587.5) * 86400.0);
+        END
+    ''')
+
+
+def _migrate_6(conn):
+    """Rollup tables for analytics, backfilled from the history."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS light_rollup (
+            intersection_id TEXT NOT NULL,
+            resolution INTEGER NOT NULL,
+            bucket_start INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            seconds REAL NOT NULL,
+            transitions INTEGER NOT NULL,
+            PRIMARY KEY (intersection_id, resolution, bucket_start, status)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS violation_rollup (
+            location TEXT NOT NULL,
+            resolution INTEGER NOT NULL,
+            bucket_start INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (location, resolution, bucket_start)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS plate_rollup (
+            day INTEGER NOT NULL,
+            plate TEXT NOT NULL,
+            location TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (day, plate, location)
+        ) WITHOUT ROWID
+    ''')
+    rollups.backfill(conn)
+
+
+def _migrate_7(conn):
+    """Correlation ID of the red phase a violation was detected in."""
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(violations)")]
+    if "trace_id" not in columns:
+        conn.execute("ALTER TABLE violations ADD COLUMN trace_id TEXT")
+
+
+def _migrate_8(conn):
+    """Name of the evidence clip a detector recorded around a violation."""
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(violations)")]
+    if "clip" not in columns:
+        conn.execute("ALTER TABLE violations ADD COLUMN clip TEXT")
+
+
+# Append new steps here; the list index + 1 is the schema version.
+MIGRATIONS = [
+    _migrate_1,
+    _migrate_2,
+    _migrate_3,
+    _migrate_4,
+    _migrate_5,
+    _migrate_6,
+    _migrate_7,
+    _migrate_8,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def init_db():
+    """Create or upgrade the schema. Safe to call from every process on start."""
+    conn = connect()
+    try:
+        # BEGIN IMMEDIATE serialises concurrent starts of the listener and API.
+        conn.isolation_level = None
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            for step in range(version, SCHEMA_VERSION):
+                MIGRATIONS[step](conn)
+                print(f"[DB] Applied migration {step + 1}: {MIGRATIONS[step].__doc__}")
+            if version < SCHEMA_VERSION:
+                conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
+
+
+# -------- Writes --------
+
+def insert_violation(conn, timestamp, violation_type, plate, location, image_hash, thumbnail,
+                     trace_id=None, clip=None):
+    insert_violations(conn, [(timestamp, violation_type, plate, location, image_hash, thumbnail, trace_id, clip)])
+
+
+def insert_light_status(conn, timestamp, status, intersection_id):
+    """Append to the history and update the current state in one transaction."""
+    insert_light_statuses(conn, [(timestamp, status, intersection_id)])
+
+
+def insert_violations(conn, rows):
+    """Batch form of insert_violation; rows are tuples in the same order.
+
+    ``trace_id`` and ``clip`` may be left off the end of a row.
+    """
+    conn.executemany(INSERT_VIOLATION_SQL, [tuple(row) + (None,) * (8 - len(row)) for row in rows])
+    rollups.record_violations(conn, rows)
+
+
+def insert_light_statuses(conn, rows):
+    """Batch form of insert_light_status; rows are tuples in the same order."""
+    conn.executemany(INSERT_LIGHT_STATUS_SQL, rows)
+    # Reads the phases being ended from intersection_state, so before the upsert.
+    rollups.record_light_statuses(conn, rows)
+    # Rows are applied in order, so the last status of each intersection wins.
+    conn.executemany(UPSERT_INTERSECTION_STATE_SQL, [row for row in rows if row[2] is not None])
+
+
+def prune_rollups(conn, now):
+    """Drop minute rollups older than rollups.MINUTE_RETENTION_DAYS."""
+    rollups.prune(conn, now)
+
+
+def prune_events(conn, keep=EVENT_RETENTION):
+    """Drop all but the newest ``keep`` events (a range delete on the key)."""
+    conn.execute('''
+        DELETE FROM events
+        WHERE id <= (SELECT MAX(id) FROM events) - ?
+    ''', (keep,))
@@ -0,0 +1,120 @@
+"""Light state handoff: JSON file polled every 10 ms vs socket push.
+
+A writer thread changes the state ``--changes`` times at random intervals.
+The reader records when it first sees each change. Afterwards both readers
+sit idle for ``--idle`` seconds, which measures their background CPU.
+
+    python bench_light_state.py --changes 200
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+
+from light_state import LightStateClient, LightStateServer
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def write_file(path, payload):
+    """The original publish_status file write."""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(json.dumps(payload))
+        f.flush()
+        os.fsync(f.fileno())
+    os.rename(tmp_path, path)
+
+
+def thread_cpu(thread):
+    return time.clock_gettime(time.pthread_getcpuclockid(thread.ident))
+
+
+def drive(publish, changes, seen):
+    latencies = []
+    for i in range(changes):
+        time.sleep(random.uniform(0.02, 0.05))
+        sent = time.monotonic()
+        publish({"status": "Red" if i % 2 else "Green", "intersection_id": "0", "seq": i})
+        deadline = sent + 1
+        while seen.get(i) is None and time.monotonic() < deadline:
+            time.sleep(0.0002)
+        if i in seen:
+            latencies.append(seen[i] - sent)
+    return latencies
+
+
+def run_file_poll(directory, changes, idle):
+    path = os.path.join(directory, "traffic_light.json")
+    write_file(path, {"status": "Off", "intersection_id": "0", "seq": -1})
+    seen = {}
+    stop = threading.Event()
+
+    def monitor_traffic_light():
+        while not stop.is_set():
+            try:
+                with open(path, "r") as f:
+                    data = json.load(f)
+                seen.setdefault(data["seq"], time.monotonic())
+            except Exception:
+                pass
+            finally:
+                time.sleep(0.01)
+
+    reader = threading.Thread(target=monitor_traffic_light, daemon=True)
+    reader.start()
+    latencies = drive(lambda payload: write_file(path, payload), changes, seen)
+    cpu_start = thread_cpu(reader)
+    time.sleep(idle)
+    idle_cpu = thread_cpu(reader) - cpu_start
+    stop.set()
+    return latencies, idle_cpu
+
+
+def run_socket(directory, changes, idle):
+    server = LightStateServer(os.path.join(directory, "traffic_light.sock")).start()
+    client = LightStateClient("0", server.path, os.path.join(directory, "missing.json"))
+    seen = {}
+    update = client.update
+
+    def timed_update(data):
+        seen.setdefault(data["seq"], time.monotonic())
+        update(data)
+    client.update = timed_update
+    reader = threading.Thread(target=client.run, daemon=True)
+    reader.start()
+    while not client.connected:
+        time.sleep(0.001)
+    latencies = drive(server.publish, changes, seen)
+    cpu_start = thread_cpu(reader)
+    time.sleep(idle)
+    idle_cpu = thread_cpu(reader) - cpu_start
+    server.close()
+    return latencies, idle_cpu
+
+
+def report(name, latencies, idle_cpu, idle):
+    print(f"{name:<10} changes seen {len(latencies):4d}  "
+          f"p50 {percentile(latencies, 50) * 1000:7.3f} ms  "
+          f"p99 {percentile(latencies, 99) * 1000:7.3f} ms  "
+          f"max {max(latencies or [0]) * 1000:7.3f} ms  "
+          f"idle cpu {idle_cpu / idle * 100:.3f}%")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--changes", type=int, default=200)
+    parser.add_argument("--idle", type=float, default=5.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        report("file poll", *run_file_poll(directory, args.changes, args.idle), args.idle)
+        report("socket", *run_socket(directory, args.changes, args.idle), args.idle)
@@ -0,0 +1,85 @@
+"""Cost of instrumentation on a hot path.
+
+Times each metrics operation in a tight loop, with a bare loop as the
+baseline, then prices the detector's frame loop: it observes
+``--per-frame`` stage samples per frame (capture, prefilter, encode,
+frame). The overhead is reported against the frame interval at ``--fps``,
+which is the budget one core has for a frame, and as the cost with a
+render of the whole registry on every ``--scrape-interval``.
+
+    python bench_metrics.py --iterations 200000 --fps 30 --per-frame 4
+"""
+import argparse
+import time
+
+import metrics
+
+
+def per_call(function, iterations):
+    """Seconds per call of ``function``, minus the loop itself."""
+    def loop(body):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            body()
+        return time.perf_counter() - start
+
+    baseline = min(loop(lambda: None) for _ in range(3))
+    elapsed = min(loop(function) for _ in range(3))
+    return max(0.0, elapsed - baseline) / iterations
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=200000)
+    parser.add_argument("--fps", type=float, default=30)
+    parser.add_argument("--per-frame", type=int, default=4, help="stage samples per frame")
+    parser.add_argument("--scrape-interval", type=float, default=15, help="seconds")
+    args = parser.parse_args()
+
+    registry = metrics.Registry()
+    counter = registry.counter("bench_total", "Bench counter", ("kind",))
+    histogram = registry.histogram("bench_seconds", "Bench histogram", ("stage",))
+    series = histogram.labels("encode")
+    child = counter.labels("status")
+
+    @metrics.timed(series)
+    def decorated():
+        pass
+
+    def plain():
+        pass
+
+    def with_block():
+        with metrics.timed(series):
+            pass
+
+    def labelled_observe():
+        histogram.labels("encode").observe(0.004)
+
+    costs = {
+        "counter child inc": per_call(lambda: child.inc(), args.iterations),
+        "histogram child observe": per_call(lambda: series.observe(0.004), args.iterations),
+        "labels() + observe": per_call(labelled_observe, args.iterations),
+        "with timed(...)": per_call(with_block, args.iterations),
+        "decorated call (vs plain)": per_call(decorated, args.iterations) - per_call(plain, args.iterations),
+    }
+    for name, seconds in costs.items():
+        print(f"{name:<27} {seconds * 1e9:8.0f} ns")
+
+    # A registry the size of the detector's: a dozen stages, some counters.
+    for stage in ("capture", "prefilter", "crop", "encode", "frame", "recognition", "dedup", "publish"):
+        histogram.labels(stage).observe(0.01)
+    for kind in ("a", "b", "c", "d"):
+        counter.labels(kind).inc()
+    start = time.perf_counter()
+    for _ in range(100):
+        registry.render()
+    render = (time.perf_counter() - start) / 100
+
+    frame_budget = 1 / args.fps
+    per_frame = args.per_frame * costs["histogram child observe"]
+    scrape_share = render / args.scrape_interval
+    print(f"render ({len(registry.render().splitlines())} lines) {render * 1e6:8.0f} us")
+    print(f"per frame: {args.per_frame} observes = {per_frame * 1e6:.2f} us of a {frame_budget * 1e3:.1f} ms "
+          f"frame ({per_frame / frame_budget:.4%}); with scrapes every {args.scrape_interval:.0f} s: "
+          f"{(per_frame * args.fps + scrape_share):.4%} of one core")
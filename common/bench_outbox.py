@@ -0,0 +1,91 @@
+"""Outbox cost while online and drain speed after an outage.
+
+Measures two things:
+- enqueue latency for status-sized and violation-sized payloads, which is
+  what the controller and the detector pay per publish
+- with ``--backlog`` messages queued during an outage, how long a
+  reconnected sender takes to empty the outbox. The broker is simulated:
+  it acknowledges each publish ``--rtt`` seconds later. Batched sends are
+  compared with one message per round trip.
+
+    python bench_outbox.py --backlog 2000 --rtt 0.05
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from outbox import Outbox, OutboxSender
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+class SimulatedBroker:
+    """Paho-like client whose acknowledgements arrive ``rtt`` after publishing."""
+
+    class Info:
+        rc = 0
+
+        def __init__(self, acked_at):
+            self.acked_at = acked_at
+
+        def is_published(self):
+            return time.monotonic() >= self.acked_at
+
+    def __init__(self, rtt):
+        self.rtt = rtt
+
+    def is_connected(self):
+        return True
+
+    def publish(self, topic, payload, qos=0):
+        return self.Info(time.monotonic() + self.rtt)
+
+
+def enqueue_latency(directory, size, count):
+    outbox = Outbox(os.path.join(directory, f"enqueue-{size}.db"))
+    payload = os.urandom(size)
+    samples = []
+    for _ in range(count):
+        start = time.perf_counter()
+        outbox.publish("traffic_violation/0/detected", payload)
+        samples.append(time.perf_counter() - start)
+    outbox.close()
+    return samples
+
+
+def drain(directory, backlog, rtt, batch_size, rate):
+    outbox = Outbox(os.path.join(directory, f"drain-{batch_size}.db"))
+    for i in range(backlog):
+        outbox.publish("traffic_light/0/status", b'{"status": "Red", "intersection_id": "0"}')
+    sender = OutboxSender(outbox, SimulatedBroker(rtt), batch_size=batch_size, rate=rate)
+    start = time.perf_counter()
+    while outbox.backlog:
+        sender.drain_once()
+    elapsed = time.perf_counter() - start
+    outbox.close()
+    return elapsed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backlog", type=int, default=2000)
+    parser.add_argument("--rtt", type=float, default=0.05, help="simulated broker ack delay (s)")
+    parser.add_argument("--rate", type=float, default=500, help="sender rate limit (msgs/s)")
+    parser.add_argument("--enqueues", type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        for size in (80, 60000):
+            samples = enqueue_latency(directory, size, args.enqueues)
+            print(f"enqueue {size:6d} B   p50 {percentile(samples, 50) * 1000:6.3f} ms   "
+                  f"p99 {percentile(samples, 99) * 1000:6.3f} ms")
+        for batch_size in (1, 50):
+            elapsed = drain(directory, args.backlog, args.rtt, batch_size, args.rate)
+            print(f"drain {args.backlog} msgs, batch {batch_size:3d}: {elapsed:7.2f} s   "
+                  f"{args.backlog / elapsed:8.1f} msgs/s")
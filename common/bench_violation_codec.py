@@ -0,0 +1,46 @@
+"""Violation messages: JSON with a base64 image vs the binary sv1 format.
+
+For each evidence image size this prints:
+- bytes per message
+- encode time on the detector
+- decode time on the listener (everything up to having the raw JPEG
+  bytes in hand)
+
+    python bench_violation_codec.py --sizes 20000,60000,150000 --messages 2000
+"""
+import argparse
+import os
+import time
+
+from violation_codec import FORMAT_BINARY, FORMAT_JSON, decode, encode
+
+
+def per_message_us(fn, arg, messages):
+    start = time.perf_counter()
+    for _ in range(messages):
+        fn(arg)
+    return (time.perf_counter() - start) / messages * 1e6
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="20000,60000,150000", help="JPEG sizes in bytes")
+    parser.add_argument("--messages", type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"{'image':>8} {'format':>6} {'bytes/msg':>10} {'overhead':>9} {'encode us':>10} {'decode us':>10}")
+    for size in (int(s) for s in args.sizes.split(",")):
+        violation = {
+            "timestamp": "2025-05-01T12:00:00+00:00Z",
+            "plate": "ABC1234",
+            "intersection_id": "0",
+            "confidence": 0.91,
+            "image_bytes": os.urandom(size),  # JPEG data is about as incompressible
+        }
+        for fmt in (FORMAT_JSON, FORMAT_BINARY):
+            payload = encode(violation, fmt)
+            assert decode(payload)["image_bytes"] == violation["image_bytes"]
+            encode_us = per_message_us(lambda v: encode(v, fmt), violation, args.messages)
+            decode_us = per_message_us(decode, payload, args.messages)
+            print(f"{size:8d} {fmt:>6} {len(payload):10d} {len(payload) / size - 1:8.1%} "
+                  f"{encode_us:10.1f} {decode_us:10.1f}")
@@ -0,0 +1,178 @@
+"""Local pub/sub for traffic light state over a Unix domain socket.
+
+The controller (traffic_light/main.py) runs a LightStateServer and
+publishes every transition. The violation detector keeps a
+LightStateClient connected. Each message is one line of JSON carrying the
+same payload as the MQTT status topic.
+
+A new subscriber first receives the latest state of every intersection,
+so it never has to poll. Readers block in recv(), which means they wake
+within microseconds of a change and use no CPU while the light holds its
+state.
+
+When the socket is unavailable, the client reads ``STATUS_FILE`` about
+once a second until it can reconnect. This covers a controller that is
+not running yet, or an older one that only writes the JSON file.
+"""
+import json
+import logging
+import os
+import socket
+import threading
+import time
+
+SOCKET_PATH = os.environ.get('TRAFFIC_LIGHT_SOCKET', '/tmp/traffic_light.sock')
+STATUS_FILE = '/tmp/traffic_light.json'
+
+logger = logging.getLogger(__name__)
+
+
+def encode(payload):
+    return (json.dumps(payload) + '\n').encode('utf-8')
+
+
+class LightStateServer:
+    """Accepts local subscribers and pushes every published state to them.
+
+    ``publish`` never blocks the runloop: sockets are non-blocking, and a
+    subscriber that stops reading is dropped. A dropped subscriber gets a
+    fresh snapshot when it reconnects.
+    """
+
+    def __init__(self, path=SOCKET_PATH):
+        self.path = path
+        self.sock = None
+        self.lock = threading.Lock()
+        self.clients = []
+        self.latest = {}  # intersection_id -> encoded line
+
+    def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)  # stale socket from a previous run
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(self.path)
+        self.sock.listen(16)
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+        return self
+
+    def _accept_loop(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return  # closed
+            with self.lock:
+                try:
+                    conn.settimeout(1.0)
+                    conn.sendall(b''.join(self.latest.values()))
+                    conn.setblocking(False)
+                except OSError:
+                    conn.close()
+                    continue
+                self.clients.append(conn)
+
+    def publish(self, payload):
+        line = encode(payload)
+        with self.lock:
+            self.latest[str(payload['intersection_id'])] = line
+            for conn in list(self.clients):
+                try:
+                    sent = conn.send(line)
+                except OSError:  # includes BlockingIOError: subscriber not reading
+                    sent = 0
+                if sent != len(line):
+                    self.clients.remove(conn)
+                    conn.close()
+
+    def close(self):
+        with self.lock:
+            for conn in self.clients:
+                conn.close()
+            self.clients = []
+        if self.sock is not None:
+            try:
+                self.sock.shutdown(socket.SHUT_RDWR)  # wakes the blocked accept()
+            except OSError:
+                pass
+            self.sock.close()
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+
+class LightStateClient:
+    """Keeps ``state`` current for one intersection (or any, if None).
+
+    ``state`` is the latest status payload dict (empty until the first
+    one arrives). ``version`` increases on every change, and
+    ``wait_for_change`` blocks until it moves past a given value.
+    """
+
+    def __init__(self, intersection_id=None, path=SOCKET_PATH, status_file=STATUS_FILE,
+                 fallback_interval=1.0):
+        self.intersection_id = None if intersection_id is None else str(intersection_id)
+        self.path = path
+        self.status_file = status_file
+        self.fallback_interval = fallback_interval
+        self.state = {}
+        self.version = 0
+        self.connected = False
+        self.changed = threading.Condition()
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
+        return self
+
+    def update(self, data):
+        if self.intersection_id is not None and str(data.get('intersection_id')) != self.intersection_id:
+            return
+        with self.changed:
+            if data == self.state:
+                return
+            self.state = data
+            self.version += 1
+            self.changed.notify_all()
+
+    def wait_for_change(self, version, timeout=None):
+        """Block until ``self.version != version``; return (version, state)."""
+        with self.changed:
+            self.changed.wait_for(lambda: self.version != version, timeout)
+            return self.version, self.state
+
+    def _read_file(self):
+        try:
+            with open(self.status_file) as f:
+                self.update(json.load(f))
+        except (OSError, ValueError):
+            pass
+
+    def _listen(self, sock):
+        buffer = b''
+        while True:
+            chunk = sock.recv(4096)
+            if not chunk:
+                return
+            buffer += chunk
+            while b'\n' in buffer:
+                line, buffer = buffer.split(b'\n', 1)
+                self.update(json.loads(line))
+
+    def run(self):
+        while True:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(self.path)
+            except OSError:
+                sock.close()
+                self._read_file()
+                time.sleep(self.fallback_interval)
+                continue
+
+            self.connected = True
+            logger.info(f"Subscribed to light state on {self.path}")
+            try:
+                self._listen(sock)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Light state connection lost: {e}")
+            finally:
+                self.connected = False
+                sock.close()
@@ -0,0 +1,418 @@
+"""Runtime metrics for every service, in the Prometheus text format.
+
+Each process keeps its metrics in a ``Registry`` (the module-level
+``REGISTRY`` by default) and serves ``render()`` on ``/metrics``. The
+detector and the API servers add the route to their app. The controller
+and the MQTT listener have no HTTP server, so they call ``serve(port)``.
+
+- ``Counter``: a value that only goes up (messages, errors)
+- ``Gauge``: a value that goes up and down (queue depth)
+- ``Histogram``: observations counted into cumulative ``le`` buckets,
+  plus their sum and count (latencies, sizes)
+
+Each of them takes label names, and ``labels(...)`` returns the child
+series for one set of label values. Hot paths should look the child up
+once and keep it. ``observe`` and ``inc`` take an uncontended lock and
+cost about a microsecond (see bench_metrics.py). ``timed`` wraps a
+function, or a ``with`` block, in a histogram observation.
+
+Components that already keep counters in a ``stats()`` dict do not need
+to touch their hot path: ``Registry.collect`` reads the dict at scrape
+time and exposes its numbers.
+
+Correlation IDs: the controller mints one with ``new_trace_id`` at every
+red onset and sends it with the status. The detector copies it into each
+violation of that red phase, and the listener stores it with the row. So
+controller logs, detector logs and the database row of one violation can
+be joined (see docs/mqtt_protocol.md).
+"""
+import asyncio
+import functools
+import math
+import re
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds, from a sub-millisecond stage up to a violation that waited
+# on ALPR and the outbox.
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0)
+
+_NAME = re.compile(r"[a-zA-Z_:][a-zA-Z0-9_:]*$")
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Value:
+    """One counter or gauge series."""
+
+    def __init__(self):
+        self.value = 0.0
+        self.function = None
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1.0):
+        with self.lock:
+            self.value += amount
+
+    def set_function(self, function):
+        """Read the value from ``function()`` at scrape time instead."""
+        self.function = function
+
+    def get(self):
+        if self.function is not None:
+            return self.function()
+        return self.value
+
+
+class _GaugeValue(_Value):
+    def dec(self, amount=1.0):
+        self.inc(-amount)
+
+    def set(self, value):
+        with self.lock:
+            self.value = value
+
+
+class _HistogramValue:
+    """One histogram series: per-bucket counts, made cumulative on render."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def time(self):
+        """Observe the duration of a ``with`` block or every call of a function."""
+        return timed(self)
+
+    def snapshot(self):
+        with self.lock:
+            return list(self.counts), self.sum
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        if not _NAME.match(name):
+            raise ValueError(f"Invalid metric name: {name}")
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.children = {}
+        self.lock = threading.Lock()
+        if not self.labelnames:
+            self.children[()] = self._child()
+
+    def _child(self):
+        raise NotImplementedError
+
+    def labels(self, *values, **kwargs):
+        """The series for one set of label values, created on first use."""
+        if kwargs:
+            values = tuple(kwargs[name] for name in self.labelnames)
+        key = tuple(str(value) for value in values)
+        if len(key) != len(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}")
+        child = self.children.get(key)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(key, self._child())
+        return child
+
+    def _unlabelled(self):
+        if self.labelnames:
+            raise ValueError(f"{self.name} has labels; use labels(...)")
+        return self.children[()]
+
+    def samples(self):
+        for key, child in list(self.children.items()):
+            yield self.name, _label_text(self.labelnames, key), child.get()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for name, labels, value in self.samples():
+            lines.append(f"{name}{labels} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _child(self):
+        return _Value()
+
+    def inc(self, amount=1.0):
+        self._unlabelled().inc(amount)
+
+    def set_function(self, function):
+        self._unlabelled().set_function(function)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _child(self):
+        return _GaugeValue()
+
+    def inc(self, amount=1.0):
+        self._unlabelled().inc(amount)
+
+    def dec(self, amount=1.0):
+        self._unlabelled().dec(amount)
+
+    def set(self, value):
+        self._unlabelled().set(value)
+
+    def set_function(self, function):
+        self._unlabelled().set_function(function)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(float(b) for b in buckets if b != math.inf))
+        super().__init__(name, documentation, labelnames)
+
+    def _child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self._unlabelled().observe(value)
+
+    def time(self):
+        return self._unlabelled().time()
+
+    def snapshot(self):
+        return self._unlabelled().snapshot()
+
+    def samples(self):
+        for key, child in list(self.children.items()):
+            counts, total = child.snapshot()
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                yield (f"{self.name}_bucket", _label_text(self.labelnames, key, ("le", _format_value(bound))),
+                       cumulative)
+            yield f"{self.name}_sum", _label_text(self.labelnames, key), total
+            yield f"{self.name}_count", _label_text(self.labelnames, key), cumulative
+
+
+class _Collected:
+    """Numbers from a ``stats()`` dict, read at scrape time."""
+
+    def __init__(self, prefix, stats, counters, labels=None):
+        self.prefix = prefix
+        self.stats = stats
+        self.counters = set(counters)
+        self.labels = _label_text(labels or {}, (labels or {}).values())
+
+    @staticmethod
+    def render_all(sources):
+        """Render sources that share a prefix, one TYPE line per metric."""
+        families = {}  # name -> (kind, [sample line]), in first-seen order
+        errors = []
+        for source in sources:
+            try:
+                data = source.stats()
+            except Exception as e:
+                errors.append(f"# {source.prefix}{source.labels}: stats failed: {_escape(e)}")
+                continue
+            for key, value in source._flatten(data):
+                name = f"{source.prefix}_{key}"
+                kind = "gauge"
+                if key in source.counters:
+                    name, kind = name + "_total", "counter"
+                family = families.setdefault(name, (kind, []))
+                family[1].append(f"{name}{source.labels} {_format_value(value)}")
+        lines = list(errors)
+        for name, (kind, samples) in families.items():
+            lines.append(f"# TYPE {name} {kind}")
+            lines += samples
+        return lines
+
+    def _flatten(self, data, prefix=""):
+        for key, value in data.items():
+            key = re.sub(r"[^a-zA-Z0-9_]", "_", f"{prefix}{key}")
+            if isinstance(value, dict):
+                yield from self._flatten(value, key + "_")
+            elif isinstance(value, bool):
+                yield key, int(value)
+            elif isinstance(value, (int, float)):
+                yield key, value
+
+
+class Registry:
+    """The metrics of one process. Asking for an existing name returns it."""
+
+    def __init__(self):
+        self.metrics = {}
+        self.collected = []
+        self.lock = threading.Lock()
+
+    def _get(self, cls, name, *args, **kwargs):
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"{name} is already registered as a {metric.kind}")
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._get(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._get(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._get(Histogram, name, documentation, labelnames, buckets)
+
+    def collect(self, prefix, stats, counters=(), labels=None):
+        """Expose the numbers in ``stats()`` as ``<prefix>_<key>`` on every scrape.
+
+        Nested dicts are flattened with ``_``. Keys listed in ``counters``
+        become ``<prefix>_<key>_total`` counters; the rest are gauges.
+        Several components of one kind (e.g. one per camera) share a prefix
+        and tell their series apart by ``labels``, a dict.
+        """
+        with self.lock:
+            self.collected.append(_Collected(prefix, stats, counters, labels))
+
+    def render(self):
+        with self.lock:
+            metrics = list(self.metrics.values())
+            collected = list(self.collected)
+        lines = []
+        for metric in metrics:
+            lines += metric.render()
+        by_prefix = {}
+        for source in collected:
+            by_prefix.setdefault(source.prefix, []).append(source)
+        for sources in by_prefix.values():
+            lines += _Collected.render_all(sources)
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name, documentation, labelnames=()):
+    return REGISTRY.counter(name, documentation, labelnames)
+
+
+def gauge(name, documentation, labelnames=()):
+    return REGISTRY.gauge(name, documentation, labelnames)
+
+
+def histogram(name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+    return REGISTRY.histogram(name, documentation, labelnames, buckets)
+
+
+class timed:
+    """Observe elapsed seconds into a histogram series.
+
+    As a decorator it times every call, including coroutine functions; as a
+    context manager it times the block::
+
+        @timed(WRITE_SECONDS)
+        def write_batch(messages): ...
+
+        with timed(STAGE_SECONDS.labels("decode")):
+            ...
+    """
+
+    def __init__(self, series):
+        self.series = series
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.series.observe(time.perf_counter() - self.start)
+        return False
+
+    def __call__(self, function):
+        series = self.series
+        if asyncio.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await function(*args, **kwargs)
+                finally:
+                    series.observe(time.perf_counter() - start)
+        else:
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    series.observe(time.perf_counter() - start)
+        return wrapper
+
+
+def serve(port, host="0.0.0.0", registry=REGISTRY):
+    """Serve ``/metrics`` from a daemon thread; returns the server."""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # scrapes every few seconds would flood the console
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
+
+
+# -------- Correlation IDs --------
+
+def new_trace_id():
+    """A short random ID for one red phase and the violations in it."""
+    return uuid.uuid4().hex[:16]
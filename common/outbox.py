@@ -0,0 +1,235 @@
+"""Durable MQTT outbox for the edge processes.
+
+Before, the controller and the detector called ``mqtt_client.publish``
+directly. While the uplink was down, messages either failed (and were
+only logged) or piled up in paho's unbounded in-memory queue, which is
+lost on restart.
+
+Now both write to an ``Outbox``: an append-only SQLite table (WAL mode)
+that survives a restart. ``Outbox.publish`` has paho's signature, so the
+outbox can stand in for the client. An ``OutboxSender`` thread drains it
+to the real client:
+- oldest first, in batches
+- at most ``rate`` messages per second
+- only while the client is connected, so paho's own queue never grows
+- a row is deleted only after the broker acknowledges it, so delivery is
+  at least once
+- on a failed or unacknowledged publish it backs off exponentially,
+  from ``backoff_min`` up to ``backoff_max`` seconds
+
+Disk use is bounded by ``max_bytes`` of payload. When a new message
+would exceed it, the oldest messages are evicted and counted.
+"""
+import logging
+import sqlite3
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+MAX_BYTES = 64 * 1024 * 1024
+
+
+class Outbox:
+    def __init__(self, path: str, max_bytes: int = MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.pending = threading.Event()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # A crash never corrupts WAL; a power cut may lose the last commits.
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                created REAL NOT NULL,
+                topic TEXT NOT NULL,
+                payload BLOB NOT NULL,
+                qos INTEGER NOT NULL
+            )
+        """)
+        self.backlog, self.backlog_bytes = self.conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(payload)), 0) FROM outbox").fetchone()
+        self.enqueued = 0
+        self.evicted = 0
+        if self.backlog:
+            self.pending.set()
+
+    def publish(self, topic: str, payload, qos: int = 1, retain: bool = False) -> int:
+        """Append a message; returns its id. Same call shape as paho's publish."""
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        with self.lock:
+            self._make_room(len(payload))
+            cursor = self.conn.execute(
+                "INSERT INTO outbox (created, topic, payload, qos) VALUES (?, ?, ?, ?)",
+                (time.time(), topic, payload, qos))
+            self.backlog += 1
+            self.backlog_bytes += len(payload)
+            self.enqueued += 1
+        self.pending.set()
+        return cursor.lastrowid
+
+    def _make_room(self, size: int):
+        while self.backlog and self.backlog_bytes + size > self.max_bytes:
+            row = self.conn.execute(
+                "SELECT id, LENGTH(payload) FROM outbox ORDER BY id LIMIT 1").fetchone()
+            self.conn.execute("DELETE FROM outbox WHERE id = ?", (row[0],))
+            self.backlog -= 1
+            self.backlog_bytes -= row[1]
+            self.evicted += 1
+
+    def peek(self, limit: int):
+        """The oldest ``limit`` messages as (id, created, topic, payload, qos)."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT id, created, topic, payload, qos FROM outbox ORDER BY id LIMIT ?",
+                (limit,)).fetchall()
+            if not rows:
+                self.pending.clear()
+            return rows
+
+    def ack(self, ids):
+        """Delete delivered messages. Ids that were evicted meanwhile are ignored."""
+        if not ids:
+            return
+        marks = ",".join("?" * len(ids))
+        with self.lock:
+            self.conn.execute("BEGIN")
+            count, size = self.conn.execute(
+                f"SELECT COUNT(*), COALESCE(SUM(LENGTH(payload)), 0) FROM outbox WHERE id IN ({marks})",
+                ids).fetchone()
+            self.conn.execute(f"DELETE FROM outbox WHERE id IN ({marks})", ids)
+            self.conn.execute("COMMIT")
+            self.backlog -= count
+            self.backlog_bytes -= size
+
+    def oldest_age(self) -> float:
+        with self.lock:
+            row = self.conn.execute("SELECT MIN(created) FROM outbox").fetchone()
+        return time.time() - row[0] if row[0] is not None else 0.0
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class OutboxSender:
+    def __init__(self, outbox: Outbox, client, batch_size: int = 50, rate: float = 50.0,
+                 backoff_min: float = 0.5, backoff_max: float = 10.0, ack_timeout: float = 10.0,
+                 clock=time.monotonic, sleep=time.sleep):
+        self.outbox = outbox
+        self.client = client
+        self.batch_size = batch_size
+        self.rate = rate
+        self.backoff_min = backoff_min
+        self.backoff_max = backoff_max
+        self.ack_timeout = ack_timeout
+        self.clock = clock
+        self.sleep = sleep
+        self.backoff = 0.0
+        self.next_send = 0.0        # rate limit: earliest time of the next publish
+        self.stopped = threading.Event()
+        self.thread = None
+        self.sent = 0
+        self.failures = 0
+        self.last_error = None
+        self.recent = deque(maxlen=10000)  # send times, for the drain rate
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="outbox-sender", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self, timeout: float = 5.0):
+        self.stopped.set()
+        self.outbox.pending.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def run(self):
+        while not self.stopped.is_set():
+            if self.backoff:
+                self.stopped.wait(self.backoff)
+            else:
+                self.outbox.pending.wait(1.0)
+            self.drain_once()
+
+    def drain_once(self) -> int:
+        """Send one batch; returns how many messages were acknowledged."""
+        if not self.client.is_connected():
+            if self.outbox.backlog:
+                self._failed("not connected")
+            return 0
+        # Publish the whole batch, then wait for the acks, so a batch costs
+        # about one round trip rather than one per message.
+        error = None
+        in_flight = []
+        for message_id, _, topic, payload, qos in self.outbox.peek(self.batch_size):
+            if self.stopped.is_set():
+                break
+            self._throttle()
+            info = self.client.publish(topic, payload, qos=qos)
+            if info.rc != 0:
+                error = f"publish rc={info.rc}"
+                break
+            in_flight.append((message_id, info))
+
+        deadline = self.clock() + self.ack_timeout
+        delivered = []
+        for message_id, info in in_flight:
+            if self._wait_published(info, deadline):
+                delivered.append(message_id)
+            else:
+                error = error or "no ack"
+        self.outbox.ack(delivered)
+        now = self.clock()
+        self.recent.extend(now for _ in delivered)
+        self.sent += len(delivered)
+
+        if error:
+            self._failed(error)
+            return len(delivered)
+        if delivered and self.backoff:
+            logger.info(f"Uplink back, {self.outbox.backlog} message(s) still queued")
+        self.backoff = 0.0
+        return len(delivered)
+
+    def _throttle(self):
+        now = self.clock()
+        if self.next_send > now:
+            self.sleep(self.next_send - now)
+            now = self.next_send
+        self.next_send = now + 1.0 / self.rate
+
+    def _wait_published(self, info, deadline: float) -> bool:
+        while not info.is_published():
+            if self.clock() >= deadline or self.stopped.is_set():
+                return False
+            self.sleep(0.005)
+        return True
+
+    def _failed(self, error: str):
+        if not self.backoff:
+            logger.warning(f"Outbox send failed ({error}), {self.outbox.backlog} message(s) queued")
+        self.failures += 1
+        self.last_error = error
+        self.backoff = min(self.backoff_max, max(self.backoff_min, self.backoff * 2))
+
+    def stats(self) -> dict:
+        now = self.clock()
+        window = [t for t in self.recent if now - t <= 60]
+        return {
+            "backlog": self.outbox.backlog,
+            "backlog_bytes": self.outbox.backlog_bytes,
+            "oldest_age_s": round(self.outbox.oldest_age(), 1),
+            "enqueued": self.outbox.enqueued,
+            "evicted": self.outbox.evicted,
+            "sent": self.sent,
+            "drain_rate": round(len(window) / 60, 2),  # messages/s over the last minute
+            "failures": self.failures,
+            "backoff_s": self.backoff,
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,63 @@
+"""Wire format for ``traffic_load/<intersection_id>`` messages.
+
+A detector reports the load on the approach its camera watches, every
+few seconds, as a JSON object:
+
+    {"timestamp": "...Z", "intersection_id": "0",
+     "approach": "main",     # "main" moves on Green, "cross" while Red
+     "interval": 10.0,       # seconds the count covers
+     "count": 4,             # vehicles that crossed the stop line
+     "queue": 3}             # vehicles waiting before the line now
+
+The controller's adaptive timing (traffic_light/adaptive.py) turns these
+into green splits. Reports are sent at QoS 0 and not retained, because
+an old report is worse than none.
+"""
+import json
+import math
+from datetime import datetime, timezone
+
+TOPIC = "traffic_load/{}"
+SUBSCRIPTION = "traffic_load/+"
+APPROACHES = ("main", "cross")
+
+
+def topic(intersection_id) -> str:
+    return TOPIC.format(intersection_id)
+
+
+def encode(intersection_id, approach: str, count: int, interval: float, queue: int = 0) -> str:
+    return json.dumps({
+        "timestamp": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "intersection_id": str(intersection_id),
+        "approach": approach,
+        "interval": round(interval, 3),
+        "count": count,
+        "queue": queue,
+    })
+
+
+def decode(payload) -> dict:
+    """Parse and check a load report; raises ValueError if it is unusable."""
+    try:
+        report = json.loads(payload)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Bad load report: {e}") from None
+    if not isinstance(report, dict):
+        raise ValueError("Bad load report: not an object")
+    if report.get("approach", "main") not in APPROACHES:
+        raise ValueError(f"Unknown approach: {report.get('approach')!r}")
+    try:
+        interval = float(report["interval"])
+        count = float(report["count"])
+        queue = float(report.get("queue") or 0)
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError(f"Bad load report: {e}") from None
+    # json.loads accepts NaN and Infinity, and NaN fails every comparison.
+    if not all(math.isfinite(value) for value in (interval, count, queue)):
+        raise ValueError("Bad load report: count or interval is not finite")
+    if interval <= 0 or count < 0 or queue < 0:
+        raise ValueError("Bad load report: negative count or interval")
+    return {"intersection_id": str(report.get("intersection_id", "")),
+            "approach": report.get("approach", "main"),
+            "interval": interval, "count": int(count), "queue": int(queue)}
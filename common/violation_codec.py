@@ -0,0 +1,128 @@
+"""Wire formats for ``traffic_violation/<id>/detected`` messages.
+
+``json`` is the original format: the JPEG is base64 text inside a JSON
+object, a third larger than the image itself.
+
+``sv1`` is a versioned binary layout that carries the JPEG as raw bytes:
+
+    magic  b"\\xa7V"   2 bytes; can never start a JSON document
+    version          uint8  (1)
+    field count      uint8  (n, the length-prefixed strings that follow)
+    confidence       float32
+    image length     uint32
+    n x (uint16 length + UTF-8): timestamp, plate, intersection_id,
+                                 violation_type, trace_id, detected_at,
+                                 clip ("" when absent)
+    image bytes
+
+All integers are big-endian. A reader takes the fields it knows and skips
+any extra ones, so later versions can append fields without breaking it.
+``trace_id`` and ``detected_at`` were appended that way: the red phase's
+correlation ID and when the crossing frame was captured (see
+common/metrics.py). ``clip`` followed: the name of the evidence clip
+on the detector (violation_detection/clips.py). Messages without these
+fields decode with them missing.
+
+Negotiation: the listener publishes the formats it accepts as a retained
+message on ``FORMATS_TOPIC``. A detector sends ``json`` until it sees
+that message, and then switches to the best format both sides support.
+An old listener never publishes it, so it keeps receiving JSON. Decoding
+tells the two formats apart by the first byte, so a listener accepts
+both at once.
+"""
+import base64
+import json
+import struct
+
+MAGIC = b"\xa7V"
+VERSION = 1
+
+FORMAT_BINARY = "sv1"
+FORMAT_JSON = "json"
+SUPPORTED_FORMATS = (FORMAT_BINARY, FORMAT_JSON)  # in order of preference
+FORMATS_TOPIC = "traffic_violation/formats"
+
+FIELDS = ("timestamp", "plate", "intersection_id", "violation_type", "trace_id", "detected_at", "clip")
+
+_HEADER = struct.Struct("!2sBBfI")
+_LENGTH = struct.Struct("!H")
+
+
+def encode_binary(violation: dict) -> bytes:
+    image = violation.get("image_bytes") or b""
+    parts = [_HEADER.pack(MAGIC, VERSION, len(FIELDS), float(violation.get("confidence") or 0.0),
+                          len(image))]
+    for field in FIELDS:
+        text = (violation.get(field) or "").encode("utf-8")
+        parts.append(_LENGTH.pack(len(text)))
+        parts.append(text)
+    parts.append(image)
+    return b"".join(parts)
+
+
+def encode_json(violation: dict) -> bytes:
+    payload = {field: violation[field] for field in FIELDS if violation.get(field) is not None}
+    if violation.get("confidence") is not None:
+        payload["confidence"] = violation["confidence"]
+    image = violation.get("image_bytes")
+    payload["image"] = base64.b64encode(image).decode("utf-8") if image else None
+    return json.dumps(payload).encode("utf-8")
+
+
+def encode(violation: dict, fmt: str = FORMAT_JSON) -> bytes:
+    """Encode a violation dict (with raw ``image_bytes``) in the given format."""
+    if fmt == FORMAT_BINARY:
+        return encode_binary(violation)
+    if fmt == FORMAT_JSON:
+        return encode_json(violation)
+    raise ValueError(f"Unknown violation format: {fmt}")
+
+
+def decode(payload: bytes) -> dict:
+    """Decode either format into a dict with raw ``image_bytes`` (or None).
+
+    Raises ValueError for a truncated message or an unsupported version.
+    """
+    if payload[:2] != MAGIC:
+        data = json.loads(payload)
+        image = data.pop("image", None)
+        data["image_bytes"] = base64.b64decode(image) if image else None
+        return data
+
+    if len(payload) < _HEADER.size:
+        raise ValueError("Truncated violation message")
+    _, version, field_count, confidence, image_length = _HEADER.unpack_from(payload)
+    if version != VERSION:
+        raise ValueError(f"Unsupported violation message version: {version}")
+    data = {"confidence": confidence}
+    offset = _HEADER.size
+    view = memoryview(payload)
+    for index in range(field_count):
+        if offset + _LENGTH.size > len(payload):
+            raise ValueError("Truncated violation message")
+        (length,) = _LENGTH.unpack_from(payload, offset)
+        offset += _LENGTH.size
+        if index < len(FIELDS):
+            data[FIELDS[index]] = str(view[offset:offset + length], "utf-8") or None
+        offset += length
+    if offset + image_length != len(payload):
+        raise ValueError("Truncated violation message")
+    data["image_bytes"] = bytes(view[offset:]) if image_length else None
+    return data
+
+
+def advertisement() -> bytes:
+    """The retained ``FORMATS_TOPIC`` payload a listener publishes."""
+    return json.dumps({"formats": list(SUPPORTED_FORMATS)}).encode("utf-8")
+
+
+def choose_format(advertised: bytes) -> str:
+    """Best format from a ``FORMATS_TOPIC`` payload; ``json`` if it is unusable."""
+    try:
+        offered = json.loads(advertised).get("formats", [])
+    except (ValueError, AttributeError):
+        return FORMAT_JSON
+    for fmt in SUPPORTED_FORMATS:
+        if fmt in offered:
+            return fmt
+    return FORMAT_JSON
@@ -0,0 +1,152 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "traffic_light"))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from adaptive import AdaptiveTiming  # noqa: E402
+from common import traffic_load  # noqa: E402
+from controller import TrafficLight  # noqa: E402
+from simulator import Corridor  # noqa: E402
+
+FIXED = {"Green": 10, "Yellow": 4, "Red": 10}
+
+
+def make_light(timing, intersection_id="0"):
+    changes = []
+    light = TrafficLight(intersection_id, lambda state: None, changes.append, FIXED, timing)
+    return light, changes
+
+
+def report(timing, main, cross, now, intersection_id="0"):
+    """Steady flows in vehicles/s, as ten-second reports with no queue."""
+    timing.observe(intersection_id, "main", round(main * 10), 10, 0, now=now)
+    timing.observe(intersection_id, "cross", round(cross * 10), 10, 0, now=now)
+
+
+def run_cycles(lights, timing, until, load):
+    """Advance lights event by event; returns each light's Green start times."""
+    greens = {light.intersection_id: [] for light in lights}
+    for light in lights:
+        light.start(0.0)
+        greens[light.intersection_id].append(0.0)
+    now = 0.0
+    while now < until:
+        light = min(lights, key=lambda light: light.next_deadline())
+        now = light.next_deadline()
+        load(now)
+        light.advance(now)
+        if light.state == "Green":
+            greens[light.intersection_id].append(now)
+    return greens
+
+
+def test_runs_fixed_durations_until_a_report_arrives():
+    timing = AdaptiveTiming({"0": {}})
+    light, _ = make_light(timing)
+
+    light.start(0.0)
+
+    assert light.next_deadline() == FIXED["Green"]
+
+
+def test_green_split_follows_demand():
+    timing = AdaptiveTiming({"0": {}}, alpha=1.0)
+    light, _ = make_light(timing)
+
+    report(timing, main=0.3, cross=0.05, now=0.0)
+    main_heavy = timing.duration(light, "Green", 0.0), timing.duration(light, "Red", 0.0)
+    for t in range(10, 400, 10):  # the cycle moves in steps; let it settle
+        report(timing, main=0.05, cross=0.3, now=t)
+        timing.duration(light, "Green", t)
+    cross_heavy = timing.duration(light, "Green", 400.0), timing.duration(light, "Red", 400.0)
+
+    assert main_heavy[0] > 2 * main_heavy[1]
+    assert cross_heavy[1] > 2 * cross_heavy[0]
+
+
+def test_phases_stay_within_bounds():
+    timing = AdaptiveTiming({"0": {"min_green": 8, "max_green": 30, "min_red": 9, "max_red": 40}})
+    light, _ = make_light(timing)
+
+    for t in range(0, 2000, 10):
+        report(timing, main=0.5, cross=0.0, now=t)
+        green = timing.duration(light, "Green", t)
+        red = timing.duration(light, "Red", t)
+        assert 8 <= green <= 30 and 9 <= red <= 40
+    assert green == 30 and red == 9
+
+
+def test_stale_reports_fall_back_to_fixed_durations():
+    timing = AdaptiveTiming({"0": {}}, stale_after=60)
+    light, _ = make_light(timing)
+    report(timing, main=0.3, cross=0.05, now=0.0)
+
+    assert timing.duration(light, "Green", 30.0) != FIXED["Green"]
+    assert timing.duration(light, "Green", 61.0) == FIXED["Green"]
+    assert timing.duration(light, "Red", 61.0) == FIXED["Red"]
+
+
+def test_reports_for_unknown_intersections_are_ignored():
+    timing = AdaptiveTiming({"0": {}})
+
+    assert not timing.observe("9", "main", 3, 10)
+    assert timing.stats() == {"0": {"adaptive": False}}
+
+
+def test_queue_growth_counts_as_demand():
+    timing = AdaptiveTiming({"0": {}}, alpha=1.0)
+
+    timing.observe("0", "main", 2, 10, queue=0, now=0)
+    timing.observe("0", "main", 2, 10, queue=5, now=10)
+
+    assert timing.demand[("0", "main")].flow == pytest.approx(0.7)
+
+
+def test_green_wave_aligns_green_starts_to_the_offsets():
+    plans = {str(i): {"green_wave": "main_st", "offset": 15 * i} for i in range(3)}
+    timing = AdaptiveTiming(plans)
+    lights = [make_light(timing, str(i))[0] for i in range(3)]
+
+    def load(now):
+        for i in range(3):
+            report(timing, main=0.2, cross=0.1, now=now, intersection_id=str(i))
+
+    greens = run_cycles(lights, timing, 1200, load)
+
+    anchor, cycle = timing.waves["main_st"]
+    for i in range(3):
+        late = [t for t in greens[str(i)] if t > 600]
+        assert late and all(abs((t - anchor - 15 * i) % cycle) < 1e-6 or
+                            abs((t - anchor - 15 * i) % cycle - cycle) < 1e-6 for t in late)
+
+
+def test_load_report_round_trip_and_validation():
+    report = traffic_load.decode(traffic_load.encode("4", "cross", 7, 10.0, queue=3))
+
+    assert report == {"intersection_id": "4", "approach": "cross", "interval": 10.0, "count": 7, "queue": 3}
+    for bad in (b"not json", b"[]", b'{"approach": "left", "interval": 10, "count": 1}',
+                b'{"interval": 0, "count": 1}', b'{"interval": 10}', b'{"interval": NaN, "count": 1}',
+                b'{"interval": Infinity, "count": 1}', b'{"interval": 10, "count": NaN}',
+                b'{"interval": 10, "count": 1, "queue": -Infinity}'):
+        with pytest.raises(ValueError):
+            traffic_load.decode(bad)
+
+
+def test_simulator_is_deterministic():
+    def run():
+        return Corridor(3, lambda t: (0.15, 0.1), FIXED, AdaptiveTiming({str(i): {} for i in range(3)}),
+                        seed=7).run(1800)
+
+    assert run() == run()
+
+
+def test_adaptive_timing_beats_fixed_time_under_uneven_load():
+    demand = lambda t: (0.3, 0.08)  # noqa: E731
+    fixed = Corridor(3, demand, {"Green": 25, "Yellow": 4, "Red": 25}, seed=1).run(3600)
+    adaptive = Corridor(3, demand, FIXED, AdaptiveTiming({str(i): {} for i in range(3)}), seed=1).run(3600)
+
+    assert adaptive["avg_delay"] < fixed["avg_delay"] / 2
+    assert adaptive["served"] > fixed["served"]
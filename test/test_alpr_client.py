@@ -0,0 +1,212 @@
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "violation_detection"))
+
+from alpr_client import AlprClient, PhashCache  # noqa: E402
+
+
+class FakeResponse:
+    def __init__(self, status_code, payload):
+        self.status_code = status_code
+        self.payload = payload
+        self.text = str(payload)
+
+    def json(self):
+        return self.payload
+
+
+class FakeHttpClient:
+    """Stands in for httpx.AsyncClient talking to the ALPR API."""
+
+    def __init__(self, latency=0.01, plate="ABC123", status_code=200):
+        self.latency = latency
+        self.plate = plate
+        self.status_code = status_code
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.uploads = []
+
+    async def post(self, url, files):
+        self.uploads.append(files["upload"][1])
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+        finally:
+            self.in_flight -= 1
+        predictions = [{"plate": self.plate, "confidence": 0.87}] if self.plate else []
+        return FakeResponse(self.status_code, {"predictions": predictions})
+
+
+def run(scenario):
+    return asyncio.run(scenario())
+
+
+def test_recognize_returns_plate_and_counts_bytes():
+    async def scenario():
+        http = FakeHttpClient()
+        alpr = await AlprClient(client=http).start()
+        plate = await alpr.recognize(b"x" * 1000)
+        await alpr.stop()
+        return plate, alpr.stats()
+
+    plate, stats = run(scenario)
+
+    assert plate == "ABC123"
+    assert stats["requests"] == 1
+    assert stats["bytes_uploaded"] == 1000
+
+
+def test_concurrency_is_bounded():
+    async def scenario():
+        http = FakeHttpClient(latency=0.02)
+        alpr = await AlprClient(client=http, concurrency=3, max_queue=50).start()
+        plates = await asyncio.gather(*(alpr.recognize(bytes([i])) for i in range(12)))
+        await alpr.stop()
+        return http, plates
+
+    http, plates = run(scenario)
+
+    assert plates == ["ABC123"] * 12
+    assert http.max_in_flight == 3
+
+
+def test_full_queue_rejects_immediately():
+    async def scenario():
+        alpr = await AlprClient(client=FakeHttpClient(latency=0.05), concurrency=1, max_queue=2).start()
+        results = await asyncio.gather(*(alpr.recognize(bytes([i])) for i in range(5)))
+        await alpr.stop()
+        return results, alpr.stats()
+
+    results, stats = run(scenario)
+
+    # All five are submitted before the worker takes one: two fit in the queue.
+    assert stats["rejected"] == 3
+    assert results.count("ABC123") == 2
+
+
+def test_requests_past_deadline_are_not_sent():
+    async def scenario():
+        http = FakeHttpClient(latency=0.05)
+        alpr = await AlprClient(client=http, concurrency=1, max_queue=10, deadline=0.03).start()
+        results = await asyncio.gather(*(alpr.recognize(bytes([i])) for i in range(3)))
+        await alpr.stop()
+        return http, results, alpr.stats()
+
+    http, results, stats = run(scenario)
+
+    assert results[0] == "ABC123"
+    assert stats["expired"] >= 1
+    assert len(http.uploads) == 3 - stats["expired"]
+
+
+def test_near_identical_crops_hit_the_cache():
+    async def scenario():
+        http = FakeHttpClient()
+        alpr = await AlprClient(client=http).start()
+        first = await alpr.recognize(b"car", key=0b1011_0000)
+        again = await alpr.recognize(b"car", key=0b1011_0001)  # 1 bit apart
+        other = await alpr.recognize(b"other", key=(1 << 64) - 1)
+        await alpr.stop()
+        return http, (first, again, other), alpr.stats()
+
+    http, plates, stats = run(scenario)
+
+    assert plates == ("ABC123",) * 3
+    assert len(http.uploads) == 2
+    assert stats["cache_hits"] == 1
+
+
+def test_read_returns_confidence_also_from_the_cache():
+    async def scenario():
+        alpr = await AlprClient(client=FakeHttpClient(plate="")).start()
+        missing = await alpr.read(b"empty", key=(1 << 64) - 1)
+        alpr.client.plate = "ABC123"
+        results = [await alpr.read(b"car", key=7) for _ in range(2)]
+        await alpr.stop()
+        return missing, results
+
+    missing, results = run(scenario)
+
+    assert missing == ("", 0.0)
+    assert results == [("ABC123", 0.87)] * 2
+
+
+def test_api_errors_return_empty_and_are_not_cached():
+    async def scenario():
+        http = FakeHttpClient(status_code=500)
+        alpr = await AlprClient(client=http).start()
+        results = [await alpr.recognize(b"car", key=1) for _ in range(2)]
+        await alpr.stop()
+        return http, results, alpr.stats()
+
+    http, results, stats = run(scenario)
+
+    assert results == ["", ""]
+    assert len(http.uploads) == 2
+    assert stats["errors"] == 2
+
+
+class NotJsonResponse(FakeResponse):
+    def json(self):
+        raise ValueError("Expecting value: line 1 column 1 (char 0)")
+
+
+class ScriptedHttpClient:
+    def __init__(self, responses):
+        self.responses = list(responses)
+
+    async def post(self, url, files):
+        return self.responses.pop(0)
+
+
+def test_malformed_responses_return_empty_and_the_worker_keeps_going():
+    async def scenario():
+        http = ScriptedHttpClient([
+            NotJsonResponse(200, "<html>Bad Gateway</html>"),
+            FakeResponse(200, {"predictions": [{"plate": "ABC123", "confidence": "high"}]}),
+            FakeResponse(200, ["not", "an", "object"]),
+            FakeResponse(200, {"predictions": [{"plate": "XYZ789", "confidence": 0.9}]}),
+        ])
+        alpr = await AlprClient(client=http, concurrency=1).start()
+        results = [await asyncio.wait_for(alpr.read(b"car"), 1) for _ in range(4)]
+        await alpr.stop()
+        return results, alpr.stats()
+
+    results, stats = run(scenario)
+
+    assert results == [("", 0.0)] * 3 + [("XYZ789", 0.9)]
+    assert stats["errors"] == 3
+
+
+def test_an_unexpected_error_fails_only_its_own_request():
+    class BrokenCache(PhashCache):
+        def get(self, key):
+            if key == 13:
+                raise RuntimeError("corrupt entry")
+            return super().get(key)
+
+    async def scenario():
+        alpr = await AlprClient(client=FakeHttpClient(), concurrency=1, cache=BrokenCache()).start()
+        failed = asyncio.get_running_loop().create_future()
+        alpr.queue.put_nowait((alpr.clock(), b"car", 13, failed))  # read() would hit the cache first
+        after = await asyncio.wait_for(alpr.read(b"car"), 1)
+        await alpr.stop()
+        return failed, after
+
+    failed, after = run(scenario)
+
+    assert isinstance(failed.exception(), RuntimeError)
+    assert after == ("ABC123", 0.87)
+
+
+def test_cache_entries_expire():
+    now = [0.0]
+    cache = PhashCache(ttl=5, clock=lambda: now[0])
+    cache.put(42, "ABC123")
+
+    assert cache.get(42) == "ABC123"
+    now[0] = 6
+    assert cache.get(42) is None
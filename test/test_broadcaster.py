@@ -0,0 +1,125 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "violation_detection"))
+
+from broadcaster import MjpegBroadcaster  # noqa: E402
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class CountingEncoder:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, frame, quality):
+        self.calls.append((frame, quality))
+        return f"{frame}@{quality}".encode()
+
+
+def make_broadcaster(max_queue=2):
+    encoder = CountingEncoder()
+    clock = FakeClock()
+    return MjpegBroadcaster(encoder, max_queue=max_queue, clock=clock), encoder, clock
+
+
+def test_each_frame_is_encoded_once_for_all_clients():
+    async def scenario():
+        broadcaster, encoder, clock = make_broadcaster()
+        clients = [broadcaster.subscribe() for _ in range(50)]
+
+        await broadcaster.publish("f1")
+
+        assert encoder.calls == [("f1", 85)]
+        assert all(c.queue.get_nowait() == b"f1@85" for c in clients)
+
+    asyncio.run(scenario())
+
+
+def test_one_encode_per_quality_tier_in_use():
+    async def scenario():
+        broadcaster, encoder, clock = make_broadcaster()
+        high = broadcaster.subscribe("high")
+        low = [broadcaster.subscribe("low") for _ in range(3)]
+
+        await broadcaster.publish("f1")
+
+        assert sorted(q for _, q in encoder.calls) == [50, 85]
+        assert high.queue.get_nowait() == b"f1@85"
+        assert low[0].queue.get_nowait() == b"f1@50"
+
+    asyncio.run(scenario())
+
+
+def test_no_viewers_no_encoding_unless_requested():
+    async def scenario():
+        broadcaster, encoder, clock = make_broadcaster()
+
+        assert await broadcaster.publish("f1") == {}
+        assert await broadcaster.publish("f2", extra_tiers=("high",)) == {"high": b"f2@85"}
+        assert len(encoder.calls) == 1
+
+    asyncio.run(scenario())
+
+
+def test_slow_client_drops_oldest_frames():
+    async def scenario():
+        broadcaster, encoder, clock = make_broadcaster(max_queue=2)
+        slow = broadcaster.subscribe()
+
+        for i in range(5):
+            clock.now += 1 / 30
+            await broadcaster.publish(f"f{i}")
+
+        assert slow.dropped == 3
+        assert [slow.queue.get_nowait(), slow.queue.get_nowait()] == [b"f3@85", b"f4@85"]
+
+    asyncio.run(scenario())
+
+
+def test_per_client_fps_limit():
+    async def scenario():
+        broadcaster, encoder, clock = make_broadcaster(max_queue=100)
+        full = broadcaster.subscribe(fps=30)
+        slow = broadcaster.subscribe(fps=5)
+
+        for i in range(30):
+            await broadcaster.publish(f"f{i}")
+            clock.now += 1 / 30
+
+        assert full.sent == 30
+        assert slow.sent == 5
+
+    asyncio.run(scenario())
+
+
+def test_unknown_tier_is_rejected():
+    broadcaster, encoder, clock = make_broadcaster()
+
+    with pytest.raises(ValueError):
+        broadcaster.subscribe("ultra")
+
+
+def test_stream_unsubscribes_when_client_disconnects():
+    async def scenario():
+        broadcaster, encoder, clock = make_broadcaster()
+        subscriber = broadcaster.subscribe()
+        stream = broadcaster.stream(subscriber)
+
+        await broadcaster.publish("f1")
+        chunk = await stream.__anext__()
+        await stream.aclose()
+
+        assert chunk == b"--frame\r\nContent-Type: image/jpeg\r\n\r\nf1@85\r\n"
+        assert broadcaster.stats()["clients"] == 0
+
+    asyncio.run(scenario())
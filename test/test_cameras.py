@@ -0,0 +1,239 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "violation_detection"))
+
+import cameras  # noqa: E402
+from alpr_client import AlprClient  # noqa: E402
+from broadcaster import MjpegBroadcaster  # noqa: E402
+from cameras import AlprShare, Camera, PrefilterCounters, Scheduler  # noqa: E402
+from frame_ring import SharedFrameRing  # noqa: E402
+from mock_alpr import MockAlprClient  # noqa: E402
+from pipeline import ViolationPipeline, ViolationPublisher  # noqa: E402
+from common import violation_codec  # noqa: E402
+
+SPAWN = multiprocessing.get_context("spawn")
+
+
+# Child processes are spawned, so their stand-ins live at module level.
+
+class CountingSource:
+    def __init__(self, frames):
+        self.frames = frames
+        self.index = 0
+
+    def read_into(self, buffer):
+        if self.index >= self.frames:
+            return False
+        self.index += 1
+        if buffer is not None:
+            buffer[0] = self.index % 256
+        return True
+
+
+def counting_source(spec):
+    return CountingSource(int(spec))
+
+
+class ScriptedPrefilter:
+    """Reports a crossing on the given frame values, if the light is red."""
+
+    def __init__(self, crossing_frames):
+        self.crossing_frames = set(crossing_frames)
+        self.frames = 0
+        self.red_frames = 0
+
+    def process(self, frame, is_red):
+        self.frames += 1
+        self.red_frames += is_red
+        return [(0, 0, 10, 10)] if is_red and frame[0] in self.crossing_frames else []
+
+    def stats(self):
+        return {"frames": self.frames, "red_frames": self.red_frames, "crossings": 0, "passed": 0,
+                "waiting": 0}
+
+
+class FakeWork(cameras.FrameWork):
+    def prefilter(self, config):
+        return ScriptedPrefilter(config["crossings"])
+
+    def crop(self, prefilter, frame, box):
+        return bytes(frame[:4]), None
+
+    def encode(self, frame, quality):
+        return bytes([quality, frame[0]])
+
+
+def write_frames(ring, count):
+    for value in range(1, count + 1):
+        ring.wait_consumed(timeout=5)
+        slot = ring.begin_write()
+        slot.data[0] = value
+        ring.commit(slot)
+    ring.close()
+    ring.detach()
+
+
+class RecordingMqttClient:
+    def __init__(self):
+        self.payloads = []
+
+    def publish(self, topic, payload):
+        self.payloads.append(payload)
+
+
+def test_shared_ring_carries_frames_between_processes():
+    ring = SharedFrameRing(frame_bytes=4, slots=3, context=SPAWN)
+    writer = SPAWN.Process(target=write_frames, args=(ring, 20))
+    writer.start()
+    values, seq = [], 0
+    try:
+        while True:
+            frame = ring.acquire_next(seq, timeout=5)
+            if frame is None:
+                break
+            values.append(frame.data[0])
+            seq = frame.seq
+            ring.release(frame)
+        writer.join(timeout=5)
+    finally:
+        ring.detach()
+
+    assert values == list(range(1, 21))  # the writer waited for each frame to be read
+    assert ring.closed
+
+
+def test_shared_ring_does_not_hand_out_pinned_slots():
+    ring = SharedFrameRing(frame_bytes=1, slots=2, context=SPAWN)
+    try:
+        slot = ring.begin_write()
+        slot.data[0] = 1
+        ring.commit(slot)
+        pinned = ring.acquire_next(0, timeout=0)
+        slot = ring.begin_write()
+        ring.commit(slot)  # the other slot, now the latest
+
+        assert ring.begin_write() is None
+        assert ring.stats()["dropped"] == 1
+        ring.release(pinned)
+        assert ring.begin_write().index == pinned.index
+    finally:
+        ring.detach()
+
+
+def make_camera(scheduler, camera_id, crossings, light, alpr, tiers=()):
+    ring = scheduler.ring()
+    broadcaster = MjpegBroadcaster(lambda frame, quality: b"")
+    subscribers = [broadcaster.subscribe(tier) for tier in tiers]
+    publisher = ViolationPublisher("0", RecordingMqttClient())
+    pipeline = ViolationPipeline(ring, broadcaster, PrefilterCounters(), AlprShare(alpr, 4), publisher,
+                                 lambda frame: light)
+    camera = Camera(camera_id, "40", {"crossings": crossings}, pipeline)
+    scheduler.add(camera)
+    return camera, subscribers
+
+
+def test_scheduler_runs_each_camera_on_a_worker_and_publishes_its_violations():
+    async def scenario():
+        alpr = await AlprClient(client=MockAlprClient(0.001, "P{n:03d}{n:03d}")).start()
+        scheduler = Scheduler(workers=2, frame_bytes=4, open_source=counting_source, work=FakeWork(),
+                              lossless=True, context=SPAWN)
+        red, green = {"status": "Red", "trace_id": "3f2a9c0d1e4b5a67"}, {"status": "Green"}
+        north, _ = make_camera(scheduler, "north", [5, 30], red, alpr)
+        east, (viewer,) = make_camera(scheduler, "east", [5], green, alpr, tiers=("medium",))
+        scheduler.start()
+        try:
+            await asyncio.wait_for(scheduler.run(), timeout=30)
+        finally:
+            scheduler.stop()
+            await alpr.stop()
+        return scheduler, north, east, viewer
+
+    scheduler, north, east, viewer = asyncio.run(scenario())
+
+    assert {north.worker, east.worker} == {0, 1}
+    assert north.pipeline.frames == east.pipeline.frames == 40
+    assert north.prefilter.stats()["red_frames"] == 40
+    violations = [violation_codec.decode(p) for p in north.pipeline.publisher.client.payloads]
+    assert [v["trace_id"] for v in violations] == ["3f2a9c0d1e4b5a67"] * 2
+    assert east.pipeline.violations == 0  # its crossing was on green
+    assert viewer.sent > 0 and viewer.queue.get_nowait()[0] == 70  # medium-tier JPEGs, encoded by the worker
+    assert scheduler.stats()["frames"] == 80
+
+
+class FakeProcess:
+    def __init__(self, alive):
+        self.alive = alive
+        self.pid = None
+
+    def is_alive(self):
+        return self.alive
+
+
+def test_cameras_are_placed_by_weight_and_move_off_a_dead_worker():
+    scheduler = Scheduler(workers=2, frame_bytes=1, context=SPAWN)
+    try:
+        light = {"status": "Green"}
+        heavy, _ = make_camera(scheduler, "heavy", [], light, None)
+        heavy.weight = 2.0
+        light_a, _ = make_camera(scheduler, "a", [], light, None)
+        light_b, _ = make_camera(scheduler, "b", [], light, None)
+        scheduler.place()
+
+        assert (heavy.worker, light_a.worker, light_b.worker) == (0, 1, 1)
+
+        scheduler.owners = SPAWN.RawArray("i", [c.worker for c in scheduler.cameras])
+        scheduler.processes = [FakeProcess(True), FakeProcess(False)]
+        light_a.prefilter.update({"frames": 10, "passed": 2, "waiting": 1})
+        scheduler.check_workers()
+
+        assert list(scheduler.owners) == [0, 0, 0]
+        light_a.prefilter.update({"frames": 3, "passed": 1, "waiting": 0})  # from the new worker's filter
+        assert (light_a.prefilter.stats()["frames"], light_a.prefilter.passed) == (13, 3)
+    finally:
+        for ring in scheduler.rings:
+            ring.detach()
+
+
+def test_load_config_fills_defaults_and_reads_stopline_files(tmp_path):
+    (tmp_path / "east.json").write_text(json.dumps({"roi": [0, 0, 10, 10], "line": [[0, 5], [10, 5]]}))
+    path = tmp_path / "cameras.json"
+    path.write_text(json.dumps({"cameras": [
+        {"id": 1, "source": "synthetic", "stopline": "east.json"},
+        {"id": "west", "source": "v4l2:0", "approach": "cross", "stopline": {"roi": [0, 0, 1, 1]}}]}))
+
+    east, west = cameras.load_config(str(path))
+
+    assert (east["id"], east["intersection_id"], east["approach"], east["weight"]) == ("1", "0", "main", 1.0)
+    assert east["stopline"]["line"] == [[0, 5], [10, 5]]
+    assert west["stopline"] == {"roi": [0, 0, 1, 1]}
+    path.write_text(json.dumps({"cameras": [{"id": "a", "source": "x", "stopline": {}}] * 2}))
+    with pytest.raises(ValueError):
+        cameras.load_config(str(path))
+
+
+def test_alpr_share_limits_one_cameras_requests_in_flight():
+    class SlowAlpr:
+        def __init__(self):
+            self.running = self.peak = 0
+
+        async def read(self, image_bytes, key=None):
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+            await asyncio.sleep(0.01)
+            self.running -= 1
+            return "P", 1.0
+
+    alpr = SlowAlpr()
+    share = AlprShare(alpr, 2)
+
+    async def scenario():
+        return await asyncio.gather(*(share.read(b"x") for _ in range(6)))
+
+    assert asyncio.run(scenario()) == [("P", 1.0)] * 6
+    assert alpr.peak == 2
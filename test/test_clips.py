@@ -0,0 +1,101 @@
+import os
+import struct
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "violation_detection"))
+
+from clips import ClipRecorder, JpegRing, jpeg_size, write_mjpeg_avi  # noqa: E402
+
+
+def fake_jpeg(index, width=64, height=48, padding=0):
+    """SOI, a baseline frame header and EOI; enough for the AVI writer."""
+    sof = struct.pack(">HBHHB", 11, 8, height, width, 1) + b"\x01\x11\x00"
+    return b"\xff\xd8\xff\xc0" + sof + bytes([index % 256]) * padding + b"\xff\xd9"
+
+
+def read_avi_frames(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    assert data[:4] == b"RIFF" and data[8:12] == b"AVI "
+    assert struct.unpack_from("<I", data, 4)[0] == len(data) - 8
+    movi = data.index(b"movi")
+    (size,) = struct.unpack_from("<I", data, movi - 4)
+    frames, offset = [], movi + 4
+    while offset < movi + size:
+        assert data[offset:offset + 4] == b"00dc"
+        (length,) = struct.unpack_from("<I", data, offset + 4)
+        frames.append(data[offset + 8:offset + 8 + length])
+        offset += 8 + length + length % 2
+    assert data[offset:offset + 4] == b"idx1"
+    return frames
+
+
+def test_ring_drops_frames_older_than_its_length():
+    ring = JpegRing(seconds=1.0, max_bytes=10 ** 6)
+    for i in range(31):
+        ring.append(i / 10, fake_jpeg(i))
+
+    assert ring.span() == 1.0
+    assert [t for t, _ in ring.between(2.5, 2.7)] == [2.5, 2.6, 2.7]
+    assert ring.evicted_by_bytes == 0
+
+
+def test_ring_caps_its_bytes_before_its_seconds():
+    ring = JpegRing(seconds=10.0, max_bytes=1000)
+    for i in range(20):
+        ring.append(i / 30, fake_jpeg(i, padding=181))  # 200 bytes each
+
+    assert ring.bytes <= 1000
+    assert len(ring.frames) == 5
+    assert ring.evicted_by_bytes == 15
+
+
+def test_mjpeg_avi_holds_the_frames_unchanged(tmp_path):
+    jpegs = [fake_jpeg(i, 640, 480, padding=i) for i in range(7)]  # odd and even sizes
+    path = str(tmp_path / "clip.avi")
+
+    write_mjpeg_avi(path, jpegs, 30)
+
+    assert jpeg_size(jpegs[0]) == (640, 480)
+    assert read_avi_frames(path) == jpegs
+    assert not os.path.exists(path + ".tmp")
+
+
+def test_recorder_writes_the_window_around_the_event(tmp_path):
+    recorder = ClipRecorder(str(tmp_path), pre=1.0, post=0.5, seconds=3.0).start()
+    for i in range(60):
+        recorder.add(fake_jpeg(i), i / 10)
+        if i == 30:
+            name = recorder.request(3.0, "ABC 123/..")
+    recorder.stop()
+
+    assert name.endswith("-ABC123-0.avi")
+    frames = read_avi_frames(recorder.path(name))
+    assert frames == [fake_jpeg(i) for i in range(20, 36)]  # 2.0 s to 3.5 s
+    assert recorder.stats()["written"] == 1
+
+
+def test_recorder_keeps_the_clip_directory_under_its_disk_budget(tmp_path):
+    recorder = ClipRecorder(str(tmp_path), pre=0.2, post=0.2, seconds=1.0, max_disk_bytes=3000,
+                            max_pending=16).start()
+    names = []
+    for i in range(100):
+        recorder.add(fake_jpeg(i, padding=100), i / 10)
+        if i % 10 == 5:
+            names.append(recorder.request(i / 10))
+    recorder.stop()
+
+    stored = [name for name in names if recorder.path(name)]
+    assert stored == names[-len(stored):]  # the oldest went first
+    assert 0 < len(stored) < len(names)
+    assert recorder.stats()["disk_bytes"] <= 3000
+
+
+def test_clip_names_cannot_leave_the_directory(tmp_path):
+    (tmp_path / "clips").mkdir()
+    (tmp_path / "secret.avi").write_bytes(b"x")
+    recorder = ClipRecorder(str(tmp_path / "clips"))
+
+    assert recorder.path("../secret.avi") is None
+    assert recorder.path("missing.avi") is None
+    assert recorder.path("notes.txt") is None
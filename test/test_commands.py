@@ -0,0 +1,79 @@
+import importlib
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+import commands  # noqa: E402
+import storage  # noqa: E402
+from mqtt_publisher import MqttPublisher  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "DB_FILE", str(tmp_path / "traffic.db"))
+    monkeypatch.setattr(storage, "_pool", None)
+    storage.init_db()
+    yield
+    storage.get_pool().close()
+
+
+def test_targets_resolve_from_one_id_a_list_or_all():
+    with storage.transaction() as conn:
+        storage.insert_light_statuses(conn, [("2025-01-01T00:00:00Z", "Red", "0"),
+                                             ("2025-01-01T00:00:01Z", "Green", "1")])
+
+    assert commands.resolve_targets({"intersection_id": 3}) == ["3"]
+    assert commands.resolve_targets({"intersection_ids": [1, "2"]}) == ["1", "2"]
+    assert sorted(commands.resolve_targets({"intersection_ids": "all"})) == ["0", "1"]
+
+
+@pytest.mark.parametrize("data", [
+    {"intersection_ids": []},
+    {"intersection_ids": "all"},  # no light has reported yet
+    {"intersection_id": ""},
+    {"intersection_ids": ["1", "+"]},
+    {"intersection_ids": ["1", "#"]},
+    {"intersection_id": "1/command"},
+])
+def test_an_empty_or_invalid_target_set_is_rejected(data):
+    assert commands.resolve_targets(data) is None
+
+
+@pytest.fixture(params=["flask_server", "asgi_server"])
+def post(request, monkeypatch):
+    """POST /api/control on one of the API servers; returns (status, json, published)."""
+    if request.param == "flask_server":
+        pytest.importorskip("flask")
+        pytest.importorskip("flask_cors")
+    else:
+        pytest.importorskip("fastapi")
+        pytest.importorskip("httpx")
+    monkeypatch.setattr(MqttPublisher, "start", lambda self: self)  # no broker connection
+    server = importlib.import_module(request.param)
+    published = []
+    monkeypatch.setattr(server.publisher, "publish_many", lambda messages, *args: published.extend(messages))
+    if request.param == "flask_server":
+        client = server.app.test_client()
+
+        def post(data):
+            response = client.post("/api/control", json=data)
+            return response.status_code, response.get_json(), published
+    else:
+        from fastapi.testclient import TestClient
+        client = TestClient(server.app)
+
+        def post(data):
+            response = client.post("/api/control", json=data)
+            return response.status_code, response.json(), published
+    return post
+
+
+@pytest.mark.parametrize("ids", [[], ["1", "+"]])
+def test_control_rejects_bad_targets_before_publishing(post, ids):
+    status, body, published = post({"command": "Red", "intersection_ids": ids})
+
+    assert status == 400 and "error" in body
+    assert published == []
@@ -0,0 +1,98 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "violation_detection"))
+
+from dedup import ViolationDeduplicator, normalize_plate, plate_distance  # noqa: E402
+
+RED_1 = {"status": "Red", "timestamp": "red-1"}
+RED_2 = {"status": "Red", "timestamp": "red-2"}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_confusable_characters_are_folded():
+    assert normalize_plate("abc-123") == normalize_plate("A8C I23") == "ABCIZ3"
+    assert plate_distance(normalize_plate("ABC123"), normalize_plate("A8C1Z3"), 1) == 0
+
+
+def test_plate_distance_is_capped():
+    assert plate_distance("ABCDEF", "ABCDEX", 1) == 1
+    assert plate_distance("ABCDEF", "XYZDEF", 1) == 2
+    assert plate_distance("ABC", "ABCDEF", 1) == 2
+
+
+def test_misreads_in_one_phase_publish_once_with_best_frame():
+    clock = FakeClock()
+    dedup = ViolationDeduplicator(settle=1.0, clock=clock)
+
+    assert dedup.offer("ABC123", 0.6, b"frame-1", RED_1) is True
+    clock.now = 0.3
+    assert dedup.offer("A8C123", 0.9, b"frame-2", RED_1) is False
+    clock.now = 0.6
+    assert dedup.offer("ABC12", 0.7, b"frame-3", RED_1) is False
+
+    clock.now = 1.2
+    assert dedup.due() == []  # last read was only 0.6 s ago
+    clock.now = 1.7
+    assert dedup.due() == [("A8C123", 0.9, b"frame-2", RED_1)]
+    assert dedup.due() == []
+
+    stats = dedup.stats()
+    assert (stats["hits"], stats["misses"], stats["upgrades"]) == (2, 1, 1)
+
+
+def test_late_reads_of_a_published_vehicle_are_dropped():
+    clock = FakeClock()
+    dedup = ViolationDeduplicator(settle=1.0, clock=clock)
+    dedup.offer("ABC123", 0.6, b"frame", RED_1)
+    clock.now = 2
+    dedup.due()
+
+    assert dedup.offer("ABC123", 0.99, b"better", RED_1) is False
+    assert dedup.due(force=True) == []
+
+
+def test_same_plate_in_another_phase_is_a_new_violation():
+    dedup = ViolationDeduplicator()
+
+    assert dedup.offer("ABC123", 0.9, b"a", RED_1) is True
+    assert dedup.offer("ABC123", 0.9, b"b", RED_2) is True
+    assert dedup.offer("XYZ789", 0.9, b"c", RED_1) is True
+    assert len(dedup.due(force=True)) == 3
+
+
+def test_published_entries_expire_after_ttl():
+    clock = FakeClock()
+    dedup = ViolationDeduplicator(settle=1.0, ttl=60, clock=clock)
+    dedup.offer("ABC123", 0.9, b"a", RED_1)
+    clock.now = 2
+    dedup.due()
+
+    clock.now = 100
+    assert dedup.offer("ABC123", 0.9, b"again", RED_1) is True
+    assert dedup.stats()["expired"] == 1
+
+
+def test_entries_are_bounded_and_pending_ones_survive_eviction():
+    clock = FakeClock()
+    dedup = ViolationDeduplicator(settle=1.0, max_entries=8, clock=clock)
+    for i in range(20):
+        dedup.offer(f"PUB{i:03d}{i:03d}", 0.9, b"x", RED_1)
+    clock.now = 2
+    dedup.due()
+    dedup.offer("PENDING", 0.9, b"keep", RED_1)
+    for i in range(20, 25):
+        dedup.offer(f"NEW{i:03d}{i:03d}", 0.9, b"x", RED_1)
+
+    stats = dedup.stats()
+    assert stats["entries"] == 8
+    assert stats["evicted"] == 26 - 8
+    assert stats["pending"] == 6  # only published entries were evicted once there were any
+    assert ("PENDING", 0.9, b"keep", RED_1) in dedup.due(force=True)
@@ -0,0 +1,87 @@
+import asyncio
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+import storage  # noqa: E402
+from event_stream import EventBroadcaster  # noqa: E402
+
+STATES = ["Green", "Yellow", "Red"]
+
+
+@pytest.fixture(autouse=True)
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "DB_FILE", str(tmp_path / "traffic.db"))
+    monkeypatch.setattr(storage, "_pool", None)
+    storage.init_db()
+    yield
+    storage.get_pool().close()
+
+
+def change_lights(count, start=0):
+    """One light change, and so one event, per row."""
+    with storage.transaction() as conn:
+        storage.insert_light_statuses(conn, [(f"2025-01-01T00:00:{i:02d}Z", STATES[i % 3], "0")
+                                             for i in range(start, start + count)])
+
+
+def event_ids(chunk):
+    return [int(line[4:]) for line in chunk.decode().splitlines() if line.startswith("id: ")]
+
+
+def test_last_event_id_resumes_after_the_given_event():
+    change_lights(4)
+    broadcaster = EventBroadcaster().start()
+
+    stream = broadcaster.stream(last_event_id=2)
+    assert next(stream) == b"retry: 3000\n\n"
+    chunk = next(stream)  # no snapshot: the client already has the state
+    stream.close()
+
+    assert event_ids(chunk) == [3, 4]
+    assert chunk.count(b"event: light") == 2
+
+
+def test_an_unknown_last_event_id_gets_a_snapshot_first():
+    change_lights(3)
+    with storage.transaction() as conn:
+        storage.prune_events(conn, keep=1)
+    broadcaster = EventBroadcaster().start()
+
+    stream = broadcaster.stream(last_event_id=0)  # events 1 and 2 were pruned
+    next(stream)
+    chunk = next(stream)
+    stream.close()
+
+    assert b"event: snapshot" in chunk and event_ids(chunk) == [3]
+
+
+def test_async_reader_catches_up_off_the_event_loop():
+    broadcaster = EventBroadcaster(poll_interval=0.01, client_buffer=2).start()
+    readers = []
+    read_events = broadcaster.read_events
+
+    def recording_read_events(after_id, limit):
+        readers.append(threading.current_thread().name)
+        return read_events(after_id, limit)
+
+    broadcaster.read_events = recording_read_events
+
+    async def scenario():
+        stream = broadcaster.astream()
+        assert await stream.__anext__() == b"retry: 3000\n\n"
+        assert b"event: snapshot" in await stream.__anext__()
+        change_lights(7)  # more than the buffer holds
+        seen = []
+        while len(seen) < 7:
+            seen += event_ids(await asyncio.wait_for(stream.__anext__(), 5))
+        await stream.aclose()
+        return seen
+
+    assert asyncio.run(scenario()) == list(range(1, 8))
+    assert broadcaster.overflows >= 1
+    assert readers and threading.main_thread().name not in readers
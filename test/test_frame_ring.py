@@ -0,0 +1,117 @@
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "violation_detection"))
+
+from frame_ring import FrameRing  # noqa: E402
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def write(ring, value, clock=None):
+    slot = ring.begin_write()
+    assert slot is not None
+    slot.data[0] = value
+    if clock:
+        clock.now += 1 / 30
+    ring.commit(slot)
+    return slot
+
+
+def make_ring(slots=3):
+    clock = FakeClock()
+    return FrameRing(lambda: bytearray(4), slots=slots, clock=clock), clock
+
+
+def test_readers_get_frames_in_place_with_sequence_numbers():
+    ring, clock = make_ring()
+    slot = write(ring, 7, clock)
+
+    frame = ring.acquire_next(0, timeout=0)
+
+    assert frame is slot  # no copy
+    assert frame.seq == 1
+    assert frame.data[0] == 7
+    ring.release(frame)
+
+
+def test_acquire_next_never_returns_the_same_frame_twice():
+    ring, clock = make_ring()
+    write(ring, 1, clock)
+    with ring.next_frame(0, timeout=0) as frame:
+        seen = frame.seq
+
+    with ring.next_frame(seen, timeout=0.01) as frame:
+        assert frame is None
+
+
+def test_pinned_slots_are_not_overwritten():
+    ring, clock = make_ring(slots=3)
+    write(ring, 1, clock)
+    pinned = ring.acquire_next(0, timeout=0)
+
+    for value in range(2, 10):
+        write(ring, value, clock)
+
+    assert pinned.data[0] == 1
+    assert pinned.seq == 1
+    ring.release(pinned)
+
+
+def test_writer_drops_when_every_slot_is_busy():
+    ring, clock = make_ring(slots=2)
+    write(ring, 1, clock)
+    pinned = ring.acquire_next(0, timeout=0)
+    write(ring, 2, clock)  # fills the other slot, which becomes latest
+
+    assert ring.begin_write() is None
+    assert ring.stats()["dropped"] == 1
+    ring.release(pinned)
+    assert ring.begin_write() is pinned
+
+
+def test_skipped_frames_and_capture_rate_are_reported():
+    ring, clock = make_ring()
+    for value in range(31):
+        write(ring, value, clock)
+    with ring.next_frame(25, timeout=0) as frame:
+        assert frame.seq == 31
+
+    stats = ring.stats()
+    assert stats["skipped"] == 5
+    assert stats["capture_fps"] == pytest.approx(30, rel=0.01)
+
+
+def test_reader_wakes_on_commit():
+    ring, clock = make_ring()
+    got = []
+    reader = threading.Thread(target=lambda: got.append(ring.acquire_next(0, timeout=2)))
+    reader.start()
+
+    write(ring, 3)
+    reader.join(timeout=2)
+
+    assert got and got[0].data[0] == 3
+
+
+def test_needs_two_slots():
+    with pytest.raises(ValueError):
+        FrameRing(lambda: bytearray(1), slots=1)
+
+
+def test_wait_consumed_lets_a_replay_writer_keep_pace_with_the_reader():
+    ring, clock = make_ring()
+    write(ring, 1)
+
+    assert not ring.wait_consumed(timeout=0.01)
+    with ring.next_frame(0, timeout=0):
+        assert ring.wait_consumed(timeout=0)
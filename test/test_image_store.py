@@ -0,0 +1,119 @@
+import base64
+import importlib
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+import image_store  # noqa: E402
+import mqtt_listener  # noqa: E402
+import storage  # noqa: E402
+from mqtt_publisher import MqttPublisher  # noqa: E402
+
+JPEG = b"\xff\xd8" + bytes(range(256)) * 4 + b"\xff\xd9"
+
+
+@pytest.fixture(autouse=True)
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "DB_FILE", str(tmp_path / "traffic.db"))
+    monkeypatch.setattr(storage, "_pool", None)
+    monkeypatch.setattr(image_store, "IMAGE_DIR", str(tmp_path / "images"))
+    storage.init_db()
+    yield
+    storage.get_pool().close()
+
+
+def insert_violation(image_hash=None, image_base64=None):
+    with storage.transaction() as conn:
+        return conn.execute(
+            "INSERT INTO violations (timestamp, type, plate, location, image_hash, image_base64) "
+            "VALUES ('2025-01-01T00:00:00Z', 'RED_LIGHT_RUN', 'ABC123', '0', ?, ?)",
+            (image_hash, image_base64)).lastrowid
+
+
+def test_identical_images_are_stored_once():
+    digest = image_store.save_image(JPEG)
+
+    assert image_store.save_image(JPEG) == digest
+    assert image_store.save_image_base64(base64.b64encode(JPEG)) == (digest, JPEG)
+    path = image_store.image_path(digest)
+    assert path.startswith(os.path.join(image_store.IMAGE_DIR, digest[:2]))
+    assert os.listdir(os.path.dirname(path)) == [digest + ".jpg"]
+
+
+def test_migration_skips_a_corrupt_inline_image_and_moves_the_rest():
+    good = [insert_violation(image_base64=base64.b64encode(JPEG).decode()) for _ in range(3)]
+    corrupt = insert_violation(image_base64="abc")  # bad padding
+
+    assert mqtt_listener.migrate_legacy_images(batch_size=2) == 3
+    assert mqtt_listener.migrate_legacy_images() == 0  # nothing left to stop at
+
+    with storage.connection() as conn:
+        rows = dict(conn.execute("SELECT id, image_hash FROM violations WHERE image_base64 IS NULL").fetchall())
+    assert sorted(rows) == sorted(good + [corrupt])
+    assert rows[corrupt] is None and {rows[i] for i in good} == {image_store.save_image(JPEG)}
+
+
+@pytest.fixture(params=["flask_server", "asgi_server"])
+def get(request, monkeypatch):
+    """GET on one of the API servers; returns (status, headers, body)."""
+    if request.param == "flask_server":
+        pytest.importorskip("flask")
+        pytest.importorskip("flask_cors")
+    else:
+        pytest.importorskip("fastapi")
+        pytest.importorskip("httpx")
+    monkeypatch.setattr(MqttPublisher, "start", lambda self: self)  # no broker connection
+    server = importlib.import_module(request.param)
+    if request.param == "flask_server":
+        client = server.app.test_client()
+
+        def get(path, **headers):
+            response = client.get(path, headers=headers)
+            return response.status_code, response.headers, response.data
+    else:
+        from fastapi.testclient import TestClient
+        client = TestClient(server.app)
+
+        def get(path, **headers):
+            response = client.get(path, headers=headers)
+            return response.status_code, response.headers, response.content
+    return get
+
+
+def test_image_endpoint_serves_the_stored_file_with_a_strong_etag(get):
+    digest = image_store.save_image(JPEG)
+    violation_id = insert_violation(image_hash=digest)
+
+    status, headers, body = get(f"/api/violations/{violation_id}/image")
+
+    assert (status, body) == (200, JPEG)
+    assert headers["ETag"] == f'"{digest}"'
+    assert "immutable" in headers["Cache-Control"]
+    status, _, body = get(f"/api/violations/{violation_id}/image", **{"If-None-Match": f'"{digest}"'})
+    assert (status, body) == (304, b"")
+
+
+def test_image_endpoint_answers_range_requests(get):
+    violation_id = insert_violation(image_hash=image_store.save_image(JPEG))
+
+    status, headers, body = get(f"/api/violations/{violation_id}/image", Range="bytes=2-9")
+
+    assert (status, body) == (206, JPEG[2:10])
+    assert headers["Content-Range"] == f"bytes 2-9/{len(JPEG)}"
+
+
+def test_image_endpoint_serves_legacy_inline_images_and_404s(get):
+    legacy_id = insert_violation(image_base64=base64.b64encode(JPEG).decode())
+    missing_file_id = insert_violation(image_hash="ab" * 32)
+    corrupt_id = insert_violation(image_base64="abc")
+
+    status, headers, body = get(f"/api/violations/{legacy_id}/image")
+
+    assert (status, body) == (200, JPEG)
+    assert headers["ETag"] == f'"legacy-{legacy_id}"'
+    assert get(f"/api/violations/{missing_file_id}/image")[0] == 404
+    assert get(f"/api/violations/{corrupt_id}/image")[0] == 404
+    assert get("/api/violations/999/image")[0] == 404
@@ -0,0 +1,94 @@
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from ingest import IngestPipeline  # noqa: E402
+
+
+class FakeWriter:
+    """Stands in for mqtt_listener.write_batch; fails any batch holding b"bad"."""
+
+    def __init__(self, delay=None):
+        self.delay = delay
+        self.batches = []
+        self.stored = []
+
+    def __call__(self, messages):
+        if self.delay is not None:
+            self.delay.wait()
+        self.batches.append(len(messages))
+        if any(payload == b"bad" for _, payload in messages):
+            raise ValueError("datatype mismatch")
+        self.stored.extend(payload for _, payload in messages)
+
+
+def test_full_queue_drops_after_the_put_timeout():
+    pipeline = IngestPipeline(FakeWriter(), max_queue=2, put_timeout=0.01)  # writer not started
+
+    assert pipeline.submit("traffic_light/0/status", b"1")
+    assert pipeline.submit("traffic_light/0/status", b"2")
+    assert not pipeline.submit("traffic_light/0/status", b"3")
+
+    stats = pipeline.stats()
+    assert (stats["accepted"], stats["dropped"], stats["max_queue_depth"]) == (2, 1, 2)
+
+
+def test_stop_writes_everything_accepted_before_it():
+    release = threading.Event()
+    writer = FakeWriter(delay=release)
+    pipeline = IngestPipeline(writer, batch_size=10).start()
+    for i in range(25):
+        pipeline.submit("traffic_light/0/status", str(i).encode())
+
+    release.set()
+    pipeline.stop(timeout=5)
+
+    assert writer.stored == [str(i).encode() for i in range(25)]
+    assert max(writer.batches) <= 10
+    assert not pipeline.submit("traffic_light/0/status", b"late")
+
+
+def test_a_poisoned_batch_loses_only_the_bad_message():
+    writer = FakeWriter()
+    pipeline = IngestPipeline(writer, batch_size=100)
+    for payload in (b"1", b"2", b"bad", b"3"):
+        pipeline.submit("traffic_light/0/status", payload)
+
+    pipeline.start()
+    pipeline.stop(timeout=5)
+
+    assert writer.stored == [b"1", b"2", b"3"]
+    assert writer.batches == [4, 1, 1, 1, 1]  # the batch, then one transaction per message
+    stats = pipeline.stats()
+    assert (stats["failed"], stats["retried_batches"], stats["flushed_messages"]) == (1, 1, 3)
+
+
+def test_a_submit_racing_stop_is_written_or_refused():
+    writer = FakeWriter()
+    pipeline = IngestPipeline(writer).start()
+    entered, release = threading.Event(), threading.Event()
+    put = pipeline.queue.put
+
+    def slow_put(item, *args, **kwargs):
+        if isinstance(item, tuple):  # hold the message between the stopped check and the put
+            entered.set()
+            release.wait()
+        put(item, *args, **kwargs)
+
+    pipeline.queue.put = slow_put
+    results = []
+    submitter = threading.Thread(target=lambda: results.append(
+        pipeline.submit("traffic_light/0/status", b"racing")))
+    submitter.start()
+    entered.wait()
+    stopper = threading.Thread(target=pipeline.stop, kwargs={"timeout": 5})
+    stopper.start()
+    stopper.join(0.1)
+
+    release.set()
+    submitter.join()
+    stopper.join()
+
+    assert results == [True] and writer.stored == [b"racing"]
@@ -0,0 +1,95 @@
+import json
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from common.light_state import LightStateClient, LightStateServer  # noqa: E402
+
+
+def status(state, intersection_id="0", timestamp="2025-06-13T17:47:39+00:00Z"):
+    return {"timestamp": timestamp, "status": state, "intersection_id": intersection_id}
+
+
+@pytest.fixture
+def paths(tmp_path):
+    return str(tmp_path / "light.sock"), str(tmp_path / "light.json")
+
+
+@pytest.fixture
+def server(paths):
+    server = LightStateServer(paths[0]).start()
+    yield server
+    server.close()
+
+
+def wait_connected(client):
+    deadline = time.monotonic() + 2
+    while not client.connected:
+        assert time.monotonic() < deadline, "client never connected"
+        time.sleep(0.001)
+
+
+def test_subscriber_gets_snapshot_then_changes(server, paths):
+    server.publish(status("Green"))
+    client = LightStateClient("0", paths[0], paths[1]).start()
+
+    version, state = client.wait_for_change(0, timeout=2)
+    assert state["status"] == "Green"
+
+    server.publish(status("Red"))
+    version, state = client.wait_for_change(version, timeout=2)
+    assert state["status"] == "Red"
+
+
+def test_red_onset_is_pushed_quickly(server, paths):
+    client = LightStateClient("0", paths[0], paths[1]).start()
+    wait_connected(client)
+
+    start = time.monotonic()
+    server.publish(status("Red"))
+    version, state = client.wait_for_change(0, timeout=2)
+
+    assert state["status"] == "Red"
+    assert time.monotonic() - start < 0.05
+
+
+def test_other_intersections_are_ignored(server, paths):
+    client = LightStateClient("1", paths[0], paths[1]).start()
+    wait_connected(client)
+
+    server.publish(status("Red", intersection_id="0"))
+    server.publish(status("Yellow", intersection_id="1"))
+
+    version, state = client.wait_for_change(0, timeout=2)
+    assert version == 1
+    assert state["status"] == "Yellow"
+
+
+def test_falls_back_to_status_file_without_socket(paths):
+    with open(paths[1], "w") as f:
+        json.dump(status("Red"), f)
+    client = LightStateClient("0", paths[0], paths[1], fallback_interval=0.01).start()
+
+    version, state = client.wait_for_change(0, timeout=2)
+
+    assert state["status"] == "Red"
+    assert not client.connected
+
+
+def test_client_reconnects_after_server_restart(paths):
+    server = LightStateServer(paths[0]).start()
+    client = LightStateClient("0", paths[0], paths[1], fallback_interval=0.01).start()
+    wait_connected(client)
+    server.close()
+
+    server = LightStateServer(paths[0]).start()
+    try:
+        server.publish(status("Red"))
+        version, state = client.wait_for_change(0, timeout=2)
+        assert state["status"] == "Red"
+    finally:
+        server.close()
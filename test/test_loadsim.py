@@ -0,0 +1,57 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import image_store  # noqa: E402
+import loadsim  # noqa: E402
+import storage  # noqa: E402
+from common import violation_codec  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def restore_paths(monkeypatch):
+    # run() points storage and image_store at its own work directory.
+    monkeypatch.setattr(storage, "DB_FILE", storage.DB_FILE)
+    monkeypatch.setattr(storage, "_pool", None)
+    monkeypatch.setattr(image_store, "IMAGE_DIR", image_store.IMAGE_DIR)
+
+
+def test_fleet_schedule_is_deterministic_and_ordered():
+    def events():
+        return list(loadsim.Fleet(20, status_interval=2, violations_per_hour=600, seed=3).events(10))
+
+    first = events()
+
+    assert first == events()
+    assert [at for at, _, _ in first] == sorted(at for at, _, _ in first)
+    assert sum(kind == "status" for _, kind, _ in first) == 20 * 5
+
+
+def test_violation_payload_decodes_with_a_unique_image():
+    fleet = loadsim.Fleet(2, image_bytes=20000)
+
+    decoded = [violation_codec.decode(fleet.violation("1", 1735689600.5)[1]) for _ in range(2)]
+
+    assert decoded[0]["plate"] == "LS000001" and decoded[0]["intersection_id"] == "1"
+    assert decoded[0]["timestamp"] == "2025-01-01T00:00:00.500000Z"
+    assert len(decoded[0]["image_bytes"]) >= 20000
+    assert decoded[0]["image_bytes"][:2] == b"\xff\xd8"
+    assert decoded[0]["image_bytes"] != decoded[1]["image_bytes"]
+
+
+def test_direct_run_stores_everything_it_publishes(tmp_path):
+    fleet = loadsim.Fleet(10, status_interval=0.5, violations_per_hour=3600, image_bytes=5000)
+
+    report = loadsim.run(fleet, 2.0, transport="direct", api="queries", api_concurrency=1,
+                         drain_timeout=10, workdir=str(tmp_path))
+
+    assert report["published"]["status"] == 40
+    assert report["stored"] == report["published"]
+    assert report["dropped"] == 0 and report["listener"] == {"dropped": 0, "failed": 0}
+    assert 0 < report["lag"][50] < 5
+    assert report["image_growth"] > 0
+    assert report["api"]["/api/lights"] and report["api_errors"] == 0
@@ -0,0 +1,149 @@
+import asyncio
+import os
+import sqlite3
+import sys
+import urllib.request
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import image_store  # noqa: E402
+import mqtt_listener  # noqa: E402
+import storage  # noqa: E402
+from common import metrics, violation_codec  # noqa: E402
+
+
+def test_render_in_prometheus_text_format():
+    registry = metrics.Registry()
+    messages = registry.counter("messages_total", "Messages", ("kind",))
+    depth = registry.gauge("queue_depth", "Queue depth")
+    messages.labels("status").inc(3)
+    messages.labels(kind='a "b"').inc()
+    depth.set(7)
+
+    text = registry.render()
+
+    assert "# TYPE messages_total counter\n" in text
+    assert 'messages_total{kind="status"} 3\n' in text
+    assert 'messages_total{kind="a \\"b\\""} 1\n' in text
+    assert "queue_depth 7\n" in text
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = metrics.Registry()
+    latency = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        latency.observe(value)
+
+    text = registry.render()
+
+    assert 'latency_seconds_bucket{le="0.1"} 2\n' in text
+    assert 'latency_seconds_bucket{le="1"} 3\n' in text
+    assert 'latency_seconds_bucket{le="+Inf"} 4\n' in text
+    assert "latency_seconds_sum 3.65\n" in text
+    assert "latency_seconds_count 4\n" in text
+
+
+def test_registry_returns_existing_metrics_and_rejects_kind_clashes():
+    registry = metrics.Registry()
+    counter = registry.counter("events_total", "Events")
+
+    assert registry.counter("events_total", "Events") is counter
+    with pytest.raises(ValueError):
+        registry.gauge("events_total", "Events")
+    with pytest.raises(ValueError):
+        registry.counter("bad name", "Nope")
+    with pytest.raises(ValueError):
+        registry.counter("labelled_total", "L", ("kind",)).inc()
+
+
+def test_collect_exposes_stats_dicts_at_scrape_time():
+    registry = metrics.Registry()
+    stats = {"sent": 1, "backlog": 4, "connected": True, "last_error": "timeout",
+             "latency_ms": {"p50": 2.5}}
+    registry.collect("outbox", lambda: stats, counters=("sent",))
+    stats["sent"] = 5
+
+    text = registry.render()
+
+    assert "outbox_sent_total 5\n" in text
+    assert "outbox_backlog 4\n" in text
+    assert "outbox_connected 1\n" in text
+    assert "outbox_latency_ms_p50 2.5\n" in text
+    assert "last_error" not in text
+
+
+def test_collected_components_of_one_kind_share_a_family():
+    registry = metrics.Registry()
+    for camera, frames in (("north", 3), ("east", 5)):
+        registry.collect("camera", lambda frames=frames: {"frames": frames, "fps": 30.0},
+                         counters=("frames",), labels={"camera": camera})
+
+    text = registry.render()
+
+    assert text.count("# TYPE camera_frames_total counter\n") == 1
+    assert 'camera_frames_total{camera="north"} 3\ncamera_frames_total{camera="east"} 5\n' in text
+    assert 'camera_fps{camera="east"} 30\n' in text
+
+
+def test_timed_observes_functions_coroutines_and_blocks():
+    registry = metrics.Registry()
+    seconds = registry.histogram("work_seconds", "Work", ("kind",))
+
+    @metrics.timed(seconds.labels("sync"))
+    def work():
+        return 1
+
+    @metrics.timed(seconds.labels("async"))
+    async def async_work():
+        await asyncio.sleep(0)
+        return 2
+
+    assert work() == 1
+    assert asyncio.run(async_work()) == 2
+    with seconds.labels("block").time():
+        pass
+
+    for kind in ("sync", "async", "block"):
+        assert f'work_seconds_count{{kind="{kind}"}} 1\n' in registry.render()
+
+
+def test_serve_answers_metrics_scrapes():
+    registry = metrics.Registry()
+    registry.counter("up_total", "Up").inc()
+    server = metrics.serve(0, host="127.0.0.1", registry=registry)
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+        with urllib.request.urlopen(url + "/metrics") as response:
+            assert response.headers["Content-Type"] == metrics.CONTENT_TYPE
+            assert b"up_total 1\n" in response.read()
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(url + "/other")
+    finally:
+        server.shutdown()
+
+
+def test_listener_stores_the_trace_id_and_measures_end_to_end_latency(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "DB_FILE", str(tmp_path / "traffic.db"))
+    monkeypatch.setattr(storage, "_pool", None)
+    monkeypatch.setattr(image_store, "IMAGE_DIR", str(tmp_path / "images"))
+    storage.init_db()
+    observed = sum(mqtt_listener.STORE_LATENCY.snapshot()[0])
+    traced = violation_codec.encode({"timestamp": "2025-05-01T12:00:00Z", "plate": "ABC123",
+                                     "intersection_id": "0", "trace_id": "3f2a9c0d1e4b5a67",
+                                     "detected_at": "2025-05-01T12:00:00.250000Z",
+                                     "clip": "20250501T120000250-ABC123-0.avi"},
+                                    violation_codec.FORMAT_BINARY)
+    untraced = violation_codec.encode({"timestamp": "2025-05-01T12:00:01Z", "plate": "XYZ789",
+                                       "intersection_id": "0"})
+
+    mqtt_listener.write_batch([("traffic_violation/0/detected", traced),
+                               ("traffic_violation/0/detected", untraced)])
+    storage.get_pool().close()
+
+    rows = sqlite3.connect(storage.DB_FILE).execute(
+        "SELECT plate, trace_id, clip FROM violations ORDER BY id").fetchall()
+    assert rows == [("ABC123", "3f2a9c0d1e4b5a67", "20250501T120000250-ABC123-0.avi"), ("XYZ789", None, None)]
+    assert sum(mqtt_listener.STORE_LATENCY.snapshot()[0]) - observed == 1
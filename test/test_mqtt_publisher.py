@@ -0,0 +1,173 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+from concurrent.futures import TimeoutError
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+from mqtt_publisher import MqttPublisher, PublishQueueFull  # noqa: E402
+
+MQTT_ERR_SUCCESS = 0
+MQTT_ERR_NO_CONN = 4
+
+
+class FakeMessageInfo:
+    def __init__(self, mid, rc):
+        self.mid = mid
+        self.rc = rc
+
+
+class FakeBroker:
+    """Stands in for paho's Client plus a broker that acks QoS 1 messages.
+
+    Acks are delivered from a separate thread (like paho's network loop) after
+    ``ack_delay`` seconds, or immediately inside publish() when ``ack_early``
+    is set, which reproduces paho calling on_publish before publish() returns.
+    """
+
+    def __init__(self, ack_delay=0.01, ack_early=False, connected=True):
+        self.ack_delay = ack_delay
+        self.ack_early = ack_early
+        self.is_connected = connected
+        self.next_mid = 0
+        self.messages = []
+        self.queued = []
+        self.on_connect = self.on_disconnect = self.on_publish = None
+
+    def connect_async(self, host, port, keepalive):
+        pass
+
+    def loop_start(self):
+        if self.is_connected:
+            self.on_connect(self, None, {}, 0)
+
+    def loop_stop(self):
+        pass
+
+    def disconnect(self):
+        pass
+
+    def _ack_later(self, mid):
+        def ack():
+            time.sleep(self.ack_delay)
+            self.on_publish(self, None, mid)
+        threading.Thread(target=ack, daemon=True).start()
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        self.next_mid += 1
+        mid = self.next_mid
+        if not self.is_connected:
+            self.queued.append((mid, topic, payload))
+            return FakeMessageInfo(mid, MQTT_ERR_NO_CONN)
+        self.messages.append((topic, payload, qos))
+        if self.ack_early:
+            self.on_publish(self, None, mid)
+        elif self.ack_delay is not None:
+            self._ack_later(mid)
+        return FakeMessageInfo(mid, MQTT_ERR_SUCCESS)
+
+    def reconnect(self):
+        self.is_connected = True
+        self.on_connect(self, None, {}, 0)
+        for mid, topic, payload in self.queued:
+            self.messages.append((topic, payload, 1))
+            self._ack_later(mid)
+        self.queued = []
+
+
+def test_publish_resolves_on_broker_ack():
+    broker = FakeBroker()
+    publisher = MqttPublisher(client=broker).start()
+
+    future = publisher.publish("traffic_light/0/command", "{}")
+
+    assert future.result(timeout=1) == 1
+    assert broker.messages == [("traffic_light/0/command", "{}", 1)]
+    assert publisher.stats()["acked"] == 1
+    assert publisher.stats()["pending"] == 0
+
+
+def test_ack_before_publish_returns_is_not_lost():
+    publisher = MqttPublisher(client=FakeBroker(ack_early=True)).start()
+
+    future = publisher.publish("traffic_light/0/command", "{}")
+
+    assert future.done()
+    assert publisher.stats()["pending"] == 0
+
+
+def test_bulk_publish_reuses_one_connection():
+    broker = FakeBroker()
+    publisher = MqttPublisher(client=broker).start()
+
+    futures = [publisher.publish(f"traffic_light/{i}/command", "{}") for i in range(100)]
+
+    assert all(f.result(timeout=1) for f in futures)
+    assert len(broker.messages) == 100
+
+
+def test_pending_messages_are_bounded():
+    publisher = MqttPublisher(client=FakeBroker(ack_delay=None), max_pending=2).start()
+
+    publisher.publish("a", "1")
+    publisher.publish("b", "2")
+    with pytest.raises(PublishQueueFull):
+        publisher.publish("c", "3")
+    assert publisher.stats()["rejected"] == 1
+
+
+def test_messages_queued_while_disconnected_are_acked_after_reconnect():
+    broker = FakeBroker(connected=False)
+    publisher = MqttPublisher(client=broker).start()
+
+    future = publisher.publish("traffic_light/0/command", "{}")
+    with pytest.raises(TimeoutError):
+        future.result(timeout=0.05)
+
+    broker.reconnect()
+    assert future.result(timeout=1) == 1
+    assert publisher.stats()["connected"]
+
+
+def test_late_ack_after_a_timeout_is_ignored():
+    broker = FakeBroker(ack_delay=None)
+    publisher = MqttPublisher(client=broker, max_pending=1).start()
+    future = publisher.publish("traffic_light/0/command", "{}")
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(publisher.wait_ack(future, 0.01))
+    broker.on_publish(broker, None, future.mid)  # the broker acks after all
+
+    assert future.cancelled()
+    assert publisher.stats()["pending"] == 0 and publisher.stats()["expired"] == 1
+    assert not publisher.early_acks
+    publisher.publish("traffic_light/1/command", "{}")  # the slot was freed
+
+
+def test_ack_for_a_future_cancelled_by_its_waiter_does_not_raise():
+    broker = FakeBroker(ack_delay=None)
+    publisher = MqttPublisher(client=broker).start()
+    future = publisher.publish("traffic_light/0/command", "{}")
+    future.cancel()
+
+    broker.on_publish(broker, None, future.mid)
+
+    assert publisher.stats()["pending"] == 0
+
+
+def test_bulk_publish_that_does_not_fit_sends_nothing():
+    broker = FakeBroker(ack_delay=None)
+    publisher = MqttPublisher(client=broker, max_pending=3).start()
+    publisher.publish("traffic_light/0/command", "{}")
+
+    with pytest.raises(PublishQueueFull):
+        publisher.publish_many([(f"traffic_light/{i}/command", "{}") for i in range(1, 4)])
+
+    assert len(broker.messages) == 1
+    futures = publisher.publish_many([(f"traffic_light/{i}/command", "{}") for i in range(1, 3)])
+    assert [f.mid for f in futures] == [2, 3]
+    assert publisher.stats()["pending"] == 3 and publisher.reserved == 0
@@ -0,0 +1,153 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from common.outbox import Outbox, OutboxSender  # noqa: E402
+
+
+class FakeInfo:
+    def __init__(self, rc=0, published=True):
+        self.rc = rc
+        self.published = published
+
+    def is_published(self):
+        return self.published
+
+
+class FakeMqttClient:
+    """Acknowledges every publish at once while connected."""
+
+    def __init__(self, connected=True):
+        self.connected = connected
+        self.messages = []
+        self.fail_after = None
+
+    def is_connected(self):
+        return self.connected
+
+    def publish(self, topic, payload, qos=0):
+        if self.fail_after is not None and len(self.messages) >= self.fail_after:
+            return FakeInfo(rc=4)  # MQTT_ERR_NO_CONN
+        self.messages.append((topic, payload, qos))
+        return FakeInfo()
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def make_sender(outbox, client, **kwargs):
+    clock = FakeClock()
+    return OutboxSender(outbox, client, clock=clock, sleep=clock.sleep, **kwargs), clock
+
+
+def test_messages_survive_a_restart(tmp_path):
+    path = str(tmp_path / "outbox.db")
+    outbox = Outbox(path)
+    outbox.publish("traffic_light/0/status", '{"status": "Red"}')
+    outbox.publish("traffic_violation/0/detected", b"\xa7V...")
+    outbox.close()
+
+    reopened = Outbox(path)
+
+    assert reopened.backlog == 2
+    assert [row[2] for row in reopened.peek(10)] == ["traffic_light/0/status", "traffic_violation/0/detected"]
+
+
+def test_drains_oldest_first_and_deletes_acknowledged(tmp_path):
+    outbox = Outbox(str(tmp_path / "outbox.db"))
+    for i in range(5):
+        outbox.publish("t", f"m{i}")
+    client = FakeMqttClient()
+    sender, _ = make_sender(outbox, client, batch_size=3)
+
+    assert sender.drain_once() == 3
+    assert sender.drain_once() == 2
+    assert [payload for _, payload, _ in client.messages] == [f"m{i}".encode() for i in range(5)]
+    assert outbox.backlog == outbox.backlog_bytes == 0
+    assert sender.stats()["sent"] == 5
+
+
+def test_backs_off_while_disconnected_and_recovers(tmp_path):
+    outbox = Outbox(str(tmp_path / "outbox.db"))
+    outbox.publish("t", "m")
+    client = FakeMqttClient(connected=False)
+    sender, _ = make_sender(outbox, client, backoff_min=0.5, backoff_max=4)
+
+    backoffs = []
+    for _ in range(5):
+        sender.drain_once()
+        backoffs.append(sender.backoff)
+    client.connected = True
+    sent = sender.drain_once()
+
+    assert backoffs == [0.5, 1, 2, 4, 4]
+    assert client.messages == [("t", b"m", 1)]
+    assert sent == 1 and sender.backoff == 0
+
+
+def test_failed_publish_keeps_the_rest_queued(tmp_path):
+    outbox = Outbox(str(tmp_path / "outbox.db"))
+    for i in range(4):
+        outbox.publish("t", f"m{i}")
+    client = FakeMqttClient()
+    client.fail_after = 2
+    sender, _ = make_sender(outbox, client)
+
+    assert sender.drain_once() == 2
+    assert outbox.backlog == 2
+    assert sender.stats()["last_error"] == "publish rc=4"
+
+
+def test_unacknowledged_messages_are_retried(tmp_path):
+    outbox = Outbox(str(tmp_path / "outbox.db"))
+    outbox.publish("t", "m")
+    client = FakeMqttClient()
+    client.publish = lambda topic, payload, qos=0: FakeInfo(published=False)
+    sender, _ = make_sender(outbox, client, ack_timeout=1)
+
+    assert sender.drain_once() == 0
+    assert outbox.backlog == 1
+    assert sender.backoff > 0
+
+
+def test_rate_limit_spaces_publishes(tmp_path):
+    outbox = Outbox(str(tmp_path / "outbox.db"))
+    for i in range(11):
+        outbox.publish("t", "m")
+    sender, clock = make_sender(outbox, FakeMqttClient(), rate=10)
+
+    sender.drain_once()
+
+    assert abs(clock.now - 1.0) < 1e-9  # 11 messages at 10/s
+
+
+def test_oldest_messages_are_evicted_beyond_max_bytes(tmp_path):
+    outbox = Outbox(str(tmp_path / "outbox.db"), max_bytes=100)
+    for i in range(10):
+        outbox.publish("t", bytes([i]) * 30)
+
+    assert outbox.backlog == 3
+    assert outbox.backlog_bytes == 90
+    assert outbox.evicted == 7
+    assert [row[3][0] for row in outbox.peek(10)] == [7, 8, 9]
+
+
+def test_ack_ignores_messages_evicted_in_flight(tmp_path):
+    outbox = Outbox(str(tmp_path / "outbox.db"), max_bytes=100)
+    outbox.publish("t", b"a" * 60)
+    (message_id, *_), = outbox.peek(1)
+    outbox.publish("t", b"b" * 60)  # evicts the first
+
+    outbox.ack([message_id])
+
+    assert outbox.backlog == 1
+    assert outbox.backlog_bytes == 60
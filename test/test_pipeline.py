@@ -0,0 +1,193 @@
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "violation_detection"))
+
+import pipeline  # noqa: E402
+from alpr_client import AlprClient  # noqa: E402
+from broadcaster import MjpegBroadcaster  # noqa: E402
+from clips import ClipRecorder  # noqa: E402
+from frame_ring import FrameRing  # noqa: E402
+from mock_alpr import MockAlprClient  # noqa: E402
+from pipeline import LoadReporter, StageTimer, ViolationPipeline, ViolationPublisher  # noqa: E402
+from stopline import CrossingTracker, StopLineFilter  # noqa: E402
+from common import violation_codec  # noqa: E402
+
+
+class CountingSource:
+    def __init__(self, frames):
+        self.frames = frames
+        self.index = 0
+
+    def read_into(self, buffer):
+        if self.index >= self.frames:
+            return False
+        self.index += 1
+        if buffer is not None:
+            buffer[0] = self.index % 256
+        return True
+
+
+class ScriptedPrefilter:
+    """Reports a crossing on the given capture indexes, if the light is red."""
+
+    def __init__(self, crossing_frames):
+        self.crossing_frames = set(crossing_frames)
+        self.seen = []
+
+    def process(self, frame, is_red):
+        self.seen.append(frame[0])
+        return [(0, 0, 10, 10)] if is_red and frame[0] in self.crossing_frames else []
+
+    def crop(self, frame, box):
+        return frame
+
+
+class RecordingMqttClient:
+    def __init__(self):
+        self.messages = []
+        self.payloads = []
+
+    def publish(self, topic, payload):
+        self.messages.append(topic)
+        self.payloads.append(payload)
+
+
+def run_pipeline(monkeypatch, frames, crossing_frames, light_for, plate="P{n:03d}{n:03d}", clips=None):
+    # No OpenCV here: stand-ins for the crop/encode helpers.
+    monkeypatch.setattr(pipeline, "plate_region", lambda vehicle: vehicle)
+    monkeypatch.setattr(pipeline, "encode_jpeg", lambda frame, quality: bytes(frame))
+    monkeypatch.setattr(pipeline, "phash", lambda region: None)
+
+    async def scenario():
+        ring = FrameRing(lambda: bytearray(4))
+        broadcaster = MjpegBroadcaster(lambda frame, quality: bytes(frame))
+        alpr = await AlprClient(client=MockAlprClient(0.001, plate)).start()
+        mqtt = RecordingMqttClient()
+        prefilter = ScriptedPrefilter(crossing_frames)
+        p = ViolationPipeline(ring, broadcaster, prefilter, alpr, ViolationPublisher("0", mqtt, clips=clips),
+                              light_for, clips=clips)
+        threading.Thread(target=p.capture_loop, args=(CountingSource(frames), True), daemon=True).start()
+        await asyncio.wait_for(p.run(), timeout=10)
+        await alpr.stop()
+        return p, prefilter, mqtt
+
+    return asyncio.run(scenario())
+
+
+def test_lossless_replay_processes_every_frame_once(monkeypatch):
+    p, prefilter, mqtt = run_pipeline(monkeypatch, 50, [], lambda frame: {"status": "Green"})
+
+    assert p.frames == 50
+    assert prefilter.seen == list(range(1, 51))
+
+
+def test_crossings_on_red_are_recognized_and_published(monkeypatch):
+    def light_for(frame):
+        return {"status": "Red", "timestamp": "red-1"} if frame.seq <= 20 else {"status": "Green"}
+
+    p, prefilter, mqtt = run_pipeline(monkeypatch, 30, [5, 12, 25], light_for)
+
+    assert p.violations == 2  # frame 25 crossed on green
+    assert mqtt.messages == ["traffic_violation/0/detected"] * 2
+    assert {"capture", "prefilter", "crop", "encode", "recognition", "dedup", "publish", "frame"} <= set(p.timer.samples)
+
+
+def test_violations_carry_the_red_phase_trace_id(monkeypatch):
+    frames_timed = sum(pipeline.STAGE_SECONDS.labels("frame").snapshot()[0])
+    light = {"status": "Red", "timestamp": "red-1", "trace_id": "3f2a9c0d1e4b5a67"}
+    before = time.time()
+
+    p, prefilter, mqtt = run_pipeline(monkeypatch, 10, [4], lambda frame: light)
+
+    violation = violation_codec.decode(mqtt.payloads[0])
+    assert violation["trace_id"] == "3f2a9c0d1e4b5a67"
+    detected_at = datetime.strptime(violation["detected_at"], "%Y-%m-%dT%H:%M:%S.%fZ")
+    assert before - 1 <= detected_at.replace(tzinfo=timezone.utc).timestamp() <= time.time()
+    assert "captured_at" not in light  # the shared light state is not modified
+    # Every frame's stage samples also reach the /metrics histogram.
+    assert sum(pipeline.STAGE_SECONDS.labels("frame").snapshot()[0]) - frames_timed == 10
+
+
+def test_violations_name_the_evidence_clip_around_their_frame(monkeypatch, tmp_path):
+    clips = ClipRecorder(str(tmp_path), pre=0.5, post=0.5, seconds=2.0)
+    light = {"status": "Red", "timestamp": "red-1"}
+
+    p, prefilter, mqtt = run_pipeline(monkeypatch, 20, [4], lambda frame: light, clips=clips)
+
+    violation = violation_codec.decode(mqtt.payloads[0])
+    assert violation["clip"].endswith("-P001001-0.avi")
+    assert len(clips.ring.frames) == 20  # every frame's JPEG went to the ring
+    assert clips.stats()["queued"] == 1  # handed to the writer at the end of the run
+
+
+def test_same_plate_in_one_red_phase_is_published_once(monkeypatch):
+    p, prefilter, mqtt = run_pipeline(monkeypatch, 20, [3, 9],
+                                      lambda frame: {"status": "Red", "timestamp": "red-1"},
+                                      plate="SAME")
+
+    assert p.violations == 1
+
+
+def test_stage_timer_summary():
+    timer = StageTimer()
+    for ms in (1, 2, 3, 50):
+        timer.record("encode", ms / 1000)
+
+    summary = timer.summary()["encode"]
+
+    assert summary["count"] == 4
+    assert summary["max_ms"] == 50
+    assert summary["histogram"]["<=2ms"] == 2
+    assert summary["histogram"]["inf"] == 4
+
+
+class ScriptedDetector:
+    def __init__(self, frames):
+        self.frames = list(frames)
+
+    def detect(self, frame):
+        return self.frames.pop(0) if self.frames else []
+
+
+class ConnectedMqttClient:
+    def __init__(self):
+        self.messages = []
+
+    def is_connected(self):
+        return True
+
+    def publish(self, topic, payload, qos=0):
+        self.messages.append((topic, json.loads(payload), qos))
+
+
+def test_load_reporter_counts_crossings_on_every_phase():
+    # One car drives over the line on green and one on red; a third waits.
+    line = [[0, 360], [640, 360]]
+    frames = [[(200, bottom - 80, 100, 80), (450, 240, 100, 80)] for bottom in range(300, 460, 20)]
+    frames += [[(200, bottom - 80, 100, 80), (450, 240, 100, 80)] for bottom in range(300, 460, 20)]
+    prefilter = StopLineFilter(ScriptedDetector(frames), CrossingTracker(line, approach=-1))
+    clock = [0.0]
+    client = ConnectedMqttClient()
+    reporter = LoadReporter("3", prefilter, client, clock=lambda: clock[0])
+
+    for _ in range(8):
+        prefilter.process(None, is_red=False)
+    for _ in range(6):
+        prefilter.tracker.update([(450, 240, 100, 80)])  # the first car leaves
+    for _ in range(8):
+        prefilter.process(None, is_red=True)
+    clock[0] = 10.0
+    reporter.report()
+    clock[0] = 15.0
+    reporter.report()
+
+    (topic, first, qos), (_, second, _) = client.messages
+    assert topic == "traffic_load/3" and qos == 0
+    assert (first["approach"], first["count"], first["interval"], first["queue"]) == ("main", 2, 10.0, 1)
+    assert (second["count"], second["interval"]) == (0, 5.0)
@@ -0,0 +1,93 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+import queries  # noqa: E402
+import storage  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "DB_FILE", str(tmp_path / "traffic.db"))
+    monkeypatch.setattr(storage, "_pool", None)
+    storage.init_db()
+    yield
+    storage.get_pool().close()
+
+
+def insert_violations(count, start=0):
+    with storage.transaction() as conn:
+        storage.insert_violations(conn, [
+            (f"2025-01-01T00:{i // 60:02d}:{i % 60:02d}Z", "RED_LIGHT_RUN", f"P{i % 3}", str(i % 2), None, None)
+            for i in range(start, start + count)])
+
+
+def row_count():
+    with storage.connection() as conn:
+        return conn.execute(queries.VIOLATION_COUNT_SQL).fetchone()[0]
+
+
+def test_keyset_pages_walk_every_violation_once():
+    insert_violations(23)
+
+    ids, after_id, pages = [], None, 0
+    while True:
+        page = queries.get_paginated_violations(limit=10, after_id=after_id)
+        ids += [row["id"] for row in page["data"]]
+        pages += 1
+        after_id = page["next_after_id"]
+        if after_id is None:
+            break
+
+    assert ids == list(range(23, 0, -1))
+    assert pages == 3 and page["total"] == 23
+
+
+def test_keyset_pages_match_offset_pages_under_filters():
+    insert_violations(30)
+
+    first = queries.get_paginated_violations(limit=4, plate="P1", intersection_id="1")
+    second = queries.get_paginated_violations(limit=4, plate="P1", intersection_id="1",
+                                              after_id=first["next_after_id"])
+    offset = queries.get_paginated_violations(page=2, limit=4, plate="P1", intersection_id="1")
+
+    assert second["data"] == offset["data"]
+    assert all(row["plate"] == "P1" and row["location"] == "1" for row in second["data"])
+    assert first["total"] == 5
+    assert second["total"] is None  # not counted again on keyset pages
+
+
+def test_a_short_page_has_no_next_cursor():
+    insert_violations(4)
+
+    assert queries.get_paginated_violations(limit=4)["next_after_id"] == 1  # a full page may be the last
+    assert queries.get_paginated_violations(limit=5)["next_after_id"] is None
+    assert queries.get_paginated_violations(limit=4, after_id=1)["data"] == []
+
+
+def test_light_history_pages_by_id():
+    with storage.transaction() as conn:
+        storage.insert_light_statuses(conn, [(f"2025-01-01T00:00:{i:02d}Z", "Red", iid)
+                                             for i in range(7) for iid in ("0", "1")])
+
+    first = queries.get_light_status_history("0", limit=4)
+    rest = queries.get_light_status_history("0", limit=4, after_id=first["next_after_id"])
+
+    timestamps = [row["timestamp"] for row in first["data"] + rest["data"]]
+    assert timestamps == [f"2025-01-01T00:00:{i:02d}Z" for i in range(6, -1, -1)]
+    assert rest["next_after_id"] is None
+
+
+def test_row_counts_follow_inserts_and_deletes():
+    insert_violations(5)
+    assert row_count() == 5
+
+    with storage.transaction() as conn:
+        conn.execute("DELETE FROM violations WHERE id <= 2")
+    insert_violations(1, start=5)
+
+    assert row_count() == 4
+    assert queries.get_paginated_violations()["total"] == 4
@@ -0,0 +1,95 @@
+import gzip
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+import storage  # noqa: E402
+from response_cache import ResponseCache  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "DB_FILE", str(tmp_path / "traffic.db"))
+    monkeypatch.setattr(storage, "_pool", None)
+    storage.init_db()
+    yield
+    storage.get_pool().close()
+
+
+def write_status(status):
+    with storage.transaction() as conn:
+        storage.insert_light_statuses(conn, [("2025-01-01T00:00:00Z", status, "0")])
+
+
+def test_a_commit_elsewhere_invalidates_every_entry():
+    cache = ResponseCache()
+    _, version = cache.get("/api/light_status/0?")
+    first = cache.put("/api/light_status/0?", {"status": "Green"}, version)
+    cache.put("/api/violations?", [], version)
+
+    assert cache.get("/api/light_status/0?")[0] is first
+    write_status("Red")
+
+    assert cache.get("/api/light_status/0?")[0] is None
+    assert cache.get("/api/violations?")[0] is None
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_a_response_built_across_a_commit_is_served_but_not_cached():
+    cache = ResponseCache()
+    _, version = cache.get("/api/light_status/0?")
+    write_status("Red")  # while the response was being built
+
+    entry = cache.put("/api/light_status/0?", {"status": "Green"}, version)
+
+    assert entry.body == b'{"status":"Green"}'
+    assert cache.get("/api/light_status/0?")[0] is None
+
+
+def test_gzip_and_identity_bodies_have_different_etags():
+    cache = ResponseCache()
+    _, version = cache.get("/api/violations?")
+    entry = cache.put("/api/violations?", [{"plate": "ABC123"}] * 200, version)
+
+    body, encoding, etag = entry.encode_for("gzip, deflate")
+    plain_body, plain_encoding, plain_etag = entry.encode_for(None)
+
+    assert (encoding, plain_encoding) == ("gzip", None)
+    assert gzip.decompress(body) == plain_body
+    assert etag != plain_etag and etag.endswith('-gz"') and plain_etag == entry.etag
+
+
+class RecordingConnection:
+    def __init__(self, conn):
+        self.conn = conn
+        self.threads = set()
+
+    def execute(self, sql):
+        self.threads.add(threading.current_thread().name)
+        return self.conn.execute(sql)
+
+
+def test_started_cache_checks_the_version_only_from_its_poller():
+    cache = ResponseCache(poll_interval=0.01)
+    cache.conn = RecordingConnection(cache.conn)
+    cache.start()
+    cache.conn.threads.discard("MainThread")  # start() takes the first reading itself
+    try:
+        _, version = cache.get("/api/light_status/0?")
+        cache.put("/api/light_status/0?", {"status": "Green"}, version)
+        assert cache.get("/api/light_status/0?")[0] is not None
+
+        write_status("Red")
+        deadline = time.monotonic() + 2
+        while cache.stats()["entries"] and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        assert cache.get("/api/light_status/0?")[0] is None
+    finally:
+        cache.stop()
+    assert cache.conn.threads == {"cache-version-poller"}
@@ -0,0 +1,171 @@
+import json
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+import mqtt_listener  # noqa: E402
+import queries  # noqa: E402
+import rollups  # noqa: E402
+import storage  # noqa: E402
+
+T0 = 1735689600  # 2025-01-01T00:00:00Z
+
+
+def ts(epoch):
+    return rollups.format_timestamp(epoch)
+
+
+@pytest.fixture(autouse=True)
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "DB_FILE", str(tmp_path / "traffic.db"))
+    monkeypatch.setattr(storage, "_pool", None)
+    storage.init_db()
+    yield
+    storage.get_pool().close()
+
+
+def insert_statuses(rows):
+    with storage.transaction() as conn:
+        storage.insert_light_statuses(conn, [(ts(t), status, iid) for t, status, iid in rows])
+
+
+def insert_violations(rows):
+    with storage.transaction() as conn:
+        storage.insert_violations(conn, [(ts(t), "RED_LIGHT_RUN", plate, location, None, None)
+                                         for t, plate, location in rows])
+
+
+def test_parse_timestamp_accepts_device_formats():
+    assert rollups.parse_timestamp("2025-01-01T00:00:00Z") == T0
+    assert rollups.parse_timestamp("2025-01-01T00:00:00+00:00Z") == T0
+    assert rollups.parse_timestamp("2025-01-01 01:00:00") == T0 + 3600
+    assert rollups.parse_timestamp("yesterday") is None
+    assert rollups.parse_timestamp(T0) is None
+
+
+def test_a_status_with_a_numeric_timestamp_does_not_lose_its_batch():
+    def status(timestamp, light):
+        return ("traffic_light/0/status",
+                json.dumps({"timestamp": timestamp, "status": light, "intersection_id": "0"}).encode())
+
+    mqtt_listener.write_batch([status(ts(T0), "Green"), status(T0 + 10, "Yellow"),
+                               status(ts(T0 + 30), "Yellow"), status(ts(T0 + 35), "Red")])
+
+    # A whole hour: the listener has already pruned these old minute buckets.
+    stats = queries.get_light_stats("0", ts(T0), ts(T0 + 3600), now=T0 + 3600)
+    assert stats["phases"]["Green"]["seconds"] == 30.0
+    assert stats["phases"]["Yellow"]["seconds"] == 5.0
+    assert stats["phases"]["Yellow"]["transitions"] == 1
+
+
+def test_phase_durations_and_transitions():
+    insert_statuses([(T0, "Green", "0"), (T0 + 30, "Yellow", "0"), (T0 + 35, "Red", "0")])
+    insert_statuses([(T0 + 50, "Red", "0"), (T0 + 95, "Green", "0")])  # repeat, then a change
+
+    stats = queries.get_light_stats("0", ts(T0), ts(T0 + 120), now=T0 + 100)
+
+    phases = stats["phases"]
+    assert phases["Green"] == {"seconds": 35.0, "share": 0.35, "transitions": 2}  # incl. the open phase
+    assert phases["Yellow"]["seconds"] == 5.0
+    assert phases["Red"] == {"seconds": 60.0, "share": 0.6, "transitions": 1}
+    assert stats["observed_seconds"] == 100.0
+
+
+def test_long_ranges_match_a_scan_of_the_history():
+    rng = random.Random(1)
+    t = T0
+    changes = []
+    for i in range(3000):
+        changes.append((t, ("Green", "Yellow", "Red")[i % 3], "7"))
+        t += rng.choice((5, 30, 90, 400, 3000))
+    for offset in range(0, len(changes), 250):
+        insert_statuses(changes[offset:offset + 250])
+    last = changes[-1][0]
+
+    for _ in range(20):
+        start = T0 + rng.randrange(0, last - T0) // 60 * 60
+        end = start + rng.randrange(1, 10 * 24 * 60) * 60
+        expected = {}
+        for (a, status, _), (b, _, _) in zip(changes, changes[1:]):
+            overlap = min(b, end) - max(a, start)
+            if overlap > 0:
+                expected[status] = expected.get(status, 0) + overlap
+
+        stats = queries.get_light_stats("7", ts(start), ts(end), now=last)
+
+        assert {s: p["seconds"] for s, p in stats["phases"].items() if p["seconds"]} == \
+            pytest.approx(expected)
+
+
+def test_violation_series_per_intersection_and_overall():
+    insert_violations([(T0 + 10, "AAA111", "1"), (T0 + 20, "BBB222", "1"),
+                       (T0 + 3700, "AAA111", "2"), (T0 + 90000, "CCC333", "1")])
+
+    overall = queries.get_violation_stats(ts(T0), ts(T0 + 2 * 86400), bucket="hour")
+    one = queries.get_violation_stats(ts(T0), ts(T0 + 2 * 86400), intersection_id="1", bucket="day")
+
+    assert overall["total"] == 4
+    assert [(p["start"], p["count"]) for p in overall["series"]] == [
+        (ts(T0), 2), (ts(T0 + 3600), 1), (ts(T0 + 90000), 1)]
+    assert [p["count"] for p in one["series"]] == [2, 1]
+
+
+def test_repeat_offenders():
+    insert_violations([(T0, "AAA111", "1"), (T0 + 86400 * 3, "AAA111", "2"),
+                       (T0 + 86400 * 5, "AAA111", "1"), (T0, "BBB222", "1"), (T0 + 60, "BBB222", "1"),
+                       (T0, "CCC333", "3")])
+
+    everywhere = queries.get_repeat_offenders(ts(T0), ts(T0 + 7 * 86400))
+    at_one = queries.get_repeat_offenders(ts(T0), ts(T0 + 7 * 86400), intersection_id="1")
+    first_days = queries.get_repeat_offenders(ts(T0), ts(T0 + 2 * 86400))
+
+    assert [(p["plate"], p["violations"], p["intersections"]) for p in everywhere["data"]] == [
+        ("AAA111", 3, 2), ("BBB222", 2, 1)]
+    assert everywhere["data"][0]["last_day"] == "2025-01-06"
+    assert [p["plate"] for p in at_one["data"]] == ["AAA111", "BBB222"]
+    assert [p["plate"] for p in first_days["data"]] == ["BBB222"]
+
+
+def test_backfill_matches_incremental_rollups():
+    rng = random.Random(2)
+    insert_statuses([(T0 + i * rng.randrange(5, 200), ("Green", "Red")[i % 2], str(i % 3))
+                     for i in range(1, 300)])
+    insert_violations([(T0 + rng.randrange(86400 * 3), f"P{rng.randrange(20)}", str(rng.randrange(3)))
+                       for _ in range(200)])
+    tables = ("light_rollup", "violation_rollup", "plate_rollup")
+    with storage.connection() as conn:
+        incremental = {t: sorted(conn.execute(f"SELECT * FROM {t}").fetchall()) for t in tables}
+    with storage.transaction() as conn:
+        for table in tables:
+            conn.execute(f"DELETE FROM {table}")
+        rollups.backfill(conn, chunk=37)
+        rebuilt = {t: sorted(conn.execute(f"SELECT * FROM {t}").fetchall()) for t in tables}
+
+    assert rebuilt == incremental
+
+
+def test_prune_drops_only_old_minute_buckets():
+    insert_statuses([(T0, "Green", "0"), (T0 + 90, "Red", "0")])
+    insert_violations([(T0, "AAA111", "0")])
+
+    with storage.transaction() as conn:
+        storage.prune_rollups(conn, now=T0 + 30 * 86400)
+        resolutions = {row[0] for row in conn.execute("SELECT resolution FROM light_rollup")}
+        violation_resolutions = {row[0] for row in conn.execute("SELECT resolution FROM violation_rollup")}
+
+    assert resolutions == violation_resolutions == {rollups.HOUR, rollups.DAY}
+
+
+def test_bad_ranges_are_rejected():
+    with pytest.raises(ValueError):
+        queries.get_light_stats("0", since="not a date")
+    with pytest.raises(ValueError):
+        queries.get_violation_stats(ts(T0 + 60), ts(T0))
+    with pytest.raises(ValueError):
+        queries.get_violation_stats(ts(T0), ts(T0 + 365 * 86400), bucket="minute")
+    with pytest.raises(ValueError):
+        queries.get_violation_stats(bucket="week")
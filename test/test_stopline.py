@@ -0,0 +1,99 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "violation_detection"))
+
+from stopline import CrossingTracker, StopLineFilter, crop_box, side_of_line  # noqa: E402
+
+# Horizontal stop line at y=360; traffic drives down the image (y grows).
+LINE = [[0, 360], [640, 360]]
+
+
+def car(x, bottom, w=100, h=80):
+    return (x, bottom - h, w, h)
+
+
+class ScriptedDetector:
+    def __init__(self, frames):
+        self.frames = list(frames)
+
+    def detect(self, frame):
+        return self.frames.pop(0) if self.frames else []
+
+
+def test_side_of_line():
+    assert side_of_line(LINE, (100, 300)) == -1
+    assert side_of_line(LINE, (100, 400)) == 1
+    assert side_of_line(LINE, (100, 360)) == 0
+
+
+def test_crossing_is_reported_once():
+    tracker = CrossingTracker(LINE)
+
+    reported = [tracker.update([car(200, bottom)]) for bottom in range(300, 460, 20)]
+
+    assert sum(len(r) for r in reported) == 1
+    assert reported[4] == [car(200, 380)]  # first frame past the line
+
+
+def test_two_vehicles_tracked_separately():
+    tracker = CrossingTracker(LINE)
+    crossings = 0
+    for bottom in range(300, 460, 20):
+        crossings += len(tracker.update([car(50, bottom), car(400, bottom + 10)]))
+
+    assert crossings == 2
+
+
+def test_approach_side_filters_reverse_crossings():
+    tracker = CrossingTracker(LINE, approach=-1)
+
+    outbound = [tracker.update([car(200, bottom)]) for bottom in range(440, 280, -20)]
+
+    assert not any(outbound)
+
+
+def test_vehicle_waiting_at_the_line_is_not_reported():
+    tracker = CrossingTracker(LINE)
+
+    reported = [tracker.update([car(200, 355)]) for _ in range(100)]
+
+    assert not any(reported)
+
+
+def test_lost_tracks_expire():
+    tracker = CrossingTracker(LINE, max_missing=2)
+    tracker.update([car(200, 300)])
+    for _ in range(3):
+        tracker.update([])
+
+    assert tracker.tracks == []
+
+
+def test_filter_only_forwards_crossings_on_red():
+    frames = [[car(200, b)] for b in range(300, 460, 20)] + [[car(200, b)] for b in range(300, 460, 20)]
+    prefilter = StopLineFilter(ScriptedDetector(frames), CrossingTracker(LINE))
+
+    green = [prefilter.process(None, is_red=False) for _ in range(8)]
+    for _ in range(6):
+        prefilter.tracker.update([])  # first car leaves
+    red = [prefilter.process(None, is_red=True) for _ in range(8)]
+
+    assert not any(green)
+    assert sum(len(r) for r in red) == 1
+    assert prefilter.stats() == {"frames": 16, "red_frames": 8, "crossings": 1, "passed": 2, "waiting": 0}
+
+
+def test_waiting_counts_tracks_before_the_line():
+    tracker = CrossingTracker(LINE, approach=-1)
+
+    tracker.update([car(50, 300), car(250, 340), car(450, 400)])
+
+    assert tracker.waiting() == 2
+    tracker.update([car(50, 300), car(250, 380)])  # one crosses, one is lost this frame
+    assert tracker.waiting() == 1
+
+
+def test_crop_box_pads_and_clips():
+    assert crop_box((100, 100, 100, 50), (480, 640), margin=0.1) == (90, 95, 210, 155)
+    assert crop_box((600, 450, 100, 50), (480, 640), margin=0.1) == (590, 445, 640, 480)
@@ -0,0 +1,91 @@
+import os
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+
+import storage  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "DB_FILE", str(tmp_path / "traffic.db"))
+    monkeypatch.setattr(storage, "_pool", None)
+    storage.init_db()
+    yield
+    storage.get_pool().close()
+
+
+def test_connections_are_tuned_and_reused():
+    with storage.connection() as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+        first = conn
+    with storage.connection() as conn:
+        assert conn is first
+
+
+def test_pool_keeps_at_most_its_size_idle(tmp_path):
+    pool = storage.ConnectionPool(str(tmp_path / "traffic.db"), size=2)
+    conns = [pool.acquire() for _ in range(3)]
+    for conn in conns:
+        pool.release(conn)
+
+    assert pool.idle.qsize() == 2
+    with pytest.raises(sqlite3.ProgrammingError):
+        conns[-1].execute("SELECT 1")  # the one that did not fit was closed
+    pool.close()
+
+
+def test_failed_transaction_rolls_back_and_the_connection_is_reusable():
+    with pytest.raises(ZeroDivisionError):
+        with storage.transaction() as conn:
+            storage.insert_light_status(conn, "2025-01-01T00:00:00Z", "Red", "0")
+            1 / 0
+
+    with storage.connection() as conn:
+        assert not conn.in_transaction
+        assert conn.execute("SELECT COUNT(*) FROM light_status").fetchone()[0] == 0
+
+
+def test_init_db_is_idempotent():
+    storage.init_db()
+
+    with storage.connection() as conn:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == storage.SCHEMA_VERSION
+
+
+def current_state():
+    with storage.connection() as conn:
+        return conn.execute("SELECT intersection_id, status, timestamp, since FROM intersection_state "
+                            "ORDER BY intersection_id").fetchall()
+
+
+def test_intersection_state_keeps_the_newest_status_and_when_it_began():
+    with storage.transaction() as conn:
+        storage.insert_light_statuses(conn, [
+            ("2025-01-01T00:00:00Z", "Green", "0"),
+            ("2025-01-01T00:00:01Z", "Red", "1"),
+            ("2025-01-01T00:00:05Z", "Green", "0"),   # a repeat: "since" stays
+            ("2025-01-01T00:00:06Z", "Yellow", None),  # history only
+        ])
+        storage.insert_light_status(conn, "2025-01-01T00:00:09Z", "Yellow", "0")
+
+    assert current_state() == [("0", "Yellow", "2025-01-01T00:00:09Z", "2025-01-01T00:00:09Z"),
+                               ("1", "Red", "2025-01-01T00:00:01Z", "2025-01-01T00:00:01Z")]
+    with storage.transaction() as conn:
+        storage.insert_light_status(conn, "2025-01-01T00:00:12Z", "Yellow", "0")
+    assert current_state()[0] == ("0", "Yellow", "2025-01-01T00:00:12Z", "2025-01-01T00:00:09Z")
+
+
+def test_intersection_state_is_seeded_from_existing_history():
+    with storage.transaction() as conn:
+        conn.executemany(storage.INSERT_LIGHT_STATUS_SQL, [("2025-01-01T00:00:00Z", "Green", "0"),
+                                                          ("2025-01-01T00:00:05Z", "Yellow", "0"),
+                                                          ("2025-01-01T00:00:03Z", "Red", "1")])
+        storage._migrate_4(conn)
+
+    assert current_state() == [("0", "Yellow", "2025-01-01T00:00:05Z", "2025-01-01T00:00:05Z"),
+                               ("1", "Red", "2025-01-01T00:00:03Z", "2025-01-01T00:00:03Z")]
@@ -0,0 +1,251 @@
+import json
+import os
+import sys
+from queue import Empty
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "traffic_light"))
+
+from controller import TrafficLight, MultiScheduler, parse_command, status_rate  # noqa: E402
+from drivers import SimulatedDriver  # noqa: E402
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeCommandQueue:
+    """Command queue on a fake clock.
+
+    ``get(timeout)`` jumps the clock to the earliest of the next scheduled
+    command and the timeout, so a whole day of cycling runs instantly. The
+    ``latency`` adds a fixed wakeup delay to every timeout, like a busy Pi.
+    """
+
+    def __init__(self, clock, latency=0.0):
+        self.clock = clock
+        self.latency = latency
+        self.scheduled = []  # (at, payload), sorted
+
+    def put_at(self, at, payload):
+        self.scheduled.append((at, payload))
+        self.scheduled.sort(key=lambda item: item[0])
+
+    def get(self, timeout=None):
+        wake_at = None if timeout is None else self.clock.now + timeout
+        if self.scheduled and (wake_at is None or self.scheduled[0][0] <= wake_at):
+            at, payload = self.scheduled.pop(0)
+            self.clock.now = max(self.clock.now, at)
+            return payload
+        if wake_at is None:
+            raise AssertionError("blocked forever with no command scheduled")
+        self.clock.now = wake_at + self.latency
+        raise Empty
+
+
+class FakeGPIO:
+    """Records every output change with the fake time it happened at."""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.changes = []
+
+    def set_lights(self, state):
+        self.changes.append((self.clock.now, state))
+
+
+def make_scheduler(durations=None, latency=0.0):
+    clock = FakeClock()
+    gpio = FakeGPIO(clock)
+    reported = []
+    light = TrafficLight("0", gpio.set_lights, reported.append, durations)
+    scheduler = MultiScheduler([light], FakeCommandQueue(clock, latency), parse_command, clock=clock,
+                               lateness_window=10 ** 6)
+    scheduler.start(clock())
+    return scheduler, clock, gpio, reported
+
+
+def run_until(scheduler, clock, until):
+    while clock.now < until:
+        scheduler.run_once()
+
+
+def test_start_state_drives_the_lights():
+    scheduler, clock, gpio, reported = make_scheduler()
+
+    assert gpio.changes == [(0.0, "Green")]
+    assert reported == ["Green"]
+
+
+def test_per_state_durations():
+    scheduler, clock, gpio, _ = make_scheduler({"Green": 10, "Yellow": 2, "Red": 8})
+
+    run_until(scheduler, clock, 40)
+
+    assert gpio.changes == [
+        (0, "Green"), (10, "Yellow"), (12, "Red"),
+        (20, "Green"), (30, "Yellow"), (32, "Red"),
+        (40, "Green"),
+    ]
+
+
+def test_transitions_have_no_jitter():
+    scheduler, clock, gpio, _ = make_scheduler()
+
+    run_until(scheduler, clock, 24 * 3600)
+
+    assert len(scheduler.lateness) == 24 * 3600 // 5
+    assert max(scheduler.lateness) == 0
+
+
+def test_wakeup_latency_does_not_accumulate():
+    # Each deadline is relative to when the state actually changed, so a
+    # late wakeup delays that transition only by the wakeup latency.
+    scheduler, clock, gpio, _ = make_scheduler(latency=0.002)
+
+    run_until(scheduler, clock, 100)
+
+    assert max(scheduler.lateness) <= 0.002 + 1e-9
+
+
+def test_command_is_handled_on_arrival():
+    scheduler, clock, gpio, reported = make_scheduler()
+    scheduler.command_queue.put_at(1.234, ("0", json.dumps({"command": "Red"})))
+
+    run_until(scheduler, clock, 1.234)
+
+    assert gpio.changes[-1] == (1.234, "Red")
+    assert scheduler.lights["0"].mode == "Manual"
+
+
+def test_manual_override_without_timeout_holds():
+    scheduler, clock, gpio, _ = make_scheduler()
+    scheduler.command_queue.put_at(1, ("0", json.dumps({"command": "Red"})))
+    scheduler.command_queue.put_at(100, ("0", json.dumps({"command": "Auto"})))
+
+    run_until(scheduler, clock, 100)
+
+    # "Auto" advances the cycle from where auto mode left it, as before.
+    assert gpio.changes == [(0, "Green"), (1, "Red"), (100, "Yellow")]
+    assert scheduler.lights["0"].mode == "Auto"
+
+
+def test_timed_override_expires_and_resumes_cycle():
+    scheduler, clock, gpio, _ = make_scheduler()
+    scheduler.command_queue.put_at(1, ("0", json.dumps({"command": "Red", "timeout": 30})))
+
+    run_until(scheduler, clock, 36)
+
+    assert gpio.changes == [(0, "Green"), (1, "Red"), (31, "Green"), (36, "Yellow")]
+    assert scheduler.lights["0"].mode == "Auto"
+
+
+def test_repeated_state_command_does_not_toggle_outputs():
+    scheduler, clock, gpio, reported = make_scheduler()
+    scheduler.command_queue.put_at(1, ("0", json.dumps({"command": "Green"})))
+
+    run_until(scheduler, clock, 1)
+
+    assert gpio.changes == [(0, "Green")]
+    assert reported == ["Green"]
+
+
+def test_bad_command_is_ignored():
+    scheduler, clock, gpio, _ = make_scheduler()
+    scheduler.command_queue.put_at(1, ("0", "not json"))
+    scheduler.command_queue.put_at(2, ("0", json.dumps({"command": "Blue"})))
+
+    run_until(scheduler, clock, 5)
+
+    assert gpio.changes == [(0, "Green"), (5, "Yellow")]
+
+
+def test_commands_with_a_bad_timeout_are_rejected():
+    scheduler, clock, drivers = make_multi_scheduler({"a": None})
+    for t, timeout in enumerate(["5", True, float("nan"), -1, 0, [5]], start=1):
+        scheduler.command_queue.put_at(t, ("a", json.dumps({"command": "Red", "timeout": timeout})))
+
+    run_until(scheduler, clock, 15)
+
+    assert drivers["a"].changes == [(0, "Green"), (5, "Yellow"), (10, "Red"), (15, "Green")]
+    assert parse_command(json.dumps({"command": "Red", "timeout": 2.5})) == ("Red", 2.5)
+
+
+def make_multi_scheduler(durations_by_id):
+    clock = FakeClock()
+    drivers = {iid: SimulatedDriver(clock) for iid in durations_by_id}
+    lights = [TrafficLight(iid, drivers[iid].set, lambda state: None, durations)
+              for iid, durations in durations_by_id.items()]
+    scheduler = MultiScheduler(lights, FakeCommandQueue(clock), parse_command, clock=clock)
+    scheduler.start(clock())
+    return scheduler, clock, drivers
+
+
+def test_multi_scheduler_runs_each_light_on_its_own_durations():
+    scheduler, clock, drivers = make_multi_scheduler({
+        "a": {"Green": 2, "Yellow": 1, "Red": 3},
+        "b": {"Green": 5, "Yellow": 5, "Red": 5},
+    })
+
+    run_until(scheduler, clock, 12)
+
+    assert drivers["a"].changes == [
+        (0, "Green"), (2, "Yellow"), (3, "Red"),
+        (6, "Green"), (8, "Yellow"), (9, "Red"), (12, "Green"),
+    ]
+    assert drivers["b"].changes == [(0, "Green"), (5, "Yellow"), (10, "Red")]
+    assert max(scheduler.lateness) == 0
+
+
+def test_multi_scheduler_routes_commands_by_intersection():
+    scheduler, clock, drivers = make_multi_scheduler({"a": None, "b": None})
+    scheduler.command_queue.put_at(1, ("b", json.dumps({"command": "Red", "timeout": 10})))
+    scheduler.command_queue.put_at(2, ("missing", json.dumps({"command": "Red"})))
+
+    run_until(scheduler, clock, 11)
+
+    assert drivers["a"].changes == [(0, "Green"), (5, "Yellow"), (10, "Red")]
+    # The override replaced b's 5 s deadline; the stale heap entry is skipped.
+    assert drivers["b"].changes == [(0, "Green"), (1, "Red"), (11, "Green")]
+
+
+def test_multi_scheduler_heap_stays_bounded():
+    scheduler, clock, drivers = make_multi_scheduler({str(i): None for i in range(100)})
+    for t in range(1, 50):
+        scheduler.command_queue.put_at(t, (str(t), json.dumps({"command": "Red", "timeout": 3})))
+
+    run_until(scheduler, clock, 600)
+
+    assert len(scheduler.heap) <= 2 * len(scheduler.lights)
+    assert scheduler.transitions > 100 * 600 // 5 * 0.95
+
+
+def test_status_rate_sums_every_lights_cycle():
+    lights = [TrafficLight(str(i), lambda state: None, lambda state: None) for i in range(1000)]
+    lights.append(TrafficLight("fast", lambda state: None, lambda state: None,
+                               {"Green": 1, "Yellow": 1, "Red": 1}))
+
+    assert abs(status_rate(lights) - (1000 * 3 / 15 + 1)) < 1e-9
+
+
+def test_a_backlog_of_commands_does_not_hold_back_other_lights():
+    scheduler, clock, drivers = make_multi_scheduler({"a": None, "b": None})
+    for _ in range(100):
+        scheduler.command_queue.put_at(4, ("b", json.dumps({"command": "Red"})))
+    handle = scheduler.handle
+
+    def slow_handle(intersection_id, raw):
+        handle(intersection_id, raw)
+        clock.now += 0.1  # each command takes a while, so the queue is never empty
+
+    scheduler.handle = slow_handle
+
+    run_until(scheduler, clock, 13)
+
+    # Before, light a stayed Green until the backlog was gone, at 14 s.
+    assert [state for _, state in drivers["a"].changes[:3]] == ["Green", "Yellow", "Red"]
+    assert drivers["a"].changes[1][0] < 5.1 + 1e-9
+    assert max(scheduler.lateness) < 0.1 + 1e-9  # at most one command's handling
@@ -0,0 +1,104 @@
+import json
+import os
+import struct
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "violation_detection"))
+
+from common import violation_codec  # noqa: E402
+from common.violation_codec import FORMAT_BINARY, FORMAT_JSON, decode, encode  # noqa: E402
+from pipeline import ViolationPublisher  # noqa: E402
+
+VIOLATION = {
+    "timestamp": "2025-05-01T12:00:00+00:00Z",
+    "plate": "ÄBC123",
+    "intersection_id": "7",
+    "confidence": 0.5,
+    "image_bytes": bytes(range(256)) * 40,
+}
+
+
+class RecordingMqttClient:
+    def __init__(self):
+        self.payloads = []
+
+    def publish(self, topic, payload):
+        self.payloads.append(payload)
+
+
+@pytest.mark.parametrize("fmt", [FORMAT_JSON, FORMAT_BINARY])
+def test_round_trip(fmt):
+    decoded = decode(encode(VIOLATION, fmt))
+
+    for field in ("timestamp", "plate", "intersection_id", "confidence", "image_bytes"):
+        assert decoded[field] == VIOLATION[field]
+    assert decoded.get("violation_type") is None
+
+
+def test_binary_carries_raw_image_bytes():
+    binary = encode(VIOLATION, FORMAT_BINARY)
+
+    assert len(binary) < len(VIOLATION["image_bytes"]) + 64
+    assert len(encode(VIOLATION, FORMAT_JSON)) > len(VIOLATION["image_bytes"]) * 4 // 3
+
+
+def test_json_from_old_detectors_still_decodes():
+    legacy = json.dumps({"timestamp": "t", "plate": "ABC123", "intersection_id": "0",
+                         "image": "aGVsbG8="}).encode()
+
+    decoded = decode(legacy)
+
+    assert decoded["plate"] == "ABC123"
+    assert decoded["image_bytes"] == b"hello"
+
+
+def test_unknown_trailing_fields_are_skipped():
+    binary = encode(VIOLATION, FORMAT_BINARY)
+    header = violation_codec._HEADER
+    magic, version, count, confidence, image_length = header.unpack_from(binary)
+    image_start = len(binary) - image_length
+    newer = (header.pack(magic, version, count + 1, confidence, image_length)
+             + binary[header.size:image_start] + struct.pack("!H", 3) + b"new" + binary[image_start:])
+
+    assert decode(newer)["image_bytes"] == VIOLATION["image_bytes"]
+
+
+def test_truncated_and_future_messages_are_rejected():
+    binary = encode(VIOLATION, FORMAT_BINARY)
+    with pytest.raises(ValueError):
+        decode(binary[:-1])
+    with pytest.raises(ValueError):
+        decode(binary[:3])
+    with pytest.raises(ValueError, match="version"):
+        decode(binary[:2] + bytes([2]) + binary[3:])
+
+
+def test_choose_format():
+    assert violation_codec.choose_format(violation_codec.advertisement()) == FORMAT_BINARY
+    assert violation_codec.choose_format(b'{"formats": ["json", "sv9"]}') == FORMAT_JSON
+    assert violation_codec.choose_format(b"") == FORMAT_JSON  # retained message cleared
+
+
+def test_publisher_switches_format_after_negotiation():
+    mqtt = RecordingMqttClient()
+    publisher = ViolationPublisher("0", mqtt)
+
+    publisher.publish("ABC123", b"jpeg", 0.9)
+    publisher.negotiate(violation_codec.advertisement())
+    publisher.publish("ABC123", b"jpeg", 0.9)
+
+    first, second = mqtt.payloads
+    assert first.startswith(b"{")
+    assert second.startswith(violation_codec.MAGIC)
+    assert decode(second)["image_bytes"] == b"jpeg"
+
+
+def test_pinned_format_ignores_negotiation():
+    publisher = ViolationPublisher("0", RecordingMqttClient(), fmt=FORMAT_JSON)
+
+    publisher.negotiate(violation_codec.advertisement())
+
+    assert publisher.format == FORMAT_JSON
@@ -0,0 +1,219 @@
+"""Adaptive signal timing from the traffic load the detectors report.
+
+Each light serves two conflicting movements. The ``main`` approach moves
+on Green and clears on Yellow; the ``cross`` street moves while the light
+shows Red. Detectors report vehicles crossing the stop line, and the
+queue before it, on ``traffic_load/<id>`` (see common/traffic_load.py).
+An intersection without a cross-street camera assumes ``cross_flow``.
+
+At the start of every cycle (on Green) the timing picks a cycle length
+with Webster's formula, ``C = (1.5 L + 5) / (1 - Y)``, and splits the
+effective green between the approaches in proportion to their flow
+ratios. A camera counts departures, which understate demand once a queue
+builds, so arrivals are estimated as the crossings plus the change in
+queue since the last report. The queue still waiting when an approach's
+service ends is demand the cycle did not serve, and is added spread over
+the next cycle; it also covers a queue longer than the camera can see.
+Every phase stays within its configured min/max.
+
+Lights in the same ``green_wave`` group share the group's longest cycle.
+Each light's Red is stretched or cut so its next Green starts ``offset``
+seconds after a point on the group's grid (anchor + k * cycle), which
+lets a platoon leaving one intersection arrive on green at the next.
+The group cycle moves in small steps, re-anchored at the last grid
+point, so the lights keep their alignment while it changes. Times are on the
+controller's clock, so a green wave spans the intersections one
+controller process drives.
+
+An intersection without a main-approach report for ``stale_after``
+seconds runs its fixed durations. Manual overrides work as before.
+"""
+import math
+import threading
+import time
+
+DEFAULTS = {
+    "min_green": 7, "max_green": 60,    # main approach, seconds
+    "min_red": 7, "max_red": 60,        # cross street
+    "min_cycle": 30, "max_cycle": 120,
+    "saturation_flow": 0.5,             # vehicles/s a moving lane discharges
+    "lost_time": 2.0,                   # start-up loss per phase, seconds
+    "cross_flow": 0.1,                  # vehicles/s assumed without a cross camera
+    "green_wave": None,                 # coordination group name
+    "offset": 0.0,                      # green start within the group's cycle
+}
+MAX_FLOW_RATIO = 0.9  # Webster's cycle diverges as the total ratio nears 1
+CYCLE_HYSTERESIS = 2.0  # seconds the target must differ before a cycle changes
+CYCLE_STEP = 0.1  # largest change of a cycle per period, as a fraction
+
+
+def step_towards(cycle, target):
+    """The next cycle length: towards ``target``, by at most CYCLE_STEP of it."""
+    if abs(target - cycle) < CYCLE_HYSTERESIS:
+        return cycle
+    step = CYCLE_STEP * cycle
+    return cycle + min(max(target - cycle, -step), step)
+
+
+class Demand:
+    """Smoothed arrival rate (vehicles/s) and latest queue on one approach."""
+
+    def __init__(self, alpha):
+        self.alpha = alpha
+        self.flow = None
+        self.queue = 0
+        self.residual = 0  # queue left when the approach's service last ended
+        self.updated = None
+
+    def observe(self, count, interval, queue, now):
+        # Arrivals are what left plus what the queue grew by.
+        rate = max(0.0, count + queue - self.queue) / interval
+        self.flow = rate if self.flow is None else self.flow + self.alpha * (rate - self.flow)
+        self.queue = queue
+        self.updated = now
+
+
+class AdaptiveTiming:
+    """Computes phase durations for TrafficLights from reported demand.
+
+    Pass it as a TrafficLight's ``timing``; the light asks
+    ``duration(light, state, now)`` every time it enters a state in auto
+    mode. ``observe`` may be called from the MQTT thread.
+    """
+
+    def __init__(self, plans, alpha=0.3, stale_after=60.0, clock=time.monotonic):
+        self.plans = {str(iid): dict(DEFAULTS, **plan) for iid, plan in plans.items()}
+        self.alpha = alpha
+        self.stale_after = stale_after
+        self.clock = clock
+        self.demand = {}   # (intersection_id, approach) -> Demand
+        self.cycles = {}   # intersection_id -> Webster cycle at its last Green
+        self.current = {}  # intersection_id -> (cycle, green, red) for this cycle
+        self.waves = {}    # green_wave group -> [anchor, cycle]
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        """Timing for the intersections with an "adaptive" section, or None."""
+        plans = {str(spec['id']): spec['adaptive'] for spec in config['intersections']
+                 if spec.get('adaptive') is not None}
+        if not plans:
+            return None
+        options = config.get('adaptive', {})
+        return cls(plans, alpha=options.get('alpha', 0.3),
+                   stale_after=options.get('stale_after', 60.0))
+
+    def observe(self, intersection_id, approach, count, interval, queue=0, now=None):
+        """Record one load report; reports for unknown intersections are ignored."""
+        intersection_id = str(intersection_id)
+        if intersection_id not in self.plans:
+            return False
+        with self.lock:
+            demand = self.demand.get((intersection_id, approach))
+            if demand is None:
+                demand = self.demand[(intersection_id, approach)] = Demand(self.alpha)
+            demand.observe(count, interval, queue, self.clock() if now is None else now)
+        return True
+
+    def _flow(self, intersection_id, approach, now):
+        demand = self.demand.get((intersection_id, approach))
+        if demand is None or demand.flow is None or now - demand.updated > self.stale_after:
+            return None
+        return demand
+
+    def _plan(self, intersection_id, yellow, now):
+        """(cycle, green, red) for the cycle starting now, or None to run fixed."""
+        plan = self.plans[intersection_id]
+        main = self._flow(intersection_id, "main", now)
+        if main is None:
+            return None
+        cross = self._flow(intersection_id, "cross", now)
+        previous = self.current.get(intersection_id) or (plan["min_cycle"],)
+        main_flow = main.flow + main.residual / previous[0]
+        cross_flow = plan["cross_flow"] if cross is None else cross.flow + cross.residual / previous[0]
+
+        saturation = plan["saturation_flow"]
+        ratios = (main_flow / saturation, cross_flow / saturation)
+        total = min(sum(ratios), MAX_FLOW_RATIO)
+        lost = yellow + 2 * plan["lost_time"]
+        target = (1.5 * lost + 5) / (1 - total)
+        target = min(max(target, plan["min_cycle"]), plan["max_cycle"])
+        self.cycles[intersection_id] = target
+
+        if plan["green_wave"] is not None:
+            cycle = self._wave(plan["green_wave"], now)[1]
+        else:
+            cycle = step_towards(previous[0], target)
+
+        # Each phase gets its share; a phase held at its bound shortens
+        # the cycle rather than handing the time to the other approach.
+        share = ratios[0] / sum(ratios) if sum(ratios) else 0.5
+        green = plan["lost_time"] + (cycle - lost) * share
+        green = min(max(green, plan["min_green"]), plan["max_green"])
+        red = plan["lost_time"] + (cycle - lost) * (1 - share)
+        red = min(max(red, plan["min_red"]), plan["max_red"])
+        return cycle, green, red
+
+    def _wave(self, group, now):
+        """The group's [anchor, cycle], following the longest member cycle.
+
+        The grid moves at most once per period and by at most
+        ``CYCLE_STEP`` of the cycle, so a noisy Webster cycle near
+        saturation cannot keep the lights realigning.
+        """
+        target = max(c for iid, c in self.cycles.items() if self.plans[iid]["green_wave"] == group)
+        wave = self.waves.get(group)
+        if wave is None:
+            wave = self.waves[group] = [now, target]
+            return wave
+        anchor, cycle = wave
+        if now - anchor >= cycle:
+            anchor += math.floor((now - anchor) / cycle) * cycle
+            wave[:] = [anchor, step_towards(cycle, target)]
+        return wave
+
+    def _aligned_red(self, intersection_id, now):
+        """Red that makes the next Green start on the group's grid, within bounds."""
+        plan = self.plans[intersection_id]
+        anchor, cycle = self.waves[plan["green_wave"]]
+        earliest = now + plan["min_red"]
+        start = anchor + plan["offset"] + math.ceil((earliest - anchor - plan["offset"]) / cycle) * cycle
+        return min(start - now, plan["max_red"])
+
+    def duration(self, light, state, now):
+        intersection_id = light.intersection_id
+        if intersection_id not in self.plans:
+            return light.durations[state]
+        with self.lock:
+            # Main is served until Yellow, the cross street until Green.
+            ended = self.demand.get((intersection_id, "main" if state == "Yellow" else "cross"))
+            if ended is not None and state != "Red":
+                ended.residual = ended.queue
+            if state == "Yellow":
+                return light.durations[state]
+            if state == "Green":
+                self.current[intersection_id] = self._plan(intersection_id, light.durations["Yellow"], now)
+            current = self.current.get(intersection_id)
+            if current is None:
+                return light.durations[state]
+            cycle, green, red = current
+            if state == "Green":
+                return green
+            if self.plans[intersection_id]["green_wave"] is not None:
+                return self._aligned_red(intersection_id, now)
+            return red
+
+    def stats(self):
+        with self.lock:
+            result = {}
+            for intersection_id in self.plans:
+                current = self.current.get(intersection_id)
+                entry = {"adaptive": current is not None}
+                if current is not None:
+                    entry.update(zip(("cycle", "green", "red"), (round(v, 1) for v in current)))
+                for approach in ("main", "cross"):
+                    demand = self.demand.get((intersection_id, approach))
+                    if demand is not None and demand.flow is not None:
+                        entry[approach] = {"flow": round(demand.flow, 3), "queue": demand.queue}
+                result[intersection_id] = entry
+            return result
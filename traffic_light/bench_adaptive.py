@@ -0,0 +1,62 @@
+"""Average delay and throughput: adaptive timing vs fixed-time baselines.
+
+Runs the deterministic corridor simulator (simulator.py) for each demand
+scenario with four strategies:
+
+- fixed 5/5/5: the shipped STATE_DURATIONS
+- fixed 25/4/25: a hand-tuned fixed plan
+- adaptive: AdaptiveTiming on every light, fed by the simulated detectors
+- green wave: the same, with the lights coordinated at offsets of one
+  travel time
+
+Same seed, same arrivals for every strategy.
+
+    python bench_adaptive.py --intersections 4 --duration 3600 --seed 0
+"""
+import argparse
+
+from adaptive import AdaptiveTiming
+from controller import STATE_DURATIONS
+from simulator import Corridor
+
+YELLOW = 4
+
+SCENARIOS = {
+    # (main, cross) arrivals in vehicles/s, as a function of time
+    "light": lambda duration: lambda t: (0.08, 0.05),
+    "balanced": lambda duration: lambda t: (0.15, 0.10),
+    "main peak": lambda duration: lambda t: (0.30, 0.08),
+    "shifting": lambda duration: lambda t: (0.28, 0.06) if t < duration / 2 else (0.08, 0.25),
+}
+
+
+def strategies(intersections, travel_time):
+    adaptive_durations = {"Green": 10, "Yellow": YELLOW, "Red": 10}  # until the first report
+    return {
+        "fixed 5/5/5": lambda: (dict(STATE_DURATIONS), None),
+        "fixed 25/4/25": lambda: ({"Green": 25, "Yellow": YELLOW, "Red": 25}, None),
+        "adaptive": lambda: (adaptive_durations,
+                             AdaptiveTiming({str(i): {} for i in range(intersections)})),
+        "green wave": lambda: (adaptive_durations, AdaptiveTiming({
+            str(i): {"green_wave": "corridor", "offset": i * travel_time} for i in range(intersections)})),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--intersections", type=int, default=4)
+    parser.add_argument("--duration", type=float, default=3600, help="simulated seconds")
+    parser.add_argument("--travel-time", type=float, default=20, help="seconds between intersections")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'scenario':<11} {'strategy':<14} {'avg delay s':>11} {'p95 s':>7} "
+          f"{'veh/h':>7} {'queued':>7}")
+    for scenario, make_demand in SCENARIOS.items():
+        for name, make in strategies(args.intersections, args.travel_time).items():
+            durations, timing = make()
+            corridor = Corridor(args.intersections, make_demand(args.duration), durations, timing,
+                                travel_time=args.travel_time, seed=args.seed)
+            result = corridor.run(args.duration)
+            print(f"{scenario:<11} {name:<14} {result['avg_delay']:11.1f} {result['p95_delay']:7.0f} "
+                  f"{result['throughput_per_hour']:7.0f} {result['queued_at_end']:7d}")
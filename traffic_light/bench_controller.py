@@ -0,0 +1,95 @@
+"""Drive many simulated intersections from one MultiScheduler runloop.
+
+Each intersection gets random phase durations and a SimulatedDriver. The
+status callback serialises the same JSON payload main.py publishes. A
+feeder thread sends timed overrides to random intersections. It reports
+CPU use, transitions/sec and how late transitions fired after their
+deadlines.
+
+    python bench_controller.py --intersections 1000 --duration 30
+"""
+import argparse
+import contextlib
+import json
+import os
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from queue import Queue
+
+from controller import STATES, TrafficLight, MultiScheduler
+from drivers import SimulatedDriver
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def parse_command(raw):
+    data = json.loads(raw)
+    return data["command"], data.get("timeout")
+
+
+def make_status_payload(intersection_id):
+    def on_change(state):
+        json.dumps({
+            "timestamp": datetime.now(timezone.utc).replace(microsecond=0).isoformat() + "Z",
+            "status": state,
+            "intersection_id": intersection_id
+        })
+    return on_change
+
+
+def send_commands(command_queue, ids, rate, stop_at):
+    while time.monotonic() < stop_at:
+        time.sleep(1 / rate)
+        command = json.dumps({"command": random.choice(STATES), "timeout": random.uniform(2, 10)})
+        command_queue.put((random.choice(ids), command))
+
+
+def run(intersections, duration, min_phase, max_phase, command_rate):
+    random.seed(0)
+    lights = []
+    for i in range(intersections):
+        durations = {state: random.uniform(min_phase, max_phase) for state in STATES}
+        lights.append(TrafficLight(str(i), SimulatedDriver().set, make_status_payload(str(i)), durations))
+
+    command_queue = Queue()
+    scheduler = MultiScheduler(lights, command_queue, parse_command, lateness_window=10 ** 7)
+    start = time.monotonic()
+    stop_at = start + duration
+    feeder = threading.Thread(target=send_commands,
+                              args=(command_queue, [light.intersection_id for light in lights],
+                                    command_rate, stop_at))
+    cpu_start = time.process_time()
+    feeder.start()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        scheduler.run(lambda: time.monotonic() >= stop_at)
+    feeder.join()
+    cpu = time.process_time() - cpu_start
+    elapsed = time.monotonic() - start
+
+    lateness = scheduler.lateness
+    print(f"{intersections} intersections, {elapsed:.1f} s, phases {min_phase}-{max_phase} s, "
+          f"{command_rate} commands/s")
+    print(f"  transitions  {scheduler.transitions} ({scheduler.transitions / elapsed:.0f}/s)")
+    print(f"  cpu          {cpu / elapsed * 100:.1f}% of one core")
+    print(f"  lateness     p50 {percentile(lateness, 50) * 1000:.2f} ms  "
+          f"p99 {percentile(lateness, 99) * 1000:.2f} ms  max {max(lateness or [0]) * 1000:.2f} ms")
+    print(f"  heap size    {len(scheduler.heap)}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--intersections", type=int, default=1000)
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--min-phase", type=float, default=3.0)
+    parser.add_argument("--max-phase", type=float, default=30.0)
+    parser.add_argument("--command-rate", type=float, default=10.0)
+    args = parser.parse_args()
+
+    run(args.intersections, args.duration, args.min_phase, args.max_phase, args.command_rate)
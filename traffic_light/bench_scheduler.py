@@ -0,0 +1,120 @@
+"""Real-clock jitter benchmark: deadline scheduler vs the old 50 ms poll loop.
+
+Both loops drive a fake GPIO with short phases so a few dozen transitions
+run in seconds. It reports how late each transition fired after its
+deadline, how long a command waited before it was applied, and how many
+times each loop woke up.
+
+    python bench_scheduler.py --transitions 30 --phase 0.23
+"""
+import argparse
+import threading
+import time
+from queue import Queue, Empty
+
+from controller import STATES, TrafficLight, MultiScheduler
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+class CountingQueue(Queue):
+    def __init__(self):
+        super().__init__()
+        self.wakeups = 0
+
+    def get(self, block=True, timeout=None):
+        self.wakeups += 1
+        return super().get(block, timeout)
+
+
+def send_commands(command_queue, count, interval, sent_at):
+    for _ in range(count):
+        time.sleep(interval)
+        sent_at.append(time.monotonic())
+        command_queue.put(("bench", "Red"))
+
+
+def run_scheduler(transitions, phase, commands):
+    command_queue = CountingQueue()
+    applied = []
+    light = TrafficLight("bench", lambda state: None, lambda state: None,
+                         {state: phase for state in STATES})
+    handle_command = light.handle_command
+
+    def timed_handle_command(cmd, timeout, now):
+        applied.append(time.monotonic())
+        handle_command(cmd, timeout, now)
+    light.handle_command = timed_handle_command
+    scheduler = MultiScheduler([light], command_queue, lambda raw: (raw, phase / 2))
+    sent_at = []
+    sender = threading.Thread(target=send_commands,
+                              args=(command_queue, commands, phase * 3.3, sent_at))
+    sender.start()
+    scheduler.run(lambda: len(scheduler.lateness) >= transitions)
+    sender.join()
+    return scheduler.lateness, command_latency(sent_at, applied), command_queue.wakeups
+
+
+def run_polling(transitions, phase, commands):
+    """The loop from the original main.py, with wall-clock deadlines."""
+    command_queue = Queue()
+    applied, lateness = [], []
+    wakeups = 0
+    auto_index = 0
+    state_start_time = time.time()
+    sent_at = []
+    sender = threading.Thread(target=send_commands,
+                              args=(command_queue, commands, phase * 3.3, sent_at))
+    sender.start()
+    while len(lateness) < transitions:
+        wakeups += 1
+        while not command_queue.empty():
+            command_queue.get()
+            applied.append(time.monotonic())
+        now = time.time()
+        if now - state_start_time >= phase:
+            lateness.append(now - state_start_time - phase)
+            auto_index = (auto_index + 1) % len(STATES)
+            state_start_time = now
+        time.sleep(0.05)
+    sender.join()
+    while True:
+        try:
+            command_queue.get_nowait()
+        except Empty:
+            break
+    return lateness, command_latency(sent_at, applied), wakeups
+
+
+def command_latency(sent_at, applied):
+    """Match each command to the first time a command was applied after it."""
+    latencies = []
+    for sent in sent_at:
+        after = [t for t in applied if t >= sent]
+        if after:
+            latencies.append(after[0] - sent)
+    return latencies
+
+
+def report(name, lateness, latencies, wakeups):
+    print(f"{name:<10} transitions {len(lateness):4d}  wakeups {wakeups:5d}  "
+          f"lateness p50 {percentile(lateness, 50) * 1000:6.2f} ms  "
+          f"p99 {percentile(lateness, 99) * 1000:6.2f} ms  "
+          f"command p50 {percentile(latencies, 50) * 1000:6.2f} ms  "
+          f"max {max(latencies or [0]) * 1000:6.2f} ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--transitions", type=int, default=30)
+    parser.add_argument("--phase", type=float, default=0.23, help="seconds per state")
+    parser.add_argument("--commands", type=int, default=5)
+    args = parser.parse_args()
+
+    report("polling", *run_polling(args.transitions, args.phase, args.commands))
+    report("scheduler", *run_scheduler(args.transitions, args.phase, args.commands))
@@ -0,0 +1,188 @@
+import heapq
+import json
+import math
+import time
+from collections import deque
+from queue import Empty
+
+# Global settings
+STATES = ["Green", "Yellow", "Red"]
+# The duration for each state in seconds.
+STATE_DURATIONS = {
+    "Green": 5,
+    "Yellow": 5,
+    "Red": 5,
+}
+
+
+def status_rate(lights):
+    """Status messages per second the lights send on their fixed durations."""
+    return sum(len(STATES) / sum(light.durations.values()) for light in lights)
+
+
+def parse_command(payload):
+    """Parse a command payload into (command, timeout).
+
+    Raises ValueError for a timeout that is not a finite number of seconds
+    above zero, so a bad one is rejected before it reaches a light.
+    """
+    data = json.loads(payload)
+    if not isinstance(data, dict):
+        return payload.strip(), None
+    timeout = data.get('timeout')
+    if timeout is not None and (isinstance(timeout, bool) or not isinstance(timeout, (int, float))
+                                or not math.isfinite(timeout) or timeout <= 0):
+        raise ValueError(f"Bad timeout: {timeout!r}")
+    return data.get('command', 'None').strip(), timeout
+
+
+class TrafficLight:
+    """State machine for one intersection.
+
+    It never sleeps or reads the clock itself: the scheduler passes ``now``
+    (monotonic seconds) in and asks for the next deadline, which makes it
+    easy to drive with a fake clock.
+    """
+
+    def __init__(self, intersection_id, set_lights, on_change, durations=None, timing=None):
+        self.intersection_id = intersection_id
+        self.set_lights = set_lights    # set_lights(state): drive the outputs
+        self.on_change = on_change      # on_change(state): report a new state
+        self.durations = dict(STATE_DURATIONS, **(durations or {}))
+        self.timing = timing            # e.g. adaptive.AdaptiveTiming; None for fixed durations
+        self.mode = "Auto"              # Current mode: "Auto" or "Manual"
+        self.auto_index = 0             # Current light index for auto mode.
+        self.state = None
+        self.deadline = None            # when the next automatic change is due
+        self.override_until = None      # end of a timed manual override
+
+    def start(self, now):
+        self.set_state(STATES[self.auto_index], now)
+
+    def set_state(self, new_state, now, report=True):
+        if new_state != self.state:
+            self.state = new_state
+            self.set_lights(new_state)
+            if report:
+                self.on_change(new_state)
+        if self.mode == "Auto":
+            self.deadline = now + self.duration(new_state, now)
+
+    def duration(self, state, now):
+        if self.timing is None:
+            return self.durations[state]
+        return self.timing.duration(self, state, now)
+
+    def next_deadline(self):
+        return self.override_until if self.mode == "Manual" else self.deadline
+
+    def advance(self, now):
+        """Handle a due deadline: the next auto phase or the end of an override."""
+        if self.mode == "Manual":
+            # Resume the cycle after whatever state the override held.
+            self.mode = "Auto"
+            self.override_until = None
+            if self.state in STATES:
+                self.auto_index = STATES.index(self.state)
+        self.auto_index = (self.auto_index + 1) % len(STATES)
+        self.set_state(STATES[self.auto_index], now)
+
+    def handle_command(self, cmd, timeout, now):
+        if cmd == "Auto":
+            self.mode = "Auto"
+            self.override_until = None
+            # When switching to auto mode, reset the index.
+            self.auto_index = (self.auto_index + 1) % len(STATES)
+            self.set_state(STATES[self.auto_index], now)
+        elif cmd in STATES:
+            self.mode = "Manual"
+            self.deadline = None
+            # Without a timeout the override holds until the next command.
+            self.override_until = now + timeout if timeout else None
+            self.set_state(cmd, now)
+        else:
+            print(f"Unknown command: {cmd}")
+
+
+class MultiScheduler:
+    """Deadline-driven runloop for one or many TrafficLights.
+
+    Instead of waking every 50 ms to poll, it blocks on the command queue
+    with a timeout that ends exactly at the next transition deadline. A
+    command is handled as soon as it arrives; otherwise the wait times out
+    when a light is due to change.
+
+    Deadlines live in a min-heap of ``(deadline, intersection_id)`` so each
+    wakeup costs O(log n) however many intersections there are. Commands
+    arrive on one queue as ``(intersection_id, raw_payload)``. When a
+    command moves a light's deadline, its old heap entry is not removed.
+    It is skipped later because it no longer matches ``next_deadline()``.
+    """
+
+    def __init__(self, lights, command_queue, parse_command, clock=time.monotonic,
+                 lateness_window=10000):
+        self.lights = {light.intersection_id: light for light in lights}
+        self.command_queue = command_queue
+        self.parse_command = parse_command  # raw payload -> (command, timeout)
+        self.clock = clock
+        self.heap = []
+        self.transitions = 0
+        self.lateness = deque(maxlen=lateness_window)  # most recent transitions only
+
+    def _schedule(self, light):
+        deadline = light.next_deadline()
+        if deadline is not None:
+            heapq.heappush(self.heap, (deadline, light.intersection_id))
+
+    def _is_stale(self, entry):
+        deadline, intersection_id = entry
+        return self.lights[intersection_id].next_deadline() != deadline
+
+    def start(self, now):
+        for light in self.lights.values():
+            light.start(now)
+            self._schedule(light)
+
+    def advance_due(self, now):
+        while self.heap and self.heap[0][0] <= now:
+            entry = heapq.heappop(self.heap)
+            if self._is_stale(entry):
+                continue
+            light = self.lights[entry[1]]
+            self.transitions += 1
+            self.lateness.append(now - entry[0])
+            light.advance(now)
+            self._schedule(light)
+
+    def handle(self, intersection_id, raw):
+        light = self.lights.get(intersection_id)
+        if light is None:
+            print(f"Command for unknown intersection {intersection_id}")
+            return
+        try:
+            cmd, cmd_timeout = self.parse_command(raw)
+        except Exception as e:
+            print(f"Bad command {raw!r}: {e}")
+            return
+        print(f'Get a command for {intersection_id}:', cmd)
+        light.handle_command(cmd, cmd_timeout, self.clock())
+        self._schedule(light)
+
+    def run_once(self):
+        while self.heap and self._is_stale(self.heap[0]):
+            heapq.heappop(self.heap)
+        timeout = None if not self.heap else max(0.0, self.heap[0][0] - self.clock())
+        try:
+            intersection_id, raw = self.command_queue.get(timeout=timeout)
+        except Empty:
+            pass
+        else:
+            self.handle(intersection_id, raw)
+        # Also after a command: steady command traffic must not hold back
+        # the other lights' deadlines.
+        self.advance_due(self.clock())
+
+    def run(self, should_stop=lambda: False):
+        self.start(self.clock())
+        while not should_stop():
+            self.run_once()
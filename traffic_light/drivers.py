@@ -0,0 +1,59 @@
+"""Output drivers that turn a light state into signals.
+
+A driver has ``set(state)`` and ``close()``. Unknown states turn every
+output off. Drivers are picked per intersection by the ``driver`` key in
+intersections.json.
+"""
+import time
+
+
+class GpioDriver:
+    """Three LEDs on Raspberry Pi GPIO pins (BCM numbering)."""
+
+    def __init__(self, red=17, yellow=27, green=22):
+        from gpiozero import LED
+        self.leds = {"Red": LED(red), "Yellow": LED(yellow), "Green": LED(green)}
+
+    def set(self, state):
+        for name, led in self.leds.items():
+            if name == state:
+                led.on()
+            else:
+                led.off()
+
+    def close(self):
+        for led in self.leds.values():
+            led.off()
+            led.close()
+
+
+class SimulatedDriver:
+    """Keeps the state in memory, for tests, benchmarks and dry runs."""
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.state = None
+        self.changes = []  # (time, state)
+
+    def set(self, state):
+        self.state = state
+        self.changes.append((self.clock(), state))
+
+    def close(self):
+        self.state = None
+
+
+DRIVERS = {
+    "gpio": GpioDriver,
+    "simulated": SimulatedDriver,
+}
+
+
+def make_driver(spec):
+    """Build the driver for one intersection entry of the config."""
+    kind = spec.get("driver", "gpio")
+    if kind not in DRIVERS:
+        raise ValueError(f"Unknown driver {kind!r} for intersection {spec.get('id')}")
+    if kind == "gpio":
+        return GpioDriver(**spec.get("pins", {}))
+    return DRIVERS[kind]()
@@ -1,157 +1,215 @@
-from gpiozero import LED
-import time
 from queue import Queue
 import os
+import sys
 
 import paho.mqtt.client as mqtt
 import json
 from datetime import datetime, timezone
 
-# Global settings
-STATES = ["Green", "Yellow", "Red"]
-STATE_DURATION = 5  # The duration for each state in seconds.
+from adaptive import AdaptiveTiming
+from controller import TrafficLight, MultiScheduler, parse_command, status_rate
+from drivers import make_driver
 
-# -------- GPIO：BCM --------
-RED_PIN = 17      # Pin 11
-YELLOW_PIN = 27   # Pin 13
-GREEN_PIN = 22    # Pin 15
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common import metrics  # noqa: E402
+from common.light_state import LightStateServer, SOCKET_PATH  # noqa: E402
+from common.outbox import Outbox, OutboxSender  # noqa: E402
+from common import traffic_load  # noqa: E402
 
-red_led = LED(RED_PIN)
-yellow_led = LED(YELLOW_PIN)
-green_led = LED(GREEN_PIN)
-
-# Local file settings.
-TMP_FILE = '/tmp/traffic_light.json'
-TMP_TMP_FILE = '/tmp/traffic_light.json.tmp'
+# -------- Config --------
+# The intersections this process drives, see intersections.json.
+CONFIG_FILE = os.environ.get(
+    'TRAFFIC_LIGHT_CONFIG',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'intersections.json'))
 
 # -------- MQTT Settings --------
 MQTT_BROKER = 'mqtt-dashboard.com'  # The MQTT broker address.
-INTERSECTION_ID = '0'
-MQTT_COMMAND_TOPIC = f'traffic_light/{INTERSECTION_ID}/command'
-MQTT_STATUS_TOPIC = f'traffic_light/{INTERSECTION_ID}/status'
+MQTT_COMMAND_TOPIC = 'traffic_light/+/command'  # One subscription for every intersection.
+
+# Status messages wait here until the broker has them, across uplink
+# outages and restarts (see common/outbox.py).
+OUTBOX_FILE = os.environ.get(
+    'TRAFFIC_LIGHT_OUTBOX',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'outbox.db'))
+# The sender drains OUTBOX_HEADROOM times as fast as the lights report, so
+# the backlog from an outage clears; "outbox_rate" and "outbox_backoff_max"
+# in the config override the rate and the reconnect backoff cap.
+OUTBOX_MIN_RATE = 50.0     # messages/s
+OUTBOX_HEADROOM = 4
+OUTBOX_BACKOFF_MAX = 10.0  # seconds
+
+# Prometheus /metrics (see common/metrics.py); "metrics_port" in the config overrides it.
+METRICS_PORT = int(os.environ.get('TRAFFIC_LIGHT_METRICS_PORT', 9101))
+
+TRANSITIONS = metrics.counter('traffic_light_transitions_total', 'Light changes reported',
+                              ('intersection_id', 'state'))
+MQTT_MESSAGES = metrics.counter('traffic_light_mqtt_messages_total', 'Messages received, by kind',
+                                ('kind',))
 
 # -------- Global variables --------
-mode = "Auto"            # Current mode: "Auto" or "Manual"
-auto_index = 0           # Current light index for auto mode.
-current_state = STATES[0]
-state_start_time = time.time()
 command_queue = Queue()
-mqtt_client = None
-
-def publish_status(state):
-    """Publish the current state to MQTT and local file."""
-    payload = {
-        "timestamp": datetime.now(timezone.utc).replace(microsecond=0).isoformat() + "Z",
-        "status": state,
-        "intersection_id": INTERSECTION_ID
-    }
-
-    # Publish to local file.
-    with open(TMP_TMP_FILE, 'w') as f:
-        f.write(json.dumps(payload))
-        f.flush()
-        os.fsync(f.fileno())
-    os.rename(TMP_TMP_FILE, TMP_FILE)  # rename to ensure atomic write
-
-    # Publish to MQTT.
-    try:
-        mqtt_client.publish(MQTT_STATUS_TOPIC, json.dumps(payload), qos=1)
-    except Exception as e:
-        print(f"MQTT publish failed: {e}")
-
-def set_lights(state):
-    """Set the lights based on the current state."""
-    if state == "Red":
-        red_led.on()
-        yellow_led.off()
-        green_led.off()
-    elif state == "Yellow":
-        red_led.off()
-        yellow_led.on()
-        green_led.off()
-    elif state == "Green":
-        red_led.off()
-        yellow_led.off()
-        green_led.on()
+outbox = None
+state_server = None
+timing = None  # AdaptiveTiming when any intersection has an "adaptive" section
+
+
+def status_topic(intersection_id):
+    return f'traffic_light/{intersection_id}/status'
+
+
+def load_config(path=CONFIG_FILE):
+    """Load the intersection definitions."""
+    with open(path) as f:
+        config = json.load(f)
+    ids = [str(spec['id']) for spec in config['intersections']]
+    if len(set(ids)) != len(ids):
+        raise ValueError(f"Duplicate intersection ids in {path}")
+    return config
+
+
+def make_publisher(intersection_id, status_file=None):
+    """Return the on_change callback that reports one intersection's state."""
+    def publish_status(state):
+        """Publish the current state to local subscribers, MQTT and local file."""
+        status = {
+            "timestamp": datetime.now(timezone.utc).replace(microsecond=0).isoformat() + "Z",
+            "status": state,
+            "intersection_id": intersection_id
+        }
+        if state == "Red":
+            # Correlates this red phase with the violations detected in it.
+            status["trace_id"] = metrics.new_trace_id()
+        TRANSITIONS.labels(intersection_id, state).inc()
+
+        # Push to co-located violation detectors first, they gate on red.
+        state_server.publish(status)
+
+        # Compatibility fallback for detectors that still read the JSON file.
+        payload = json.dumps(status)
+        if status_file:
+            tmp_file = status_file + '.tmp'
+            with open(tmp_file, 'w') as f:
+                f.write(payload)
+            os.rename(tmp_file, status_file)  # rename to ensure atomic write
+
+        # Queue for MQTT; the outbox sender delivers it once the uplink is up.
+        try:
+            outbox.publish(status_topic(intersection_id), payload, qos=1)
+        except Exception as e:
+            print(f"Outbox write failed: {e}")
+    return publish_status
+
+
+def on_connect(client, userdata, flags, rc):
+    # Subscribing here re-subscribes after every reconnect.
+    if rc == 0:
+        client.subscribe(MQTT_COMMAND_TOPIC)
+        if timing is not None:
+            client.subscribe(traffic_load.SUBSCRIPTION)
     else:
-        # Turn off all lights if the state is unknown.
-        red_led.off()
-        yellow_led.off()
-        green_led.off()
-
-def set_state(new_state, report=True):
-    global current_state, state_start_time
-    if new_state != current_state:
-        current_state = new_state
-        state_start_time = time.time()
-        set_lights(new_state)
-        if report:
-            publish_status(new_state)
+        print(f"MQTT connect failed, return code: {rc}")
+
 
 def on_message(client, userdata, msg):
     """Handle incoming MQTT messages for the command."""
+    # traffic_light/<intersection_id>/command or traffic_load/<intersection_id>
+    intersection_id = msg.topic.split('/')[1]
+    if msg.topic.startswith('traffic_load/'):
+        try:
+            report = traffic_load.decode(msg.payload)
+        except ValueError as e:
+            MQTT_MESSAGES.labels('bad_load').inc()
+            print(f"Bad load report on {msg.topic}: {e}")
+            return
+        MQTT_MESSAGES.labels('load').inc()
+        timing.observe(intersection_id, report['approach'], report['count'],
+                       report['interval'], report['queue'])
+        return
+    MQTT_MESSAGES.labels('command').inc()
     payload = msg.payload.decode('utf-8').strip()
-    command_queue.put(payload)
-
-def parse_command(command):
-    """Parse the incoming command from MQTT."""
-    json_command = json.loads(command)
-    if isinstance(json_command, dict):
-        return json_command.get('command', 'None').strip()
-    return command.strip()
+    command_queue.put((intersection_id, payload))
+
+def build_lights(config, timing=None):
+    """Create the driver and TrafficLight for every configured intersection."""
+    drivers, lights = [], []
+    for spec in config['intersections']:
+        intersection_id = str(spec['id'])
+        driver = make_driver(spec)
+        drivers.append(driver)
+        lights.append(TrafficLight(intersection_id, driver.set,
+                                   make_publisher(intersection_id, spec.get('status_file')),
+                                   spec.get('durations'),
+                                   timing if spec.get('adaptive') is not None else None))
+    return drivers, lights
+
+
+def register_metrics(scheduler, sender, timing=None):
+    """Expose the runloop, outbox and adaptive timing; read on every scrape."""
+    def lateness():
+        values = sorted(scheduler.lateness)
+        if not values:
+            return {}
+        return {"p50": values[len(values) // 2], "p99": values[int(0.99 * (len(values) - 1))],
+                "max": values[-1]}
+    metrics.REGISTRY.collect('traffic_light_scheduler',
+                             lambda: {"transitions": scheduler.transitions, "lateness_seconds": lateness()},
+                             counters=('transitions',))
+    metrics.REGISTRY.collect('traffic_light_outbox', sender.stats,
+                             counters=('enqueued', 'evicted', 'sent', 'failures'))
+    if timing is not None:
+        cycle = metrics.gauge('traffic_light_cycle_seconds', 'Adaptive cycle length, 0 while running fixed',
+                              ('intersection_id',))
+        for intersection_id in timing.plans:
+            cycle.labels(intersection_id).set_function(
+                lambda iid=intersection_id: (timing.current.get(iid) or (0,))[0])
 
 
 def main():
-    global mqtt_client, mode, auto_index
-
-    # Initialize GPIO LEDs.
-    set_state(STATES[auto_index])
-
-    # Initialize MQTT client.
+    global outbox, state_server, timing
+
+    config_file = sys.argv[1] if len(sys.argv) > 1 else CONFIG_FILE
+    config = load_config(config_file)
+    # Green splits follow the detectors' load reports; fixed durations
+    # until the first report arrives.
+    timing = AdaptiveTiming.from_config(config)
+    drivers, lights = build_lights(config, timing)
+    print(f"Driving {len(lights)} intersection(s) from {config_file}")
+
+    # Initialize MQTT client: one connection for every intersection. It
+    # connects in the background, so the lights run without an uplink.
     client = mqtt.Client()
+    client.on_connect = on_connect
     client.on_message = on_message
-    client.connect(MQTT_BROKER)
-    client.subscribe(MQTT_COMMAND_TOPIC)
-    mqtt_client = client
+    client.connect_async(config.get('mqtt_broker', MQTT_BROKER))
     client.loop_start()
 
+    outbox = Outbox(config.get('outbox', OUTBOX_FILE))
+    rate = config.get('outbox_rate') or max(OUTBOX_MIN_RATE, OUTBOX_HEADROOM * status_rate(lights))
+    sender = OutboxSender(outbox, client, rate=rate,
+                          backoff_max=config.get('outbox_backoff_max', OUTBOX_BACKOFF_MAX)).start()
+    print(f"Outbox drains at up to {rate:.0f} messages/s")
+
+    state_server = LightStateServer(config.get('state_socket', SOCKET_PATH)).start()
+    scheduler = MultiScheduler(lights, command_queue, parse_command)
+    register_metrics(scheduler, sender, timing)
+    metrics_server = metrics.serve(config.get('metrics_port', METRICS_PORT))
+
     try:
-        while True:
-            # 1. The manual command queue processing.
-            while not command_queue.empty():
-                cmd = parse_command(command_queue.get())
-                print('Get a command:', cmd)
-                if cmd == "Auto":
-                    mode = "Auto"
-                    # When switching to auto mode, reset the index.
-                    auto_index = (auto_index + 1) % len(STATES)
-                    set_state(STATES[auto_index])
-                elif cmd in STATES:
-                    mode = "Manual"
-                    set_state(cmd)
-                else:
-                    print(f"Unknown command: {cmd}")
-
-            # 2. The auto mode state transition.
-            now = time.time()
-            if mode == "Auto":
-                if now - state_start_time >= STATE_DURATION:
-                    auto_index = (auto_index + 1) % len(STATES)
-                    set_state(STATES[auto_index])
-
-            time.sleep(0.05)
+        # Sets the start state on every driver, then sleeps until a command
+        # arrives or the earliest transition is due.
+        scheduler.run()
 
     except KeyboardInterrupt:
         print("Ctrl+C to quit ...")
     finally:
-        red_led.off()
-        yellow_led.off()
-        green_led.off()
-        red_led.close()
-        yellow_led.close()
-        green_led.close()
+        for driver in drivers:
+            driver.close()
+        state_server.close()
+        metrics_server.shutdown()
+        sender.stop()
+        outbox.close()
         client.loop_stop()
         client.disconnect()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
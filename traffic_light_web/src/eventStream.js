@@ -0,0 +1,13 @@
+// One shared Server-Sent Events connection to the backend push stream.
+// EventSource reconnects on its own and resends Last-Event-ID, so the
+// backend replays whatever was missed while disconnected.
+const STREAM_URL = 'http://localhost:5000/api/stream'
+
+let source = null
+
+export function eventStream() {
+  if (!source) {
+    source = new EventSource(STREAM_URL)
+  }
+  return source
+}
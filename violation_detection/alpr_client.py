@@ -0,0 +1,208 @@
+"""Long-lived, bounded-concurrency client for the remote ALPR API.
+
+- One ``httpx.AsyncClient`` with keep-alive is reused for every request,
+  instead of a new connection per plate.
+- ``concurrency`` worker tasks drain a bounded queue. When the queue is
+  full, ``recognize`` returns "" at once. A request still queued after
+  its ``deadline`` is dropped rather than sent, because its result would
+  come too late to matter.
+- A short-TTL cache keyed by perceptual hash answers near-identical crops
+  (a car stopped on the line, seen frame after frame) without another
+  upload.
+- ``read`` also returns the API's confidence, so callers can keep the
+  best read of a vehicle; ``recognize`` returns just the plate.
+
+``stats()`` reports:
+- queue wait and API latency p50/p99
+- bytes uploaded
+- counts for cache hits, drops and errors
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+
+logger = logging.getLogger("video_stream")
+
+UTILITY_API_URL = "http://104.168.34.100:5555/v1/image/alpr"
+NO_PLATE = ("", 0.0)
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def phash(image) -> int:
+    """64-bit DCT perceptual hash of a BGR image."""
+    import cv2
+    import numpy as np
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:8, :8].flatten()
+    bits = low > np.median(low[1:])  # skip the DC term
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+class PhashCache:
+    """Recent (hash -> result) entries, matched within a Hamming distance."""
+
+    def __init__(self, ttl: float = 10.0, max_distance: int = 6, max_entries: int = 256,
+                 clock=time.monotonic):
+        self.ttl = ttl
+        self.max_distance = max_distance
+        self.entries = deque(maxlen=max_entries)  # (expires, hash, plate)
+        self.clock = clock
+
+    def get(self, key: int):
+        now = self.clock()
+        while self.entries and self.entries[0][0] <= now:
+            self.entries.popleft()
+        for expires, cached, plate in reversed(self.entries):
+            if (cached ^ key).bit_count() <= self.max_distance:
+                return plate
+        return None
+
+    def put(self, key: int, plate: str):
+        self.entries.append((self.clock() + self.ttl, key, plate))
+
+
+class AlprClient:
+    def __init__(self, url: str = UTILITY_API_URL, concurrency: int = 2, max_queue: int = 16,
+                 deadline: float = 3.0, request_timeout: float = 2.0, cache: PhashCache = None,
+                 client=None, clock=time.monotonic):
+        self.url = url
+        self.concurrency = concurrency
+        self.deadline = deadline
+        self.request_timeout = request_timeout
+        self.cache = cache if cache is not None else PhashCache()
+        self.client = client
+        self.clock = clock
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.workers = []
+        self.queue_wait = deque(maxlen=1000)
+        self.latency = deque(maxlen=1000)
+        self.requests = 0
+        self.bytes_uploaded = 0
+        self.cache_hits = 0
+        self.rejected = 0   # queue full
+        self.expired = 0    # past deadline before a worker picked it up
+        self.errors = 0
+
+    async def start(self):
+        if self.client is None:
+            import httpx
+            self.client = httpx.AsyncClient(
+                timeout=self.request_timeout,
+                limits=httpx.Limits(max_connections=self.concurrency,
+                                    max_keepalive_connections=self.concurrency))
+        self.workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+        return self
+
+    async def stop(self):
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        if hasattr(self.client, "aclose"):
+            await self.client.aclose()
+
+    async def recognize(self, image_bytes: bytes, key: int = None) -> str:
+        """Plate text for a JPEG crop, or "" (none found, dropped or failed)."""
+        plate, _ = await self.read(image_bytes, key)
+        return plate
+
+    async def read(self, image_bytes: bytes, key: int = None) -> tuple:
+        """(plate, confidence) for a JPEG crop; ("", 0.0) when there is none."""
+        if key is not None:
+            result = self.cache.get(key)
+            if result is not None:
+                self.cache_hits += 1
+                return result
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((self.clock(), image_bytes, key, future))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return NO_PLATE
+        return await future
+
+    async def _worker(self):
+        while True:
+            enqueued, image_bytes, key, future = await self.queue.get()
+            # One bad request must not end the worker: its caller gets the
+            # exception and the queue keeps draining.
+            try:
+                await self._handle(enqueued, image_bytes, key, future)
+            except Exception as e:
+                self.errors += 1
+                logger.exception("ALPR worker error")
+                if not future.done():
+                    future.set_exception(e)
+
+    async def _handle(self, enqueued, image_bytes, key, future):
+        waited = self.clock() - enqueued
+        self.queue_wait.append(waited)
+        if waited > self.deadline:
+            self.expired += 1
+            if not future.done():
+                future.set_result(NO_PLATE)
+            return
+        # A request for the same car may have finished while this waited.
+        result = self.cache.get(key) if key is not None else None
+        if result is not None:
+            self.cache_hits += 1
+        else:
+            result = await self._post(image_bytes)
+            if result is not None and key is not None:
+                self.cache.put(key, result)
+        if not future.done():
+            future.set_result(result or NO_PLATE)
+
+    async def _post(self, image_bytes: bytes):
+        """Returns (plate, confidence), NO_PLATE for no plate, or None on error."""
+        start = self.clock()
+        self.requests += 1
+        self.bytes_uploaded += len(image_bytes)
+        try:
+            response = await self.client.post(
+                self.url,
+                files={"upload": ("plate.jpg", image_bytes, "image/jpeg")}
+            )
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Plate API error: {str(e)}")
+            return None
+        finally:
+            self.latency.append(self.clock() - start)
+        if response.status_code != 200:
+            self.errors += 1
+            logger.error(f"API error: {response.status_code} - {response.text}")
+            return None
+        try:
+            predictions = response.json().get("predictions", [])
+            if not predictions:
+                logger.info("No plate detected")
+                return NO_PLATE
+            best = predictions[0]
+            return best.get("plate") or "", float(best.get("confidence", 0.0))
+        except (ValueError, TypeError, KeyError, AttributeError, IndexError) as e:
+            self.errors += 1
+            logger.error(f"Unexpected API response: {e!r} - {response.text[:200]}")
+            return None
+
+    def stats(self) -> dict:
+        return {
+            "queued": self.queue.qsize(),
+            "requests": self.requests,
+            "bytes_uploaded": self.bytes_uploaded,
+            "cache_hits": self.cache_hits,
+            "rejected": self.rejected,
+            "expired": self.expired,
+            "errors": self.errors,
+            "queue_wait_ms": {"p50": round(percentile(self.queue_wait, 50) * 1000, 1),
+                              "p99": round(percentile(self.queue_wait, 99) * 1000, 1)},
+            "api_latency_ms": {"p50": round(percentile(self.latency, 50) * 1000, 1),
+                               "p99": round(percentile(self.latency, 99) * 1000, 1)},
+        }
@@ -0,0 +1,99 @@
+"""ALPR request throughput: per-request clients vs the pooled AlprClient.
+
+Starts mock_alpr.py in-process with ``--latency`` seconds per request and
+sends ``--requests`` recognitions, arriving every ``--interval`` seconds.
+The "old" mode reproduces the previous get_plate: a new AsyncClient (new
+TCP connection) per request and only one request in flight, with later
+ones skipped while it runs. The "pooled" mode uses AlprClient.
+
+    python bench_alpr.py --requests 200 --interval 0.02 --latency 0.15
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from alpr_client import AlprClient, percentile
+from mock_alpr import MockAlprServer
+
+FULL_FRAME_BYTES = 60_000   # 640x480 at quality 85
+CROP_BYTES = 9_000          # plate region at quality 75
+
+
+async def old_get_plate(url, image_bytes):
+    async with httpx.AsyncClient(timeout=2.0) as client:
+        response = await client.post(url, files={"upload": ("plate.jpg", image_bytes, "image/jpeg")})
+    predictions = response.json().get("predictions", [])
+    return predictions[0].get("plate", "") if predictions else ""
+
+
+async def run_old(url, requests, interval):
+    running = False
+    latencies, skipped = [], 0
+
+    async def recognize():
+        nonlocal running
+        start = time.perf_counter()
+        try:
+            await old_get_plate(url, b"x" * FULL_FRAME_BYTES)
+            latencies.append(time.perf_counter() - start)
+        finally:
+            running = False
+
+    tasks = []
+    for _ in range(requests):
+        if running:
+            skipped += 1
+        else:
+            running = True
+            tasks.append(asyncio.create_task(recognize()))
+        await asyncio.sleep(interval)
+    await asyncio.gather(*tasks)
+    return latencies, skipped
+
+
+async def run_pooled(url, requests, interval, concurrency):
+    alpr = await AlprClient(url, concurrency=concurrency, max_queue=64).start()
+    latencies = []
+
+    async def recognize(i):
+        start = time.perf_counter()
+        if await alpr.recognize(b"x" * CROP_BYTES + i.to_bytes(4, "big")):
+            latencies.append(time.perf_counter() - start)
+
+    tasks = []
+    for i in range(requests):
+        tasks.append(asyncio.create_task(recognize(i)))
+        await asyncio.sleep(interval)
+    await asyncio.gather(*tasks)
+    await alpr.stop()
+    stats = alpr.stats()
+    return latencies, stats["rejected"] + stats["expired"], stats
+
+
+def report(name, latencies, dropped, server, elapsed):
+    print(f"{name:<8} recognized {len(latencies):4d}  dropped/skipped {dropped:4d}  "
+          f"p50 {percentile(latencies, 50) * 1000:7.1f} ms  p99 {percentile(latencies, 99) * 1000:7.1f} ms  "
+          f"connections {server.connections:4d}  uploaded {server.bytes_received / 1e6:6.2f} MB  "
+          f"({elapsed:.1f} s)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--interval", type=float, default=0.02, help="seconds between requests")
+    parser.add_argument("--latency", type=float, default=0.15, help="mock API seconds per request")
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    for name in ("old", "pooled"):
+        server = MockAlprServer(("127.0.0.1", 0), args.latency).start()
+        start = time.perf_counter()
+        if name == "old":
+            latencies, dropped = asyncio.run(run_old(server.url, args.requests, args.interval))
+        else:
+            latencies, dropped, stats = asyncio.run(
+                run_pooled(server.url, args.requests, args.interval, args.concurrency))
+        report(name, latencies, dropped, server, time.perf_counter() - start)
+        server.shutdown()
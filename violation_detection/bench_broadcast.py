@@ -0,0 +1,106 @@
+"""CPU cost of /video_feed as viewers grow: per-client encoding vs broadcaster.
+
+Feeds synthetic 640x480 frames at 30 fps to N in-process clients for
+``--duration`` seconds per step and reports CPU use and delivered fps. The
+"per-client" mode reproduces the old generate_mjpeg: every client copies
+and encodes each frame itself. It uses cv2 when installed. Otherwise it
+falls back to zlib on the raw frame bytes as a stand-in encoder (which
+also releases the GIL), so the scaling shape can be checked anywhere.
+
+    python bench_broadcast.py --clients 1 5 10 25 50 --duration 5
+"""
+import argparse
+import asyncio
+import os
+import time
+import zlib
+
+from broadcaster import MjpegBroadcaster
+
+WIDTH, HEIGHT = 640, 480
+
+
+def make_encoder(name):
+    if name == "cv2":
+        import cv2
+        import numpy as np
+        frame = np.random.default_rng(0).integers(0, 255, (HEIGHT, WIDTH, 3), dtype=np.uint8)
+
+        def encode(frame, quality):
+            return cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes()
+        return frame, lambda f: f.copy(), encode
+
+    # Noise over a gradient: compresses about as well as a camera image.
+    row = bytes((x * 255 // WIDTH) for x in range(WIDTH)) * 3
+    frame = bytearray(row * HEIGHT)
+    frame[::7] = os.urandom(len(frame[::7]))
+
+    def encode(frame, quality):
+        return zlib.compress(frame, 1)
+    return frame, bytes, encode
+
+
+async def per_client(frame, copy, encode, clients, duration):
+    delivered = [0] * clients
+    stop_at = time.monotonic() + duration
+
+    async def generate_mjpeg(i):
+        while time.monotonic() < stop_at:
+            jpeg = await asyncio.to_thread(encode, copy(frame), 85)
+            delivered[i] += len(jpeg) > 0
+            await asyncio.sleep(0.033)
+
+    await asyncio.gather(*(generate_mjpeg(i) for i in range(clients)))
+    return sum(delivered)
+
+
+async def broadcast(frame, copy, encode, clients, duration):
+    broadcaster = MjpegBroadcaster(encode)
+    delivered = [0] * clients
+    stop_at = time.monotonic() + duration
+
+    async def client(i):
+        async for _ in broadcaster.stream(broadcaster.subscribe()):
+            delivered[i] += 1
+
+    tasks = [asyncio.create_task(client(i)) for i in range(clients)]
+    while time.monotonic() < stop_at:
+        await broadcaster.publish(copy(frame))
+        await asyncio.sleep(0.033)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return sum(delivered)
+
+
+def measure(mode, frame, copy, encode, clients, duration):
+    cpu_start = time.process_time()
+    start = time.monotonic()
+    delivered = asyncio.run(mode(frame, copy, encode, clients, duration))
+    elapsed = time.monotonic() - start
+    cpu = time.process_time() - cpu_start
+    return cpu / elapsed * 100, delivered / elapsed / clients
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 5, 10, 25, 50])
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--encoder", choices=["cv2", "zlib"], default=None)
+    args = parser.parse_args()
+
+    encoder_name = args.encoder
+    if encoder_name is None:
+        try:
+            import cv2  # noqa: F401
+            encoder_name = "cv2"
+        except ImportError:
+            encoder_name = "zlib"
+    frame, copy, encode = make_encoder(encoder_name)
+
+    print(f"encoder {encoder_name}, {args.duration} s per step")
+    print(f"{'clients':>8}  {'per-client cpu':>14}  {'fps/client':>10}  {'broadcast cpu':>13}  {'fps/client':>10}")
+    for clients in args.clients:
+        old_cpu, old_fps = measure(per_client, frame, copy, encode, clients, args.duration)
+        new_cpu, new_fps = measure(broadcast, frame, copy, encode, clients, args.duration)
+        print(f"{clients:>8}  {old_cpu:>13.1f}%  {old_fps:>10.1f}  {new_cpu:>12.1f}%  {new_fps:>10.1f}")
@@ -0,0 +1,104 @@
+"""Aggregate detection fps against the number of worker processes.
+
+Runs ``--cameras`` synthetic cameras of ``--frames`` frames each through
+the Scheduler (see cameras.py) with the real per-frame work, once for each
+count in ``--workers``:
+- capture into shared memory
+- the stop-line pre-filter (MOG2)
+- plate crops on red
+- a JPEG encode per frame for the clip ring
+
+Frames are replayed losslessly and as fast as the workers take them. The
+light is red throughout, and ALPR is an in-process mock. Throughput
+counts from the first processed frame to the last, so process startup is
+left out. It is reported with the speedup over one worker and how busy
+the workers were. Compare it with the host's core count: workers beyond
+the cores only add switching.
+
+Needs OpenCV and numpy.
+
+    python bench_cameras.py --cameras 4 --frames 600 --workers 1,2,4
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from alpr_client import AlprClient
+from broadcaster import MjpegBroadcaster
+from cameras import AlprShare, Camera, PrefilterCounters, Scheduler
+from clips import ClipRecorder
+from mock_alpr import MockAlprClient
+from pipeline import ViolationPipeline, ViolationPublisher, encode_jpeg
+from stopline import load_config
+
+
+class RecordingMqttClient:
+    def __init__(self):
+        self.messages = 0
+
+    def publish(self, topic, payload):
+        self.messages += 1
+
+
+async def run(workers, cameras, frames, config, directory):
+    alpr = await AlprClient(concurrency=4, max_queue=1000, deadline=60,
+                            client=MockAlprClient(0.05, plate="MK{n:04d}{n:04d}")).start()
+    scheduler = Scheduler(workers=workers, lossless=True)
+    for index in range(cameras):
+        ring = scheduler.ring()
+        clips = ClipRecorder(os.path.join(directory, f"{workers}-{index}")).start()
+        pipeline = ViolationPipeline(ring, MjpegBroadcaster(encode_jpeg), PrefilterCounters(),
+                                     AlprShare(alpr, 1000 // cameras), ViolationPublisher("0", RecordingMqttClient()),
+                                     lambda frame: {"status": "Red"}, clips=clips)
+        scheduler.add(Camera(str(index), f"synthetic:{frames}", config, pipeline))
+
+    times = []
+    handle = scheduler.handle
+
+    def timed_handle(result):
+        times.append(time.perf_counter())
+        handle(result)
+
+    scheduler.handle = timed_handle
+    scheduler.start()
+    try:
+        await scheduler.run()
+    finally:
+        scheduler.stop()
+        await alpr.stop()
+        for camera in scheduler.cameras:
+            camera.pipeline.clips.stop()
+    elapsed = times[-1] - times[0]
+    busy = sum(camera.busy for camera in scheduler.cameras)
+    violations = sum(camera.pipeline.violations for camera in scheduler.cameras)
+    return (len(times) - 1) / elapsed, busy / elapsed / scheduler.workers, violations
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cameras", type=int, default=4)
+    parser.add_argument("--frames", type=int, default=600, help="per camera")
+    parser.add_argument("--workers", default=None, help="comma-separated counts (default: 1, 2, 4... up to the cores)")
+    parser.add_argument("--config", default=None, help="stop-line config (default: stopline.json)")
+    args = parser.parse_args()
+
+    cores = os.cpu_count() or 1
+    if args.workers:
+        counts = [int(n) for n in args.workers.split(",")]
+    else:
+        counts = [1]
+        while counts[-1] * 2 <= min(cores, args.cameras):
+            counts.append(counts[-1] * 2)
+    config = load_config(args.config) if args.config else load_config()
+
+    print(f"{args.cameras} cameras x {args.frames} frames at 640x480, {cores} cores")
+    print(f"{'workers':>7} {'fps':>8} {'per camera':>11} {'speedup':>8} {'busy':>6} {'violations':>10}")
+    baseline = None
+    with tempfile.TemporaryDirectory() as directory:
+        for workers in counts:
+            fps, busy, violations = asyncio.run(run(workers, args.cameras, args.frames, config, directory))
+            baseline = baseline or fps
+            print(f"{workers:>7} {fps:>8.1f} {fps / args.cameras:>11.1f} {fps / baseline:>7.2f}x "
+                  f"{busy:>6.0%} {violations:>10}")
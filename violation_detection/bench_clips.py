@@ -0,0 +1,106 @@
+"""Memory and CPU budget of the evidence clip ring on a 640x480@30 stream.
+
+Encodes ``--seconds`` of frames from a source at each JPEG quality tier.
+The default source is the synthetic road scene with sensor-like noise
+added; a recorded ``video:<path>`` gives numbers for a real scene. It then
+reports:
+- per tier: encode time and JPEG size. The encode is the extra CPU a
+  clip tier costs while no viewer watches that tier.
+- the ring's steady state for the clip tier: bytes held, and what
+  ``--ring-bytes`` caps it to
+- ``ClipRecorder.add`` per frame, which is the frame-loop cost
+- writing one ``--pre`` + ``--post`` clip as MJPEG AVI, and as H.264
+  when OpenCV has an encoder: time on the writer thread and file size
+
+Needs OpenCV and numpy.
+
+    python bench_clips.py --fps 30 --seconds 12 --tier medium
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from broadcaster import QUALITY_TIERS
+from clips import ClipRecorder, h264_available, write_h264, write_mjpeg_avi
+from sources import make_source
+
+WIDTH, HEIGHT = 640, 480
+
+
+def frames(spec, count, noise, seed=0):
+    source = make_source(spec)
+    rng = np.random.default_rng(seed)
+    buffer = np.empty((HEIGHT, WIDTH, 3), dtype=np.uint8)
+    for _ in range(count):
+        if not source.read_into(buffer):
+            return
+        if noise:
+            grain = rng.normal(0, noise, buffer.shape)
+            yield np.clip(buffer + grain, 0, 255).astype(np.uint8)
+        else:
+            yield buffer.copy()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--source", default="synthetic:100000")
+    parser.add_argument("--noise", type=float, default=6.0, help="sensor noise sigma added to each frame")
+    parser.add_argument("--fps", type=float, default=30)
+    parser.add_argument("--seconds", type=float, default=12.0, help="ring length")
+    parser.add_argument("--ring-bytes", type=int, default=24 * 1024 * 1024)
+    parser.add_argument("--tier", default="medium", choices=list(QUALITY_TIERS))
+    parser.add_argument("--pre", type=float, default=5.0)
+    parser.add_argument("--post", type=float, default=3.0)
+    args = parser.parse_args()
+
+    count = int(args.seconds * args.fps)
+    raw = list(frames(args.source, count, args.noise))
+    budget = 1 / args.fps
+
+    print(f"{len(raw)} frames {WIDTH}x{HEIGHT}, {args.fps:.0f} fps, noise {args.noise}")
+    encoded = {}
+    for tier, quality in QUALITY_TIERS.items():
+        start = time.process_time()
+        jpegs = [cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes()
+                 for frame in raw]
+        per_frame = (time.process_time() - start) / len(jpegs)
+        encoded[tier] = jpegs
+        size = sum(map(len, jpegs)) / len(jpegs)
+        print(f"encode {tier:<6} q{quality}: {per_frame * 1000:5.2f} ms/frame "
+              f"({per_frame / budget:5.1%} of a core), {size / 1024:5.1f} KB/frame, "
+              f"{size * args.fps / 1024 ** 2:4.2f} MB/s")
+
+    jpegs = encoded[args.tier]
+    with tempfile.TemporaryDirectory() as directory:
+        recorder = ClipRecorder(directory, args.pre, args.post, args.seconds, args.ring_bytes)
+        # Feed the ring three times over so it is in steady state.
+        start = time.perf_counter()
+        for i in range(3 * len(jpegs)):
+            recorder.add(jpegs[i % len(jpegs)], i / args.fps)
+        add = (time.perf_counter() - start) / (3 * len(jpegs))
+        stats = recorder.stats()
+        print(f"ring ({args.tier}): {stats['ring_frames']} frames, {stats['ring_seconds']:.1f} s, "
+              f"{stats['ring_bytes'] / 1024 ** 2:.1f} MB (cap {args.ring_bytes / 1024 ** 2:.0f} MB, "
+              f"{stats['ring_evicted_by_bytes']} evicted by the cap)")
+        print(f"add: {add * 1e6:.1f} us/frame ({add / budget:.3%} of the frame budget)")
+
+        clip = jpegs[:int((args.pre + args.post) * args.fps)]
+        path = os.path.join(directory, "clip.avi")
+        start = time.perf_counter()
+        write_mjpeg_avi(path, clip, args.fps)
+        elapsed = time.perf_counter() - start
+        print(f"clip {args.pre + args.post:.0f} s mjpeg avi: {elapsed * 1000:6.1f} ms, "
+              f"{os.path.getsize(path) / 1024 ** 2:.2f} MB")
+        if h264_available(directory):
+            path = os.path.join(directory, "clip.mp4")
+            start = time.process_time()
+            write_h264(path, clip, args.fps)
+            elapsed = time.process_time() - start
+            print(f"clip {args.pre + args.post:.0f} s h264 mp4:  {elapsed * 1000:6.1f} ms CPU, "
+                  f"{os.path.getsize(path) / 1024 ** 2:.2f} MB")
+        else:
+            print("h264: no encoder in this OpenCV build")
@@ -0,0 +1,96 @@
+"""Replay recorded video through the stop-line pre-filter.
+
+The labels file lists when the light was red and when real violations
+happened, in seconds from the start of the video:
+
+    {"red": [[12.0, 42.5], [75.0, 105.0]], "violations": [20.3, 88.1]}
+
+The report covers:
+- recall: labelled violations with a crossing within ``--tolerance``
+  seconds
+- false alarms
+- how many ALPR calls the pre-filter makes per hour of footage, compared
+  with the old policy of every 30th frame while red
+- pre-filter throughput
+
+    python bench_prefilter.py recording.mp4 labels.json --config stopline.json
+"""
+import argparse
+import json
+import time
+
+import cv2
+
+from stopline import StopLineFilter, load_config
+
+BASELINE_INTERVAL = 30  # the old policy: one ALPR call every 30th frame while red
+
+
+def is_red_at(red, t):
+    return any(start <= t < end for start, end in red)
+
+
+def replay(video, config, red):
+    capture = cv2.VideoCapture(video)
+    if not capture.isOpened():
+        raise SystemExit(f"Cannot open {video}")
+    fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+    prefilter = StopLineFilter.from_config(config)
+
+    crossing_times = []
+    index = 0
+    busy = 0.0
+    while True:
+        ok, frame = capture.read()
+        if not ok:
+            break
+        t = index / fps
+        start = time.perf_counter()
+        crossed = prefilter.process(frame, is_red_at(red, t))
+        busy += time.perf_counter() - start
+        crossing_times.extend([t] * len(crossed))
+        index += 1
+    capture.release()
+    return prefilter, crossing_times, index, index / fps, busy
+
+
+def score(crossing_times, violations, tolerance):
+    unmatched = list(crossing_times)
+    hits = 0
+    for t in violations:
+        match = next((c for c in unmatched if abs(c - t) <= tolerance), None)
+        if match is not None:
+            unmatched.remove(match)
+            hits += 1
+    return hits, len(unmatched)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("video")
+    parser.add_argument("labels")
+    parser.add_argument("--config", default=None, help="stop-line config (default: stopline.json)")
+    parser.add_argument("--tolerance", type=float, default=1.0, help="seconds")
+    args = parser.parse_args()
+
+    with open(args.labels) as f:
+        labels = json.load(f)
+    config = load_config(args.config) if args.config else load_config()
+
+    prefilter, crossing_times, frames, duration, busy = replay(args.video, config, labels["red"])
+    hits, false_alarms = score(crossing_times, labels["violations"], args.tolerance)
+    per_hour = 3600 / duration if duration else 0
+    baseline_calls = prefilter.red_frames // BASELINE_INTERVAL
+    calls = len(crossing_times)
+
+    print(json.dumps({
+        "frames": frames,
+        "duration_s": round(duration, 1),
+        "prefilter_fps": round(frames / busy, 1) if busy else None,
+        "violations_labelled": len(labels["violations"]),
+        "recall": round(hits / len(labels["violations"]), 3) if labels["violations"] else None,
+        "false_alarms": false_alarms,
+        "alpr_calls_per_hour": round(calls * per_hour, 1),
+        "baseline_alpr_calls_per_hour": round(baseline_calls * per_hour, 1),
+        "alpr_calls_saved_per_hour": round((baseline_calls - calls) * per_hour, 1),
+    }, indent=2))
@@ -0,0 +1,112 @@
+"""Encode-once MJPEG fan-out for /video_feed.
+
+One encoder task hands each new frame to ``MjpegBroadcaster.publish``. It
+JPEG-encodes the frame once per quality tier that currently has a client
+due for a frame, then puts the same bytes on each of those clients'
+queues. The cost of a frame depends on the number of tiers in use, not
+on the number of viewers.
+
+Client queues are small and bounded. When a client falls behind, its
+oldest queued frame is dropped, so a slow viewer sees fewer but current
+frames instead of an ever-growing lag.
+
+When another process encodes the frames (cameras.py), ``due_tiers``
+says what to encode and ``deliver`` fans the result out.
+"""
+import asyncio
+import time
+
+QUALITY_TIERS = {"high": 85, "medium": 70, "low": 50}
+MAX_FPS = 30
+
+
+class Subscriber:
+    def __init__(self, tier: str, fps: float, max_queue: int):
+        self.tier = tier
+        self.interval = 1.0 / fps
+        self.next_due = 0.0
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.sent = 0
+        self.dropped = 0
+
+    def due(self, now: float) -> bool:
+        return now >= self.next_due
+
+    def offer(self, jpeg: bytes, now: float):
+        # Stay on the fps cadence, but restart it after a long stall rather
+        # than bursting frames to catch up.
+        self.next_due += self.interval
+        if self.next_due < now:
+            self.next_due = now + self.interval
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(jpeg)
+        self.sent += 1
+
+
+class MjpegBroadcaster:
+    def __init__(self, encode, max_queue: int = 2, clock=time.monotonic):
+        self.encode = encode  # encode(frame, quality) -> JPEG bytes, run in a worker thread
+        self.max_queue = max_queue
+        self.clock = clock
+        self.subscribers = set()
+        self.frames = 0
+        self.encodes = 0
+
+    def subscribe(self, tier: str = "high", fps: float = MAX_FPS) -> Subscriber:
+        if tier not in QUALITY_TIERS:
+            raise ValueError(f"Unknown quality tier {tier!r}, expected one of {list(QUALITY_TIERS)}")
+        subscriber = Subscriber(tier, min(max(fps, 1), MAX_FPS), self.max_queue)
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self.subscribers.discard(subscriber)
+
+    async def publish(self, frame, extra_tiers=()) -> dict:
+        """Encode ``frame`` for every tier needed and hand it to due clients.
+
+        ``extra_tiers`` are encoded even without a viewer, e.g. for plate
+        recognition. Returns ``{tier: jpeg_bytes}`` for what was encoded.
+        """
+        now = self.clock()
+        jpegs = {}
+        for tier in self.due_tiers(now) | set(extra_tiers):
+            jpegs[tier] = await asyncio.to_thread(self.encode, frame, QUALITY_TIERS[tier])
+            self.encodes += 1
+        self.deliver(jpegs, now)
+        return jpegs
+
+    def due_tiers(self, now: float = None) -> set:
+        """The tiers that have a client due for a frame."""
+        now = self.clock() if now is None else now
+        return {s.tier for s in self.subscribers if s.due(now)}
+
+    def deliver(self, jpegs: dict, now: float = None):
+        """Hand frames encoded elsewhere (``{tier: jpeg_bytes}``) to the due clients."""
+        now = self.clock() if now is None else now
+        for subscriber in [s for s in self.subscribers if s.due(now)]:
+            if subscriber.tier in jpegs:
+                subscriber.offer(jpegs[subscriber.tier], now)
+        self.frames += 1
+
+    async def stream(self, subscriber: Subscriber):
+        """multipart/x-mixed-replace body for one client."""
+        try:
+            while True:
+                jpeg = await subscriber.queue.get()
+                yield (b'--frame\r\n'
+                       b'Content-Type: image/jpeg\r\n\r\n' +
+                       jpeg + b'\r\n')
+        finally:
+            self.unsubscribe(subscriber)
+
+    def stats(self) -> dict:
+        return {
+            "clients": len(self.subscribers),
+            "frames": self.frames,
+            "encodes": self.encodes,
+            "sent": sum(s.sent for s in self.subscribers),
+            "dropped": sum(s.dropped for s in self.subscribers),
+        }
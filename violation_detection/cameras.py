@@ -0,0 +1,473 @@
+"""Several cameras on one host, with the frame work spread over processes.
+
+cameras.json ($CAMERAS_CONFIG) lists the cameras. Without it, main.py
+runs one camera from $FRAME_SOURCE.
+
+    {"cameras": [
+        {"id": "north", "source": "camera", "intersection_id": "0",
+         "approach": "main", "stopline": "stopline.json"},
+        {"id": "east", "source": "rtsp://10.0.0.12/stream1", "intersection_id": "0",
+         "approach": "cross", "stopline": "stopline-east.json", "weight": 2}]}
+
+``source`` takes any sources.py spec. ``stopline`` is a path (relative
+to this directory) or the config itself. ``weight`` is the camera's
+relative pre-filter cost, e.g. for one with a DNN model. It is used when
+cameras are placed on workers.
+
+The processes:
+- one capture process per camera reads its source into a
+  ``SharedFrameRing`` (see frame_ring.py). Decoding an RTSP or file
+  stream is cv2 work, and Picamera2 wants one owner.
+- ``workers`` detection processes, each serving the cameras placed on
+  it. A worker reads each new frame in place from shared memory, runs the
+  camera's stop-line pre-filter, crops and encodes the plate regions, and
+  JPEG-encodes the frame for the tiers wanted. Only those results cross a
+  pipe to the main process.
+- the main process keeps the rest per camera: the light state, ALPR,
+  dedup and publishing, /video_feed/<camera_id> clients and the clip
+  ring. It tells the workers, through a shared control word per camera,
+  whether the light is red and which tiers to encode.
+
+The ``Scheduler`` in the main process places the work. A camera's
+pre-filter keeps a background model and tracks, so one worker processes
+all of its frames in order. Cameras go to the worker with the least
+weight placed on it. A worker takes one frame per ready camera in turn,
+so a busy camera delays its neighbours by at most one frame. If a worker
+dies, its cameras move to the least loaded live one. Their pre-filters
+start again there with an empty background model. Crops from every
+camera share one ALPR client, and ``AlprShare`` limits how many of a
+camera's crops it holds at once, so a busy approach cannot starve the
+others.
+"""
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import time
+
+from alpr_client import phash
+from broadcaster import QUALITY_TIERS
+from frame_ring import SharedFrameRing
+from pipeline import ALPR_JPEG_QUALITY, encode_jpeg, plate_region
+
+logger = logging.getLogger("video_stream")
+
+CONFIG_FILE = os.environ.get(
+    'CAMERAS_CONFIG',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cameras.json'))
+
+# Control word bits, set by the main process for each camera
+RED = 1
+TIER_BITS = {tier: 2 << i for i, tier in enumerate(QUALITY_TIERS)}
+
+
+def load_config(path=CONFIG_FILE) -> list:
+    """The camera list, with defaults filled in and stop-line configs loaded."""
+    with open(path) as f:
+        cameras = json.load(f)["cameras"]
+    base = os.path.dirname(os.path.abspath(path))
+    ids = set()
+    for camera in cameras:
+        camera["id"] = str(camera["id"])
+        if camera["id"] in ids:
+            raise ValueError(f"Duplicate camera id {camera['id']!r}")
+        ids.add(camera["id"])
+        camera.setdefault("intersection_id", "0")
+        camera.setdefault("approach", "main")
+        camera.setdefault("weight", 1.0)
+        stopline = camera.get("stopline", "stopline.json")
+        if isinstance(stopline, str):
+            with open(os.path.join(base, stopline)) as f:
+                camera["stopline"] = json.load(f)
+    return cameras
+
+
+def encode_control(is_red: bool, tiers) -> int:
+    word = RED if is_red else 0
+    for tier in tiers:
+        word |= TIER_BITS[tier]
+    return word
+
+
+def decode_control(word: int):
+    return bool(word & RED), {tier for tier, bit in TIER_BITS.items() if word & bit}
+
+
+class FrameWork:
+    """What a detection worker does to a frame. Tests swap in stand-ins."""
+
+    def prefilter(self, config: dict):
+        from stopline import StopLineFilter
+        return StopLineFilter.from_config(config)
+
+    def crop(self, prefilter, frame, box) -> tuple:
+        """(jpeg, phash) of the vehicle's plate region."""
+        region = plate_region(prefilter.crop(frame, box))
+        return encode_jpeg(region, ALPR_JPEG_QUALITY), phash(region)
+
+    def encode(self, frame, quality: int) -> bytes:
+        return encode_jpeg(frame, quality)
+
+
+class FrameResult:
+    """One processed frame, sent from a worker to the main process."""
+
+    def __init__(self, camera, seq, timestamp, worker, crops=(), jpegs=None, timings=None,
+                 prefilter=None, error=None):
+        self.camera = camera              # the camera's index in the scheduler
+        self.seq = seq
+        self.timestamp = timestamp
+        self.worker = worker
+        self.crops = list(crops)          # [(jpeg, phash)] of crossing vehicles' plate regions
+        self.jpegs = jpegs or {}          # {tier: jpeg} of the whole frame
+        self.timings = timings or {}      # stage -> seconds in the worker
+        self.prefilter = prefilter or {}  # the pre-filter's stats() after this frame
+        self.error = error
+
+
+# -------- child processes --------
+
+def capture_process(source, ring, open_source=None, lossless=False, stop=None):
+    """Fill ``ring`` from the source until it is exhausted or ``stop`` is set."""
+    if open_source is None:
+        from sources import make_source as open_source
+    try:
+        source = open_source(source)
+        while stop is None or not stop.is_set():
+            if lossless and not ring.wait_consumed(timeout=0.5):
+                continue
+            slot = ring.begin_write()
+            if not source.read_into(None if slot is None else slot.data):
+                break
+            if slot is not None:
+                ring.commit(slot)
+    except Exception as e:
+        logger.error(f"Capture failed: {e}")
+    finally:
+        ring.close()
+        ring.detach()
+
+
+def detection_worker(index, rings, stoplines, owners, controls, results, stop, work=None):
+    """Process the new frames of the cameras placed on worker ``index``.
+
+    ``rings`` and ``stoplines`` are per camera, in the order of ``owners``
+    and ``controls``.
+    """
+    work = work or FrameWork()
+    cond = rings[0].cond  # shared by every ring, so one wait covers all cameras
+    seen = [0] * len(rings)
+    prefilters = {}
+    start = 0
+
+    def ready():
+        return stop.is_set() or any(owners[i] == index and rings[i].seq > seen[i] for i in range(len(rings)))
+
+    try:
+        while not stop.is_set():
+            with cond:
+                cond.wait_for(ready, timeout=0.5)
+            mine = [i for i in range(len(rings)) if owners[i] == index]
+            for i in prefilters.keys() - set(mine):
+                del prefilters[i]  # moved to another worker
+            # One frame per ready camera, starting after the camera served
+            # first last time.
+            mine = [i for i in mine if i >= start] + [i for i in mine if i < start]
+            if mine:
+                start = mine[0] + 1
+            for i in mine:
+                frame = rings[i].acquire_next(seen[i], timeout=0)
+                if frame is None:
+                    continue
+                seen[i] = frame.seq
+                try:
+                    result = _process(work, index, i, frame, stoplines[i], prefilters, controls[i])
+                except Exception as e:
+                    logger.error(f"Worker {index} failed on camera {i}: {e}")
+                    result = FrameResult(i, frame.seq, frame.timestamp, index, error=str(e))
+                finally:
+                    rings[i].release(frame)
+                results.put(result)
+    finally:
+        for ring in rings:
+            ring.detach()
+
+
+def _process(work, index, camera, frame, stopline, prefilters, control):
+    is_red, tiers = decode_control(control)
+    prefilter = prefilters.get(camera)
+    if prefilter is None:
+        prefilter = prefilters[camera] = work.prefilter(stopline)
+    timings = {}
+    start = time.perf_counter()
+    boxes = prefilter.process(frame.data, is_red)
+    timings["prefilter"] = time.perf_counter() - start
+    crops = []
+    if boxes:
+        start = time.perf_counter()
+        crops = [work.crop(prefilter, frame.data, box) for box in boxes]
+        timings["crop"] = time.perf_counter() - start
+        tiers.add("high")  # the evidence image
+    jpegs = {}
+    if tiers:
+        start = time.perf_counter()
+        jpegs = {tier: work.encode(frame.data, QUALITY_TIERS[tier]) for tier in tiers}
+        timings["encode"] = time.perf_counter() - start
+    return FrameResult(camera, frame.seq, frame.timestamp, index, crops, jpegs, timings, prefilter.stats())
+
+
+# -------- main process --------
+
+class PrefilterCounters:
+    """The main process's view of a camera's pre-filter, which runs in a worker.
+
+    Workers send the filter's ``stats()`` with every frame. LoadReporter
+    and /stream_stats read them here as they would the filter itself.
+    """
+
+    def __init__(self):
+        self.counts = {"frames": 0, "red_frames": 0, "crossings": 0, "passed": 0, "waiting": 0}
+        self.base = dict(self.counts)  # totals of pre-filters on previous workers
+
+    @property
+    def passed(self) -> int:
+        return self.counts["passed"]
+
+    @property
+    def tracker(self):
+        return self
+
+    def waiting(self) -> int:
+        return self.counts["waiting"]
+
+    def update(self, stats: dict):
+        for key, value in stats.items():
+            self.counts[key] = value if key == "waiting" else self.base[key] + value
+
+    def restart(self):
+        """The camera moved to a new worker, whose pre-filter counts from 0."""
+        self.base = dict(self.counts)
+
+    def stats(self) -> dict:
+        return dict(self.counts)
+
+
+class AlprShare:
+    """One camera's share of the ALPR client every camera uses."""
+
+    def __init__(self, alpr, limit: int):
+        self.alpr = alpr
+        self.limit = limit
+        self.slots = asyncio.Semaphore(limit)
+        self.held = 0
+
+    async def read(self, image_bytes: bytes, key: int = None) -> tuple:
+        async with self.slots:
+            self.held += 1
+            try:
+                return await self.alpr.read(image_bytes, key)
+            finally:
+                self.held -= 1
+
+
+class Camera:
+    def __init__(self, camera_id: str, source: str, stopline: dict, pipeline, weight: float = 1.0):
+        self.id = camera_id
+        self.source = source
+        self.stopline = stopline
+        self.pipeline = pipeline     # a ViolationPipeline on a SharedFrameRing, run by the scheduler
+        self.weight = weight
+        self.prefilter = pipeline.prefilter
+        self.worker = None
+        self.seen_seq = 0
+        self.red_light = {}          # the latest red light state, for the violations of its phase
+        self.busy = 0.0              # worker seconds spent on this camera
+        self.errors = 0
+        self.capture = None
+
+    @property
+    def ring(self):
+        return self.pipeline.ring
+
+    @property
+    def done(self) -> bool:
+        return self.ring.closed and self.seen_seq >= self.ring.seq
+
+    def stats(self) -> dict:
+        return {"worker": self.worker, "frames": self.pipeline.frames,
+                "violations": self.pipeline.violations, "errors": self.errors,
+                "worker_ms_per_frame": round(self.busy / self.pipeline.frames * 1000, 2)
+                if self.pipeline.frames else 0.0,
+                "capture_alive": self.capture is not None and self.capture.is_alive()}
+
+
+class Scheduler:
+    """Runs the cameras' capture and detection processes and their results.
+
+    Create every ring with ``ring`` and ``add`` every camera before
+    ``start``. ``run`` handles results until every source is exhausted,
+    which a live camera never is.
+    """
+
+    def __init__(self, workers: int = None, shape=(480, 640, 3), frame_bytes: int = None, slots: int = 4,
+                 open_source=None, work=None, lossless: bool = False, context=None):
+        # spawn: the children must not inherit the server's threads and sockets.
+        self.context = context or multiprocessing.get_context("spawn")
+        self.workers = workers or os.cpu_count() or 1
+        self.shape = None if frame_bytes else shape
+        self.frame_bytes = frame_bytes
+        self.slots = slots
+        self.open_source = open_source
+        self.work = work
+        self.lossless = lossless
+        self.cond = self.context.Condition()  # shared by every ring
+        self.cameras = []
+        self.rings = []
+        self.owners = None
+        self.controls = None
+        self.results = self.context.Queue()
+        self.stop_event = self.context.Event()
+        self.processes = []  # the detection workers
+        self.started = None
+
+    def ring(self) -> SharedFrameRing:
+        ring = SharedFrameRing(self.frame_bytes, self.shape, self.slots, self.context, cond=self.cond)
+        self.rings.append(ring)
+        return ring
+
+    def add(self, camera: Camera):
+        if camera.ring is not self.rings[len(self.cameras)]:
+            raise ValueError("Add cameras in the order their rings were created")
+        self.cameras.append(camera)
+
+    def place(self):
+        """Each camera, heaviest first, on the worker with the least weight so far."""
+        load = [0.0] * self.workers
+        for camera in sorted(self.cameras, key=lambda c: -c.weight):
+            camera.worker = min(range(self.workers), key=lambda w: load[w])
+            load[camera.worker] += camera.weight
+
+    def start(self):
+        self.workers = min(self.workers, len(self.cameras))
+        self.place()
+        self.owners = self.context.RawArray("i", [camera.worker for camera in self.cameras])
+        self.controls = self.context.RawArray("i", len(self.cameras))
+        for i, camera in enumerate(self.cameras):
+            self.controls[i] = self._control(camera)
+        for index in range(self.workers):
+            process = self.context.Process(
+                target=detection_worker, name=f"detector-{index}", daemon=True,
+                args=(index, self.rings, [c.stopline for c in self.cameras], self.owners, self.controls,
+                      self.results, self.stop_event, self.work))
+            process.start()
+            self.processes.append(process)
+        for camera in self.cameras:
+            camera.capture = self.context.Process(
+                target=capture_process, name=f"capture-{camera.id}", daemon=True,
+                args=(camera.source, camera.ring, self.open_source, self.lossless, self.stop_event))
+            camera.capture.start()
+        self.started = time.perf_counter()
+        logger.info(f"{len(self.cameras)} cameras on {self.workers} detection workers: "
+                    + ", ".join(f"{c.id}->{c.worker}" for c in self.cameras))
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        with self.cond:
+            self.cond.notify_all()
+        for process in self.processes + [c.capture for c in self.cameras if c.capture]:
+            process.join(timeout=2)
+            if process.is_alive():
+                process.terminate()  # e.g. blocked in a camera read
+        for ring in self.rings:
+            ring.detach()
+
+    def _control(self, camera) -> int:
+        pipeline = camera.pipeline
+        light = pipeline.light_for(None)  # read as the next frame is taken, before it exists
+        is_red = light.get("status") == "Red"
+        if is_red:
+            camera.red_light = light
+        tiers = pipeline.broadcaster.due_tiers()
+        if pipeline.clips is not None:
+            tiers.add(pipeline.clip_tier)
+        return encode_control(is_red, tiers)
+
+    def handle(self, result: FrameResult):
+        """Hand a processed frame to its camera's pipeline."""
+        i = result.camera
+        camera = self.cameras[i]
+        pipeline = camera.pipeline
+        if result.worker != camera.worker:
+            return  # processed by the worker the camera just moved from
+        camera.seen_seq = max(camera.seen_seq, result.seq)
+        self.controls[i] = self._control(camera)
+        if result.error is not None:
+            camera.errors += 1
+            return
+        camera.busy += sum(result.timings.values())
+        for stage, seconds in result.timings.items():
+            pipeline.timer.record(stage, seconds)
+        camera.prefilter.update(result.prefilter)
+        pipeline.broadcaster.deliver(result.jpegs)
+        # Crops only come from frames the worker saw while red.
+        pipeline.dispatch(result.timestamp, camera.red_light, result.crops, result.jpegs)
+        pipeline.timer.record("frame", camera.ring.clock() - result.timestamp)
+        pipeline.frames += 1
+        pipeline.flush()
+
+    def check_workers(self):
+        """Move the cameras of dead workers to the least loaded live one."""
+        alive = [i for i, p in enumerate(self.processes) if p.is_alive()]
+        if not alive or len(alive) == len(self.processes):
+            return
+        for i, camera in enumerate(self.cameras):
+            if camera.worker in alive:
+                continue
+            load = {w: sum(c.weight for c in self.cameras if c.worker == w) for w in alive}
+            worker = min(alive, key=lambda w: load[w])
+            logger.warning(f"Detection worker {camera.worker} died, camera {camera.id} moves to {worker}")
+            camera.worker = worker
+            camera.prefilter.restart()
+            self.owners[i] = worker
+        with self.cond:
+            self.cond.notify_all()
+
+    async def run(self):
+        last_check = time.monotonic()
+        while not all(camera.done for camera in self.cameras):
+            try:
+                result = await asyncio.to_thread(self.results.get, True, 0.5)
+            except queue.Empty:
+                result = None
+            if result is not None:
+                self.handle(result)
+            if time.monotonic() - last_check > 1.0:
+                last_check = time.monotonic()
+                self.check_workers()
+                if not any(p.is_alive() for p in self.processes):
+                    raise RuntimeError("Every detection worker has died")
+        for camera in self.cameras:
+            pipeline = camera.pipeline
+            await asyncio.gather(*pipeline.tasks)
+            pipeline.flush(force=True)
+            if pipeline.clips is not None:
+                pipeline.clips.flush(force=True)
+
+    def camera(self, camera_id: str):
+        return next((c for c in self.cameras if c.id == camera_id), None)
+
+    def stats(self) -> dict:
+        elapsed = time.perf_counter() - self.started if self.started else 0.0
+        workers = []
+        for index, process in enumerate(self.processes):
+            placed = [c for c in self.cameras if c.worker == index]
+            workers.append({"pid": process.pid, "alive": process.is_alive(),
+                            "cameras": [c.id for c in placed],
+                            "busy": round(sum(c.busy for c in placed) / elapsed, 3) if elapsed else 0.0})
+        frames = sum(c.pipeline.frames for c in self.cameras)
+        return {"workers": workers, "frames": frames,
+                "fps": round(frames / elapsed, 1) if elapsed else 0.0,
+                "cameras": {c.id: c.stats() for c in self.cameras}}
@@ -0,0 +1,318 @@
+"""Evidence clips: a short video around each violation.
+
+The encoder already turns every frame into a JPEG for /video_feed.
+``ClipRecorder.add`` keeps those bytes in a ``JpegRing``, which holds
+the last ``seconds`` of frames up to ``max_bytes``, whichever limit is
+hit first. No frame is encoded twice, and nothing is decoded.
+
+When a violation is published, ``request`` names a clip covering ``pre``
+seconds before the crossing frame and ``post`` seconds after it. The name
+goes out with the violation right away. Once the ring has frames past the
+end of the window, the clip's frames are handed to a writer thread, off
+the frame loop. They are references to the ring's bytes, not copies.
+
+Two containers:
+- ``mjpeg`` (default): the JPEGs go as they are into an AVI (RIFF)
+  container. That is only file I/O, and every player can open it.
+- ``h264``: each frame is decoded and re-encoded with OpenCV's
+  VideoWriter into an MP4. The file is several times smaller, but it
+  costs CPU on the device, and it needs an OpenCV build with an H.264
+  encoder. Without one, ``start`` falls back to ``mjpeg``.
+
+Clips live in ``directory``, served at /clips/<name>. The oldest are
+deleted once the directory exceeds ``max_disk_bytes``.
+"""
+import logging
+import os
+import re
+import struct
+import threading
+import time
+from collections import deque
+from queue import Queue, Full
+
+logger = logging.getLogger("video_stream")
+
+CODECS = ("mjpeg", "h264")
+EXTENSIONS = {"mjpeg": ".avi", "h264": ".mp4"}
+
+
+class JpegRing:
+    """Timestamped JPEG frames covering at most ``seconds`` and ``max_bytes``."""
+
+    def __init__(self, seconds: float = 12.0, max_bytes: int = 24 * 1024 * 1024):
+        self.seconds = seconds
+        self.max_bytes = max_bytes
+        self.frames = deque()  # (timestamp, jpeg), oldest first
+        self.bytes = 0
+        self.evicted_by_bytes = 0
+
+    def append(self, timestamp: float, jpeg: bytes):
+        self.frames.append((timestamp, jpeg))
+        self.bytes += len(jpeg)
+        while self.frames and timestamp - self.frames[0][0] > self.seconds:
+            self.bytes -= len(self.frames.popleft()[1])
+        while len(self.frames) > 1 and self.bytes > self.max_bytes:
+            self.bytes -= len(self.frames.popleft()[1])
+            self.evicted_by_bytes += 1
+
+    def between(self, start: float, end: float) -> list:
+        return [(t, jpeg) for t, jpeg in self.frames if start <= t <= end]
+
+    def span(self) -> float:
+        return self.frames[-1][0] - self.frames[0][0] if self.frames else 0.0
+
+
+def jpeg_size(jpeg: bytes):
+    """(width, height) from a JPEG's start-of-frame marker."""
+    offset = 2
+    while offset + 4 <= len(jpeg):
+        if jpeg[offset] != 0xFF:
+            break
+        marker = jpeg[offset + 1]
+        (length,) = struct.unpack_from(">H", jpeg, offset + 2)
+        # SOF0..SOF15, except DHT (C4), JPG (C8) and DAC (CC)
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height, width = struct.unpack_from(">HH", jpeg, offset + 5)
+            return width, height
+        offset += 2 + length
+    raise ValueError("No frame header in JPEG")
+
+
+def _chunk(fourcc: bytes, data: bytes) -> bytes:
+    return fourcc + struct.pack("<I", len(data)) + data + (b"\0" if len(data) % 2 else b"")
+
+
+def _list(kind: bytes, data: bytes) -> bytes:
+    return _chunk(b"LIST", kind + data)
+
+
+def write_mjpeg_avi(path: str, jpegs: list, fps: float):
+    """Write JPEG frames unchanged into a Motion-JPEG AVI file."""
+    width, height = jpeg_size(jpegs[0])
+    rate = max(1, int(round(fps * 1000)))  # frames per 1000 s, so fractional fps survive
+    largest = max(len(jpeg) for jpeg in jpegs)
+    avih = struct.pack("<14I", int(round(1e6 / fps)), int(largest * fps), 0, 0x10, len(jpegs), 0, 1,
+                       largest, width, height, 0, 0, 0, 0)
+    strh = struct.pack("<4s4sIHHIIIIIIIIhhhh", b"vids", b"MJPG", 0, 0, 0, 0, 1000, rate, 0, len(jpegs),
+                       largest, 0xFFFFFFFF, 0, 0, 0, width, height)
+    strf = struct.pack("<IiiHH4sIiiII", 40, width, height, 1, 24, b"MJPG", width * height * 3, 0, 0, 0, 0)
+    header = _list(b"hdrl", _chunk(b"avih", avih) + _list(b"strl", _chunk(b"strh", strh) + _chunk(b"strf", strf)))
+
+    index = []
+    offset = 4  # idx1 offsets count from the "movi" fourcc
+    for jpeg in jpegs:
+        index.append(struct.pack("<4sIII", b"00dc", 0x10, offset, len(jpeg)))  # every frame is a keyframe
+        offset += 8 + len(jpeg) + len(jpeg) % 2
+    movi_size = offset
+    idx1 = _chunk(b"idx1", b"".join(index))
+    riff_size = 4 + len(header) + 8 + movi_size + len(idx1)
+
+    with open(path + ".tmp", "wb") as f:
+        f.write(b"RIFF" + struct.pack("<I", riff_size) + b"AVI " + header)
+        f.write(b"LIST" + struct.pack("<I", movi_size) + b"movi")
+        for jpeg in jpegs:
+            f.write(b"00dc" + struct.pack("<I", len(jpeg)))
+            f.write(jpeg)
+            if len(jpeg) % 2:
+                f.write(b"\0")
+        f.write(idx1)
+    os.replace(path + ".tmp", path)
+
+
+def write_h264(path: str, jpegs: list, fps: float):
+    """Decode the frames and re-encode them as H.264 in an MP4 with OpenCV."""
+    import cv2
+    import numpy as np
+    width, height = jpeg_size(jpegs[0])
+    writer = cv2.VideoWriter(path + ".tmp.mp4", cv2.VideoWriter_fourcc(*"avc1"), fps, (width, height))
+    if not writer.isOpened():
+        raise RuntimeError("OpenCV has no H.264 encoder")
+    try:
+        for jpeg in jpegs:
+            writer.write(cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR))
+    finally:
+        writer.release()
+    os.replace(path + ".tmp.mp4", path)
+
+
+def h264_available(directory: str) -> bool:
+    try:
+        import cv2
+    except ImportError:
+        return False
+    probe = os.path.join(directory, ".h264-probe.mp4")
+    writer = cv2.VideoWriter(probe, cv2.VideoWriter_fourcc(*"avc1"), 30, (64, 48))
+    available = writer.isOpened()
+    writer.release()
+    if os.path.exists(probe):
+        os.unlink(probe)
+    return available
+
+
+class ClipRequest:
+    def __init__(self, name, start, end):
+        self.name = name
+        self.start = start
+        self.end = end
+
+
+class ClipRecorder:
+    """Keeps the JPEG ring and writes the clips that violations ask for.
+
+    ``add`` and ``request`` run on the frame loop. Timestamps are the frame
+    ring's monotonic capture times.
+    """
+
+    def __init__(self, directory: str, pre: float = 5.0, post: float = 3.0, seconds: float = 12.0,
+                 max_bytes: int = 24 * 1024 * 1024, max_disk_bytes: int = 2 * 1024 ** 3,
+                 codec: str = "mjpeg", max_pending: int = 4):
+        if codec not in CODECS:
+            raise ValueError(f"Unknown clip codec {codec!r}, expected one of {list(CODECS)}")
+        if pre + post > seconds:
+            raise ValueError("The ring must hold at least pre + post seconds")
+        self.directory = directory
+        self.pre = pre
+        self.post = post
+        self.codec = codec
+        self.ring = JpegRing(seconds, max_bytes)
+        self.max_disk_bytes = max_disk_bytes
+        self.pending = []
+        self.lock = threading.Lock()
+        self.queue = Queue(maxsize=max_pending)
+        self.thread = None
+        self.disk = deque()  # (path, bytes) of stored clips, oldest first
+        self.disk_bytes = 0
+        self.requested = 0
+        self.written = 0
+        self.dropped = 0     # the writer was too far behind
+        self.failed = 0
+        self.truncated = 0   # the window started before the oldest frame in the ring
+        self.write_seconds = 0.0
+        self.last_write_ms = 0.0
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        if self.codec == "h264" and not h264_available(self.directory):
+            # Decided before any clip is named, so names match their container.
+            logger.warning("OpenCV has no H.264 encoder, writing MJPEG clips")
+            self.codec = "mjpeg"
+        entries = [os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                   if name.endswith(tuple(EXTENSIONS.values()))]
+        for path in sorted(entries, key=os.path.getmtime):
+            size = os.path.getsize(path)
+            self.disk.append((path, size))
+            self.disk_bytes += size
+        self.thread = threading.Thread(target=self._run, name="clip-writer", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.flush(force=True)
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+
+    # -------- frame loop --------
+    def add(self, jpeg: bytes, timestamp: float):
+        self.ring.append(timestamp, jpeg)
+        if self.pending:
+            self.flush()
+
+    def request(self, event_time: float, label: str = "") -> str:
+        """Name the clip around ``event_time``; the file is written once the window has passed."""
+        label = re.sub(r"[^A-Za-z0-9_-]", "", label)[:32]
+        now = time.time()
+        stamp = time.strftime("%Y%m%dT%H%M%S", time.gmtime(now)) + f"{int(now * 1000) % 1000:03d}"
+        name = f"{stamp}-{label or 'clip'}-{self.requested}{EXTENSIONS[self.codec]}"
+        with self.lock:
+            self.requested += 1
+            self.pending.append(ClipRequest(name, event_time - self.pre, event_time + self.post))
+        return name
+
+    def flush(self, force: bool = False):
+        """Hand the clips whose window has passed (every pending one if ``force``) to the writer."""
+        newest = self.ring.frames[-1][0] if self.ring.frames else None
+        with self.lock:
+            due = [r for r in self.pending if force or (newest is not None and newest >= r.end)]
+            if not due:
+                return
+            self.pending = [r for r in self.pending if r not in due]
+        for request in due:
+            frames = self.ring.between(request.start, request.end)
+            if not frames:
+                self.failed += 1
+                continue
+            if frames[0][0] - request.start > 1.0:
+                self.truncated += 1
+            try:
+                self.queue.put_nowait((request.name, frames))
+            except Full:
+                self.dropped += 1
+                logger.warning(f"Clip writer behind, dropped {request.name}")
+
+    # -------- writer thread --------
+    def _write(self, name, frames):
+        path = os.path.join(self.directory, name)
+        jpegs = [jpeg for _, jpeg in frames]
+        span = frames[-1][0] - frames[0][0]
+        fps = (len(frames) - 1) / span if span > 0 else 30.0
+        if self.codec == "h264":
+            write_h264(path, jpegs, fps)
+        else:
+            write_mjpeg_avi(path, jpegs, fps)
+        return path
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            name, frames = item
+            start = time.perf_counter()
+            try:
+                path = self._write(name, frames)
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Failed to write clip {name}: {e}")
+                continue
+            elapsed = time.perf_counter() - start
+            self.write_seconds += elapsed
+            self.last_write_ms = elapsed * 1000
+            self.written += 1
+            size = os.path.getsize(path)
+            self.disk.append((path, size))
+            self.disk_bytes += size
+            while self.disk_bytes > self.max_disk_bytes and len(self.disk) > 1:
+                old_path, old_size = self.disk.popleft()
+                try:
+                    os.unlink(old_path)
+                except OSError:
+                    pass
+                self.disk_bytes -= old_size
+
+    def path(self, name: str):
+        """The stored clip's path, or None for an unknown or unsafe name."""
+        if os.path.basename(name) != name or not name.endswith(tuple(EXTENSIONS.values())):
+            return None
+        path = os.path.join(self.directory, name)
+        return path if os.path.exists(path) else None
+
+    def stats(self) -> dict:
+        return {
+            "codec": self.codec,
+            "ring_frames": len(self.ring.frames),
+            "ring_bytes": self.ring.bytes,
+            "ring_seconds": round(self.ring.span(), 2),
+            "ring_evicted_by_bytes": self.ring.evicted_by_bytes,
+            "pending": len(self.pending),
+            "queued": self.queue.qsize(),
+            "requested": self.requested,
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "truncated": self.truncated,
+            "avg_write_ms": round(self.write_seconds / self.written * 1000, 1) if self.written else 0.0,
+            "last_write_ms": round(self.last_write_ms, 1),
+            "disk_bytes": self.disk_bytes,
+        }
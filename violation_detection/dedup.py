@@ -0,0 +1,139 @@
+"""Bounded, fuzzy deduplication of violations before they are published.
+
+The same car is usually read several times while it crosses the line,
+and OCR often misreads a character or two ("ABC123" / "A8C123"). So a
+read counts as the same vehicle as an earlier one when all of these hold:
+- it happened in the same red phase (the light's timestamp)
+- the plates are within ``max_distance`` edits, once confusable
+  characters (0/O/D/Q, 1/I/L, 2/Z, 5/S, 8/B, 6/G) are folded together
+
+The first read opens a pending candidate. Later matching reads replace
+its evidence if their confidence is higher. The candidate is released for
+publishing once no read has matched it for ``settle`` seconds, so each
+vehicle is sent once, with its best frame. Published entries are kept,
+without their image, until ``ttl`` passes. After that they expire, and the
+oldest are evicted beyond ``max_entries``, so memory stays bounded on a
+detector that runs for months.
+"""
+import time
+from collections import OrderedDict
+
+CONFUSABLE = str.maketrans({"0": "O", "D": "O", "Q": "O", "1": "I", "L": "I",
+                            "2": "Z", "5": "S", "8": "B", "6": "G"})
+
+
+def normalize_plate(plate: str) -> str:
+    return "".join(ch for ch in plate.upper() if ch.isalnum()).translate(CONFUSABLE)
+
+
+def plate_distance(a: str, b: str, limit: int) -> int:
+    """Levenshtein distance between two normalized plates, capped at ``limit + 1``."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+class Candidate:
+    __slots__ = ("phase", "plate", "normalized", "confidence", "evidence", "light",
+                 "first_seen", "last_seen", "reads", "published")
+
+    def __init__(self, phase, plate, confidence, evidence, light, now):
+        self.phase = phase
+        self.plate = plate
+        self.normalized = normalize_plate(plate)
+        self.confidence = confidence
+        self.evidence = evidence
+        self.light = light
+        self.first_seen = now
+        self.last_seen = now
+        self.reads = 1
+        self.published = False
+
+
+class ViolationDeduplicator:
+    def __init__(self, settle: float = 1.5, ttl: float = 300.0, max_entries: int = 1024,
+                 max_distance: int = 1, clock=time.monotonic):
+        self.settle = settle
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self.clock = clock
+        self.entries = OrderedDict()  # id -> Candidate, least recently matched first
+        self.next_id = 0
+        self.hits = 0       # reads merged into an earlier one
+        self.misses = 0     # reads that opened a new candidate
+        self.upgrades = 0   # merged reads with a better confidence than the kept one
+        self.expired = 0
+        self.evicted = 0
+
+    def offer(self, plate: str, confidence: float, evidence: bytes, light: dict) -> bool:
+        """Record a read; True if it is a new vehicle, False if merged into a known one."""
+        now = self.clock()
+        self._expire(now)
+        phase = light.get("timestamp")
+        normalized = normalize_plate(plate)
+        for entry_id, candidate in self.entries.items():
+            if candidate.phase == phase and plate_distance(
+                    candidate.normalized, normalized, self.max_distance) <= self.max_distance:
+                self.hits += 1
+                candidate.reads += 1
+                candidate.last_seen = now
+                if not candidate.published and confidence > candidate.confidence:
+                    self.upgrades += 1
+                    candidate.plate, candidate.normalized = plate, normalized
+                    candidate.confidence, candidate.evidence, candidate.light = confidence, evidence, light
+                self.entries.move_to_end(entry_id)
+                return False
+
+        self.misses += 1
+        self.entries[self.next_id] = Candidate(phase, plate, confidence, evidence, light, now)
+        self.next_id += 1
+        while len(self.entries) > self.max_entries:
+            # Least recently matched first, sparing the few still unpublished.
+            victim = next((i for i, c in self.entries.items() if c.published), None)
+            if victim is None:
+                self.entries.popitem(last=False)
+            else:
+                del self.entries[victim]
+            self.evicted += 1
+        return True
+
+    def due(self, force: bool = False):
+        """Pending candidates that have settled (all of them if ``force``), marked published."""
+        now = self.clock()
+        ready = []
+        for candidate in self.entries.values():
+            if not candidate.published and (force or now - candidate.last_seen >= self.settle):
+                ready.append((candidate.plate, candidate.confidence, candidate.evidence, candidate.light))
+                candidate.published = True
+                candidate.evidence = None  # only metadata is kept for later matches
+        self._expire(now)
+        return ready
+
+    def _expire(self, now: float):
+        # Entries are ordered by last match, so expired ones are at the front.
+        while self.entries:
+            entry_id, candidate = next(iter(self.entries.items()))
+            if not candidate.published or now - candidate.last_seen < self.ttl:
+                break
+            del self.entries[entry_id]
+            self.expired += 1
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self.entries),
+            "pending": sum(1 for c in self.entries.values() if not c.published),
+            "hits": self.hits,
+            "misses": self.misses,
+            "upgrades": self.upgrades,
+            "expired": self.expired,
+            "evicted": self.evicted,
+        }
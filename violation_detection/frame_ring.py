@@ -0,0 +1,303 @@
+"""Preallocated ring of camera frame buffers with sequence numbers.
+
+The capture thread fills a free slot in place (``begin_write`` then
+``commit``), and every committed frame gets the next sequence number and
+its capture timestamp. Readers block in ``acquire_next(after_seq)`` until
+a frame newer than the last one they saw exists. They receive the slot
+itself, not a copy, and the slot stays pinned until ``release``. The
+writer only reuses slots that are neither pinned nor the latest frame, so
+a reader never sees a buffer change under it.
+
+When every slot is busy, the writer's frame is counted as dropped. Frames
+a reader never saw, because newer ones superseded them, are counted as
+skipped.
+
+``SharedFrameRing`` has the same interface across processes. Its slots
+live in one shared-memory block and its bookkeeping in shared arrays, so
+a capture process writes frames that other processes read in place
+(see cameras.py).
+"""
+import math
+import multiprocessing
+import threading
+import time
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+
+
+class Slot:
+    def __init__(self, data):
+        self.data = data        # the preallocated frame buffer
+        self.seq = 0            # 0 = never written
+        self.timestamp = 0.0    # monotonic capture time
+        self.pins = 0
+
+
+class FrameRing:
+    def __init__(self, allocate, slots: int = 4, clock=time.monotonic):
+        if slots < 2:
+            raise ValueError("need at least 2 slots")
+        self.slots = [Slot(allocate()) for _ in range(slots)]
+        self.clock = clock
+        self.cond = threading.Condition()
+        self.latest = None
+        self.seq = 0
+        self.read_seq = 0  # newest seq any reader has acquired
+        self.dropped = 0   # captures lost because every slot was in use
+        self.skipped = 0   # committed frames no reader asked for in time
+        self.fps = 0.0     # smoothed capture rate
+        self.last_age = 0.0
+
+    # -------- writer --------
+    def begin_write(self):
+        """Return the oldest slot that is safe to overwrite, or None."""
+        with self.cond:
+            free = [s for s in self.slots if s.pins == 0 and s is not self.latest]
+            if not free:
+                self.dropped += 1
+                return None
+            return min(free, key=lambda s: s.seq)
+
+    def wait_consumed(self, timeout: float = None) -> bool:
+        """Block until a reader has taken the latest frame (lossless replay)."""
+        with self.cond:
+            return self.cond.wait_for(lambda: self.read_seq >= self.seq, timeout)
+
+    def commit(self, slot, timestamp: float = None):
+        now = self.clock()
+        with self.cond:
+            if self.latest is not None and now > self.latest.timestamp:
+                rate = 1.0 / (now - self.latest.timestamp)
+                self.fps = rate if self.fps == 0 else 0.9 * self.fps + 0.1 * rate
+            self.seq += 1
+            slot.seq = self.seq
+            slot.timestamp = now if timestamp is None else timestamp
+            self.latest = slot
+            self.cond.notify_all()
+
+    # -------- readers --------
+    def acquire_next(self, after_seq: int = 0, timeout: float = None):
+        """Pin and return the latest frame once its seq is > after_seq.
+
+        Returns None on timeout. The caller must ``release`` the slot.
+        """
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.latest is not None and self.latest.seq > after_seq,
+                                      timeout):
+                return None
+            slot = self.latest
+            slot.pins += 1
+            if after_seq:
+                self.skipped += slot.seq - after_seq - 1
+            self.last_age = self.clock() - slot.timestamp
+            if slot.seq > self.read_seq:
+                self.read_seq = slot.seq
+                self.cond.notify_all()
+            return slot
+
+    def release(self, slot):
+        with self.cond:
+            slot.pins -= 1
+
+    @contextmanager
+    def next_frame(self, after_seq: int = 0, timeout: float = None):
+        slot = self.acquire_next(after_seq, timeout)
+        try:
+            yield slot
+        finally:
+            if slot is not None:
+                self.release(slot)
+
+    def stats(self) -> dict:
+        with self.cond:
+            return {
+                "seq": self.seq,
+                "capture_fps": round(self.fps, 1),
+                "dropped": self.dropped,
+                "skipped": self.skipped,
+                "buffer_age_ms": round(self.last_age * 1000, 2),
+                "pinned": sum(1 for s in self.slots if s.pins),
+            }
+
+
+class SharedFrameRing:
+    """``FrameRing`` across processes, for frames of a fixed size.
+
+    Create it in the parent and pass it to child processes as a
+    ``Process`` argument: the lock and the shared arrays can only be
+    inherited. ``slot.data`` is a numpy array of ``shape``, or a
+    memoryview of ``frame_bytes`` when there is no shape. Readers get a
+    local ``Slot`` with the frame's seq and timestamp; the buffer is
+    shared, so ``release`` it as with ``FrameRing``. Each process calls
+    ``detach`` when done with it; the creator's call frees the memory.
+    """
+
+    # Indexes into the shared counters
+    SEQ, READ_SEQ, LATEST, DROPPED, SKIPPED, CLOSED = range(6)
+
+    def __init__(self, frame_bytes: int = None, shape=None, slots: int = 4, context=None, cond=None,
+                 clock=time.monotonic):
+        if slots < 2:
+            raise ValueError("need at least 2 slots")
+        context = context or multiprocessing.get_context()
+        self.shape = tuple(shape) if shape else None
+        if frame_bytes is None and not self.shape:
+            raise ValueError("need frame_bytes or a shape")
+        self.frame_bytes = frame_bytes if frame_bytes is not None else math.prod(self.shape)
+        self.count = slots
+        self.clock = clock
+        self.cond = cond or context.Condition()  # rings may share one, to wait on several
+        self.seqs = context.RawArray("q", slots)      # 0 = never written
+        self.stamps = context.RawArray("d", slots)    # monotonic capture time
+        self.pins = context.RawArray("i", slots)
+        self.counters = context.RawArray("q", 6)      # LATEST is the slot index + 1, 0 = none
+        self.rates = context.RawArray("d", 2)         # smoothed capture fps, age of the last read
+        self.shm = shared_memory.SharedMemory(create=True, size=slots * self.frame_bytes)
+        self.owner = True
+        self._attach()
+
+    def _attach(self):
+        self.slots = []
+        for index in range(self.count):
+            buffer = self.shm.buf[index * self.frame_bytes:(index + 1) * self.frame_bytes]
+            if self.shape:
+                import numpy as np
+                buffer = np.ndarray(self.shape, dtype=np.uint8, buffer=buffer)
+            slot = Slot(buffer)
+            slot.index = index
+            self.slots.append(slot)
+
+    def __getstate__(self):
+        state = dict(self.__dict__, name=self.shm.name, owner=False)
+        del state["shm"], state["slots"]
+        return state
+
+    def __setstate__(self, state):
+        name = state.pop("name")
+        self.__dict__.update(state)
+        self.shm = shared_memory.SharedMemory(name=name)
+        self._attach()
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    @property
+    def seq(self) -> int:
+        return self.counters[self.SEQ]
+
+    @property
+    def closed(self) -> bool:
+        return bool(self.counters[self.CLOSED])
+
+    def _latest(self):
+        index = self.counters[self.LATEST] - 1
+        return None if index < 0 else index
+
+    def _slot(self, index):
+        slot = self.slots[index]
+        slot.seq = self.seqs[index]
+        slot.timestamp = self.stamps[index]
+        return slot
+
+    # -------- writer --------
+    def begin_write(self):
+        """Return the oldest slot that is safe to overwrite, or None."""
+        with self.cond:
+            latest = self._latest()
+            free = [i for i in range(self.count) if self.pins[i] == 0 and i != latest]
+            if not free:
+                self.counters[self.DROPPED] += 1
+                return None
+            return self._slot(min(free, key=lambda i: self.seqs[i]))
+
+    def wait_consumed(self, timeout: float = None) -> bool:
+        """Block until a reader has taken the latest frame (lossless replay)."""
+        with self.cond:
+            return self.cond.wait_for(lambda: self.counters[self.READ_SEQ] >= self.counters[self.SEQ],
+                                      timeout)
+
+    def commit(self, slot, timestamp: float = None):
+        now = self.clock()
+        with self.cond:
+            latest = self._latest()
+            if latest is not None and now > self.stamps[latest]:
+                rate = 1.0 / (now - self.stamps[latest])
+                fps = self.rates[0]
+                self.rates[0] = rate if fps == 0 else 0.9 * fps + 0.1 * rate
+            self.counters[self.SEQ] += 1
+            self.seqs[slot.index] = slot.seq = self.counters[self.SEQ]
+            self.stamps[slot.index] = slot.timestamp = now if timestamp is None else timestamp
+            self.counters[self.LATEST] = slot.index + 1
+            self.cond.notify_all()
+
+    def close(self):
+        """Mark the source exhausted; readers see it in ``closed``."""
+        with self.cond:
+            self.counters[self.CLOSED] = 1
+            self.cond.notify_all()
+
+    # -------- readers --------
+    def acquire_next(self, after_seq: int = 0, timeout: float = None):
+        """Pin and return the latest frame once its seq is > after_seq.
+
+        Returns None on timeout, or at once when the ring is closed and has
+        nothing newer. The caller must ``release`` the slot.
+        """
+        with self.cond:
+            def ready():
+                latest = self._latest()
+                return (latest is not None and self.seqs[latest] > after_seq) or self.counters[self.CLOSED]
+
+            if not self.cond.wait_for(ready, timeout):
+                return None
+            index = self._latest()
+            if index is None or self.seqs[index] <= after_seq:
+                return None  # closed
+            self.pins[index] += 1
+            slot = self._slot(index)
+            if after_seq:
+                self.counters[self.SKIPPED] += slot.seq - after_seq - 1
+            self.rates[1] = self.clock() - slot.timestamp
+            if slot.seq > self.counters[self.READ_SEQ]:
+                self.counters[self.READ_SEQ] = slot.seq
+                self.cond.notify_all()
+            return slot
+
+    def release(self, slot):
+        with self.cond:
+            self.pins[slot.index] -= 1
+
+    @contextmanager
+    def next_frame(self, after_seq: int = 0, timeout: float = None):
+        slot = self.acquire_next(after_seq, timeout)
+        try:
+            yield slot
+        finally:
+            if slot is not None:
+                self.release(slot)
+
+    def stats(self) -> dict:
+        with self.cond:
+            return {
+                "seq": self.counters[self.SEQ],
+                "capture_fps": round(self.rates[0], 1),
+                "dropped": self.counters[self.DROPPED],
+                "skipped": self.counters[self.SKIPPED],
+                "buffer_age_ms": round(self.rates[1] * 1000, 2),
+                "pinned": sum(1 for pins in self.pins if pins),
+            }
+
+    def detach(self):
+        """Drop this process's mapping; the creator also removes the block."""
+        for slot in self.slots:
+            if isinstance(slot.data, memoryview):
+                slot.data.release()
+        self.slots = []
+        try:
+            self.shm.close()
+        except BufferError:
+            pass  # a numpy view is still referenced; the mapping goes with the process
+        if self.owner:
+            self.shm.unlink()
+
@@ -1,19 +1,25 @@
-from fastapi import FastAPI
-from fastapi.responses import StreamingResponse
-from picamera2 import Picamera2
-import cv2
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import FileResponse, Response, StreamingResponse
 import threading
 import asyncio
-import numpy as np
-import base64
 import os
 import logging
-import httpx
 
 import paho.mqtt.client as mqtt
-import json
-from datetime import datetime, timezone
-import time
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common import metrics  # noqa: E402
+from common.light_state import LightStateClient  # noqa: E402
+from common.outbox import Outbox, OutboxSender  # noqa: E402
+from common.violation_codec import FORMATS_TOPIC  # noqa: E402
+from broadcaster import MjpegBroadcaster, MAX_FPS  # noqa: E402
+from cameras import AlprShare, Camera, PrefilterCounters, Scheduler, load_config as load_cameras  # noqa: E402
+from cameras import CONFIG_FILE as CAMERAS_CONFIG  # noqa: E402
+from clips import ClipRecorder  # noqa: E402
+from stopline import load_config as load_stopline_config  # noqa: E402
+from alpr_client import AlprClient  # noqa: E402
+from pipeline import LoadReporter, ViolationPipeline, ViolationPublisher, encode_jpeg  # noqa: E402
 
 # Logger configuration
 logger = logging.getLogger("video_stream")
@@ -23,164 +29,228 @@ formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(messag
 handler.setFormatter(formatter)
 logger.addHandler(handler)
 
-UTILITY_API_URL = "http://104.168.34.100:5555/v1/image/alpr"
+UTILITY_API_URL = os.environ.get("ALPR_API_URL", "http://104.168.34.100:5555/v1/image/alpr")
+ALPR_CONCURRENCY = 2       # requests in flight to the ALPR API, shared by every camera
+ALPR_QUEUE = 16            # crops waiting for the API; each camera may hold its share
+
+# Cameras: cameras.json ($CAMERAS_CONFIG, see cameras.py) lists them.
+# Without it there is one camera, "0": the Pi camera, or e.g.
+# FRAME_SOURCE="video:recording.mp4" for a dry run.
+FRAME_SOURCE = os.environ.get("FRAME_SOURCE", "camera")
+FRAME_WIDTH, FRAME_HEIGHT = 640, 480   # every camera's frames are scaled to this
+# Processes running the pre-filter and JPEG encodes; at most one per camera.
+DETECTION_WORKERS = int(os.environ.get("DETECTION_WORKERS", os.cpu_count() or 1))
 
 # -------- MQTT Settings --------
 MQTT_BROKER = 'mqtt-dashboard.com'  # MQTT broker address
 INTERSECTION_ID = '0'
-MQTT_COMMAND_TOPIC = f'traffic_violation/{INTERSECTION_ID}/detected'
-
-def publish_violation(plate: str, image_bytes: bytes):
-    report = (traffic_light["timestamp"], plate)
-    if report in reports:
-        return
-    reports.add(report)
-    
-    payload = {
-        "timestamp": datetime.now(timezone.utc).replace(microsecond=0).isoformat() + "Z",
-        "plate": plate,
-        "intersection_id": INTERSECTION_ID,
-        "image": base64.b64encode(image_bytes).decode('utf-8')
-    }
-    try:
-        mqtt_client.publish(MQTT_COMMAND_TOPIC, json.dumps(payload))
-        logger.info(f"Published violation: {payload}"[:150])
-    except Exception as e:
-        logger.error(f"Failed to publish violation: {str(e)}")
+# "auto" sends JSON until the listener advertises the binary format;
+# "json" or "sv1" pins one (see common/violation_codec.py).
+VIOLATION_FORMAT = os.environ.get("VIOLATION_FORMAT", "auto")
+# Violations wait here until the broker has them (see common/outbox.py).
+OUTBOX_FILE = os.environ.get("VIOLATION_OUTBOX",
+                             os.path.join(os.path.dirname(os.path.abspath(__file__)), "outbox.db"))
+# Which movement the default camera watches for the controller's adaptive
+# timing: "main" (moves on Green) or "cross" (moves while the light is Red).
+LOAD_APPROACH = os.environ.get("LOAD_APPROACH", "main")
+LOAD_INTERVAL = 10.0       # seconds between traffic load reports
 
-
-# Asynchronous license plate recognition
-async def get_plate(image_bytes: bytes) -> str:
-    try:
-        async with httpx.AsyncClient(timeout=2.0) as client:
-            response = await client.post(
-                UTILITY_API_URL,
-                files={"upload": ("plate.jpg", image_bytes, "image/jpeg")}
-            )
-        if response.status_code != 200:
-            logger.error(f"API error: {response.status_code} - {response.text}")
-            return ""
-        predictions = response.json().get("predictions", [])
-        if not predictions:
-            logger.info("No plate detected")
-            return ""
-        plate = predictions[0].get("plate", "")
-        return plate
-    except Exception as e:
-        logger.error(f"Plate API error: {str(e)}")
-        return ""
+# Evidence clips around each violation (see clips.py), in a directory per
+# camera under CLIP_DIR, served at /clips/<name>.
+CLIP_DIR = os.environ.get("CLIP_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "clips"))
+CLIP_CODEC = os.environ.get("CLIP_CODEC", "mjpeg")  # or "h264"
+CLIP_TIER = "medium"       # JPEG quality tier kept in the clip ring
+CLIP_PRE, CLIP_POST = 5.0, 3.0   # seconds before / after the crossing frame
+CLIP_RING_SECONDS = 12.0   # pre + post + time to read the plate and settle the dedup
+CLIP_RING_BYTES = 24 * 1024 * 1024
+CLIP_DISK_BYTES = 2 * 1024 ** 3
 
 app = FastAPI()
 
-# Camera initialization
-picam2 = Picamera2()
-config = picam2.create_video_configuration(
-    main={"size": (640, 480)},
-    controls={"FrameRate": 30}
-)
-picam2.configure(config)
-picam2.start()
-
-# Thread-safe FrameBuffer
-class FrameBuffer:
-    def __init__(self):
-        self.frame = None
-        self.lock = threading.Lock()
-    def update(self, frame):
-        with self.lock:
-            self.frame = frame
-    def get_frame(self):
-        with self.lock:
-            frame = self.frame
-        if frame is not None:
-            return frame.copy()
-        return None
-frame_buffer = FrameBuffer()
-
-# Camera frame capture thread
-def capture_frames():
-    while True:
-        frame = picam2.capture_array()
-        frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
-        frame_buffer.update(frame)
-capture_thread = threading.Thread(target=capture_frames, daemon=True)
-capture_thread.start()
-
-# Top-level variable for storing traffic light status
-traffic_light = {}
-
-# Traffic light status monitoring thread
-def monitor_traffic_light():
-    global traffic_light
-    while True:
-        try:
-            with open("/tmp/traffic_light.json", "r") as f:
-                data = json.load(f)
-                traffic_light = data
-        except Exception as e:
-            logger.warning(f"Failed to read traffic light file: {str(e)}")
-        finally:
-            time.sleep(0.01)
-
-# Start traffic light monitoring thread
-traffic_light_thread = threading.Thread(target=monitor_traffic_light, daemon=True)
-traffic_light_thread.start()
-
-# Already reported violations
-reports = set()
-
-# MJPEG stream generator (core improvement)
-async def generate_mjpeg():
-    frame_count = 0
-    recognition_interval = 30  # Recognize every 30 frames (approximately every second)
-
-    recognition_running = False  # Local state
-
-    async def run_recognition(jpeg_bytes):
-        nonlocal recognition_running
-        try:
-            plate = await get_plate(jpeg_bytes)
-            if plate:
-                logger.info(f"Detected plate: {plate}")
-                publish_violation(plate, jpeg_bytes)
-        finally:
-            recognition_running = False
-
-    while True:
-        # Fetch frame in a separate thread to avoid blocking the main event loop
-        frame = await asyncio.to_thread(frame_buffer.get_frame)
-        if frame is None:
-            await asyncio.sleep(0.01)
-            continue
-        _, jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
-        jpeg_bytes = jpeg.tobytes()
-
-        # Run only one recognition async task
-        if frame_count % recognition_interval == 0 and not recognition_running and traffic_light and traffic_light['status'] == "Red":
-                
-            recognition_running = True
-            asyncio.create_task(run_recognition(jpeg_bytes))
-
-        yield (b'--frame\r\n'
-               b'Content-Type: image/jpeg\r\n\r\n' + 
-               jpeg_bytes + b'\r\n')
-        frame_count += 1
-        await asyncio.sleep(0.033)  # Wait slightly to maintain 30fps
 
-@app.get("/video_feed")
-async def video_feed():
-    return StreamingResponse(generate_mjpeg(),
+def camera_configs() -> list:
+    if os.path.exists(CAMERAS_CONFIG):
+        return load_cameras(CAMERAS_CONFIG)
+    return [{"id": "0", "source": FRAME_SOURCE, "intersection_id": INTERSECTION_ID,
+             "approach": LOAD_APPROACH, "stopline": load_stopline_config(), "weight": 1.0}]
+
+
+# Detection workers are spawned processes, which import this module again
+# as __mp_main__. They need none of the service below.
+if __name__ != "__mp_main__":
+    CAMERAS = camera_configs()
+
+    # Traffic light status per intersection, pushed by the controller over a
+    # Unix socket (falls back to reading /tmp/traffic_light.json while the
+    # socket is unavailable).
+    light_states = {}
+
+    # Pooled, keep-alive ALPR client for every camera; started with the app.
+    alpr = AlprClient(UTILITY_API_URL, concurrency=ALPR_CONCURRENCY, max_queue=ALPR_QUEUE)
+    alpr_share = max(1, (ALPR_CONCURRENCY + ALPR_QUEUE) // len(CAMERAS))
+
+    # Violations are written to the durable outbox; the sender (started with
+    # the MQTT client) drains it to the broker.
+    outbox = Outbox(OUTBOX_FILE)
+    outbox_sender = OutboxSender(outbox, client=None)
+
+    # Capture and detection processes; frames are shared through shared memory.
+    scheduler = Scheduler(workers=DETECTION_WORKERS, shape=(FRAME_HEIGHT, FRAME_WIDTH, 3))
+    load_reporters = []
+    for config in CAMERAS:
+        intersection_id = config["intersection_id"]
+        if intersection_id not in light_states:
+            light_states[intersection_id] = LightStateClient(intersection_id).start()
+        light_state = light_states[intersection_id]
+        # Every /video_feed/<id> client reads from the camera's broadcaster;
+        # the detection worker encodes each frame once per tier in use.
+        broadcaster = MjpegBroadcaster(encode_jpeg)
+        # The stop-line pre-filter runs in a worker; these are its counters.
+        prefilter = PrefilterCounters()
+        clip_recorder = ClipRecorder(os.path.join(CLIP_DIR, config["id"]), pre=CLIP_PRE, post=CLIP_POST,
+                                     seconds=CLIP_RING_SECONDS, max_bytes=CLIP_RING_BYTES,
+                                     max_disk_bytes=CLIP_DISK_BYTES, codec=CLIP_CODEC)
+        publisher = ViolationPublisher(intersection_id, client=outbox, fmt=VIOLATION_FORMAT, clips=clip_recorder)
+        pipeline = ViolationPipeline(scheduler.ring(), broadcaster, prefilter, AlprShare(alpr, alpr_share),
+                                     publisher, lambda frame, light_state=light_state: light_state.state,
+                                     clips=clip_recorder, clip_tier=CLIP_TIER)
+        scheduler.add(Camera(config["id"], config["source"], config["stopline"], pipeline, config["weight"]))
+        # Stop-line counts for the controller; its client is set with the MQTT one.
+        load_reporters.append(LoadReporter(intersection_id, prefilter, approach=config["approach"],
+                                           interval=LOAD_INTERVAL))
+
+    # The components keep their own counters; /metrics reads them on scrape,
+    # so the frame loop pays only for the stage histogram.
+    for camera, load_reporter in zip(scheduler.cameras, load_reporters):
+        labels = {"camera": camera.id}
+        pipeline = camera.pipeline
+        metrics.REGISTRY.collect("detector_camera", camera.stats, counters=("frames", "violations", "errors"),
+                                 labels=labels)
+        metrics.REGISTRY.collect("detector_capture", pipeline.ring.stats, counters=("dropped", "skipped"),
+                                 labels=labels)
+        metrics.REGISTRY.collect("detector_stream", pipeline.broadcaster.stats,
+                                 counters=("frames", "encodes", "sent", "dropped"), labels=labels)
+        metrics.REGISTRY.collect("detector_prefilter", pipeline.prefilter.stats,
+                                 counters=("frames", "red_frames", "crossings", "passed"), labels=labels)
+        metrics.REGISTRY.collect("detector_dedup", pipeline.publisher.dedup.stats,
+                                 counters=("hits", "misses", "upgrades", "expired", "evicted"), labels=labels)
+        metrics.REGISTRY.collect("detector_publisher",
+                                 lambda publisher=pipeline.publisher: {"published": publisher.published,
+                                                                       "bytes": publisher.bytes_published},
+                                 counters=("published", "bytes"), labels=labels)
+        metrics.REGISTRY.collect("detector_load", lambda load_reporter=load_reporter: {
+            "reports": load_reporter.reports}, counters=("reports",), labels=labels)
+        metrics.REGISTRY.collect("detector_clips", pipeline.clips.stats,
+                                 counters=("ring_evicted_by_bytes", "requested", "written", "dropped", "failed",
+                                           "truncated"), labels=labels)
+    metrics.REGISTRY.collect("detector_alpr", alpr.stats,
+                             counters=("requests", "bytes_uploaded", "cache_hits", "rejected", "expired", "errors"))
+    metrics.REGISTRY.collect("detector_outbox", outbox_sender.stats,
+                             counters=("enqueued", "evicted", "sent", "failures"))
+    metrics.gauge("detector_light_connected", "Light state sockets that are connected").set_function(
+        lambda: sum(light_state.connected for light_state in light_states.values()))
+    metrics.gauge("detector_workers_alive", "Detection worker processes that are running").set_function(
+        lambda: sum(process.is_alive() for process in scheduler.processes))
+
+@app.on_event("startup")
+async def start_pipeline():
+    # Each camera is opened by its capture process, started here rather
+    # than at import.
+    for camera in scheduler.cameras:
+        camera.pipeline.clips.start()
+    scheduler.start()
+    for load_reporter in load_reporters:
+        threading.Thread(target=load_reporter.run, daemon=True).start()
+    await alpr.start()
+    asyncio.create_task(scheduler.run())
+
+@app.on_event("shutdown")
+async def stop_alpr():
+    await alpr.stop()
+    scheduler.stop()
+    for camera in scheduler.cameras:
+        camera.pipeline.clips.stop()
+
+def camera_or_404(camera_id: str):
+    camera = scheduler.camera(camera_id)
+    if camera is None:
+        raise HTTPException(status_code=404, detail=f"No camera {camera_id!r}")
+    return camera
+
+def stream(camera, quality: str, fps: float):
+    broadcaster = camera.pipeline.broadcaster
+    try:
+        subscriber = broadcaster.subscribe(quality, fps)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return StreamingResponse(broadcaster.stream(subscriber),
                              media_type='multipart/x-mixed-replace; boundary=frame')
 
+@app.get("/video_feed")
+async def video_feed(quality: str = "high", fps: float = MAX_FPS):
+    return stream(scheduler.cameras[0], quality, fps)
+
+@app.get("/video_feed/{camera_id}")
+async def camera_feed(camera_id: str, quality: str = "high", fps: float = MAX_FPS):
+    return stream(camera_or_404(camera_id), quality, fps)
+
+def camera_stats(camera, load_reporter):
+    pipeline = camera.pipeline
+    publisher = pipeline.publisher
+    return {"stream": pipeline.broadcaster.stats(), "capture": pipeline.ring.stats(),
+            "prefilter": pipeline.prefilter.stats(), "dedup": publisher.dedup.stats(),
+            "publisher": {"format": publisher.format, "published": publisher.published,
+                          "bytes": publisher.bytes_published},
+            "load": {"approach": load_reporter.approach, "reports": load_reporter.reports,
+                     "last": load_reporter.last},
+            "clips": pipeline.clips.stats(),
+            "stages": pipeline.timer.summary()}
+
+@app.get("/stream_stats")
+async def stream_stats():
+    return {"scheduler": scheduler.stats(), "alpr": alpr.stats(), "outbox": outbox_sender.stats(),
+            "cameras": {camera.id: camera_stats(camera, load_reporter)
+                        for camera, load_reporter in zip(scheduler.cameras, load_reporters)}}
+
+@app.get("/clips/{name}")
+async def clip(name: str):
+    path = next(filter(None, (camera.pipeline.clips.path(name) for camera in scheduler.cameras)), None)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Clip not found (or not written yet)")
+    media_type = "video/mp4" if name.endswith(".mp4") else "video/x-msvideo"
+    return FileResponse(path, media_type=media_type)
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    return Response(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
 @app.get("/")
 async def root():
-    return {"message": "Connect to /video_feed for streaming."}
+    return {"message": "Connect to /video_feed/<camera_id> for streaming (?quality=high|medium|low&fps=1-30).",
+            "cameras": [camera.id for camera in scheduler.cameras]}
+
+def on_connect(client, userdata, flags, rc):
+    # The listener's accepted formats are a retained message, so this
+    # arrives right after (re)subscribing.
+    client.subscribe(FORMATS_TOPIC)
+
+def on_message(client, userdata, msg):
+    if msg.topic == FORMATS_TOPIC:
+        for camera in scheduler.cameras:
+            camera.pipeline.publisher.negotiate(msg.payload)
 
 if __name__ == "__main__":
     client = mqtt.Client()
-    client.connect(MQTT_BROKER)
-    mqtt_client = client
+    client.on_connect = on_connect
+    client.on_message = on_message
+    # Connect in the background: detection runs, and violations queue up,
+    # while the uplink is down.
+    client.connect_async(MQTT_BROKER)
     client.loop_start()
+    outbox_sender.client = client
+    for load_reporter in load_reporters:
+        load_reporter.client = client
+    outbox_sender.start()
 
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,112 @@
+"""Local stand-ins for the ALPR API, for tests and benchmarks.
+
+``MockAlprServer`` answers ``POST /v1/image/alpr`` like the real service,
+after a fixed ``--latency``. It speaks HTTP/1.1 keep-alive and counts
+connections and bytes received, which shows whether clients reuse
+connections. ``MockAlprClient`` is the in-process equivalent: it can be
+passed to ``AlprClient(client=...)`` to skip the network entirely.
+
+    python mock_alpr.py --port 5555 --latency 0.15 --plate ABC123
+"""
+import argparse
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class MockAlprResponse:
+    def __init__(self, payload):
+        self.status_code = 200
+        self.payload = payload
+        self.text = json.dumps(payload)
+
+    def json(self):
+        return self.payload
+
+
+class MockAlprClient:
+    """Async drop-in for the httpx client: sleeps ``latency``, returns a plate.
+
+    ``plate`` may contain ``{n}``, the request number, to tell cars apart.
+    """
+
+    def __init__(self, latency=0.15, plate="ABC123"):
+        self.latency = latency
+        self.plate = plate
+        self.requests = 0
+        self.bytes_received = 0
+
+    async def post(self, url, files):
+        self.requests += 1
+        self.bytes_received += len(files["upload"][1])
+        await asyncio.sleep(self.latency)
+        plate = self.plate.format(n=self.requests)
+        predictions = [{"plate": plate, "confidence": 0.9}] if plate else []
+        return MockAlprResponse({"predictions": predictions})
+
+    async def aclose(self):
+        pass
+
+
+class MockAlprServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, address, latency=0.15, plate="ABC123"):
+        super().__init__(address, MockAlprHandler)
+        self.latency = latency
+        self.plate = plate
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.requests = 0
+        self.bytes_received = 0
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1/image/alpr"
+
+
+class MockAlprHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with self.server.lock:
+            self.server.requests += 1
+            self.server.bytes_received += len(body)
+        time.sleep(self.server.latency)
+        predictions = [{"plate": self.server.plate, "confidence": 0.9}] if self.server.plate else []
+        payload = json.dumps({"predictions": predictions}).encode()
+        self.send_response(200 if self.path == "/v1/image/alpr" else 404)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5555)
+    parser.add_argument("--latency", type=float, default=0.15, help="seconds per request")
+    parser.add_argument("--plate", default="ABC123", help="empty for 'no plate'")
+    args = parser.parse_args()
+
+    server = MockAlprServer((args.host, args.port), args.latency, args.plate)
+    print(f"Mock ALPR on {server.url}")
+    server.serve_forever()
@@ -0,0 +1,355 @@
+"""The violation pipeline: capture -> pre-filter -> encode -> ALPR -> publish.
+
+``ViolationPipeline`` holds no globals and never touches the camera,
+MQTT or the light-state socket itself. main.py wires one per camera to
+the live ones. Its frames are pre-filtered and encoded in worker
+processes, and the cameras.py scheduler hands the results to
+``dispatch``. replay.py runs it in-process on recorded footage, a light
+timeline and a mock ALPR backend. Every stage is timed into a ``StageTimer``, which also
+feeds the ``detector_stage_seconds`` histogram on /metrics.
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from alpr_client import percentile, phash
+from dedup import ViolationDeduplicator
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common import metrics, traffic_load, violation_codec  # noqa: E402
+
+logger = logging.getLogger("video_stream")
+
+ALPR_PLATE_REGION = 0.6    # lower fraction of the vehicle crop that is uploaded
+ALPR_MAX_WIDTH = 480       # crops wider than this are downscaled before upload
+ALPR_JPEG_QUALITY = 75
+
+HISTOGRAM_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000)
+
+STAGE_SECONDS = metrics.histogram("detector_stage_seconds", "Time spent per pipeline stage", ("stage",))
+PUBLISH_LATENCY = metrics.histogram(
+    "detector_violation_latency_seconds",
+    "From capture of the crossing frame to the violation being queued for MQTT")
+
+
+def iso_timestamp(epoch: float) -> str:
+    return datetime.fromtimestamp(epoch, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def encode_jpeg(frame, quality: int) -> bytes:
+    import cv2
+    _, jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return jpeg.tobytes()
+
+
+def plate_region(vehicle):
+    """The lower part of a vehicle crop, where the plate is, capped in width."""
+    height, width = vehicle.shape[:2]
+    region = vehicle[int(height * (1 - ALPR_PLATE_REGION)):]
+    if width > ALPR_MAX_WIDTH:
+        import cv2
+        scale = ALPR_MAX_WIDTH / width
+        region = cv2.resize(region, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    return region
+
+
+class StageTimer:
+    """Latency samples per pipeline stage (the most recent ``window`` of each).
+
+    Every sample is also observed into ``histogram`` for /metrics.
+    """
+
+    def __init__(self, window: int = 100000, histogram=STAGE_SECONDS):
+        self.samples = defaultdict(lambda: deque(maxlen=window))
+        self.counts = defaultdict(int)
+        self.histogram = histogram
+        self.series = {}  # stage -> histogram child, looked up once
+
+    def record(self, stage: str, seconds: float):
+        self.samples[stage].append(seconds)
+        self.counts[stage] += 1
+        series = self.series.get(stage)
+        if series is None:
+            series = self.series[stage] = self.histogram.labels(stage)
+        series.observe(seconds)
+
+    @contextmanager
+    def time(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def summary(self) -> dict:
+        result = {}
+        for stage, samples in self.samples.items():
+            values = list(samples)
+            histogram = {}
+            for bound in HISTOGRAM_BUCKETS_MS:
+                histogram[f"<={bound}ms"] = sum(1 for v in values if v * 1000 <= bound)
+            histogram["inf"] = len(values)
+            result[stage] = {
+                "count": self.counts[stage],
+                "p50_ms": round(percentile(values, 50) * 1000, 3),
+                "p90_ms": round(percentile(values, 90) * 1000, 3),
+                "p99_ms": round(percentile(values, 99) * 1000, 3),
+                "max_ms": round(max(values) * 1000, 3) if values else 0.0,
+                "histogram": histogram,  # cumulative counts
+            }
+        return result
+
+
+class ViolationPublisher:
+    """Publishes each vehicle's violation once over MQTT, with its best read.
+
+    Reads are offered to a ``ViolationDeduplicator`` and only sent by
+    ``flush`` once they have settled (see dedup.py). Messages are JSON
+    until ``negotiate`` sees that the listener accepts the binary format,
+    unless ``fmt`` pins one (see common/violation_codec.py). Each message
+    carries the red phase's ``trace_id`` and, as ``detected_at``, when the
+    crossing frame was captured (``captured_at`` in the light dict). With a
+    ``clips`` recorder it also names the evidence clip around that frame
+    (``frame_time``, see clips.py).
+    """
+
+    def __init__(self, intersection_id: str, client=None, dedup: ViolationDeduplicator = None,
+                 fmt: str = "auto", clips=None):
+        self.intersection_id = intersection_id
+        self.topic = f'traffic_violation/{intersection_id}/detected'
+        self.client = client
+        self.dedup = dedup if dedup is not None else ViolationDeduplicator()
+        self.clips = clips
+        self.pinned = fmt != "auto"
+        self.format = fmt if self.pinned else violation_codec.FORMAT_JSON
+        if self.format not in violation_codec.SUPPORTED_FORMATS:
+            raise ValueError(f"Unknown violation format: {fmt}")
+        self.published = 0
+        self.bytes_published = 0
+
+    def negotiate(self, advertised: bytes):
+        """Handle a ``FORMATS_TOPIC`` message from the listener."""
+        if not self.pinned:
+            fmt = violation_codec.choose_format(advertised)
+            if fmt != self.format:
+                logger.info(f"Violation format: {fmt}")
+            self.format = fmt
+
+    def offer(self, plate: str, confidence: float, image_bytes: bytes, light: dict) -> bool:
+        return self.dedup.offer(plate, confidence, image_bytes, light)
+
+    def flush(self, force: bool = False) -> int:
+        """Publish every settled violation; returns how many were sent."""
+        sent = 0
+        for plate, confidence, image_bytes, light in self.dedup.due(force):
+            sent += self.publish(plate, image_bytes, confidence, light)
+        return sent
+
+    def publish(self, plate: str, image_bytes: bytes, confidence: float = None, light: dict = None) -> bool:
+        light = light or {}
+        captured_at = light.get("captured_at")
+        clip = None
+        if self.clips is not None and light.get("frame_time") is not None:
+            clip = self.clips.request(light["frame_time"], plate)
+        violation = {
+            "timestamp": datetime.now(timezone.utc).replace(microsecond=0).isoformat() + "Z",
+            "plate": plate,
+            "intersection_id": self.intersection_id,
+            "confidence": confidence,
+            "image_bytes": image_bytes,
+            "trace_id": light.get("trace_id"),
+            "detected_at": None if captured_at is None else iso_timestamp(captured_at),
+            "clip": clip,
+        }
+        try:
+            payload = violation_codec.encode(violation, self.format)
+            self.client.publish(self.topic, payload)
+            self.published += 1
+            self.bytes_published += len(payload)
+            if captured_at is not None:
+                PUBLISH_LATENCY.observe(time.time() - captured_at)
+            logger.info(f"Published violation ({self.format}, {len(payload)} bytes): {plate} "
+                        f"trace={violation['trace_id']}")
+        except Exception as e:
+            logger.error(f"Failed to publish violation: {str(e)}")
+            return False
+        return True
+
+
+class LoadReporter:
+    """Reports the approach's traffic load to the controller's adaptive timing.
+
+    Every ``interval`` seconds it publishes the vehicles that crossed the
+    stop line since the last report, on any phase, and the vehicles
+    waiting before it (see common/traffic_load.py). Reports go straight
+    to the MQTT client at QoS 0, not through the outbox: a report that
+    arrives late would only mislead the timing.
+    """
+
+    def __init__(self, intersection_id: str, prefilter, client=None, approach: str = "main",
+                 interval: float = 10.0, clock=time.monotonic):
+        if approach not in traffic_load.APPROACHES:
+            raise ValueError(f"Unknown approach: {approach}")
+        self.intersection_id = intersection_id
+        self.topic = traffic_load.topic(intersection_id)
+        self.prefilter = prefilter
+        self.client = client
+        self.approach = approach
+        self.interval = interval
+        self.clock = clock
+        self.passed = prefilter.passed
+        self.since = clock()
+        self.last = None
+        self.reports = 0
+
+    def report(self):
+        """Publish one report covering the time since the previous one."""
+        now = self.clock()
+        passed = self.prefilter.passed
+        count, interval = passed - self.passed, now - self.since
+        self.passed, self.since = passed, now
+        if interval <= 0:
+            return None
+        payload = traffic_load.encode(self.intersection_id, self.approach, count, interval,
+                                      self.prefilter.tracker.waiting())
+        self.last = traffic_load.decode(payload)
+        if self.client is None or not self.client.is_connected():
+            return payload
+        try:
+            self.client.publish(self.topic, payload, qos=0)
+            self.reports += 1
+        except Exception as e:
+            logger.error(f"Failed to publish load report: {str(e)}")
+        return payload
+
+    def run(self, stop=None):
+        stop = stop or threading.Event()
+        while not stop.wait(self.interval):
+            self.report()
+
+
+class ViolationPipeline:
+    def __init__(self, ring, broadcaster, prefilter, alpr, publisher, light_for, timer=None,
+                 clips=None, clip_tier: str = "medium"):
+        self.ring = ring
+        self.broadcaster = broadcaster
+        self.prefilter = prefilter
+        self.alpr = alpr
+        self.publisher = publisher
+        self.light_for = light_for  # light_for(slot) -> light state dict for that frame
+        self.timer = timer or StageTimer()
+        self.clips = clips          # clips.ClipRecorder: every frame's JPEG goes to its ring
+        self.clip_tier = clip_tier
+        self.capture_done = False
+        self.frames = 0
+        self.violations = 0
+        self.tasks = set()
+
+    # -------- capture thread --------
+    def capture_loop(self, source, lossless: bool = False, stop=None):
+        """Fill the ring from ``source`` until it is exhausted or ``stop`` is set.
+
+        ``lossless`` waits for the reader to take each frame before writing
+        the next one, so replays process every frame; live capture never
+        waits and lets the ring drop frames instead.
+        """
+        try:
+            while stop is None or not stop.is_set():
+                if lossless:
+                    self.ring.wait_consumed()
+                slot = self.ring.begin_write()
+                with self.timer.time("capture"):
+                    ok = source.read_into(None if slot is None else slot.data)
+                if not ok:
+                    break
+                if slot is not None:
+                    self.ring.commit(slot)
+        finally:
+            self.capture_done = True
+
+    # -------- event loop --------
+    def find_crossings(self, frame, is_red: bool):
+        """Pre-filter one frame; return (jpeg, phash) of each crossing vehicle's plate region."""
+        with self.timer.time("prefilter"):
+            boxes = self.prefilter.process(frame, is_red)
+        crops = []
+        for box in boxes:
+            with self.timer.time("crop"):
+                region = plate_region(self.prefilter.crop(frame, box))
+                crops.append((encode_jpeg(region, ALPR_JPEG_QUALITY), phash(region)))
+        return crops
+
+    async def recognize(self, crop_bytes: bytes, crop_hash: int, evidence_bytes: bytes, light: dict):
+        with self.timer.time("recognition"):
+            plate, confidence = await self.alpr.read(crop_bytes, crop_hash)
+        if plate:
+            logger.info(f"Detected plate: {plate}")
+            with self.timer.time("dedup"):
+                self.publisher.offer(plate, confidence, evidence_bytes, light)
+
+    def dispatch(self, timestamp: float, light: dict, crops: list, jpegs: dict):
+        """Send a processed frame's crops to ALPR and its JPEG to the clip ring.
+
+        ``jpegs`` must hold "high" when there are crops, and the clip tier.
+        """
+        if self.clips is not None:
+            self.clips.add(jpegs[self.clip_tier], timestamp)
+        if not crops:
+            return
+        # Wall-clock capture time, carried to the DB as detected_at, and the
+        # ring time the evidence clip is centred on.
+        light = dict(light, captured_at=time.time() - (self.ring.clock() - timestamp), frame_time=timestamp)
+        for crop_bytes, crop_hash in crops:
+            task = asyncio.create_task(self.recognize(crop_bytes, crop_hash, jpegs["high"], light))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def run(self):
+        """Process frames until capture is done and every frame is handled."""
+        seen_seq = 0
+        while True:
+            # Wait for the next captured frame in a separate thread to avoid
+            # blocking the event loop; paced by capture, never a duplicate.
+            frame = await asyncio.to_thread(self.ring.acquire_next, seen_seq, 0.5)
+            if frame is None:
+                if self.capture_done and self.ring.seq == seen_seq:
+                    break
+                continue
+            seen_seq = frame.seq
+            try:
+                # Every frame goes through the pre-filter (it keeps a background
+                # model and tracks); it returns crops only while the light is red.
+                light = self.light_for(frame)
+                is_red = light.get('status') == "Red"
+                crops = await asyncio.to_thread(self.find_crossings, frame.data, is_red)
+
+                # The slot stays pinned while encoders read it in place.
+                extra_tiers = ("high",) if crops else ()
+                if self.clips is not None:
+                    extra_tiers += (self.clip_tier,)
+                with self.timer.time("encode"):
+                    jpegs = await self.broadcaster.publish(frame.data, extra_tiers=extra_tiers)
+                self.dispatch(frame.timestamp, light, crops, jpegs)
+                self.timer.record("frame", self.ring.clock() - frame.timestamp)
+            finally:
+                self.ring.release(frame)
+            self.frames += 1
+            self.flush()
+        await asyncio.gather(*self.tasks)
+        self.flush(force=True)
+        if self.clips is not None:
+            self.clips.flush(force=True)
+
+    def flush(self, force: bool = False):
+        """Publish the violations that have settled (all pending ones if ``force``)."""
+        start = time.perf_counter()
+        sent = self.publisher.flush(force)
+        if sent:
+            self.timer.record("publish", time.perf_counter() - start)
+            self.violations += sent
@@ -0,0 +1,151 @@
+"""Replay footage through the violation pipeline as fast as it will go.
+
+This runs the same capture -> pre-filter -> encode -> ALPR -> publish
+path as main.py. The inputs differ:
+- frames come from a source (see sources.py)
+- the light follows a timeline file instead of the controller
+- plates come from a mock ALPR backend, or a real URL
+- violations are collected instead of being sent over MQTT
+
+Frames are replayed losslessly, without real-time pacing. The result is
+printed (or written with --output) as JSON:
+- frames/sec
+- per-stage latency percentiles and cumulative histograms
+- the memory high-water mark
+- violations detected
+
+    python replay.py synthetic:1800 --timeline timeline.json
+    python replay.py video:recording.mp4 --timeline labels.json --alpr-latency 0.2 \\
+        --output replay.json
+
+The timeline uses the bench_prefilter.py labels format: {"red": [[start_s,
+end_s], ...]}, with an optional "violations" list reported as the expected
+count. Without a timeline the light is red throughout.
+"""
+import argparse
+import asyncio
+import json
+import platform
+import resource
+import threading
+import time
+
+import numpy as np
+
+from alpr_client import AlprClient
+from broadcaster import MjpegBroadcaster
+from frame_ring import FrameRing
+from mock_alpr import MockAlprClient
+from pipeline import ViolationPipeline, ViolationPublisher, encode_jpeg
+from sources import make_source
+from stopline import StopLineFilter, load_config
+
+
+class Timeline:
+    """Light state at a point of the footage, from red intervals in seconds."""
+
+    def __init__(self, red, fps):
+        self.red = [tuple(interval) for interval in red]
+        self.fps = fps
+
+    def light_for(self, frame):
+        t = (frame.seq - 1) / self.fps
+        for start, end in self.red:
+            if start <= t < end:
+                return {"status": "Red", "timestamp": f"replay+{start}"}
+        return {"status": "Green", "timestamp": None}
+
+
+class RecordingMqttClient:
+    """Collects what the publisher would have sent to the broker."""
+
+    def __init__(self):
+        self.messages = []
+
+    def publish(self, topic, payload):
+        self.messages.append((topic, len(payload)))
+
+
+async def drain(stream):
+    async for _ in stream:
+        pass
+
+
+async def replay(source, config, timeline, alpr, viewers):
+    width, height = source.size
+    ring = FrameRing(lambda: np.empty((height, width, 3), dtype=np.uint8))
+    broadcaster = MjpegBroadcaster(encode_jpeg, max_queue=8)
+    mqtt = RecordingMqttClient()
+    pipeline = ViolationPipeline(ring, broadcaster, StopLineFilter.from_config(config), alpr,
+                                 ViolationPublisher("replay", mqtt), timeline.light_for)
+
+    await alpr.start()
+    # Stand-in viewers so the stream encoder does its normal work.
+    viewer_tasks = [asyncio.create_task(drain(broadcaster.stream(broadcaster.subscribe())))
+                    for _ in range(viewers)]
+    capture = threading.Thread(target=pipeline.capture_loop, args=(source, True), daemon=True)
+    start = time.perf_counter()
+    capture.start()
+    await pipeline.run()
+    elapsed = time.perf_counter() - start
+    stream_stats = broadcaster.stats()
+    for task in viewer_tasks:
+        task.cancel()
+    await asyncio.gather(*viewer_tasks, return_exceptions=True)
+    await alpr.stop()
+    return pipeline, ring, stream_stats, mqtt, elapsed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("source", help="video:<path>, images:<dir>[@fps] or synthetic[:frames]")
+    parser.add_argument("--timeline", help="JSON with red intervals (seconds)")
+    parser.add_argument("--config", help="stop-line config (default: stopline.json)")
+    parser.add_argument("--alpr-url", help="real or mock_alpr.py server; default in-process mock")
+    parser.add_argument("--alpr-latency", type=float, default=0.15, help="in-process mock latency")
+    parser.add_argument("--alpr-concurrency", type=int, default=2)
+    parser.add_argument("--viewers", type=int, default=1, help="simulated /video_feed clients")
+    parser.add_argument("--output", help="write the JSON report here as well")
+    args = parser.parse_args()
+
+    source = make_source(args.source)
+    labels = {}
+    if args.timeline:
+        with open(args.timeline) as f:
+            labels = json.load(f)
+    timeline = Timeline(labels.get("red", [[0, float("inf")]]), source.fps)
+    config = load_config(args.config) if args.config else load_config()
+    if args.alpr_url:
+        alpr = AlprClient(args.alpr_url, concurrency=args.alpr_concurrency, max_queue=1000, deadline=60)
+    else:
+        alpr = AlprClient(concurrency=args.alpr_concurrency, max_queue=1000, deadline=60,
+                          # The number twice: consecutive plates differ by two characters,
+                          # so the deduplicator does not merge them as misreads.
+                          client=MockAlprClient(args.alpr_latency, plate="MK{n:04d}{n:04d}"))
+
+    pipeline, ring, stream_stats, mqtt, elapsed = asyncio.run(
+        replay(source, config, timeline, alpr, args.viewers))
+
+    report = {
+        "source": args.source,
+        "python": platform.python_version(),
+        "frames": pipeline.frames,
+        "seconds": round(elapsed, 3),
+        "fps": round(pipeline.frames / elapsed, 1) if elapsed else None,
+        "footage_seconds": round(pipeline.frames / source.fps, 1),
+        "violations_detected": pipeline.violations,
+        "violations_expected": len(labels["violations"]) if "violations" in labels else None,
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "capture": ring.stats(),
+        "prefilter": pipeline.prefilter.stats(),
+        "stream": stream_stats,
+        "mqtt_messages": len(mqtt.messages),
+        "alpr": alpr.stats(),
+        "dedup": pipeline.publisher.dedup.stats(),
+        "stages": pipeline.timer.summary(),
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
@@ -0,0 +1,186 @@
+"""Frame sources for the violation pipeline.
+
+Every source fills a caller-provided BGR buffer in place:
+``read_into(buffer)`` returns False once the source is exhausted.
+Passing None consumes a frame without copying it, which the capture loop
+does when every ring slot is busy. ``size`` is (width, height) and
+``fps`` is the nominal rate, used to place frames on a replay timeline.
+
+``make_source`` parses a command-line spec:
+
+    camera                 Picamera2 (the live default)
+    v4l2:<device>          a USB camera, e.g. v4l2:/dev/video0 (or v4l2:0)
+    rtsp://..., http://... a network camera's stream, reopened when it drops
+    video:<path>           a recorded file, via OpenCV
+    images:<dir>[@fps]     sorted image files
+    synthetic[:frames]     generated road scene with a car crossing the
+                           stop line every few seconds
+"""
+import os
+import time
+
+import numpy as np
+
+
+class PicameraSource:
+    def __init__(self, size=(640, 480), fps: int = 30):
+        from picamera2 import Picamera2
+        self.size = size
+        self.fps = fps
+        self.picam2 = Picamera2()
+        config = self.picam2.create_video_configuration(
+            # Picamera2's "RGB888" is laid out B, G, R in memory, i.e. what
+            # OpenCV expects, so frames need no color conversion.
+            main={"size": size, "format": "RGB888"},
+            controls={"FrameRate": fps}
+        )
+        self.picam2.configure(config)
+        self.picam2.start()
+
+    def read_into(self, buffer) -> bool:
+        from picamera2 import MappedArray
+        with self.picam2.captured_request() as request:
+            if buffer is not None:
+                # One copy straight from the camera's buffer into the slot.
+                with MappedArray(request, "main") as m:
+                    np.copyto(buffer, m.array)
+        return True
+
+
+class VideoFileSource:
+    def __init__(self, path, api=None):
+        import cv2
+        self.cv2 = cv2
+        self.capture = cv2.VideoCapture(path) if api is None else cv2.VideoCapture(path, api)
+        if not self.capture.isOpened():
+            raise ValueError(f"Cannot open video {path}")
+        self.size = (int(self.capture.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                     int(self.capture.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        self.fps = self.capture.get(cv2.CAP_PROP_FPS) or 30.0
+
+    def read_into(self, buffer) -> bool:
+        if buffer is None:
+            return self.capture.grab()
+        ok, frame = self.capture.read(buffer)  # decodes into buffer when the shape matches
+        if ok and frame is not buffer:
+            if frame.shape != buffer.shape:
+                # A shared frame ring has one size for every camera.
+                self.cv2.resize(frame, (buffer.shape[1], buffer.shape[0]), dst=buffer,
+                                interpolation=self.cv2.INTER_AREA)
+            else:
+                np.copyto(buffer, frame)
+        return ok
+
+
+class V4l2Source(VideoFileSource):
+    def __init__(self, device: str, size=(640, 480), fps: int = 30):
+        import cv2
+        super().__init__(int(device) if device.isdigit() else device, cv2.CAP_V4L2)
+        self.capture.set(cv2.CAP_PROP_FRAME_WIDTH, size[0])
+        self.capture.set(cv2.CAP_PROP_FRAME_HEIGHT, size[1])
+        self.capture.set(cv2.CAP_PROP_FPS, fps)
+        self.size = (int(self.capture.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                     int(self.capture.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        self.fps = self.capture.get(cv2.CAP_PROP_FPS) or fps
+
+
+class StreamSource(VideoFileSource):
+    """A network camera. A live stream never ends: it is reopened after a drop."""
+
+    def __init__(self, url: str, retry: float = 2.0):
+        import cv2
+        self.url = url
+        self.retry = retry
+        try:
+            super().__init__(url)
+        except ValueError:
+            # Offline at startup: keep trying from read_into.
+            self.cv2 = cv2
+            self.capture = cv2.VideoCapture()
+            self.size, self.fps = None, 30.0
+
+    def read_into(self, buffer) -> bool:
+        while not (self.capture.isOpened() and super().read_into(buffer)):
+            self.capture.release()
+            time.sleep(self.retry)
+            self.capture = self.cv2.VideoCapture(self.url)
+        return True
+
+
+class ImageDirSource:
+    EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+    def __init__(self, path: str, fps: float = 30.0):
+        import cv2
+        self.cv2 = cv2
+        self.files = sorted(os.path.join(path, name) for name in os.listdir(path)
+                            if name.lower().endswith(self.EXTENSIONS))
+        if not self.files:
+            raise ValueError(f"No images in {path}")
+        first = cv2.imread(self.files[0])
+        self.size = (first.shape[1], first.shape[0])
+        self.fps = fps
+        self.index = 0
+
+    def read_into(self, buffer) -> bool:
+        if self.index >= len(self.files):
+            return False
+        path = self.files[self.index]
+        self.index += 1
+        if buffer is not None:
+            image = self.cv2.imread(path)
+            if image.shape != buffer.shape:
+                image = self.cv2.resize(image, (buffer.shape[1], buffer.shape[0]))
+            np.copyto(buffer, image)
+        return True
+
+
+class SyntheticSource:
+    """A static road with a car driving down across the stop line."""
+
+    def __init__(self, frames: int = 900, size=(640, 480), fps: float = 30.0,
+                 car_every: float = 4.0, car_size=(120, 90), speed: float = 6.0):
+        self.frames = frames
+        self.size = size
+        self.fps = fps
+        self.car_every = int(car_every * fps)
+        self.car_size = car_size
+        self.speed = speed
+        width, height = size
+        gradient = np.linspace(60, 120, height, dtype=np.uint8)
+        self.background = np.repeat(gradient[:, None, None], width, axis=1).repeat(3, axis=2)
+        self.index = 0
+
+    def read_into(self, buffer) -> bool:
+        if self.index >= self.frames:
+            return False
+        index = self.index
+        self.index += 1
+        if buffer is None:
+            return True
+        np.copyto(buffer, self.background)
+        width, height = self.size
+        car_w, car_h = self.car_size
+        top = int((index % self.car_every) * self.speed) - car_h
+        if top < height:
+            left = (width - car_w) // 2
+            buffer[max(0, top):max(0, top + car_h), left:left + car_w] = (40, 40, 200)
+        return True
+
+
+def make_source(spec: str):
+    kind, _, arg = spec.partition(":")
+    if kind == "camera":
+        return PicameraSource()
+    if kind == "v4l2":
+        return V4l2Source(arg)
+    if kind in ("rtsp", "rtsps", "http", "https"):
+        return StreamSource(spec)
+    if kind == "video":
+        return VideoFileSource(arg)
+    if kind == "images":
+        path, _, fps = arg.partition("@")
+        return ImageDirSource(path, float(fps or 30))
+    if kind == "synthetic":
+        return SyntheticSource(int(arg or 900))
+    raise ValueError(f"Unknown frame source {spec!r}")
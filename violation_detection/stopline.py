@@ -0,0 +1,233 @@
+"""On-device stop-line pre-filter that decides which frames go to ALPR.
+
+Every frame passes through a detector restricted to a region of interest
+around the stop line.
+
+- ``MotionDetector``: MOG2 background subtraction. Cheap and always on.
+- ``DnnVehicleDetector``: an optional OpenCV-DNN model (ONNX, Caffe,
+  Darknet, ...), run only on frames where motion was seen.
+
+Detected boxes are tracked across frames by ``CrossingTracker``. A
+vehicle is reported once, on the frame where its bottom-center point
+crosses the stop line. ``StopLineFilter`` returns those crossings while
+the light is red, and the caller crops them for plate recognition. It
+also counts crossings on every phase, and the tracks still waiting
+before the line, as the approach's traffic load for adaptive timing.
+
+Configuration lives in stopline.json (or $STOPLINE_CONFIG):
+
+    {"roi": [x0, y0, x1, y1],             # pixels, full frame
+     "line": [[x1, y1], [x2, y2]],        # the stop line
+     "approach": 1,                       # optional: only count crossings from
+                                          # this side (+1/-1) of the line
+     "min_area": 1500, "downscale": 2,    # motion blobs, in full-frame pixels
+     "model": "vehicles.onnx",            # optional DNN confirmation
+     "classes": [2, 3, 5, 7], "confidence": 0.4, "input_size": [320, 320]}
+"""
+import json
+import math
+import os
+
+CONFIG_FILE = os.environ.get(
+    'STOPLINE_CONFIG',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stopline.json'))
+
+COCO_VEHICLES = (2, 3, 5, 7)  # car, motorcycle, bus, truck
+
+
+def load_config(path=CONFIG_FILE) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def side_of_line(line, point) -> int:
+    """+1 / -1 for the two sides of ``line``, 0 when exactly on it."""
+    (x1, y1), (x2, y2) = line
+    px, py = point
+    cross = (x2 - x1) * (py - y1) - (y2 - y1) * (px - x1)
+    return (cross > 0) - (cross < 0)
+
+
+def anchor(box):
+    """Bottom-center of an (x, y, w, h) box: where the wheels meet the road."""
+    x, y, w, h = box
+    return (x + w / 2, y + h)
+
+
+def crop_box(box, shape, margin: float = 0.1):
+    """Pad ``box`` by ``margin`` of its size and clip to a (height, width) frame."""
+    x, y, w, h = box
+    height, width = shape[:2]
+    dx, dy = int(w * margin), int(h * margin)
+    return (max(0, int(x) - dx), max(0, int(y) - dy),
+            min(width, int(x + w) + dx), min(height, int(y + h) + dy))
+
+
+class Track:
+    def __init__(self, box, side):
+        self.box = box
+        self.side = side
+        self.missing = 0
+        self.crossed = False
+
+
+class CrossingTracker:
+    """Nearest-neighbour tracker that reports each line crossing once."""
+
+    def __init__(self, line, approach=None, max_distance: float = 80, max_missing: int = 5):
+        self.line = line
+        self.approach = approach
+        self.max_distance = max_distance
+        self.max_missing = max_missing
+        self.tracks = []
+
+    def update(self, boxes) -> list:
+        """Feed this frame's boxes; return the boxes that just crossed."""
+        crossed = []
+        unmatched = list(self.tracks)
+        for box in boxes:
+            point = anchor(box)
+            best, best_distance = None, self.max_distance
+            for track in unmatched:
+                distance = math.dist(point, anchor(track.box))
+                if distance <= best_distance:
+                    best, best_distance = track, distance
+            side = side_of_line(self.line, point)
+            if best is None:
+                self.tracks.append(Track(box, side))
+                continue
+            unmatched.remove(best)
+            if (not best.crossed and side and best.side and side != best.side
+                    and (self.approach is None or best.side == self.approach)):
+                best.crossed = True
+                crossed.append(box)
+            best.box, best.missing = box, 0
+            if side:
+                best.side = side
+
+        for track in unmatched:
+            track.missing += 1
+        self.tracks = [t for t in self.tracks if t.missing <= self.max_missing]
+        return crossed
+
+    def waiting(self) -> int:
+        """Vehicles seen in this frame that have not crossed the line yet."""
+        return sum(1 for t in self.tracks if not t.crossed and not t.missing
+                   and t.side and (self.approach is None or t.side == self.approach))
+
+
+class MotionDetector:
+    """Moving blobs inside the ROI via MOG2 background subtraction."""
+
+    def __init__(self, roi, min_area: int = 1500, downscale: int = 2,
+                 history: int = 500, var_threshold: float = 32):
+        import cv2
+        self.cv2 = cv2
+        self.roi = roi
+        self.min_area = min_area
+        self.downscale = downscale
+        self.subtractor = cv2.createBackgroundSubtractorMOG2(
+            history=history, varThreshold=var_threshold, detectShadows=False)
+        self.kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
+
+    def detect(self, frame) -> list:
+        cv2 = self.cv2
+        x0, y0, x1, y1 = self.roi
+        d = self.downscale
+        region = frame[y0:y1, x0:x1]
+        if d > 1:
+            region = cv2.resize(region, None, fx=1 / d, fy=1 / d, interpolation=cv2.INTER_AREA)
+        mask = self.subtractor.apply(region)
+        mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, self.kernel)
+        mask = cv2.dilate(mask, self.kernel, iterations=2)
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        boxes = []
+        for contour in contours:
+            if cv2.contourArea(contour) * d * d < self.min_area:
+                continue
+            x, y, w, h = cv2.boundingRect(contour)
+            boxes.append((x0 + x * d, y0 + y * d, w * d, h * d))
+        return boxes
+
+
+class DnnVehicleDetector:
+    """Vehicle boxes inside the ROI from an OpenCV-DNN detection model."""
+
+    def __init__(self, roi, model: str, model_config: str = "", input_size=(320, 320),
+                 confidence: float = 0.4, classes=COCO_VEHICLES):
+        import cv2
+        self.roi = roi
+        self.confidence = confidence
+        self.classes = set(classes)
+        self.model = cv2.dnn_DetectionModel(cv2.dnn.readNet(model, model_config))
+        self.model.setInputParams(size=tuple(input_size), scale=1 / 255.0, swapRB=True)
+
+    def detect(self, frame) -> list:
+        x0, y0, x1, y1 = self.roi
+        class_ids, scores, boxes = self.model.detect(frame[y0:y1, x0:x1], confThreshold=self.confidence)
+        return [(x0 + x, y0 + y, w, h)
+                for class_id, (x, y, w, h) in zip(list(class_ids), list(boxes))
+                if int(class_id) in self.classes]
+
+
+class GatedDetector:
+    """Run the (expensive) confirming detector only on frames with motion."""
+
+    def __init__(self, motion, confirm):
+        self.motion = motion
+        self.confirm = confirm
+
+    def detect(self, frame) -> list:
+        if not self.motion.detect(frame):
+            return []
+        return self.confirm.detect(frame)
+
+
+def make_detector(config: dict):
+    roi = config["roi"]
+    motion = MotionDetector(roi, config.get("min_area", 1500), config.get("downscale", 2))
+    if not config.get("model"):
+        return motion
+    dnn = DnnVehicleDetector(roi, config["model"], config.get("model_config", ""),
+                             config.get("input_size", (320, 320)), config.get("confidence", 0.4),
+                             config.get("classes", COCO_VEHICLES))
+    return GatedDetector(motion, dnn)
+
+
+class StopLineFilter:
+    def __init__(self, detector, tracker, margin: float = 0.1):
+        self.detector = detector
+        self.tracker = tracker
+        self.margin = margin
+        self.frames = 0
+        self.red_frames = 0
+        self.crossings = 0
+        self.passed = 0  # crossings on any phase, the approach's flow
+
+    @classmethod
+    def from_config(cls, config: dict):
+        tracker = CrossingTracker(config["line"], config.get("approach"))
+        return cls(make_detector(config), tracker, config.get("margin", 0.1))
+
+    def process(self, frame, is_red: bool) -> list:
+        """Boxes of vehicles crossing the stop line in this frame, while red.
+
+        Call it for every frame, whatever the light: the detector's
+        background model and the tracks need the full sequence.
+        """
+        crossed = self.tracker.update(self.detector.detect(frame))
+        self.frames += 1
+        self.passed += len(crossed)
+        if not is_red:
+            return []
+        self.red_frames += 1
+        self.crossings += len(crossed)
+        return crossed
+
+    def crop(self, frame, box):
+        x0, y0, x1, y1 = crop_box(box, frame.shape, self.margin)
+        return frame[y0:y1, x0:x1]
+
+    def stats(self) -> dict:
+        return {"frames": self.frames, "red_frames": self.red_frames, "crossings": self.crossings,
+                "passed": self.passed, "waiting": self.tracker.waiting()}